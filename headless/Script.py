@@ -0,0 +1,195 @@
+# Copyright (c) 2024 GregValiant
+#   Released under the terms of the AGPLv3 or higher.
+#
+#   Stand-in for Cura's PostProcessingPlugin "Script" base class.  The GV scripts do "from ..Script import Script" so when they
+#   are loaded by the headless runner that import resolves to this file.  Settings come from the scripts own
+#   getSettingDataString() defaults and are overridden by the settings JSON supplied to the runner.
+#   getValue() and putValue() are copied from Cura so the output is identical to what Cura would write.
+
+import json
+import re
+import collections
+from typing import Any, Dict, Optional
+
+
+class _SettingStack:
+    """Holds the definition (from getSettingDataString) and the instance values of one script."""
+
+    def __init__(self, setting_data: Dict[str, Any]) -> None:
+        self._definitions = setting_data.get("settings", {})
+        self._properties = {}    # {key: {property_name: value}} set through setProperty()
+
+    def getProperty(self, key: str, property_name: str) -> Any:
+        if key in self._properties and property_name in self._properties[key]:
+            value = self._properties[key][property_name]
+        else:
+            definition = self._definitions.get(key)
+            if definition is None:
+                return None
+            if property_name != "value":
+                return definition.get(property_name)
+            value = definition.get("default_value")
+            if "value" in definition:
+                value = self._evaluate(definition["value"], value)
+        if property_name == "value":
+            return self._coerce(key, value)
+        return value
+
+    def setProperty(self, key: str, property_name: str, property_value: Any, *args, **kwargs) -> None:
+        self._properties.setdefault(key, {})[property_name] = property_value
+
+    ## Cura evaluates string "value" entries as python expressions against the machine settings.
+    def _evaluate(self, expression: Any, default: Any) -> Any:
+        if not isinstance(expression, str):
+            return expression
+        from UM.Application import Application
+        machine = Application.getInstance().getGlobalContainerStack()
+        names = _MachineNames(machine, self)
+        try:
+            return eval(expression, {"__builtins__": {}}, names)
+        except Exception:
+            return expression if default is None else default
+
+    ## Saved settings are strings.  Convert them to the setting type the same way Cura hands them back to the script.
+    def _coerce(self, key: str, value: Any) -> Any:
+        definition = self._definitions.get(key, {})
+        setting_type = definition.get("type", "str")
+        if value is None:
+            return None
+        try:
+            if setting_type == "bool":
+                if isinstance(value, str):
+                    return value.strip().lower() in ("true", "1", "yes", "on")
+                return bool(value)
+            if setting_type == "int":
+                return int(float(value))
+            if setting_type == "float":
+                return float(value)
+        except (TypeError, ValueError):
+            return value
+        if setting_type in ("str", "enum") and not isinstance(value, str):
+            return str(value)
+        return value
+
+
+class _MachineNames(dict):
+    """Name lookup for setting expressions: script settings first, then the machine settings."""
+
+    def __init__(self, machine, setting_stack: _SettingStack) -> None:
+        super().__init__()
+        self._machine = machine
+        self._setting_stack = setting_stack
+
+    def __missing__(self, key: str) -> Any:
+        if key in self._setting_stack._definitions:
+            return self._setting_stack.getProperty(key, "value")
+        if self._machine is not None:
+            value = self._machine.getProperty(key, "value")
+            if value is not None:
+                return value
+        raise KeyError(key)
+
+
+class Script:
+    """Base class for post-processing scripts, headless edition."""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._stack = None
+        self._definition = None
+        self._instance = None
+
+    def initialize(self) -> None:
+        setting_data = self.getSettingData()
+        self._stack = _SettingStack(setting_data)
+        self._definition = setting_data
+        self._instance = self._stack
+
+    def getSettingData(self) -> Dict[str, Any]:
+        setting_data_as_string = self.getSettingDataString()
+        setting_data = json.loads(setting_data_as_string, object_pairs_hook = collections.OrderedDict)
+        return setting_data
+
+    def getSettingDataString(self) -> str:
+        raise NotImplementedError()
+
+    def getDefinitionId(self) -> Optional[str]:
+        if self._stack:
+            return self.getSettingData().get("key")
+        return None
+
+    def getStackId(self) -> Optional[str]:
+        if self._stack:
+            return str(id(self._stack))
+        return None
+
+    def getSettingValueByKey(self, key: str) -> Any:
+        """Convenience function that retrieves value of a setting from the stack."""
+        if self._stack is not None:
+            return self._stack.getProperty(key, "value")
+        return None
+
+    def getValue(self, line: str, key: str, default = None) -> Any:
+        """Convenience function that finds the value in a line of g-code.
+
+        When requesting key = x from line "G1 X100" the value 100 is returned.
+        """
+        if not key in line or (";" in line and line.find(key) > line.find(";")):
+            return default
+        sub_part = line[line.find(key) + 1:]
+        m = re.search("^-?[0-9]+\\.?[0-9]*", sub_part)
+        if m is None:
+            return default
+        try:
+            return int(m.group(0))
+        except ValueError: #Not an integer.
+            try:
+                return float(m.group(0))
+            except ValueError: #Not a number at all.
+                return default
+
+    def putValue(self, line: str = "", **kwargs) -> str:
+        """Convenience function to produce a line of g-code.
+
+        The parameters will be added in order G M T S F X Y Z E.  Any other parameters will be added after those.
+        """
+        # Strip the comment.
+        if ";" in line:
+            comment = line[line.find(";"):]
+            line = line[:line.find(";")]
+        else:
+            comment = ""
+
+        # Parse the original g-code line and add them to kwargs.
+        for part in line.split(" "):
+            if part == "":
+                continue
+            parameter = part[0]
+            if parameter not in kwargs:
+                value = part[1:]
+                kwargs[parameter] = value
+
+        # Start writing the new g-code line.
+        line_parts = list()
+        # First add these parameters in order
+        for parameter in ["G", "M", "T", "S", "F", "X", "Y", "Z", "E"]:
+            if parameter in kwargs:
+                value = kwargs.pop(parameter)  # get the corresponding value and remove the parameter from kwargs
+                line_parts.append(parameter + str(value))
+        # Then add the rest of the parameters
+        for parameter, value in kwargs.items():
+            line_parts.append(parameter + str(value))
+
+        # If there was a comment, put it at the end.
+        if comment != "":
+            line_parts.append(comment)
+
+        # Add spaces and return the new line
+        return " ".join(line_parts)
+
+    def execute(self, data):
+        """This is called when the script is executed.
+
+        It gets a list of g-code strings and needs to return a (modified) list.
+        """
+        raise NotImplementedError()
@@ -0,0 +1,8 @@
+# Copyright (c) 2024 GregValiant
+#   Released under the terms of the AGPLv3 or higher.
+#
+#   Headless runner for the GV post-processing scripts.  See "python -m headless --help".
+
+from .runner import split_gcode, join_gcode, load_script, create_script, run_scripts, process_file, setup
+from .cache import ResultCache
+from .stream import GcodeFile, StreamData, StreamingError
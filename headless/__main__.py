@@ -0,0 +1,90 @@
+# Copyright (c) 2024 GregValiant
+#   Released under the terms of the AGPLv3 or higher.
+#
+#   Command line for the headless runner.  Examples:
+#       python -m headless part.gcode -o part_pp.gcode -p printer.json -s PauseAtLayer_GV=pause.json
+#       python -m headless part.gcode -o part_pp.gcode -p printer.json --chain farm_chain.json
+#       python -m headless part.gcode -o part_pp.gcode -p printer.json --cura-chain
+#       python -m headless part.gcode -o part_pp.gcode -p printer.json --chain farm_chain.json --fused
+#       python -m headless huge.gcode -o huge_pp.gcode -p printer.json -s PauseAtLayer_GV=pause.json --stream
+#       python -m headless part.gcode -o part_pp.gcode -p printer.json --chain farm_chain.json --cache
+#       python -m headless part.gcode -o part_pp.bgcode -p printer.json -s DisplayInfoOnLCD_GV
+#   Scripts given with -s run in the order they are listed.  "--cura-chain" uses the post_processing_scripts
+#   entry of the printer profile's "metadata", which is where Cura saves the post-processor list.
+
+import argparse
+import json
+import logging
+import os
+import sys
+
+from . import runner
+from .bgcode import COMPRESSIONS, ENCODINGS, BgcodeWriter
+
+
+def main(argv = None) -> int:
+    parser = argparse.ArgumentParser(prog = "python -m headless", description = "Run GV post-processing scripts on a gcode file without Cura.")
+    parser.add_argument("input", help = "The sliced .gcode file")
+    parser.add_argument("-o", "--output", help = "Output file.  Defaults to <input>_pp.gcode")
+    parser.add_argument("-p", "--profile", help = "Printer profile JSON with the machine and extruder settings")
+    parser.add_argument("-s", "--script", action = "append", default = [], metavar = "NAME[=SETTINGS.json]", help = "A script to run, with an optional settings file")
+    parser.add_argument("--chain", help = "JSON list of {\"script\": name, \"settings\": {...}} to run in order")
+    parser.add_argument("--cura-chain", action = "store_true", help = "Run the scripts saved in the profile's post_processing_scripts metadata")
+    parser.add_argument("--fused", action = "store_true", help = "Scripts next to each other in the chain that support it share one pass over the layers")
+    parser.add_argument("--stream", action = "store_true", help = "Don't read the whole file into memory.  For very big files.  Some scripts can't run this way")
+    parser.add_argument("--lookback", type = int, default = runner.DEFAULT_LOOKBACK, help = "With --stream, how many layers the scripts can go back and change (default %(default)s)")
+    parser.add_argument("--instrument", action = "store_true", help = "Add a ';  [Profile]' line with the time, layers touched, lines scanned and regex calls of each script to the header")
+    parser.add_argument("--trace-memory", action = "store_true", help = "Add the peak memory (tracemalloc) to the ';  [Profile]' lines.  Much slower")
+    parser.add_argument("--cache", action = "store_true", help = "Keep the result of each script and use it again when the same gcode is run with the same settings")
+    parser.add_argument("--cache-dir", help = "Folder for --cache (default " + runner.default_cache_dir() + ")")
+    parser.add_argument("--cache-size", type = float, default = runner.DEFAULT_CACHE_MB, metavar = "MB", help = "The oldest results are removed to keep the cache under this size (default %(default)s)")
+    parser.add_argument("--clear-cache", action = "store_true", help = "Empty the cache before running")
+    parser.add_argument("--binary", action = "store_true", help = "Write binary gcode (.bgcode).  On by default when the output file ends with .bgcode")
+    parser.add_argument("--bgcode-compression", choices = sorted(COMPRESSIONS), default = "heatshrink12", help = "Compression of the gcode blocks (default %(default)s).  'deflate' is much faster when the heatshrink2 package isn't installed")
+    parser.add_argument("--bgcode-encoding", choices = sorted(ENCODINGS), default = "meatpack", help = "Encoding of the gcode blocks (default %(default)s).  'meatpack' leaves out the comments")
+    parser.add_argument("--scripts-dir", default = runner.SCRIPTS_DIR, help = "Folder with the *_GV.py scripts")
+    parser.add_argument("-v", "--verbose", action = "store_true", help = "Log debug messages")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level = logging.DEBUG if args.verbose else logging.INFO, format = "%(levelname)s %(message)s")
+    profile = runner._stand_ins.loadProfile(args.profile)
+    runner.setup(profile)
+
+    chain = []
+    if args.cura_chain:
+        chain += runner.parse_cura_script_list(profile.get("metadata", {}).get("post_processing_scripts", ""))
+    if args.chain:
+        chain += runner.load_chain(args.chain)
+    for script_arg in args.script:
+        script_name, _, settings_path = script_arg.partition("=")
+        chain.append((script_name, runner.load_settings(settings_path)))
+    if not chain:
+        parser.error("No scripts to run.  Use -s, --chain or --cura-chain.")
+
+    output = args.output
+    if not output:
+        output = os.path.splitext(args.input)[0] + ("_pp.bgcode" if args.binary else "_pp.gcode")
+    bgcode = None
+    if args.binary or output.lower().endswith(".bgcode"):
+        bgcode = BgcodeWriter(args.bgcode_compression, args.bgcode_encoding)
+    cache = None
+    if args.cache or args.clear_cache:
+        cache = runner.ResultCache(args.cache_dir, args.cache_size)
+        if args.clear_cache:
+            cache.clear()
+        if not args.cache:
+            cache = None
+    try:
+        result = runner.process_file(args.input, output, chain, args.scripts_dir, args.fused, args.stream, args.lookback, args.instrument, args.trace_memory, cache, bgcode)
+    except runner.StreamingError as e:
+        logging.error(str(e))
+        return 1
+    if cache is not None:
+        result["cache_hits"] = cache.hits
+        result["cache_misses"] = cache.misses
+    print(json.dumps(result))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,450 @@
+# Copyright (c) 2024 GregValiant
+#   Released under the terms of the AGPLv3 or higher.
+#
+#   Minimal replacements for the parts of Uranium (UM) and Cura that the GV scripts call.  They are only installed
+#   when the real UM package cannot be imported, so nothing here is used when the scripts run inside Cura.
+#   The machine and extruder settings come from a saved printer profile (JSON).  The layout of that file is:
+#       {
+#           "global":      {"machine_width": 235, "machine_depth": 235, ...},
+#           "extruders":   [{"material_print_temperature": 205, ...}, {...}],
+#           "materials":   [{"material": "PLA", "name": "Generic PLA", "brand": "Generic"}],
+#           "metadata":    {"post_processing_scripts": ""},
+#           "preferences": {"cura/currency": "$"},
+#           "print_information": {"job_name": "", "material_lengths": [], "material_weights": [], "material_costs": []}
+#       }
+#   Any key that is not in the profile falls back to the Cura default listed in MACHINE_DEFAULTS.
+
+import json
+import logging
+import sys
+import types
+from typing import Any, Dict, List, Optional
+
+_log = logging.getLogger("headless")
+
+## Cura (fdmprinter) defaults for the settings the GV scripts ask for most often.
+MACHINE_DEFAULTS = {
+    "machine_name": "Headless Printer",
+    "machine_width": 220,
+    "machine_depth": 220,
+    "machine_height": 250,
+    "machine_center_is_zero": False,
+    "machine_shape": "rectangular",
+    "machine_heated_bed": True,
+    "machine_heated_build_volume": False,
+    "machine_gcode_flavor": "RepRap (Marlin/Sprinter)",
+    "machine_extruder_count": 1,
+    "extruders_enabled_count": 1,
+    "machine_firmware_retract": False,
+    "machine_nozzle_size": 0.4,
+    "machine_nozzle_id": "0.4 mm",
+    "machine_extruder_cooling_fan_number": 0,
+    "machine_scale_fan_speed_zero_to_one": False,
+    "machine_use_extruder_offset_to_offset_coords": True,
+    "machine_extruders_share_nozzle": False,
+    "machine_extruders_share_heater": False,
+    "machine_extruder_end_code": "",
+    "machine_nozzle_temp_enabled": True,
+    "machine_max_feedrate_x": 299792458000,
+    "machine_max_feedrate_y": 299792458000,
+    "machine_max_feedrate_z": 299792458000,
+    "machine_max_feedrate_e": 299792458000,
+    "machine_max_acceleration_x": 9000,
+    "machine_max_acceleration_y": 9000,
+    "machine_max_acceleration_z": 100,
+    "machine_max_acceleration_e": 10000,
+    "machine_acceleration": 4000,
+    "machine_max_jerk_xy": 20.0,
+    "machine_max_jerk_z": 0.4,
+    "machine_max_jerk_e": 5.0,
+    "machine_steps_per_mm_x": 50,
+    "machine_steps_per_mm_y": 50,
+    "machine_steps_per_mm_z": 50,
+    "machine_steps_per_mm_e": 1600,
+    "machine_disallowed_areas": [],
+    "nozzle_disallowed_areas": [],
+    "gantry_height": 999999,
+    "machine_head_with_fans_polygon": [[-20, 10], [10, 10], [10, -10], [-20, -10]],
+    "print_sequence": "all_at_once",
+    "adhesion_type": "skirt",
+    "raft_airgap": 0.3,
+    "layer_height": 0.2,
+    "layer_height_0": 0.3,
+    "line_width": 0.4,
+    "material_diameter": 1.75,
+    "material_print_temperature": 210,
+    "material_print_temperature_layer_0": 215,
+    "material_initial_print_temperature": 200,
+    "material_final_print_temperature": 195,
+    "material_standby_temperature": 175,
+    "material_bed_temperature": 60,
+    "material_bed_temperature_layer_0": 60,
+    "build_volume_temperature": 35,
+    "material_flow": 100,
+    "relative_extrusion": False,
+    "retraction_enable": True,
+    "retraction_amount": 6.5,
+    "retraction_speed": 25,
+    "retraction_retract_speed": 25,
+    "retraction_prime_speed": 25,
+    "retraction_hop_enabled": False,
+    "retraction_hop": 1,
+    "retraction_combing": "all",
+    "speed_print": 60,
+    "speed_infill": 60,
+    "speed_wall": 30,
+    "speed_wall_0": 30,
+    "speed_wall_x": 60,
+    "speed_topbottom": 30,
+    "speed_travel": 120,
+    "speed_layer_0": 30,
+    "speed_print_layer_0": 30,
+    "speed_travel_layer_0": 60,
+    "speed_z_hop": 10,
+    "acceleration_enabled": False,
+    "acceleration_print": 3000,
+    "acceleration_travel": 5000,
+    "acceleration_travel_enabled": True,
+    "jerk_enabled": False,
+    "jerk_print": 20,
+    "jerk_travel": 30,
+    "jerk_travel_enabled": True,
+    "cool_fan_enabled": True,
+    "cool_fan_speed": 100,
+    "cool_fan_speed_min": 100,
+    "cool_fan_speed_max": 100,
+    "cool_fan_speed_0": 0,
+    "cool_fan_full_layer": 2,
+    "cool_min_layer_time": 10,
+    "cool_lift_head": False,
+    "bridge_settings_enabled": False,
+    "bridge_fan_speed": 100,
+    "bridge_skin_speed": 15,
+    "bridge_wall_speed": 15,
+    "support_enable": False,
+    "support_structure": "normal",
+    "prime_tower_enable": False,
+    "prime_tower_size": 20,
+    "prime_tower_position_x": 200,
+    "prime_tower_position_y": 200,
+    "switch_extruder_retraction_amount": 16,
+    "switch_extruder_extra_prime_amount": 0,
+    "machine_extruders_shared_nozzle_initial_retraction": 0,
+    "retraction_hop_after_extruder_switch": True,
+    "adaptive_layer_height_enabled": False,
+    "speed_slowdown_layers": 2,
+    "speed_support": 60,
+    "speed_support_interface": 40,
+    "speed_prime_tower": 60,
+    "speed_roofing": 30,
+    "speed_ironing": 20,
+    "skirt_brim_speed": 30,
+    "magic_spiralize": False,
+    "infill_sparse_density": 20,
+    "wall_line_count": 2,
+    "top_layers": 4,
+    "bottom_layers": 4,
+    "z_seam_type": "sharpest_corner",
+    "wipe_brush_pos_x": 100,
+}
+## Feature extruder assignments.  Cura resolves these to the first extruder on single extruder machines.
+for _key in ("wall_extruder_nr", "wall_0_extruder_nr", "wall_x_extruder_nr", "roofing_extruder_nr", "top_bottom_extruder_nr", "infill_extruder_nr",
+             "support_extruder_nr", "support_infill_extruder_nr", "support_extruder_nr_layer_0", "support_interface_extruder_nr", "support_roof_extruder_nr",
+             "support_bottom_extruder_nr", "skirt_brim_extruder_nr", "adhesion_extruder_nr", "raft_base_extruder_nr", "raft_interface_extruder_nr", "raft_surface_extruder_nr"):
+    MACHINE_DEFAULTS[_key] = 0
+
+
+class _ContainerStack:
+    """A settings stack.  Values are looked up in this stack, then in the fallback stack, then in MACHINE_DEFAULTS."""
+
+    def __init__(self, values: Dict[str, Any], fallback: Optional["_ContainerStack"] = None, metadata: Dict[str, Any] = None) -> None:
+        self._values = values
+        self._fallback = fallback
+        self._metadata = metadata if metadata is not None else {}
+        self.material = _Material({})
+        self.isEnabled = True
+
+    def getProperty(self, key: str, property_name: str) -> Any:
+        if property_name not in ("value", "default_value"):
+            return None
+        if key in self._values:
+            return self._values[key]
+        if self._fallback is not None and key in self._fallback._values:
+            return self._fallback._values[key]
+        return MACHINE_DEFAULTS.get(key)
+
+    def setProperty(self, key: str, property_name: str, property_value: Any, *args, **kwargs) -> None:
+        if property_name == "value":
+            self._values[key] = property_value
+
+    def getMetaDataEntry(self, entry: str, default: Any = None) -> Any:
+        return self._metadata.get(entry, default)
+
+    def setMetaDataEntry(self, entry: str, value: Any) -> None:
+        self._metadata[entry] = value
+
+    def getId(self) -> str:
+        return str(self.getProperty("machine_name", "value"))
+
+
+class _GlobalStack(_ContainerStack):
+    def __init__(self, values: Dict[str, Any], extruder_values: List[Dict[str, Any]], metadata: Dict[str, Any], materials: List[Dict[str, Any]]) -> None:
+        super().__init__(values, None, metadata)
+        extruder_count = int(values.get("machine_extruder_count", max(len(extruder_values), 1)))
+        self._values.setdefault("machine_extruder_count", extruder_count)
+        self.extruderList = []
+        for num in range(0, extruder_count):
+            extruder_dict = dict(extruder_values[num]) if num < len(extruder_values) else {}
+            extruder_stack = _ContainerStack(extruder_dict, self)
+            extruder_stack.isEnabled = bool(extruder_dict.get("extruder_enabled", True))
+            extruder_stack.material = _Material(materials[num] if num < len(materials) else {})
+            self.extruderList.append(extruder_stack)
+        self._values.setdefault("extruders_enabled_count", len([ext for ext in self.extruderList if ext.isEnabled]))
+        # Settings that are per-extruder in Cura are answered from the first extruder when asked of the global stack
+        self._fallback = self.extruderList[0] if self.extruderList else None
+
+    @property
+    def extruders(self) -> Dict[str, _ContainerStack]:
+        return {str(num): ext for num, ext in enumerate(self.extruderList)}
+
+
+class _Material:
+    def __init__(self, metadata: Dict[str, Any]) -> None:
+        self._metadata = metadata
+
+    def getMetaDataEntry(self, entry: str, default: Any = None) -> Any:
+        return self._metadata.get(entry, default)
+
+
+class DurationFormat:
+    class Format:
+        Seconds = 0
+        Short = 1
+        Long = 2
+        ISO8601 = 3
+
+
+class Duration:
+    def __init__(self, duration: float = 0) -> None:
+        self._duration = max(int(round(duration)), 0)
+
+    @property
+    def valid(self) -> bool:
+        return True
+
+    def getDisplayString(self, display_format: int = DurationFormat.Format.Short) -> str:
+        hours, remainder = divmod(self._duration, 3600)
+        minutes, seconds = divmod(remainder, 60)
+        if display_format == DurationFormat.Format.Seconds:
+            return str(self._duration)
+        if display_format == DurationFormat.Format.ISO8601:
+            return "%02d:%02d:%02d" % (hours, minutes, seconds)
+        if display_format == DurationFormat.Format.Long:
+            return "%d hours %d minutes %d seconds" % (hours, minutes, seconds)
+        return "%02d:%02d" % (hours, minutes)
+
+    def __int__(self) -> int:
+        return self._duration
+
+
+class _PrintInformation:
+    def __init__(self, info: Dict[str, Any]) -> None:
+        self.jobName = str(info.get("job_name", ""))
+        self.currentPrintTime = Duration(float(info.get("print_time", 0)))
+        self.materialLengths = list(info.get("material_lengths", []))
+        self.materialWeights = list(info.get("material_weights", []))
+        self.materialCosts = list(info.get("material_costs", []))
+        self.materialNames = list(info.get("material_names", []))
+
+
+class Preferences:
+    def __init__(self, values: Dict[str, Any] = None) -> None:
+        self._values = {"cura/currency": "$", "physics/automatic_push_free": False, "physics/automatic_drop_down": True}
+        if values:
+            self._values.update(values)
+
+    def getValue(self, key: str) -> Any:
+        return self._values.get(key)
+
+    def setValue(self, key: str, value: Any) -> None:
+        self._values[key] = value
+
+    def addPreference(self, key: str, default_value: Any) -> None:
+        self._values.setdefault(key, default_value)
+
+
+class _ExtruderManager:
+    def __init__(self, global_stack: _GlobalStack, initial_extruder_nr: int) -> None:
+        self._global_stack = global_stack
+        self._initial_extruder_nr = initial_extruder_nr
+
+    def getInitialExtruderNr(self) -> int:
+        return self._initial_extruder_nr
+
+    def getActiveExtruderStacks(self) -> List[_ContainerStack]:
+        return self._global_stack.extruderList
+
+    def getUsedExtruderStacks(self) -> List[_ContainerStack]:
+        return [ext for ext in self._global_stack.extruderList if ext.isEnabled]
+
+
+class Application:
+    """Answers Application.getInstance() and CuraApplication.getInstance() for the scripts."""
+
+    _instance = None
+
+    def __init__(self, profile: Dict[str, Any] = None) -> None:
+        profile = profile if profile is not None else {}
+        self._profile = profile
+        self._global_stack = _GlobalStack(dict(profile.get("global", {})), list(profile.get("extruders", [])), dict(profile.get("metadata", {})), list(profile.get("materials", [])))
+        self._preferences = Preferences(profile.get("preferences"))
+        self._print_information = _PrintInformation(profile.get("print_information", {}))
+        self._extruder_manager = _ExtruderManager(self._global_stack, int(profile.get("initial_extruder_nr", 0)))
+
+    @classmethod
+    def getInstance(cls, *args, **kwargs) -> "Application":
+        if Application._instance is None:
+            Application._instance = Application()
+        return Application._instance
+
+    def getGlobalContainerStack(self) -> _GlobalStack:
+        return self._global_stack
+
+    def getPreferences(self) -> Preferences:
+        return self._preferences
+
+    def getPrintInformation(self) -> _PrintInformation:
+        return self._print_information
+
+    def getExtruderManager(self) -> _ExtruderManager:
+        return self._extruder_manager
+
+    def getVersion(self) -> str:
+        return "headless"
+
+    def getApplicationName(self) -> str:
+        return "cura"
+
+    ## Fill in the print information from the gcode header when the profile did not supply it.
+    def setPrintInformationFromHeader(self, header: str, job_name: str) -> None:
+        info = self._print_information
+        if not info.jobName:
+            info.jobName = job_name
+        for line in header.split("\n"):
+            if line.startswith(";TIME:") and int(info.currentPrintTime) == 0:
+                try:
+                    info.currentPrintTime = Duration(float(line.split(":")[1]))
+                except ValueError:
+                    pass
+            elif line.startswith(";Filament used:") and not info.materialLengths:
+                for length in line.split(":")[1].split(","):
+                    try:
+                        info.materialLengths.append(float(length.strip().rstrip("m")))
+                    except ValueError:
+                        pass
+        extruder_count = len(self._global_stack.extruderList)
+        for attribute in ("materialLengths", "materialWeights", "materialCosts"):
+            values = getattr(info, attribute)
+            while len(values) < extruder_count:
+                values.append(0.0)
+
+
+class Message:
+    """Messages are written to the log instead of popping up in the Cura window."""
+
+    def __init__(self, text: str = "", lifetime: int = 30, dismissable: bool = True, progress: float = None, title: Optional[str] = None, *args, **kwargs) -> None:
+        self._text = text
+        self._title = title
+
+    def show(self) -> None:
+        _log.warning("%s %s", self._title if self._title else "", self._text)
+
+    def hide(self, *args, **kwargs) -> None:
+        pass
+
+    def getText(self) -> str:
+        return self._text
+
+
+class Logger:
+    _levels = {"d": logging.DEBUG, "i": logging.INFO, "w": logging.WARNING, "e": logging.ERROR, "c": logging.CRITICAL}
+
+    @classmethod
+    def log(cls, log_type: str, message: str, *args, **kwargs) -> None:
+        _log.log(cls._levels.get(log_type, logging.INFO), message, *args)
+
+    @classmethod
+    def logException(cls, log_type: str, message: str, *args) -> None:
+        _log.log(cls._levels.get(log_type, logging.ERROR), message, *args, exc_info = True)
+
+
+class Platform:
+    @staticmethod
+    def isWindows() -> bool:
+        return sys.platform.startswith("win")
+
+    @staticmethod
+    def isOSX() -> bool:
+        return sys.platform == "darwin"
+
+    @staticmethod
+    def isLinux() -> bool:
+        return sys.platform.startswith("linux")
+
+
+def _parseBool(value: Any) -> bool:
+    if isinstance(value, str):
+        return value.strip().lower() in ("true", "1", "yes", "on")
+    return bool(value)
+
+
+def loadProfile(path: Optional[str]) -> Dict[str, Any]:
+    """Read a saved printer profile.  A file without a "global" section is taken to be a flat dict of global settings."""
+    if not path:
+        return {}
+    with open(path, "r", encoding = "utf-8") as profile_file:
+        profile = json.load(profile_file)
+    if "global" not in profile and "extruders" not in profile:
+        profile = {"global": profile}
+    return profile
+
+
+def install(profile: Dict[str, Any] = None) -> Application:
+    """Put the stand-ins in sys.modules (when UM is not importable) and create the Application instance for this profile."""
+    try:
+        import UM.Application
+        real_um = not getattr(UM.Application, "__headless__", False)
+    except ImportError:
+        real_um = False
+    if real_um:
+        raise RuntimeError("The real UM package is importable.  The headless runner must not be used inside Cura.")
+
+    modules = {
+        "UM": {},
+        "UM.Application": {"Application": Application},
+        "UM.Message": {"Message": Message},
+        "UM.Logger": {"Logger": Logger},
+        "UM.Qt": {},
+        "UM.Qt.Duration": {"Duration": Duration, "DurationFormat": DurationFormat},
+        "UM.Util": {"parseBool": _parseBool},
+        "UM.Preferences": {"Preferences": Preferences},
+        "UM.Platform": {"Platform": Platform},
+        "cura": {},
+        "cura.CuraApplication": {"CuraApplication": Application},
+    }
+    for module_name, attributes in modules.items():
+        module = sys.modules.get(module_name)
+        if module is None:
+            module = types.ModuleType(module_name)
+            module.__headless__ = True
+            if "." not in module_name or module_name in ("UM.Qt",):
+                module.__path__ = []
+            sys.modules[module_name] = module
+        for attribute, value in attributes.items():
+            setattr(module, attribute, value)
+        if "." in module_name:
+            parent, child = module_name.rsplit(".", 1)
+            setattr(sys.modules[parent], child, module)
+
+    Application._instance = Application(profile)
+    return Application._instance
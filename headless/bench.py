@@ -0,0 +1,233 @@
+# Copyright (c) 2024 GregValiant
+#   Released under the terms of the AGPLv3 or higher.
+#
+#   Benchmark for the GV scripts.  Every script in BENCH_CASES is run over the synthetic corpus (headless/corpus.py)
+#   and the execute() time, lines per second and peak memory are recorded.  Each run is in a fresh process so the
+#   peak RSS belongs to that one script.  The results can be saved as a baseline and later runs are compared to it.
+#
+#   python -m headless.bench                                  # small, medium, raft_multi and one_at_a_time
+#   python -m headless.bench --corpus tall,huge --scripts PauseAtLayer_GV
+#   python -m headless.bench --save-baseline                  # store the results in bench_baseline.json
+#   The baseline is made on the machine that runs the bench (the times depend on it).  When there is no baseline file
+#   the first run saves its results as the baseline and says so.
+#   python -m headless.bench --tolerance 0.2                  # exit code 1 if anything is 20% slower or bigger
+
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Optional
+
+try:
+    import resource
+except ImportError:
+    resource = None     # Windows.  Peak memory is not reported.
+
+from . import corpus, runner
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.realpath(__file__)), "bench_baseline.json")
+DEFAULT_CORPUS = ["small", "medium", "raft_multi", "one_at_a_time"]
+
+## (label, script, settings).  The settings make each script do a representative amount of work.
+##   AddCuraSettings_GV is left out because it needs a complete printer profile.
+##   AAA_PostProcessReadMe_GV only opens the PDF.
+BENCH_CASES = [
+    ("AddCoolingProfile_GV:by_layer", "AddCoolingProfile_GV", {"fan_layer_or_feature": "by_layer", "layer_fan_1": "1/30", "layer_fan_2": "10/60", "layer_fan_3": "50/100"}),
+    ("AddCoolingProfile_GV:by_feature", "AddCoolingProfile_GV", {"fan_layer_or_feature": "by_feature", "feature_fan_start_layer": 2, "feature_fan_combing": True}),
+    ("AlterZhops_GV", "AlterZhops_GV", {"new_hop_hgt_t0": 0.6, "new_hop_hgt_t1": 0.6}),
+    ("ArcFitting_GV", "ArcFitting_GV", {"arc_tolerance": 0.2}),
+    ("BridgeTemperatureAdjustment_GV", "BridgeTemperatureAdjustment_GV", {"bridge_temperature": 195, "resume_temperature": 205}),
+    ("CleaningStation_GV", "CleaningStation_GV", {"clean_frequency": "every_layer", "minimum_z": 0}),
+    ("DisplayInfoOnLCD_GV:progress", "DisplayInfoOnLCD_GV", {"display_option": "display_progress", "add_m73_line": True, "add_m73_percent": True, "add_m73_time": True, "add_m118_line": True}),
+    ("DisplayInfoOnLCD_GV:filename_layer", "DisplayInfoOnLCD_GV", {"display_option": "filename_layer"}),
+    ("EmulateMultiExtruder_GV", "EmulateMultiExtruder_GV", {}),
+    ("FilamentChange_GV", "FilamentChange_GV", {"layer_number": "10,20,30,40,50,60,70,80"}),
+    ("InsertAtLayerChange_GV", "InsertAtLayerChange_GV", {"gcode_to_add": "M400,M118 layer"}),
+    ("LimitXYAccelJerk_GV", "LimitXYAccelJerk_GV", {"start_layer": 10, "jerk_enable": True}),
+    ("LimitXYAccelJerk_GV:gradual", "LimitXYAccelJerk_GV", {"type_of_change": "gradual_change", "gradient_start_layer": 5}),
+    ("LittleUtilities_GV:remove_comments", "LittleUtilities_GV", {"remove_comments": True}),
+    ("LittleUtilities_GV:line_numbers", "LittleUtilities_GV", {"debugging_tools": True, "line_numbers": True}),
+    ("LittleUtilities_GV:practice_file", "LittleUtilities_GV", {"debugging_tools": True, "debug_file": True, "debug_start_layer": 5, "debug_end_layer": 50}),
+    ("LittleUtilities_GV:very_cool", "LittleUtilities_GV", {"very_cool": True, "very_cool_layer": "5-40,60,70-90"}),
+    ("LittleUtilities_GV:speed_limits", "LittleUtilities_GV", {"speed_limit_enable": True, "speeds_to_check": "all_speeds"}),
+    ("MultiExtColorMix_GV", "MultiExtColorMix_GV", {"start_layer": 5, "end_layer": 60}),
+    ("PauseAtLayer_GV", "PauseAtLayer_GV", {"pause_layer": "10,20,30,40,50,60,70,80"}),
+    ("SearchAndReplace_GV", "SearchAndReplace_GV", {"search": "G0 F7200", "replace": "G0 F9000"}),
+    ("SearchAndReplace_GV:regex", "SearchAndReplace_GV", {"search": "F(\\d+) X", "replace": "F\\1 X", "is_regex": True}),
+    ("SuptIntMaterialChange_GV", "SuptIntMaterialChange_GV", {"layers_of_interest": "10,17,24-31"}),
+    ("TimeLapse_GV", "TimeLapse_GV", {}),
+    ("TimedCoolDown_GV", "TimedCoolDown_GV", {}),
+]
+
+
+def _peakRssMb() -> Optional[float]:
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kB and macOS reports bytes
+    return round(peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024, 1)
+
+
+def corpus_profile(settings: corpus.CorpusSettings) -> Dict[str, Any]:
+    """A printer profile that matches the synthetic print."""
+    return {
+        "global": {
+            "machine_extruder_count": settings.extruders,
+            "extruders_enabled_count": settings.extruders,
+            "adhesion_type": "raft" if settings.raft_layers else "skirt",
+            "print_sequence": "one_at_a_time" if settings.models > 1 else "all_at_once",
+            "relative_extrusion": settings.relative_extrusion,
+            "layer_height": settings.layer_height,
+            "layer_height_0": settings.layer_height_0,
+            "machine_width": 300,
+            "machine_depth": 300,
+            # Turn on the Cura features some scripts need before they will run
+            "retraction_hop_enabled": True,
+            "bridge_settings_enabled": True,
+            "machine_extruders_share_heater": settings.extruders > 1,
+            "machine_extruders_share_nozzle": settings.extruders > 1,
+        },
+        "extruders": [{"material_print_temperature": settings.print_temp, "retraction_amount": settings.retract_dist} for _ in range(settings.extruders)],
+    }
+
+
+def corpus_file(name: str, corpus_dir: str) -> str:
+    """Write the named corpus entry once and reuse it on later runs."""
+    settings = corpus.CorpusSettings.named(name)
+    os.makedirs(corpus_dir, exist_ok = True)
+    path = os.path.join(corpus_dir, "corpus_" + name + "_" + str(settings.layers) + "x" + str(settings.lines_per_layer) + ".gcode")
+    if not os.path.isfile(path):
+        temp_path = path + ".part"
+        corpus.write_gcode(temp_path, settings)
+        os.replace(temp_path, path)
+    return path
+
+
+def _runCase(label: str, script_name: str, settings: Dict[str, Any], gcode_path: str, profile: Dict[str, Any], scripts_dir: str) -> Dict[str, Any]:
+    # Runs in its own process
+    runner.setup(profile)
+    with open(gcode_path, "r", encoding = "utf-8", newline = "") as gcode_file:
+        data = runner.split_gcode(gcode_file.read())
+    runner._stand_ins.Application.getInstance().setPrintInformationFromHeader(data[0], os.path.basename(gcode_path))
+    line_count = sum(item.count("\n") for item in data)
+    rss_loaded = _peakRssMb()
+    script = runner.create_script(script_name, settings, scripts_dir)
+    error = None
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    try:
+        script.execute(data)
+    except Exception as e:
+        error = type(e).__name__ + ": " + str(e)
+    seconds = time.perf_counter() - wall_start
+    cpu_seconds = time.process_time() - cpu_start
+    rss_peak = _peakRssMb()
+    return {
+        "case": label,
+        "corpus": os.path.basename(gcode_path),
+        "lines": line_count,
+        "seconds": round(seconds, 4),
+        "cpu_seconds": round(cpu_seconds, 4),
+        "lines_per_sec": round(line_count / seconds) if seconds > 0 else None,
+        "peak_rss_mb": rss_peak,
+        "rss_growth_mb": round(rss_peak - rss_loaded, 1) if rss_peak is not None and rss_loaded is not None else None,
+        "error": error,
+    }
+
+
+def run(corpus_names: List[str], case_filter: Optional[List[str]] = None, corpus_dir: Optional[str] = None, scripts_dir: str = runner.SCRIPTS_DIR) -> List[Dict[str, Any]]:
+    corpus_dir = corpus_dir or os.path.join(tempfile.gettempdir(), "gv_corpus")
+    cases = [case for case in BENCH_CASES if not case_filter or case[0] in case_filter or case[1] in case_filter]
+    results = []
+    context = multiprocessing.get_context("spawn")
+    for name in corpus_names:
+        gcode_path = corpus_file(name, corpus_dir)
+        profile = corpus_profile(corpus.CorpusSettings.named(name))
+        for label, script_name, settings in cases:
+            # A fresh process for every run keeps the peak memory numbers honest
+            with context.Pool(processes = 1, maxtasksperchild = 1) as pool:
+                result = pool.apply(_runCase, (label, script_name, settings, gcode_path, profile, scripts_dir))
+            result["corpus"] = name
+            results.append(result)
+            _printResult(result)
+    return results
+
+
+def _key(result: Dict[str, Any]) -> str:
+    return result["case"] + "|" + result["corpus"]
+
+
+def compare(results: List[Dict[str, Any]], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """List the runs that are slower or use more memory than the baseline by more than the tolerance."""
+    regressions = []
+    for result in results:
+        base = baseline.get(_key(result))
+        if not base or result["error"]:
+            continue
+        if base.get("lines_per_sec") and result["lines_per_sec"] and result["lines_per_sec"] < base["lines_per_sec"] * (1 - tolerance):
+            regressions.append(_key(result) + ": " + str(result["lines_per_sec"]) + " lines/sec (baseline " + str(base["lines_per_sec"]) + ")")
+        if base.get("peak_rss_mb") and result["peak_rss_mb"] and result["peak_rss_mb"] > base["peak_rss_mb"] * (1 + tolerance):
+            regressions.append(_key(result) + ": " + str(result["peak_rss_mb"]) + " MB peak RSS (baseline " + str(base["peak_rss_mb"]) + ")")
+    return regressions
+
+
+def _printResult(result: Dict[str, Any]) -> None:
+    if result["error"]:
+        print("%-40s %-14s ERROR %s" % (result["case"], result["corpus"], result["error"]), flush = True)
+        return
+    print("%-40s %-14s %10d lines %9.3fs %12s lines/s %8s MB" % (result["case"], result["corpus"], result["lines"], result["seconds"],
+                                                               result["lines_per_sec"], result["peak_rss_mb"]), flush = True)
+
+
+def main(argv = None) -> int:
+    parser = argparse.ArgumentParser(prog = "python -m headless.bench", description = "Time the GV scripts over the synthetic corpus.")
+    parser.add_argument("--corpus", default = ",".join(DEFAULT_CORPUS), help = "Comma separated corpus names, or 'all'.  Choices: " + ", ".join(corpus.CORPUS))
+    parser.add_argument("--scripts", help = "Comma separated script names or case labels.  Default is every case.")
+    parser.add_argument("--corpus-dir", help = "Where the corpus files are kept between runs.  Default is the temp folder.")
+    parser.add_argument("--baseline", default = BASELINE_FILE, help = "Baseline JSON file")
+    parser.add_argument("--save-baseline", action = "store_true", help = "Store these results as the new baseline")
+    parser.add_argument("--tolerance", type = float, default = 0.25, help = "Allowed slow-down/memory growth against the baseline (0.25 = 25%%)")
+    parser.add_argument("--json", help = "Also write the results to this file")
+    args = parser.parse_args(argv)
+
+    corpus_names = list(corpus.CORPUS) if args.corpus == "all" else [name.strip() for name in args.corpus.split(",") if name.strip()]
+    for name in corpus_names:
+        if name not in corpus.CORPUS:
+            parser.error("Unknown corpus '" + name + "'")
+    case_filter = [name.strip() for name in args.scripts.split(",")] if args.scripts else None
+    results = run(corpus_names, case_filter, args.corpus_dir)
+
+    if args.json:
+        with open(args.json, "w", encoding = "utf-8") as json_file:
+            json.dump(results, json_file, indent = 1)
+
+    baseline = {}
+    have_baseline = os.path.isfile(args.baseline)
+    if have_baseline:
+        with open(args.baseline, "r", encoding = "utf-8") as baseline_file:
+            baseline = json.load(baseline_file)
+    if args.save_baseline or not have_baseline:
+        for result in results:
+            if not result["error"]:
+                baseline[_key(result)] = {"lines_per_sec": result["lines_per_sec"], "peak_rss_mb": result["peak_rss_mb"], "seconds": result["seconds"]}
+        with open(args.baseline, "w", encoding = "utf-8") as baseline_file:
+            json.dump(baseline, baseline_file, indent = 1, sort_keys = True)
+        if not have_baseline and not args.save_baseline:
+            print("There was no baseline at " + args.baseline + ".  These results were saved as the baseline and nothing was compared.")
+        else:
+            print("Baseline saved to " + args.baseline)
+        return 0
+    regressions = compare(results, baseline, args.tolerance)
+    missing = [_key(result) for result in results if not result["error"] and _key(result) not in baseline]
+    if missing:
+        print("Not in the baseline (not compared): " + ", ".join(missing))
+    for regression in regressions:
+        print("REGRESSION " + regression)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,322 @@
+# Copyright (c) 2024 GregValiant
+#   Released under the terms of the AGPLv3 or higher.
+#
+#   Writes data[] as binary gcode (.bgcode, the block format of libbgcode that Prusa printers and PrusaConnect read).
+#   The file is a header and then blocks, each with a CRC32:
+#       file metadata       "Producer" from the ';Generated with' line of data[0]
+#       printer metadata    the printer, layer height, height, filament and time from the header (data[0])
+#       thumbnails          the '; thumbnail begin WxH' ... '; thumbnail end' pictures in data[0]
+#       print metadata      the filament and the time
+#       slicer metadata     every ';KEY:value' line of the header
+#       gcode               the gcode in blocks of up to 64K characters
+#   The gcode is MeatPack encoded (two characters in a byte for the digits, '.', 'G', 'X', 'E' and the new lines, and
+#   the spaces are left out of the G lines) and then compressed with heatshrink or deflate.  Comments are dropped
+#   unless the encoding is 'meatpack-comments' or 'none'.  The metadata is deflated and the thumbnails are not
+#   compressed.
+#   The items are read and written one block at a time so the gcode is never in memory twice.  With --stream the
+#   items come from the file the last pass wrote.
+#   Heatshrink uses the "heatshrink2" package when it is installed.  Without it a Python encoder is used, which gives
+#   a file the printer reads just the same but is slow on big files ("deflate" is much faster).
+
+import base64
+import os
+import re
+import struct
+import sys
+import tempfile
+import zlib
+from array import array
+from typing import Dict, Iterable, List, Optional, Tuple
+
+MAGIC = b"GCDE"
+VERSION = 1
+CHECKSUM_CRC32 = 1
+
+## Block types
+FILE_METADATA = 0
+GCODE = 1
+SLICER_METADATA = 2
+PRINTER_METADATA = 3
+PRINT_METADATA = 4
+THUMBNAIL = 5
+
+COMPRESSIONS = {"none": 0, "deflate": 1, "heatshrink11": 2, "heatshrink12": 3}
+ENCODINGS = {"none": 0, "meatpack": 1, "meatpack-comments": 2}
+THUMBNAIL_FORMATS = {"PNG": 0, "JPG": 1, "QOI": 2}
+## The most characters of gcode in one block
+GCODE_BLOCK_SIZE = 65535
+
+## MeatPack: the characters that fit in 4 bits.  With the spaces left out 'E' takes the place of the space.
+_MEATPACK_CHARS = "0123456789. \nGX"
+_MEATPACK_SIGNAL = b"\xff\xff"
+_MEATPACK_ENABLE_PACKING = 251
+_MEATPACK_ENABLE_NO_SPACES = 247
+
+_THUMBNAIL_BEGIN = re.compile(r"^; ?thumbnail(?:_(PNG|JPG|QOI))? begin (\d+)x(\d+)")
+_THUMBNAIL_END = re.compile(r"^; ?thumbnail(?:_(?:PNG|JPG|QOI))? end")
+_HEADER_SETTING = re.compile(r"^;([A-Za-z][^:;]*):(.*)$")
+
+
+def _duration(seconds: float) -> str:
+    ## The way PrusaSlicer writes a time: "1d 2h 3m 4s" without the leading zeros
+    seconds = int(round(seconds))
+    parts = []
+    for unit, size in (("d", 86400), ("h", 3600), ("m", 60)):
+        if seconds >= size or parts:
+            parts.append(str(seconds // size) + unit)
+            seconds %= size
+    parts.append(str(seconds) + "s")
+    return " ".join(parts)
+
+
+def read_header(header: str) -> Tuple[Dict[str, Dict[str, str]], List[Tuple[int, int, int, bytes]], str]:
+    """The metadata blocks and the thumbnails of data[0].  Returns ({block: {key: value}}, [(format, width, height, picture)], data[0] without the thumbnails)."""
+    settings = {}
+    thumbnails = []
+    kept = []
+    picture = None
+    for line in header.split("\n"):
+        if picture is not None:
+            if _THUMBNAIL_END.match(line):
+                thumbnails.append((picture[0], picture[1], picture[2], base64.b64decode("".join(picture[3]))))
+                picture = None
+            else:
+                picture[3].append(line.lstrip("; "))
+            continue
+        begin = _THUMBNAIL_BEGIN.match(line)
+        if begin:
+            picture = (THUMBNAIL_FORMATS[begin.group(1) or "PNG"], int(begin.group(2)), int(begin.group(3)), [])
+            continue
+        kept.append(line)
+        setting = _HEADER_SETTING.match(line)
+        if setting and not setting.group(1) in settings:
+            settings[setting.group(1)] = setting.group(2).strip()
+
+    printed = {}
+    if "Filament used" in settings:
+        lengths = []
+        for length in settings["Filament used"].split(","):
+            try:
+                lengths.append("{:.2f}".format(float(length.strip().rstrip("m")) * 1000))
+            except ValueError:
+                pass
+        if lengths:
+            printed["filament used [mm]"] = ", ".join(lengths)
+    if "TIME" in settings:
+        try:
+            printed["estimated printing time (normal mode)"] = _duration(float(settings["TIME"]))
+        except ValueError:
+            pass
+    printer = {}
+    for key, setting in (("printer_model", "TARGET_MACHINE.NAME"), ("layer_height", "Layer height"), ("max_layer_z", "MAXZ")):
+        if setting in settings:
+            printer[key] = settings[setting]
+    printer.update(printed)
+    file_info = {}
+    if "Generated with" in header:
+        for line in kept:
+            if line.startswith(";Generated with "):
+                file_info["Producer"] = line[len(";Generated with "):].strip()
+                break
+    blocks = {FILE_METADATA: file_info, PRINTER_METADATA: printer, PRINT_METADATA: printed, SLICER_METADATA: settings}
+    return blocks, thumbnails, "\n".join(kept)
+
+
+#----MeatPack----------------------------------------------------------------------------------------------------------
+def _meatpack_table() -> List[bytes]:
+    ## The packed bytes of every pair of characters.  The index is the pair read as a little endian 16 bit number.
+    codes = [15] * 256
+    for code, char in enumerate(_MEATPACK_CHARS):
+        codes[ord(char)] = code
+    codes[ord(" ")] = 15
+    codes[ord("E")] = _MEATPACK_CHARS.index(" ")
+    table = []
+    for pair in range(65536):
+        first = pair & 0xFF
+        second = pair >> 8
+        packed = bytes([codes[first] | (codes[second] << 4)])
+        if codes[first] == 15:
+            packed += bytes([first])
+        if codes[second] == 15:
+            packed += bytes([second])
+        table.append(packed)
+    return table
+
+
+class MeatPacker:
+    """MeatPack encoding of the lines of a gcode block.  Each block turns packing on itself so it can be read on its own."""
+
+    _table = None
+
+    def __init__(self, keep_comments: bool = False) -> None:
+        self.keep_comments = keep_comments
+        if MeatPacker._table is None:
+            MeatPacker._table = _meatpack_table()
+
+    def _line(self, line: str) -> str:
+        if not self.keep_comments:
+            line = line.split(";", 1)[0].rstrip()
+            if line == "":
+                return ""
+        # The spaces come out of the G lines.  Lines with a checksum are left alone or it wouldn't match.
+        if line[:1] == "G" and line[1:2].isdigit() and not "*" in line:
+            code, semicolon, comment = line.partition(";")
+            line = code.replace(" ", "") + semicolon + comment
+        # A new line has to be the second character of a pair or the first character of the next line is lost.
+        # An odd line gets an empty line after it.
+        length = len(line) if line.isascii() else len(line.encode("utf-8"))
+        return line + ("\n\n" if length % 2 == 0 else "\n")
+
+    def encode(self, lines: List[str]) -> bytes:
+        text = "".join([self._line(line) for line in lines]).encode("utf-8")
+        pairs = array("H", text)
+        if sys.byteorder == "big":
+            pairs.byteswap()
+        return (_MEATPACK_SIGNAL + bytes([_MEATPACK_ENABLE_PACKING]) + _MEATPACK_SIGNAL + bytes([_MEATPACK_ENABLE_NO_SPACES])
+                + b"".join(map(self._table.__getitem__, pairs)))
+
+
+#----Compression-------------------------------------------------------------------------------------------------------
+def _heatshrink2():
+    try:
+        import heatshrink2
+    except ImportError:
+        return None
+    return heatshrink2
+
+
+def heatshrink(data: bytes, window_bits: int, lookahead_bits: int = 4) -> bytes:
+    """Heatshrink (LZSS) compression with a window of 2^window_bits bytes and matches of up to 2^lookahead_bits bytes."""
+    module = _heatshrink2()
+    if module is not None:
+        return module.compress(data, window_sz2 = window_bits, lookahead_sz2 = lookahead_bits)
+    window = 1 << window_bits
+    longest = 1 << lookahead_bits
+    reference_bits = 1 + window_bits + lookahead_bits
+    out = bytearray()
+    bits = 0
+    bit_count = 0
+    pos = 0
+    size = len(data)
+    while pos < size:
+        # The longest earlier match (it can run on past 'pos').  Two bytes is the shortest that saves anything.
+        match_length = 0
+        match_start = -1
+        start = pos - window if pos > window else 0
+        limit = min(longest, size - pos)
+        length = 2
+        while length <= limit:
+            found = data.rfind(data[pos:pos + length], start, pos + length - 1)
+            if found < 0:
+                break
+            match_length = length
+            match_start = found
+            length += 1
+        if match_length:
+            bits = (bits << reference_bits) | ((pos - match_start - 1) << lookahead_bits) | (match_length - 1)
+            bit_count += reference_bits
+            pos += match_length
+        else:
+            bits = (bits << 9) | 0x100 | data[pos]
+            bit_count += 9
+            pos += 1
+        while bit_count >= 8:
+            bit_count -= 8
+            out.append((bits >> bit_count) & 0xFF)
+        bits &= (1 << bit_count) - 1
+    if bit_count:
+        out.append((bits << (8 - bit_count)) & 0xFF)
+    return bytes(out)
+
+
+def compress(data: bytes, compression: int) -> bytes:
+    if compression == 1:
+        return zlib.compress(data)
+    if compression == 2:
+        return heatshrink(data, 11)
+    if compression == 3:
+        return heatshrink(data, 12)
+    return data
+
+
+#----Writer------------------------------------------------------------------------------------------------------------
+class BgcodeWriter:
+    """Writes data[] (a list, or the GcodeFile of --stream) to a .bgcode file.
+
+    'compression' is for the gcode blocks and 'encoding' is one of ENCODINGS.  The metadata is always deflated.
+    """
+
+    def __init__(self, compression: str = "heatshrink12", encoding: str = "meatpack", block_size: int = GCODE_BLOCK_SIZE) -> None:
+        self.compression = COMPRESSIONS[compression]
+        self.encoding = ENCODINGS[encoding]
+        self.block_size = block_size
+        self._packer = MeatPacker(self.encoding == ENCODINGS["meatpack-comments"]) if self.encoding else None
+        self.blocks = 0
+
+    def _block(self, out_file, block_type: int, compression: int, parameters: bytes, payload: bytes) -> None:
+        compressed = compress(payload, compression)
+        if compression:
+            header = struct.pack("<HHII", block_type, compression, len(payload), len(compressed))
+        else:
+            header = struct.pack("<HHI", block_type, compression, len(payload))
+        checksum = zlib.crc32(compressed, zlib.crc32(parameters, zlib.crc32(header)))
+        out_file.write(header)
+        out_file.write(parameters)
+        out_file.write(compressed)
+        out_file.write(struct.pack("<I", checksum))
+        self.blocks += 1
+
+    def _metadata(self, out_file, block_type: int, values: Dict[str, str]) -> None:
+        ## INI encoded: key=value lines
+        text = "".join(key + "=" + value + "\n" for key, value in values.items())
+        self._block(out_file, block_type, COMPRESSIONS["deflate"], struct.pack("<H", 0), text.encode("utf-8"))
+
+    def _gcode(self, out_file, lines: List[str]) -> None:
+        if self._packer is not None:
+            payload = self._packer.encode(lines)
+        else:
+            payload = "".join(line + "\n" for line in lines).encode("utf-8")
+        self._block(out_file, GCODE, self.compression, struct.pack("<H", self.encoding), payload)
+
+    def write_file(self, out_file, items: Iterable[str]) -> None:
+        out_file.write(MAGIC + struct.pack("<IH", VERSION, CHECKSUM_CRC32))
+        lines = []
+        size = 0
+        partial = ""
+        for num, item in enumerate(items):
+            if num == 0:
+                blocks, thumbnails, item = read_header(item)
+                if blocks[FILE_METADATA]:
+                    self._metadata(out_file, FILE_METADATA, blocks[FILE_METADATA])
+                self._metadata(out_file, PRINTER_METADATA, blocks[PRINTER_METADATA])
+                for picture_format, width, height, picture in thumbnails:
+                    self._block(out_file, THUMBNAIL, 0, struct.pack("<HHH", picture_format, width, height), picture)
+                self._metadata(out_file, PRINT_METADATA, blocks[PRINT_METADATA])
+                self._metadata(out_file, SLICER_METADATA, blocks[SLICER_METADATA])
+            item_lines = (partial + item).split("\n")
+            # The last piece is the start of a line that goes on in the next item ("" when the item ends with a new line)
+            partial = item_lines.pop()
+            for line in item_lines:
+                if size + len(line) + 1 > self.block_size and lines:
+                    self._gcode(out_file, lines)
+                    lines = []
+                    size = 0
+                lines.append(line)
+                size += len(line) + 1
+        if partial:
+            lines.append(partial)
+        if lines:
+            self._gcode(out_file, lines)
+
+    def write(self, path: str, items: Iterable[str]) -> None:
+        """Write to a temporary file in the same folder and rename it (like runner.write_atomic)."""
+        folder = os.path.dirname(os.path.realpath(path))
+        handle, temp_path = tempfile.mkstemp(prefix = ".", suffix = ".tmp", dir = folder)
+        try:
+            with os.fdopen(handle, "wb") as out_file:
+                self.write_file(out_file, items)
+            os.replace(temp_path, path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
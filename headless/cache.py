@@ -0,0 +1,190 @@
+# Copyright (c) 2024 GregValiant
+#   Released under the terms of the AGPLv3 or higher.
+#
+#   Disk cache for the result of each pass over data[].  Running the same file through the same scripts again (a print
+#   farm re-queueing a job, a watch folder seeing the same file twice) returns the stored output instead of running them.
+#   The key is a hash of:
+#       the data[] items the pass starts with (their text and where each one starts and ends)
+#       the name and the setting values of every script in the pass
+#       the printer profile and print information the stand-ins hand to the scripts
+#       the source of the script files and of GcodeTools_GV
+#   An entry is <key>.gcode (the items one after the other) and <key>.json (the item offsets and the source hashes).
+#   The cache is kept under 'max_mb' by removing the entries that were used longest ago.  Entries made with a script
+#   file that has changed since are removed as well.
+
+import hashlib
+import json
+import os
+import tempfile
+import time
+from array import array
+from typing import Any, Dict, Iterable, List, Optional
+
+from . import _stand_ins
+from .stream import GcodeFile, write_items
+
+DEFAULT_CACHE_MB = 1024
+## Scripts that put the time of day in the gcode.  Their output is never the same twice so it is not cached.
+CLOCK_SCRIPTS = ("AddCuraSettings_GV",)
+
+
+def default_cache_dir() -> str:
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "gv-headless")
+
+
+class ResultCache:
+    """A size limited folder of pass results.  get() and put() are used by runner._run_cached()."""
+
+    def __init__(self, cache_dir: str = None, max_mb: float = DEFAULT_CACHE_MB) -> None:
+        self.cache_dir = cache_dir if cache_dir else default_cache_dir()
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self._source_hashes = {}    # type: Dict[str, tuple]
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(self.cache_dir, exist_ok = True)
+
+    def source_hash(self, path: str) -> str:
+        """sha256 of a script file.  Only read again when the file's size or time stamp changes."""
+        stat = os.stat(path)
+        known = self._source_hashes.get(path)
+        if known is not None and known[0] == (stat.st_size, stat.st_mtime_ns):
+            return known[1]
+        with open(path, "rb") as source_file:
+            digest = hashlib.sha256(source_file.read()).hexdigest()
+        self._source_hashes[path] = ((stat.st_size, stat.st_mtime_ns), digest)
+        return digest
+
+    def recipe(self, scripts: List[tuple], helper_paths: List[str]) -> Dict[str, Any]:
+        """What a pass does: the (name, script, source path) of each script, with its setting values, and the source hashes."""
+        entries = []
+        sources = {}
+        for script_name, script, source_path in scripts:
+            settings = {}
+            for setting_key in script.getSettingData().get("settings", {}):
+                settings[setting_key] = script.getSettingValueByKey(setting_key)
+            entries.append({"script": script_name, "settings": settings})
+            sources[source_path] = self.source_hash(source_path)
+        for helper_path in helper_paths:
+            sources[helper_path] = self.source_hash(helper_path)
+        return {"scripts": entries, "sources": sources}
+
+    @staticmethod
+    def machine_state() -> Dict[str, Any]:
+        ## Everything the scripts can read from the stand-in Application
+        app = _stand_ins.Application.getInstance()
+        info = app.getPrintInformation()
+        return {
+            "profile": app._profile,
+            "print_information": [info.jobName, int(info.currentPrintTime), info.materialLengths, info.materialWeights, info.materialCosts, info.materialNames],
+        }
+
+    def key(self, items: Iterable[str], recipe: Dict[str, Any], machine: Dict[str, Any]) -> str:
+        key_hash = hashlib.sha256()
+        key_hash.update(json.dumps([recipe, machine], sort_keys = True, default = str).encode("utf-8"))
+        for item in items:
+            item = item.encode("utf-8")
+            key_hash.update(len(item).to_bytes(8, "little"))
+            key_hash.update(item)
+        return key_hash.hexdigest()
+
+    def _paths(self, key: str) -> tuple:
+        return os.path.join(self.cache_dir, key + ".gcode"), os.path.join(self.cache_dir, key + ".json")
+
+    def get(self, key: str) -> Optional[GcodeFile]:
+        """The stored result as a GcodeFile, or None.  The caller closes it."""
+        gcode_path, meta_path = self._paths(key)
+        try:
+            with open(meta_path, "r", encoding = "utf-8") as meta_file:
+                meta = json.load(meta_file)
+            result = GcodeFile(gcode_path, array("q", meta["bounds"]))
+        except (OSError, ValueError, KeyError):
+            self.misses += 1
+            return None
+        if len(result._bounds) < 2 or result._bounds[-1] != result._size:
+            result.close()
+            self.misses += 1
+            return None
+        # The time stamp of the .json is the last time the entry was used
+        os.utime(meta_path)
+        self.hits += 1
+        return result
+
+    def put(self, key: str, items: Iterable[str], recipe: Dict[str, Any]) -> None:
+        """Store the result of a pass.  The .json is written last so an entry without one is never read."""
+        gcode_path, meta_path = self._paths(key)
+        temp_paths = []
+        try:
+            handle, temp_path = tempfile.mkstemp(prefix = ".", suffix = ".tmp", dir = self.cache_dir)
+            os.close(handle)
+            temp_paths.append(temp_path)
+            bounds = write_items(temp_path, items)
+            os.replace(temp_paths.pop(), gcode_path)
+            handle, temp_path = tempfile.mkstemp(prefix = ".", suffix = ".tmp", dir = self.cache_dir)
+            temp_paths.append(temp_path)
+            with os.fdopen(handle, "w", encoding = "utf-8") as meta_file:
+                json.dump({"scripts": [entry["script"] for entry in recipe["scripts"]], "sources": recipe["sources"],
+                           "created": time.time(), "bounds": bounds.tolist()}, meta_file)
+            os.replace(temp_paths.pop(), meta_path)
+        finally:
+            for temp_path in temp_paths:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+        self.evict()
+
+    def evict(self) -> None:
+        """Remove the entries made with a script file that has changed, then the oldest ones until the cache fits."""
+        entries = []
+        total = 0
+        for file_name in os.listdir(self.cache_dir):
+            if not file_name.endswith(".json"):
+                continue
+            key = file_name[:-len(".json")]
+            gcode_path, meta_path = self._paths(key)
+            try:
+                with open(meta_path, "r", encoding = "utf-8") as meta_file:
+                    sources = json.load(meta_file).get("sources", {})
+                used = os.stat(meta_path).st_mtime
+                size = os.path.getsize(gcode_path) + os.path.getsize(meta_path)
+            except (OSError, ValueError):
+                self._remove(key)
+                continue
+            if self._stale(sources):
+                self._remove(key)
+                continue
+            entries.append((used, size, key))
+            total += size
+        entries.sort()
+        for used, size, key in entries:
+            if total <= self.max_bytes:
+                break
+            self._remove(key)
+            total -= size
+
+    def _stale(self, sources: Dict[str, str]) -> bool:
+        for source_path, digest in sources.items():
+            try:
+                if self.source_hash(source_path) != digest:
+                    return True
+            except OSError:
+                # The script is gone (or the cache is shared with another install).  Leave it to the size limit.
+                continue
+        return False
+
+    def _remove(self, key: str) -> None:
+        ## The .json goes first so a half removed entry is never read
+        for path in reversed(self._paths(key)):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def clear(self) -> None:
+        for file_name in os.listdir(self.cache_dir):
+            if file_name.endswith(".json"):
+                self._remove(file_name[:-len(".json")])
+            elif file_name.endswith(".gcode") or file_name.endswith(".tmp"):
+                try:
+                    os.remove(os.path.join(self.cache_dir, file_name))
+                except OSError:
+                    pass
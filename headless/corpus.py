@@ -0,0 +1,361 @@
+# Copyright (c) 2024 GregValiant
+#   Released under the terms of the AGPLv3 or higher.
+#
+#   Synthetic Cura-style gcode for testing and benchmarking the GV scripts.
+#   The output follows the layout of the data[] list that Cura hands to the scripts:
+#       header, startup (ending with ;LAYER_COUNT:), one item per layer (;LAYER: ... ;TIME_ELAPSED:), ending gcode.
+#   Each layer has ;MESH:, ;TYPE: blocks (skirt, walls, skin, fill, support, prime tower), bridges, combing
+#   travels, retractions and fan/temperature lines.  Optional features: raft layers (;LAYER:-N), tool changes
+#   (T0..Tn) and One-at-a-Time model sequences (;LAYER:0 again for every model, with the model-to-model travel
+#   in its own data[] item the way Cura does it).
+#   The same settings always produce the same gcode (the random generator is seeded).
+#
+#   python -m headless.corpus out.gcode --layers 5000 --extruders 2 --raft 3
+#   python -m headless.corpus --sizes
+
+import argparse
+import math
+import random
+import sys
+from typing import Any, Dict, Iterator, List
+
+## The standard corpus.  "lines_per_layer" is approximate.  The last entry is several GB when written out.
+CORPUS = {
+    "small": {"layers": 100, "lines_per_layer": 400},
+    "medium": {"layers": 1000, "lines_per_layer": 600},
+    "raft_multi": {"layers": 1000, "lines_per_layer": 600, "raft_layers": 3, "extruders": 2},
+    "one_at_a_time": {"layers": 1200, "lines_per_layer": 400, "models": 4},
+    "tall": {"layers": 5000, "lines_per_layer": 400},
+    "huge": {"layers": 50000, "lines_per_layer": 2000},
+}
+
+class CorpusSettings:
+    """The knobs of one synthetic print."""
+
+    def __init__(self, layers: int = 100, lines_per_layer: int = 400, raft_layers: int = 0, extruders: int = 1, models: int = 1,
+                 relative_extrusion: bool = False, support: bool = True, bridges: bool = True, seed: int = 1) -> None:
+        self.layers = max(int(layers), 1)
+        self.lines_per_layer = max(int(lines_per_layer), 40)
+        self.raft_layers = max(int(raft_layers), 0)
+        self.extruders = max(int(extruders), 1)
+        self.models = max(int(models), 1)
+        self.relative_extrusion = bool(relative_extrusion)
+        self.support = bool(support)
+        self.bridges = bool(bridges)
+        self.seed = int(seed)
+        self.layer_height = 0.2
+        self.layer_height_0 = 0.3
+        self.retract_dist = 6.5
+        self.print_temp = 205
+        self.bed_temp = 60
+
+    @classmethod
+    def named(cls, name: str, **overrides) -> "CorpusSettings":
+        settings = dict(CORPUS[name])
+        settings.update(overrides)
+        return cls(**settings)
+
+
+class _Writer:
+    """Turns moves into gcode lines and keeps track of E, the position and the elapsed time."""
+
+    def __init__(self, settings: CorpusSettings) -> None:
+        self.settings = settings
+        # The startup gcode ends with a retraction
+        self.e = 0.0 if settings.relative_extrusion else -settings.retract_dist
+        self.x = 0.0
+        self.y = 0.0
+        self.z = 0.0
+        self.feedrate = 0
+        self.elapsed = 0.0
+        self.retracted = True
+        self.filament_used = 0.0
+        self.e_per_mm = 0.4 * 0.2 / (math.pi * (1.75 / 2) ** 2)
+
+    @staticmethod
+    def num(value: float) -> str:
+        # Cura writes up to 3 decimals for XYZ and drops the trailing zeros
+        text = "%.3f" % value
+        text = text.rstrip("0").rstrip(".")
+        return "0" if text in ("-0", "") else text
+
+    def travel(self, lines: List[str], x: float, y: float, feedrate: int = 7200) -> None:
+        f_word = "" if feedrate == self.feedrate else " F" + str(feedrate)
+        lines.append("G0" + f_word + " X" + self.num(x) + " Y" + self.num(y))
+        self.elapsed += math.hypot(x - self.x, y - self.y) / (feedrate / 60)
+        self.feedrate = feedrate
+        self.x, self.y = x, y
+
+    def extrude(self, lines: List[str], x: float, y: float, feedrate: int) -> None:
+        if self.retracted:
+            self.unretract(lines)
+        distance = math.hypot(x - self.x, y - self.y)
+        e_amount = distance * self.e_per_mm
+        self.filament_used += e_amount
+        f_word = "" if feedrate == self.feedrate else " F" + str(feedrate)
+        if self.settings.relative_extrusion:
+            e_word = "%.5f" % e_amount
+        else:
+            self.e += e_amount
+            e_word = "%.5f" % self.e
+        lines.append("G1" + f_word + " X" + self.num(x) + " Y" + self.num(y) + " E" + e_word)
+        self.elapsed += distance / (feedrate / 60)
+        self.feedrate = feedrate
+        self.x, self.y = x, y
+
+    def retract(self, lines: List[str]) -> None:
+        if self.retracted:
+            return
+        dist = self.settings.retract_dist
+        if self.settings.relative_extrusion:
+            lines.append("G1 F2700 E-" + "%.5f" % dist)
+        else:
+            self.e -= dist
+            lines.append("G1 F2700 E" + "%.5f" % self.e)
+        self.feedrate = 2700
+        self.retracted = True
+        self.elapsed += 0.25
+
+    def unretract(self, lines: List[str]) -> None:
+        dist = self.settings.retract_dist
+        if self.settings.relative_extrusion:
+            lines.append("G1 F2700 E" + "%.5f" % dist)
+        else:
+            self.e += dist
+            lines.append("G1 F2700 E" + "%.5f" % self.e)
+        self.feedrate = 2700
+        self.retracted = False
+        self.elapsed += 0.25
+
+    def move_z(self, lines: List[str], z: float, feedrate: int = 600) -> None:
+        lines.append("G0 F" + str(feedrate) + " Z" + self.num(z))
+        self.elapsed += abs(z - self.z) / (feedrate / 60)
+        self.feedrate = feedrate
+        self.z = z
+
+
+def _header(settings: CorpusSettings, writer: _Writer, total_layers: int) -> str:
+    max_z = settings.layer_height_0 + settings.layer_height * (settings.layers - 1)
+    header = ";FLAVOR:Marlin\n"
+    header += ";TIME:" + str(int(writer.elapsed)) + "\n"
+    header += ";Filament used: " + ", ".join(["%.5fm" % (writer.filament_used / 1000 / settings.extruders)] * settings.extruders) + "\n"
+    header += ";Layer height: " + str(settings.layer_height) + "\n"
+    header += ";MINX:20.5\n;MINY:20.5\n;MINZ:" + str(settings.layer_height_0) + "\n"
+    header += ";MAXX:" + str(20.5 + 60 * settings.models) + "\n;MAXY:120.5\n;MAXZ:" + str(round(max_z, 3)) + "\n"
+    header += ";TARGET_MACHINE.NAME:Synthetic Printer\n"
+    return header
+
+
+def _startup(settings: CorpusSettings, total_layers: int) -> str:
+    lines = [";Generated with Cura_SteamEngine 5.7.0", "T0", "M82 ;absolute extrusion mode",
+             "M140 S" + str(settings.bed_temp), "M105", "M190 S" + str(settings.bed_temp),
+             "M104 S" + str(settings.print_temp), "M105", "M109 S" + str(settings.print_temp), "M82 ;absolute extrusion mode",
+             "G28 ;Home", "G92 E0", "G1 Z2.0 F3000", "G1 X0.1 Y20 Z0.3 F5000.0", "G1 X0.1 Y200.0 Z0.3 F1500.0 E15",
+             "G92 E0", "G1 F2700 E-" + str(settings.retract_dist)]
+    if settings.relative_extrusion:
+        lines += ["M83 ;relative extrusion mode", "G92 E0"]
+    lines += ["M107", ";LAYER_COUNT:" + str(total_layers)]
+    return "\n".join(lines) + "\n"
+
+
+def _ending(settings: CorpusSettings) -> str:
+    lines = ["G1 F2700 E-2", "M140 S0", "M107", "G91 ;Relative positioning", "G1 E-2 F2700", "G1 E-2 Z0.2 F2400",
+             "G1 X5 Y5 F3000", "G1 Z10", "G90 ;Absolute positioning", "G1 X0 Y220", "M106 S0", "M104 S0", "M140 S0", "M84 X Y E",
+             "M82 ;absolute extrusion mode", "M104 S0", ";End of Gcode"]
+    return "\n".join(lines) + "\n"
+
+
+def _polygon(cx: float, cy: float, radius: float, segments: int, start_angle: float) -> List[tuple]:
+    return [(cx + radius * math.cos(start_angle + 2 * math.pi * num / segments), cy + radius * math.sin(start_angle + 2 * math.pi * num / segments))
+            for num in range(1, segments + 1)]
+
+
+def _layer(settings: CorpusSettings, writer: _Writer, rng: random.Random, layer_nr: int, z: float, cx: float, cy: float,
+           model_name: str, is_raft: bool, tool: int, new_tool: int, fan_speed: int) -> str:
+    lines = [";LAYER:" + str(layer_nr)]
+    budget = settings.lines_per_layer
+    if fan_speed is not None:
+        lines.append("M106 S" + str(fan_speed) if fan_speed > 0 else "M107")
+    if is_raft:
+        lines.append(";MESH:NONMESH")
+    else:
+        lines.append(";MESH:" + model_name)
+    writer.retract(lines)
+    writer.move_z(lines, round(z, 3))
+    writer.travel(lines, cx + 20, cy)
+
+    # Skirt/brim on the first printed layer and raft layers are all "support" type
+    if is_raft:
+        lines.append(";TYPE:SUPPORT")
+        feature_plan = [("SUPPORT", budget - 10)]
+    else:
+        feature_plan = []
+        if layer_nr == 0:
+            feature_plan.append(("SKIRT", max(budget // 10, 8)))
+        wall_segments = max(budget // 6, 12)
+        feature_plan += [("WALL-INNER", wall_segments), ("WALL-OUTER", wall_segments)]
+        if settings.support and layer_nr % 7 in (3, 4):
+            feature_plan.append(("SUPPORT", budget // 10))
+            feature_plan.append(("SUPPORT-INTERFACE", budget // 20))
+        if settings.extruders > 1:
+            feature_plan.append(("PRIME-TOWER", budget // 20))
+        used = sum(count for _, count in feature_plan)
+        remaining = max(budget - used - 15, 10)
+        if layer_nr < 4 or layer_nr % 10 in (0, 1):
+            feature_plan.append(("SKIN", remaining))
+        else:
+            feature_plan.append(("SKIN", remaining // 4))
+            feature_plan.append(("FILL", remaining - remaining // 4))
+
+    for feature, count in feature_plan:
+        count = max(count, 4)
+        if new_tool is not None and feature == "FILL":
+            _tool_change(settings, writer, lines, tool, new_tool)
+            new_tool = None
+        if feature != "SUPPORT" or not is_raft:
+            lines.append(";TYPE:" + feature)
+        if feature == "SKIN" and settings.bridges and layer_nr > 5 and layer_nr % 25 == 0:
+            lines.append(";BRIDGE")
+        if feature in ("SKIRT", "WALL-INNER", "WALL-OUTER"):
+            radius = {"SKIRT": 28.0, "WALL-INNER": 19.2, "WALL-OUTER": 19.6}[feature]
+            points = _polygon(cx, cy, radius, count, rng.random() * 2 * math.pi)
+            writer.travel(lines, points[-1][0], points[-1][1])
+            for x, y in points:
+                writer.extrude(lines, x, y, 1800 if feature == "WALL-OUTER" else 2400)
+        else:
+            # Zig-zag lines for skin, infill, support and the prime tower
+            width = {"PRIME-TOWER": 8.0, "SUPPORT": 12.0, "SUPPORT-INTERFACE": 12.0}.get(feature, 34.0)
+            ox = cx - width / 2 if feature not in ("PRIME-TOWER",) else cx + 30
+            oy = cy - width / 2
+            step = width / max(count // 2, 1)
+            feedrate = 3000 if feature == "FILL" else 1800
+            writer.retract(lines)
+            # A combing travel is a run of short G0 moves
+            for hop in range(rng.randint(2, 9)):
+                writer.travel(lines, ox + hop * 0.8, oy + hop * 0.5)
+            for num in range(count // 2):
+                y = oy + num * step
+                writer.extrude(lines, ox + (width if num % 2 == 0 else 0), y, feedrate)
+                writer.extrude(lines, ox + (width if num % 2 == 0 else 0), y + step, feedrate)
+        if feature in ("SUPPORT", "SUPPORT-INTERFACE", "FILL"):
+            writer.retract(lines)
+            lines.append(";MESH:NONMESH")
+            writer.travel(lines, cx + rng.uniform(-15, 15), cy + rng.uniform(-15, 15))
+            lines.append(";MESH:" + model_name if not is_raft else ";MESH:NONMESH")
+    if new_tool is not None:
+        _tool_change(settings, writer, lines, tool, new_tool)
+    writer.retract(lines)
+    writer.elapsed += 1.5
+    lines.append(";TIME_ELAPSED:" + "%.6f" % writer.elapsed)
+    return "\n".join(lines) + "\n"
+
+
+def _tool_change(settings: CorpusSettings, writer: _Writer, lines: List[str], tool: int, new_tool: int) -> None:
+    writer.retract(lines)
+    lines.append("T" + str(new_tool))
+    lines.append("M104 T" + str(tool) + " S" + str(settings.print_temp - 30))
+    lines.append("M109 S" + str(settings.print_temp))
+    lines.append("G92 E0")
+    writer.e = 0.0
+    writer.elapsed += 20.0
+
+
+def generate(settings: CorpusSettings) -> Iterator[str]:
+    """Yield the data[] items one at a time so a multi-GB corpus never has to be in memory."""
+    rng = random.Random(settings.seed)
+    writer = _Writer(settings)
+    layers_per_model = max(settings.layers // settings.models, 1)
+    total_layers = layers_per_model * settings.models + settings.raft_layers
+    # The header holds the totals, so the print is laid out once with a throw-away writer to get them.
+    # That is the same work as the real pass, but nothing is kept.
+    header_writer = _Writer(settings)
+    for _ in _body(settings, header_writer, random.Random(settings.seed), layers_per_model):
+        pass
+    yield _header(settings, header_writer, total_layers)
+    yield _startup(settings, total_layers)
+    for item in _body(settings, writer, rng, layers_per_model):
+        yield item
+    yield _ending(settings)
+
+
+def _body(settings: CorpusSettings, writer: _Writer, rng: random.Random, layers_per_model: int) -> Iterator[str]:
+    tool = 0
+    for model in range(settings.models):
+        cx = 50.0 + 60 * model
+        cy = 70.0
+        model_name = "model_" + str(model + 1) + ".stl"
+        if model > 0:
+            # One-at-a-Time: Cura puts the move to the next model in its own data[] item
+            lines = []
+            writer.retract(lines)
+            writer.move_z(lines, round(writer.z + 5, 3))
+            writer.travel(lines, cx + 20, cy)
+            yield "\n".join(lines) + "\n"
+        raft_layers = settings.raft_layers if model == 0 else 0
+        z = 0.0
+        for raft_nr in range(raft_layers):
+            z += 0.3 if raft_nr == 0 else 0.25
+            yield _layer(settings, writer, rng, raft_nr - raft_layers, z, cx, cy, model_name, True, tool, None, None if raft_nr else 0)
+        for layer_nr in range(layers_per_model):
+            z += settings.layer_height_0 if layer_nr == 0 else settings.layer_height
+            if layer_nr == 0:
+                fan_speed = 0
+            elif layer_nr == 1:
+                fan_speed = 255
+            else:
+                fan_speed = None
+            # Multi-extruder prints switch tools part way through every other layer, before the infill
+            new_tool = (tool + 1) % settings.extruders if settings.extruders > 1 and layer_nr % 2 == 1 else None
+            yield _layer(settings, writer, rng, layer_nr, z, cx, cy, model_name, False, tool, new_tool, fan_speed)
+            if new_tool is not None:
+                tool = new_tool
+
+
+def generate_data(settings: CorpusSettings) -> List[str]:
+    """The whole data[] list in memory.  Use write_gcode() for the big sizes."""
+    return list(generate(settings))
+
+
+def write_gcode(path: str, settings: CorpusSettings) -> Dict[str, Any]:
+    items = 0
+    size = 0
+    with open(path, "w", encoding = "utf-8", newline = "") as gcode_file:
+        for item in generate(settings):
+            gcode_file.write(item)
+            items += 1
+            size += len(item)
+    return {"path": path, "items": items, "bytes": size}
+
+
+def main(argv = None) -> int:
+    parser = argparse.ArgumentParser(prog = "python -m headless.corpus", description = "Write synthetic Cura-style gcode.")
+    parser.add_argument("output", nargs = "?", help = "The .gcode file to write")
+    parser.add_argument("--preset", choices = sorted(CORPUS), help = "Start from one of the standard corpus entries")
+    parser.add_argument("--layers", type = int)
+    parser.add_argument("--lines-per-layer", type = int)
+    parser.add_argument("--raft", type = int, dest = "raft_layers")
+    parser.add_argument("--extruders", type = int)
+    parser.add_argument("--models", type = int, help = "More than 1 gives a One-at-a-Time print")
+    parser.add_argument("--relative", action = "store_true", dest = "relative_extrusion")
+    parser.add_argument("--seed", type = int)
+    parser.add_argument("--sizes", action = "store_true", help = "List the standard corpus")
+    args = parser.parse_args(argv)
+
+    if args.sizes:
+        for name, entry in CORPUS.items():
+            print(name, entry)
+        return 0
+    if not args.output:
+        parser.error("An output file is required")
+    options = dict(CORPUS[args.preset]) if args.preset else {}
+    for key in ("layers", "lines_per_layer", "raft_layers", "extruders", "models", "seed"):
+        if getattr(args, key) is not None:
+            options[key] = getattr(args, key)
+    if args.relative_extrusion:
+        options["relative_extrusion"] = True
+    print(write_gcode(args.output, CorpusSettings(**options)))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
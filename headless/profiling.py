@@ -0,0 +1,112 @@
+# Copyright (c) 2024 GregValiant
+#   Released under the terms of the AGPLv3 or higher.
+#
+#   Opt-in instrumentation for the scripts ("python -m headless ... --profile").
+#   Every pass (one script, or a --fused group) is timed, and its memory, the data[] items it changed ("layers touched"),
+#   the lines it read ("lines scanned") and its calls to the "re" module are counted.  The results go into the header as a ";  [Profile]" line, next to
+#   the ";  [Script] did not run..." notices the scripts write, and to the log.
+#   The peak memory comes from tracemalloc, which slows line-by-line scripts down a lot, so it is only measured when it
+#   is asked for ("--trace-memory").  The times in those runs are only good for comparing the scripts with each other.
+
+import re
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Tuple
+
+## The functions of the re module that are counted.  Calls on compiled patterns can't be counted.
+_REGEX_FUNCTIONS = ("compile", "search", "match", "fullmatch", "sub", "subn", "split", "findall", "finditer")
+
+
+class _CountingData:
+    """Stands in for data[] while a script runs and counts what the script reads and changes."""
+
+    def __init__(self, data) -> None:
+        self.data = data
+        self.lines_scanned = 0
+        self.changed = set()
+
+    def _read(self, item: Any) -> Any:
+        if isinstance(item, str):
+            self.lines_scanned += item.count("\n")
+        return item
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    def __iter__(self):
+        for item in self.data:
+            yield self._read(item)
+
+    def __contains__(self, item: Any) -> bool:
+        return item in self.data
+
+    def __getitem__(self, num):
+        if isinstance(num, slice):
+            return [self._read(item) for item in self.data[num]]
+        return self._read(self.data[num])
+
+    def __setitem__(self, num, value) -> None:
+        self.data[num] = value
+        if isinstance(num, int):
+            self.changed.add(num % len(self.data))
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.data, name)
+
+
+def _countRegexCalls(counter: List[int]) -> Dict[str, Callable]:
+    ## Swap the re functions for counting ones.  Returns the originals for _restoreRegex()
+    originals = {name: getattr(re, name) for name in _REGEX_FUNCTIONS}
+    for name, function in originals.items():
+        def counting(*args, _function = function, **kwargs):
+            counter[0] += 1
+            return _function(*args, **kwargs)
+        setattr(re, name, counting)
+    return originals
+
+
+def _restoreRegex(originals: Dict[str, Callable]) -> None:
+    for name, function in originals.items():
+        setattr(re, name, function)
+
+
+def measure(name: str, run_pass: Callable, data, trace_memory: bool = False) -> Tuple[Any, Dict[str, Any]]:
+    """Run 'run_pass(data)' and return its result and the numbers."""
+    counting_data = _CountingData(data)
+    regex_calls = [0]
+    started_tracing = trace_memory and not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start()
+    elif trace_memory:
+        tracemalloc.reset_peak()
+    memory_before = tracemalloc.get_traced_memory()[0] if trace_memory else 0
+    originals = _countRegexCalls(regex_calls)
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    try:
+        result = run_pass(counting_data)
+    finally:
+        wall_seconds = time.perf_counter() - wall_start
+        cpu_seconds = time.process_time() - cpu_start
+        _restoreRegex(originals)
+        peak_memory = tracemalloc.get_traced_memory()[1] - memory_before if trace_memory else None
+        if started_tracing:
+            tracemalloc.stop()
+    if result is counting_data:
+        result = data
+    return result, {
+        "script": name,
+        "wall_seconds": round(wall_seconds, 3),
+        "cpu_seconds": round(cpu_seconds, 3),
+        "peak_mb": round(max(peak_memory, 0) / (1024 * 1024), 1) if peak_memory is not None else None,
+        "layers_touched": len(counting_data.changed),
+        "items": len(data),
+        "lines_scanned": counting_data.lines_scanned,
+        "regex_calls": regex_calls[0],
+    }
+
+
+def header_line(numbers: Dict[str, Any]) -> str:
+    peak = "  peak {peak_mb}MB".format(**numbers) if numbers["peak_mb"] is not None else ""
+    return (";  [Profile] {script}  wall {wall_seconds}s  cpu {cpu_seconds}s" + peak + "  layers touched {layers_touched} of {items}"
+            "  lines scanned {lines_scanned}  regex calls {regex_calls}\n").format(**numbers)
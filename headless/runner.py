@@ -0,0 +1,436 @@
+# Copyright (c) 2024 GregValiant
+#   Released under the terms of the AGPLv3 or higher.
+#
+#   Runs the GV post-processing scripts on a .gcode file without Cura.
+#   The file is split into the same data[] list that Cura hands to execute():
+#       data[0]  the header (;FLAVOR, ;TIME, ;MINX...)
+#       data[1]  the startup gcode down to ;LAYER_COUNT:
+#       data[2]...data[-2]  one item per ;LAYER: ending with its ;TIME_ELAPSED: line
+#       data[-1] the ending gcode
+#   The scripts are loaded from the "scripts" folder as a package whose parent is this package, so their
+#   "from ..Script import Script" picks up the headless Script class.
+
+import configparser
+import functools
+import importlib
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import types
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from . import _stand_ins, profiling
+from .bgcode import BgcodeWriter
+from .cache import CLOCK_SCRIPTS, DEFAULT_CACHE_MB, ResultCache, default_cache_dir
+from .stream import DEFAULT_LOOKBACK, GcodeFile, StreamData, StreamingError, write_items
+
+SCRIPTS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), "scripts")
+_PACKAGE = __package__ + ".gv_scripts"
+## Modules in the scripts folder that the scripts import by their bare name (Cura registers every file in the folder)
+HELPER_MODULES = ["GcodeTools_GV"]
+
+
+def split_gcode(gcode: str) -> List[str]:
+    """Split the text of a gcode file into Cura's data[] list."""
+    lines = io.StringIO(gcode, newline = "\n").readlines()
+    data = []
+    num = 0
+    line_count = len(lines)
+
+    # The header is the block of comments at the top of the file.  Cura puts the ";Generated with" line in the startup.
+    while num < line_count and lines[num].startswith(";") and not lines[num].startswith(";Generated with"):
+        num += 1
+        if lines[num - 1].startswith(";END_OF_HEADER"):
+            break
+    data.append("".join(lines[0:num]))
+
+    # The startup gcode runs to the first layer
+    start = num
+    while num < line_count and not lines[num].startswith(";LAYER:"):
+        num += 1
+    data.append("".join(lines[start:num]))
+
+    # Layers.  Each one starts with ";LAYER:" and ends with its ";TIME_ELAPSED:" line.  Anything between that and the
+    # next ";LAYER:" (the move to the next model in a One-at-a-Time print) is an item of its own, as it is in Cura.
+    layer_starts = [index for index in range(num, line_count) if lines[index].startswith(";LAYER:")]
+    layer_starts.append(line_count)
+    for index in range(len(layer_starts) - 1):
+        layer_start = layer_starts[index]
+        next_start = layer_starts[index + 1]
+        layer_end = next_start
+        for line_index in range(next_start - 1, layer_start, -1):
+            if lines[line_index].startswith(";TIME_ELAPSED:"):
+                layer_end = line_index + 1
+                break
+        data.append("".join(lines[layer_start:layer_end]))
+        if layer_end < next_start:
+            data.append("".join(lines[layer_end:next_start]))
+
+    # Everything after the last layer is the ending gcode
+    if len(layer_starts) == 1 or data[-1].startswith(";LAYER:"):
+        data.append("")
+    return data
+
+
+def join_gcode(data: List[str]) -> str:
+    return "".join(data)
+
+
+def _scriptsPackage(scripts_dir: str) -> types.ModuleType:
+    # A package named "headless.gv_scripts" that points at the scripts folder.  One package per folder.
+    package = sys.modules.get(_PACKAGE)
+    if package is not None and package.__path__ == [scripts_dir]:
+        return package
+    for module_name in [name for name in sys.modules if name.startswith(_PACKAGE + ".")]:
+        del sys.modules[module_name]
+    package = types.ModuleType(_PACKAGE)
+    package.__path__ = [scripts_dir]
+    package.__package__ = _PACKAGE
+    sys.modules[_PACKAGE] = package
+    return package
+
+
+def load_helpers(scripts_dir: str = SCRIPTS_DIR) -> None:
+    """Import the helper modules of the scripts folder (GcodeTools_GV) and register them under their bare names."""
+    scripts_dir = os.path.realpath(scripts_dir)
+    _scriptsPackage(scripts_dir)
+    for helper_name in HELPER_MODULES:
+        if os.path.isfile(os.path.join(scripts_dir, helper_name + ".py")):
+            sys.modules[helper_name] = importlib.import_module(_PACKAGE + "." + helper_name)
+    # Out of Cura map_layers() may fork a worker for each core
+    if "GcodeTools_GV" in sys.modules:
+        sys.modules["GcodeTools_GV"].PARALLEL_WORKERS = 0
+
+
+def load_script(script_name: str, scripts_dir: str = SCRIPTS_DIR):
+    """Import scripts/<script_name>.py and return the script class of the same name."""
+    scripts_dir = os.path.realpath(scripts_dir)
+    if not os.path.isfile(os.path.join(scripts_dir, script_name + ".py")):
+        raise FileNotFoundError("There is no script named '" + script_name + "' in " + scripts_dir)
+    load_helpers(scripts_dir)
+    module = importlib.import_module(_PACKAGE + "." + script_name)
+    # Cura registers every script module under its bare name as well
+    sys.modules[script_name] = module
+    script_class = getattr(module, script_name, None)
+    if script_class is None:
+        raise AttributeError("The file " + script_name + ".py does not contain a script class named '" + script_name + "'")
+    return script_class
+
+
+def create_script(script_name: str, settings: Optional[Dict[str, Any]] = None, scripts_dir: str = SCRIPTS_DIR):
+    """Create the script, initialize() it and then apply the settings, in the same order Cura uses."""
+    script = load_script(script_name, scripts_dir)()
+    script.initialize()
+    for setting_key, setting_value in (settings or {}).items():
+        script._instance.setProperty(setting_key, "value", setting_value)
+    return script
+
+
+def parse_cura_script_list(scripts_list: str) -> List[Tuple[str, Dict[str, str]]]:
+    """Read the "post_processing_scripts" metadata string that Cura stores in the printer profile."""
+    chain = []
+    if not scripts_list:
+        return chain
+    for script_str in scripts_list.split("\n"):
+        if not script_str.strip():
+            continue
+        script_str = script_str.replace(r"\\\n", "\n").replace(r"\\\\", "\\\\")
+        script_parser = configparser.ConfigParser(interpolation = None)
+        script_parser.optionxform = str
+        script_parser.read_string(script_str)
+        for script_name, settings in script_parser.items():
+            if script_name == "DEFAULT":
+                continue
+            chain.append((script_name, dict(settings.items())))
+    return chain
+
+
+def load_settings(path: Optional[str]) -> Dict[str, Any]:
+    if not path:
+        return {}
+    with open(path, "r", encoding = "utf-8") as settings_file:
+        return json.load(settings_file)
+
+
+def load_chain(path: str) -> List[Tuple[str, Dict[str, Any]]]:
+    """A chain file is a JSON list of {"script": "PauseAtLayer_GV", "settings": {...} or "settings.json"}."""
+    with open(path, "r", encoding = "utf-8") as chain_file:
+        entries = json.load(chain_file)
+    chain = []
+    base_dir = os.path.dirname(os.path.realpath(path))
+    for entry in entries:
+        settings = entry.get("settings", {})
+        if isinstance(settings, str):
+            settings = load_settings(os.path.join(base_dir, settings))
+        chain.append((entry["script"], settings))
+    return chain
+
+
+def setup(profile: Optional[Dict[str, Any]] = None):
+    """Install the UM/cura stand-ins for this printer profile.  Must be called before any script is loaded."""
+    return _stand_ins.install(profile)
+
+
+def run_scripts(data: List[str], chain: List[Tuple[str, Dict[str, Any]]], scripts_dir: str = SCRIPTS_DIR, fused: bool = False,
+                instrument: bool = False, trace_memory: bool = False, cache: ResultCache = None) -> List[str]:
+    """Run each (script name, settings) in order the way Cura's PostProcessingPlugin does.
+
+    With 'fused' the scripts next to each other in the chain that have layer hooks (getLayerHooks()) share one pass
+    over data[] instead of each splitting and joining every layer.  The output is the same.
+    With 'instrument' a ";  [Profile]" line for each pass is added to data[0] (see profiling.py).  'trace_memory' adds
+    the peak memory to it.
+    With a 'cache' (see cache.py) a pass that was run before on the same data[] with the same settings is read back
+    from the cache instead.
+    """
+    if ";POSTPROCESSED\n" in data[0]:
+        return data
+    for run_pass in _passes(chain, scripts_dir, fused, instrument, trace_memory, cache):
+        data = run_pass(data)
+    data[0] += ";POSTPROCESSED\n"
+    return data
+
+
+def _passes(chain: List[Tuple[str, Dict[str, Any]]], scripts_dir: str, fused: bool, instrument: bool = False, trace_memory: bool = False,
+            cache: ResultCache = None) -> Iterator[Callable[[List[str]], List[str]]]:
+    """The passes over data[] for the chain.  One per script, or one per group of scripts that share a pass."""
+    # The profile lines have the times in them so an instrumented run is never cached
+    if cache is not None and not (instrument or trace_memory):
+        for run_pass in _passes(chain, scripts_dir, fused):
+            yield functools.partial(_run_cached, run_pass = run_pass, cache = cache)
+        return
+    if instrument or trace_memory:
+        for run_pass in _passes(chain, scripts_dir, fused):
+            yield functools.partial(_run_profiled, run_pass = run_pass, trace_memory = trace_memory)
+        return
+    if not fused:
+        for script_name, settings in chain:
+            yield functools.partial(_run_script, script_name = script_name, script = create_script(script_name, settings, scripts_dir))
+        return
+    group = []
+    for script_name, settings in chain:
+        script = create_script(script_name, settings, scripts_dir)
+        hooks = _layer_hooks(script_name, script)
+        if hooks is not None and (not group or _helpers().can_share_pass([hook for entry in group for hook in entry[2]], hooks)):
+            group.append((script_name, script, hooks))
+            continue
+        if group:
+            yield functools.partial(_run_group, group = group)
+        group = []
+        if hooks is not None:
+            group.append((script_name, script, hooks))
+        else:
+            yield functools.partial(_run_script, script_name = script_name, script = script)
+    if group:
+        yield functools.partial(_run_group, group = group)
+
+
+def _pass_scripts(run_pass: functools.partial) -> List[tuple]:
+    ## The (script name, script) of each script in a pass
+    if "group" in run_pass.keywords:
+        return [(entry[0], entry[1]) for entry in run_pass.keywords["group"]]
+    return [(run_pass.keywords["script_name"], run_pass.keywords["script"])]
+
+
+def _run_profiled(data: List[str], run_pass: functools.partial, trace_memory: bool) -> List[str]:
+    name = " + ".join(script_name for script_name, script in _pass_scripts(run_pass))
+    data, numbers = profiling.measure(name, run_pass, data, trace_memory)
+    data[0] += profiling.header_line(numbers)
+    _stand_ins.Logger.log("i", "Profile: %s", profiling.header_line(numbers)[len(";  [Profile] "):].rstrip())
+    return data
+
+
+def _run_cached(data: List[str], run_pass: functools.partial, cache: ResultCache) -> List[str]:
+    scripts = _pass_scripts(run_pass)
+    if any(script_name in CLOCK_SCRIPTS for script_name, script in scripts):
+        return run_pass(data)
+    helper_paths = [sys.modules[helper_name].__file__ for helper_name in HELPER_MODULES if helper_name in sys.modules]
+    recipe = cache.recipe([(script_name, script, sys.modules[type(script).__module__].__file__) for script_name, script in scripts], helper_paths)
+    key = cache.key(data, recipe, cache.machine_state())
+    name = " + ".join(script_name for script_name, script in scripts)
+    cached = cache.get(key)
+    if cached is not None:
+        _stand_ins.Logger.log("i", "Cache: %s read from the cache", name)
+        try:
+            if isinstance(data, list) or len(cached) != len(data):
+                return list(cached)
+            # Streamed.  The items go through data[] so they are written out a few layers at a time.
+            for num in range(len(cached)):
+                data[num] = cached[num]
+            return data
+        finally:
+            cached.close()
+    result = run_pass(data)
+    # A streamed pass that failed in a script with a bare "except:" is not stored
+    if getattr(data, "error", None) is None:
+        cache.put(key, result, recipe)
+    return result
+
+
+def _run_script(data: List[str], script_name: str, script) -> List[str]:
+    try:
+        result = script.execute(data)
+    except StreamingError:
+        raise
+    except Exception:
+        _stand_ins.Logger.logException("e", "Exception in post-processing script %s", script_name)
+        return data
+    if result is not None:
+        data = result
+    return data
+
+
+def _layer_hooks(script_name: str, script) -> Optional[list]:
+    get_hooks = getattr(script, "getLayerHooks", None)
+    if get_hooks is None:
+        return None
+    try:
+        return get_hooks()
+    except Exception:
+        _stand_ins.Logger.logException("w", "Could not get the layer hooks of %s.  It will run on its own.", script_name)
+        return None
+
+
+def _run_group(data: List[str], group: list) -> List[str]:
+    """One pass over data[] for a group of scripts.  If any of them fails they are run one at a time instead."""
+    if len(group) == 1:
+        return _run_script(data, group[0][0], group[0][1])
+    # A streamed data[] can't be put back the way it was
+    saved_data = list(data) if isinstance(data, list) else None
+    try:
+        return _helpers().run_layer_hooks(data, [hook for entry in group for hook in entry[2]])
+    except Exception as e:
+        if saved_data is None:
+            raise StreamingError("The shared pass for " + ", ".join(entry[0] for entry in group) + " failed.  Run them without --fused.") from e
+        _stand_ins.Logger.logException("w", "The shared pass for %s failed.  Running them one at a time.", ", ".join(entry[0] for entry in group))
+    data = saved_data
+    for script_name, script, hooks in group:
+        data = _run_script(data, script_name, script)
+    return data
+
+
+def _helpers() -> types.ModuleType:
+    # The helper module is registered by load_script()
+    return sys.modules["GcodeTools_GV"]
+
+
+def write_atomic(path: str, text: str) -> None:
+    """Write to a temporary file in the same folder and rename it, so nobody can pick up a half written file."""
+    folder = os.path.dirname(os.path.realpath(path))
+    handle, temp_path = tempfile.mkstemp(prefix = ".", suffix = ".tmp", dir = folder)
+    try:
+        with os.fdopen(handle, "w", encoding = "utf-8", newline = "") as temp_file:
+            temp_file.write(text)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def process_file(input_path: str, output_path: str, chain: List[Tuple[str, Dict[str, Any]]], scripts_dir: str = SCRIPTS_DIR, fused: bool = False,
+                 stream: bool = False, lookback: int = DEFAULT_LOOKBACK, instrument: bool = False,
+                 trace_memory: bool = False, cache: ResultCache = None, bgcode: BgcodeWriter = None) -> Dict[str, Any]:
+    """Read a gcode file, run the chain of scripts on it and write the result.  Returns some timing numbers.
+
+    With 'stream' the file is never read into memory as a whole.  See stream.py.
+    With a 'cache' the passes that were run before come from the cache.  See cache.py.
+    With a 'bgcode' writer the result is written as binary gcode.  See bgcode.py.
+    """
+    if stream:
+        return _process_file_streaming(input_path, output_path, chain, scripts_dir, fused, lookback, instrument, trace_memory, cache, bgcode)
+    start_time = time.perf_counter()
+    with open(input_path, "r", encoding = "utf-8", newline = "") as gcode_file:
+        gcode = gcode_file.read()
+    data = split_gcode(gcode)
+    del gcode
+    read_time = time.perf_counter()
+    app = _stand_ins.Application.getInstance()
+    app.setPrintInformationFromHeader(data[0], os.path.splitext(os.path.basename(input_path))[0])
+    data = run_scripts(data, chain, scripts_dir, fused, instrument, trace_memory, cache)
+    run_time = time.perf_counter()
+    if bgcode is not None:
+        bgcode.write(output_path, data)
+    else:
+        write_atomic(output_path, join_gcode(data))
+    end_time = time.perf_counter()
+    return {
+        "input": input_path,
+        "output": output_path,
+        "layers": max(len(data) - 3, 0),
+        "read_seconds": round(read_time - start_time, 4),
+        "script_seconds": round(run_time - read_time, 4),
+        "write_seconds": round(end_time - run_time, 4),
+        "total_seconds": round(end_time - start_time, 4),
+    }
+
+
+def _process_file_streaming(input_path: str, output_path: str, chain: List[Tuple[str, Dict[str, Any]]], scripts_dir: str, fused: bool, lookback: int,
+                            instrument: bool, trace_memory: bool, cache: ResultCache = None, bgcode: BgcodeWriter = None) -> Dict[str, Any]:
+    # Every pass reads the file the last pass wrote.  The last one is renamed to the output file.
+    start_time = time.perf_counter()
+    folder = os.path.dirname(os.path.realpath(output_path))
+    source = GcodeFile(input_path)
+    read_time = time.perf_counter()
+    temp_paths = []
+    try:
+        app = _stand_ins.Application.getInstance()
+        app.setPrintInformationFromHeader(source[0], os.path.splitext(os.path.basename(input_path))[0])
+        if ";POSTPROCESSED\n" in source[0]:
+            passes = []
+        else:
+            passes = list(_passes(chain, scripts_dir, fused, instrument, trace_memory, cache)) or [lambda data: data]
+        for pass_nr, run_pass in enumerate(passes):
+            data = StreamData(source, lookback, folder)
+            result = run_pass(data)
+            if data.error is not None:
+                data.discard()
+                raise StreamingError(data.error)
+            if pass_nr == len(passes) - 1:
+                result[0] += ";POSTPROCESSED\n"
+            handle, temp_path = tempfile.mkstemp(prefix = ".", suffix = ".tmp", dir = folder)
+            os.close(handle)
+            temp_paths.append(temp_path)
+            if result is data:
+                bounds = data.save(temp_path)
+            else:
+                # The script made a new list.  It is already in memory so it is written as it is.
+                data.discard()
+                bounds = write_items(temp_path, result)
+                del result
+            source.close()
+            source = GcodeFile(temp_path, bounds)
+            if len(temp_paths) > 1:
+                os.remove(temp_paths.pop(0))
+        layers = max(len(source) - 3, 0)
+        run_time = time.perf_counter()
+        if bgcode is not None:
+            # Encoded a block at a time from the file the last pass wrote
+            bgcode.write(output_path, source)
+        source.close()
+        if bgcode is None and temp_paths:
+            os.replace(temp_paths.pop(), output_path)
+        elif bgcode is None:
+            handle, temp_path = tempfile.mkstemp(prefix = ".", suffix = ".tmp", dir = folder)
+            os.close(handle)
+            temp_paths.append(temp_path)
+            shutil.copyfile(input_path, temp_path)
+            os.replace(temp_paths.pop(), output_path)
+    finally:
+        source.close()
+        for temp_path in temp_paths:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+    end_time = time.perf_counter()
+    return {
+        "input": input_path,
+        "output": output_path,
+        "layers": layers,
+        "read_seconds": round(read_time - start_time, 4),
+        "script_seconds": round(run_time - read_time, 4),
+        "write_seconds": round(end_time - run_time, 4),
+        "total_seconds": round(end_time - start_time, 4),
+    }
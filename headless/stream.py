@@ -0,0 +1,253 @@
+# Copyright (c) 2024 GregValiant
+#   Released under the terms of the AGPLv3 or higher.
+#
+#   Streaming (file backed) data[] for gcode files that are too big to hold in memory.
+#   GcodeFile only keeps the offsets of the data[] items.  An item is read from the file when a script asks for it.
+#   StreamData is the data[] a script gets in streaming mode.  The header, the startup and the ending gcode (data[0],
+#   data[1] and data[-1]) are kept in memory.  The layers that were changed are kept until the script has moved
+#   'lookback' items past them, and then they are written to the output.  A layer that was written out can still be
+#   read (PauseAtLayer and MultiExtColorMix look back for the last position) but it can't be changed again.
+#   Scripts that go back and change layers they already left behind, or that add or remove items, raise
+#   StreamingError and have to be run without --stream.
+
+import os
+import shutil
+import tempfile
+from array import array
+from collections.abc import Sequence
+from typing import Dict, List, Union
+
+DEFAULT_LOOKBACK = 4
+
+
+class StreamingError(Exception):
+    """The script did something that can't be done while streaming."""
+    pass
+
+
+class GcodeFile(Sequence):
+    """The data[] items of a gcode file, read from the file when they are asked for.  Split like runner.split_gcode."""
+
+    def __init__(self, path: str, bounds: array = None) -> None:
+        """'bounds' are the item offsets from StreamData.save().  The items of a file written by an earlier pass have
+        to stay the same (a script may have put gcode lines in the header) so that file isn't split again."""
+        self.path = path
+        self._file = open(path, "rb")
+        self._size = os.fstat(self._file.fileno()).st_size
+        self._bounds = bounds if bounds is not None else self._findItems()
+
+    def _findItems(self) -> array:
+        gcode_file = self._file
+        size = self._size
+        bounds = array("q", [0])
+
+        # The header is the block of comments at the top of the file.  Cura puts the ";Generated with" line in the startup.
+        gcode_file.seek(0)
+        pos = 0
+        line = gcode_file.readline()
+        while line.startswith(b";") and not line.startswith(b";Generated with"):
+            pos += len(line)
+            if line.startswith(b";END_OF_HEADER"):
+                break
+            line = gcode_file.readline()
+        bounds.append(pos)
+
+        # Find the layer lines and the ;TIME_ELAPSED: lines a block at a time
+        layer_starts = array("q")
+        time_lines = array("q")
+        gcode_file.seek(pos)
+        if gcode_file.read(7) == b";LAYER:":
+            layer_starts.append(pos)
+        self._scan(pos, (b"\n;LAYER:", b"\n;TIME_ELAPSED:"), (layer_starts, time_lines))
+
+        # The startup gcode runs to the first layer
+        layer_starts.append(size)
+        bounds.append(layer_starts[0])
+
+        # Layers, and the move to the next model after a layer in a One-at-a-Time print
+        last_was_layer = False
+        time_nr = 0
+        for layer_nr in range(len(layer_starts) - 1):
+            layer_start = layer_starts[layer_nr]
+            next_start = layer_starts[layer_nr + 1]
+            layer_end = next_start
+            time_line = -1
+            while time_nr < len(time_lines) and time_lines[time_nr] < next_start:
+                if time_lines[time_nr] > layer_start:
+                    time_line = time_lines[time_nr]
+                time_nr += 1
+            if time_line != -1:
+                layer_end = self._lineEnd(time_line, next_start)
+            bounds.append(layer_end)
+            last_was_layer = True
+            if layer_end < next_start:
+                bounds.append(next_start)
+                last_was_layer = False
+
+        # Everything after the last layer is the ending gcode
+        if len(bounds) == 3 or last_was_layer:
+            bounds.append(size)
+        return bounds
+
+    def _scan(self, pos: int, patterns: tuple, found: tuple, block_size: int = 1 << 20) -> None:
+        ## Add the start of the line after the "\n" of every match to 'found'
+        gcode_file = self._file
+        gcode_file.seek(pos)
+        overlap = max(len(pattern) for pattern in patterns) - 1
+        tail = b""
+        last = [-1] * len(patterns)
+        while True:
+            block = gcode_file.read(block_size)
+            if not block:
+                break
+            buffer = tail + block
+            base = pos - len(tail)
+            for pattern_nr, pattern in enumerate(patterns):
+                index = buffer.find(pattern)
+                while index != -1:
+                    line_start = base + index + 1
+                    if line_start > last[pattern_nr]:
+                        found[pattern_nr].append(line_start)
+                        last[pattern_nr] = line_start
+                    index = buffer.find(pattern, index + 1)
+            pos += len(block)
+            tail = buffer[-overlap:]
+
+    def _lineEnd(self, line_start: int, limit: int) -> int:
+        self._file.seek(line_start)
+        pos = line_start
+        while pos < limit:
+            block = self._file.read(min(256, limit - pos))
+            line_end = block.find(b"\n")
+            if line_end != -1:
+                return pos + line_end + 1
+            pos += len(block)
+        return limit
+
+    def __len__(self) -> int:
+        return len(self._bounds) - 1
+
+    def raw(self, num: int) -> bytes:
+        self._file.seek(self._bounds[num])
+        return self._file.read(self._bounds[num + 1] - self._bounds[num])
+
+    def __getitem__(self, num: Union[int, slice]) -> Union[str, List[str]]:
+        if isinstance(num, slice):
+            return [self[index] for index in range(*num.indices(len(self)))]
+        if num < 0:
+            num += len(self)
+        if not 0 <= num < len(self):
+            raise IndexError("data index out of range")
+        return self.raw(num).decode("utf-8")
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class StreamData(Sequence):
+    """The data[] for one pass over a GcodeFile.  save() writes the result."""
+
+    def __init__(self, source: GcodeFile, lookback: int = DEFAULT_LOOKBACK, temp_dir: str = None) -> None:
+        self._source = source
+        self._lookback = max(int(lookback), 1)
+        self._count = len(source)
+        self._pinned = {}   # type: Dict[int, str]
+        for num in (0, 1, self._count - 1):
+            self._pinned[num] = source[num]
+        self._changed = {}  # type: Dict[int, str]
+        ## Layers before 'sealed' are in the body file
+        self._sealed = 2
+        self._body = tempfile.TemporaryFile(dir = temp_dir)
+        self._body_bounds = array("q", [0])
+        ## A script with a bare "except:" can swallow the StreamingError so the runner checks this after the pass
+        self.error = None
+
+    def __len__(self) -> int:
+        return self._count
+
+    def _index(self, num: int) -> int:
+        if num < 0:
+            num += self._count
+        if not 0 <= num < self._count:
+            raise IndexError("data index out of range")
+        return num
+
+    def __getitem__(self, num: Union[int, slice]) -> Union[str, List[str]]:
+        if isinstance(num, slice):
+            return [self[index] for index in range(*num.indices(self._count))]
+        num = self._index(num)
+        if num in self._pinned:
+            return self._pinned[num]
+        if num in self._changed:
+            return self._changed[num]
+        if num < self._sealed:
+            start = self._body_bounds[num - 2]
+            self._body.seek(start)
+            text = self._body.read(self._body_bounds[num - 1] - start).decode("utf-8")
+            self._body.seek(0, os.SEEK_END)
+            return text
+        return self._source[num]
+
+    def __setitem__(self, num: int, text: str) -> None:
+        if isinstance(num, slice):
+            self._fail("A script replaced a range of data[] items.  It can't be run with --stream.")
+        num = self._index(num)
+        if num in self._pinned:
+            self._pinned[num] = text
+            return
+        if num < self._sealed:
+            self._fail("A script changed data[" + str(num) + "] after it had moved more than " + str(self._lookback) +
+                       " items past it.  Run it without --stream or with a bigger --lookback.")
+        self._changed[num] = text
+        self._seal(num - self._lookback)
+
+    def _seal(self, end: int) -> None:
+        ## Write the layers before 'end' to the body file
+        end = min(end, self._count - 1)
+        for num in range(self._sealed, end):
+            if num in self._changed:
+                self._body.write(self._changed.pop(num).encode("utf-8"))
+            else:
+                self._body.write(self._source.raw(num))
+            self._body_bounds.append(self._body.tell())
+        self._sealed = max(self._sealed, end)
+
+    def _fail(self, message: str) -> None:
+        if self.error is None:
+            self.error = message
+        raise StreamingError(message)
+
+    def _notSupported(self, *args, **kwargs) -> None:
+        self._fail("A script added or removed data[] items.  It can't be run with --stream.")
+
+    insert = append = extend = pop = remove = reverse = sort = clear = __delitem__ = _notSupported
+
+    def save(self, path: str) -> array:
+        """Write the whole data[] to 'path' and close the body file.  Returns the offsets of the items in the file."""
+        self._seal(self._count - 1)
+        self._body.seek(0)
+        bounds = array("q", [0])
+        with open(path, "wb") as out_file:
+            out_file.write(self._pinned[0].encode("utf-8"))
+            bounds.append(out_file.tell())
+            out_file.write(self._pinned[1].encode("utf-8"))
+            body_start = out_file.tell()
+            shutil.copyfileobj(self._body, out_file)
+            bounds.extend(body_start + offset for offset in self._body_bounds)
+            out_file.write(self._pinned[self._count - 1].encode("utf-8"))
+            bounds.append(out_file.tell())
+        self._body.close()
+        return bounds
+
+    def discard(self) -> None:
+        self._body.close()
+
+
+def write_items(path: str, items: List[str]) -> array:
+    """Write a data[] list to 'path'.  Returns the offsets of the items in the file like StreamData.save()."""
+    bounds = array("q", [0])
+    with open(path, "wb") as out_file:
+        for item in items:
+            out_file.write(item.encode("utf-8"))
+            bounds.append(out_file.tell())
+    return bounds
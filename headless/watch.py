@@ -0,0 +1,252 @@
+# Copyright (c) 2024 GregValiant
+#   Released under the terms of the AGPLv3 or higher.
+#
+#   Watch folder for a print farm.  The slicers save into a shared folder and every new .gcode file that shows up is
+#   run through a chain of GV scripts (the same headless path as "python -m headless") and written to the output folder.
+#       python -m headless.watch incoming processed -p printer.json --chain farm_chain.json --workers 4
+#       python -m headless.watch incoming processed -p printer.json -s PauseAtLayer_GV=pause.json --done-dir originals
+#       python -m headless.watch incoming processed -p printer.json --cura-chain --once
+#   - A file is only read once it has stayed the same size for "--settle" seconds (network shares write in pieces).
+#   - Up to "--workers" files are run at once, each in its own process.  A file that is waiting doesn't hold a worker.
+#   - The output is written to a temporary file and renamed so the printers never pick up half a file.
+#   - A file is run again when it changes.  After a restart the files that have an output newer than they are are
+#     left alone.  With "--done-dir" the files are moved there when they are done.
+#   - Every file gets a line in the log ("--log", gv-watch.log in the output folder) with the times from the runner,
+#     how long it waited for a worker, and the error if it failed.
+#   Ctrl-C (or SIGTERM) stops it after the files that are running are finished.
+
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import signal
+import sys
+import time
+import traceback
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from typing import Any, Dict, List, Tuple
+
+from . import runner
+from .bgcode import BgcodeWriter
+
+DEFAULT_INTERVAL = 2.0
+DEFAULT_SETTLE = 3.0
+LOG_NAME = "gv-watch.log"
+GCODE_EXTENSIONS = (".gcode", ".gco", ".g")
+
+
+def _init_worker(scripts_dir: str, workers: int) -> None:
+    # The farm already keeps every core busy so the scripts don't start processes of their own (map_layers)
+    runner.setup({})
+    runner.load_helpers(scripts_dir)
+    if workers > 1:
+        sys.modules["GcodeTools_GV"].PARALLEL_WORKERS = 1
+
+
+def _run_file(input_path: str, output_path: str, chain: List[Tuple[str, Dict[str, Any]]], profile: Dict[str, Any],
+              options: Dict[str, Any]) -> Dict[str, Any]:
+    # Runs in a worker.  A new Application for every file so the print information of one file isn't kept for the next.
+    started = time.time()
+    runner.setup(profile)
+    cache = None
+    if options["cache"]:
+        cache = runner.ResultCache(options["cache_dir"], options["cache_size"])
+    bgcode = BgcodeWriter() if options["binary"] else None
+    try:
+        result = runner.process_file(input_path, output_path, chain, options["scripts_dir"], options["fused"], options["stream"],
+                                     options["lookback"], cache = cache, bgcode = bgcode)
+        result["status"] = "ok"
+    except Exception as e:
+        result = {"input": input_path, "output": output_path, "status": "error", "error": type(e).__name__ + ": " + str(e),
+                  "traceback": traceback.format_exc()}
+    result["started"] = started
+    result["worker"] = os.getpid()
+    return result
+
+
+class FolderWatcher:
+    """Runs the chain on the gcode files that show up in 'input_dir' with a pool of 'workers' processes.
+
+    'options' are the runner options (see _run_file): scripts_dir, fused, stream, lookback, cache, cache_dir,
+    cache_size and binary.
+    """
+
+    def __init__(self, input_dir: str, output_dir: str, chain: List[Tuple[str, Dict[str, Any]]], profile: Dict[str, Any],
+                 options: Dict[str, Any], workers: int = None, interval: float = DEFAULT_INTERVAL, settle: float = DEFAULT_SETTLE,
+                 log_path: str = None, done_dir: str = None) -> None:
+        self.input_dir = os.path.realpath(input_dir)
+        self.output_dir = os.path.realpath(output_dir)
+        self.chain = chain
+        self.profile = profile
+        self.options = options
+        self.workers = max(int(workers or os.cpu_count() or 1), 1)
+        self.interval = interval
+        self.settle = settle
+        self.log_path = log_path or os.path.join(self.output_dir, LOG_NAME)
+        self.done_dir = os.path.realpath(done_dir) if done_dir else None
+        self.stopping = False
+        self._seen = {}     # type: Dict[str, Tuple[tuple, float]]   path: (size and time stamp, when it was first seen like that)
+        self._done = {}     # type: Dict[str, tuple]                 path: the size and time stamp it was run with
+        self._running = {}  # type: Dict[Future, Tuple[str, tuple, float]]
+        for folder in (self.output_dir, self.done_dir):
+            if folder:
+                os.makedirs(folder, exist_ok = True)
+
+    def output_path(self, input_path: str) -> str:
+        name = os.path.splitext(os.path.basename(input_path))[0]
+        return os.path.join(self.output_dir, name + (".bgcode" if self.options["binary"] else ".gcode"))
+
+    def scan(self) -> List[Tuple[str, tuple]]:
+        """The files that are ready to run, oldest first: not being written, not running and not done."""
+        now = time.time()
+        running = set(path for path, signature, queued in self._running.values())
+        ready = []
+        present = set()
+        for entry in os.scandir(self.input_dir):
+            name = entry.name
+            if name.startswith(".") or not name.lower().endswith(GCODE_EXTENSIONS) or not entry.is_file():
+                continue
+            path = entry.path
+            present.add(path)
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            signature = (stat.st_size, stat.st_mtime_ns)
+            seen = self._seen.get(path)
+            if seen is None or seen[0] != signature:
+                self._seen[path] = (signature, now)
+                continue
+            if now - seen[1] < self.settle or path in running or self._done.get(path) == signature:
+                continue
+            try:
+                if os.stat(self.output_path(path)).st_mtime_ns >= stat.st_mtime_ns:
+                    # Done before a restart
+                    self._done[path] = signature
+                    continue
+            except OSError:
+                pass
+            ready.append((stat.st_mtime_ns, path, signature))
+        # Forget the files that are gone
+        for path in [path for path in self._seen if not path in present]:
+            del self._seen[path]
+            self._done.pop(path, None)
+        return [(path, signature) for mtime, path, signature in sorted(ready)]
+
+    def _log(self, result: Dict[str, Any]) -> None:
+        with open(self.log_path, "a", encoding = "utf-8") as log_file:
+            log_file.write(json.dumps(result) + "\n")
+        if result["status"] == "ok":
+            logging.info("%s -> %s  %.2fs (waited %.2fs)", os.path.basename(result["input"]), os.path.basename(result["output"]),
+                         result["total_seconds"], result["waited_seconds"])
+        else:
+            logging.error("%s failed: %s", os.path.basename(result["input"]), result["error"])
+
+    def _finished(self, future: Future) -> bool:
+        path, signature, queued = self._running.pop(future)
+        try:
+            result = future.result()
+        except Exception as e:
+            # The worker died (out of memory, killed)
+            result = {"input": path, "output": self.output_path(path), "status": "error", "error": type(e).__name__ + ": " + str(e), "started": queued}
+        result["waited_seconds"] = round(max(result.pop("started") - queued, 0.0), 4)
+        self._done[path] = signature
+        if result["status"] == "ok" and self.done_dir:
+            try:
+                os.replace(path, os.path.join(self.done_dir, os.path.basename(path)))
+            except OSError as e:
+                result["move_error"] = str(e)
+        self._log(result)
+        return result["status"] == "ok"
+
+    def run(self, once: bool = False) -> int:
+        """Watch until stopped (or, with 'once', until the files that are there now are done).  Returns the number of files that failed."""
+        failed = 0
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers = self.workers, mp_context = context, initializer = _init_worker,
+                                 initargs = (self.options["scripts_dir"], self.workers)) as executor:
+            while not self.stopping:
+                ready = self.scan()
+                for path, signature in ready[:self.workers - len(self._running)]:
+                    future = executor.submit(_run_file, path, self.output_path(path), self.chain, self.profile, self.options)
+                    self._running[future] = (path, signature, time.time())
+                if once and not ready and not self._running and all(path in self._done for path in self._seen):
+                    break
+                if self._running:
+                    finished, _ = wait(list(self._running), timeout = self.interval, return_when = FIRST_COMPLETED)
+                else:
+                    finished = []
+                    time.sleep(self.interval)
+                for future in finished:
+                    if not self._finished(future):
+                        failed += 1
+            # Let the files that are running finish
+            wait(list(self._running))
+            for future in list(self._running):
+                if not self._finished(future):
+                    failed += 1
+        return failed
+
+    def stop(self, *args) -> None:
+        self.stopping = True
+
+
+def main(argv = None) -> int:
+    parser = argparse.ArgumentParser(prog = "python -m headless.watch", description = "Run GV post-processing scripts on every gcode file that is saved into a folder.")
+    parser.add_argument("input_dir", help = "The folder to watch")
+    parser.add_argument("output_dir", help = "Where the processed files are written")
+    parser.add_argument("-p", "--profile", help = "Printer profile JSON with the machine and extruder settings")
+    parser.add_argument("-s", "--script", action = "append", default = [], metavar = "NAME[=SETTINGS.json]", help = "A script to run, with an optional settings file")
+    parser.add_argument("--chain", help = "JSON list of {\"script\": name, \"settings\": {...}} to run in order")
+    parser.add_argument("--cura-chain", action = "store_true", help = "Run the scripts saved in the profile's post_processing_scripts metadata")
+    parser.add_argument("--workers", type = int, default = None, help = "How many files are run at once (default one per core)")
+    parser.add_argument("--interval", type = float, default = DEFAULT_INTERVAL, help = "Seconds between looks at the folder (default %(default)s)")
+    parser.add_argument("--settle", type = float, default = DEFAULT_SETTLE, help = "A file has to stay the same for this many seconds before it is read (default %(default)s)")
+    parser.add_argument("--done-dir", help = "Move the files here once they are done.  Otherwise they are left where they are")
+    parser.add_argument("--log", help = "The per-file log (JSON lines).  Default is " + LOG_NAME + " in the output folder")
+    parser.add_argument("--once", action = "store_true", help = "Run the files that are in the folder now and stop")
+    parser.add_argument("--fused", action = "store_true", help = "Scripts next to each other in the chain that support it share one pass over the layers")
+    parser.add_argument("--stream", action = "store_true", help = "Don't read whole files into memory.  Some scripts can't run this way")
+    parser.add_argument("--lookback", type = int, default = runner.DEFAULT_LOOKBACK, help = "With --stream, how many layers the scripts can go back and change (default %(default)s)")
+    parser.add_argument("--cache", action = "store_true", help = "Keep the result of each script and use it again when the same gcode is run with the same settings")
+    parser.add_argument("--cache-dir", help = "Folder for --cache (default " + runner.default_cache_dir() + ")")
+    parser.add_argument("--cache-size", type = float, default = runner.DEFAULT_CACHE_MB, metavar = "MB", help = "The oldest results are removed to keep the cache under this size (default %(default)s)")
+    parser.add_argument("--binary", action = "store_true", help = "Write binary gcode (.bgcode)")
+    parser.add_argument("--scripts-dir", default = runner.SCRIPTS_DIR, help = "Folder with the *_GV.py scripts")
+    parser.add_argument("-v", "--verbose", action = "store_true", help = "Log debug messages")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level = logging.DEBUG if args.verbose else logging.INFO, format = "%(asctime)s %(levelname)s %(message)s")
+    profile = runner._stand_ins.loadProfile(args.profile)
+    chain = []
+    if args.cura_chain:
+        chain += runner.parse_cura_script_list(profile.get("metadata", {}).get("post_processing_scripts", ""))
+    if args.chain:
+        chain += runner.load_chain(args.chain)
+    for script_arg in args.script:
+        script_name, _, settings_path = script_arg.partition("=")
+        chain.append((script_name, runner.load_settings(settings_path)))
+    if not chain:
+        parser.error("No scripts to run.  Use -s, --chain or --cura-chain.")
+    if not os.path.isdir(args.input_dir):
+        parser.error("The folder " + args.input_dir + " doesn't exist")
+    # Check the names now rather than in every file's log
+    runner.setup(profile)
+    for script_name, settings in chain:
+        runner.load_script(script_name, args.scripts_dir)
+
+    options = {"scripts_dir": args.scripts_dir, "fused": args.fused, "stream": args.stream, "lookback": args.lookback, "cache": args.cache,
+               "cache_dir": args.cache_dir, "cache_size": args.cache_size, "binary": args.binary}
+    watcher = FolderWatcher(args.input_dir, args.output_dir, chain, profile, options, args.workers, args.interval, args.settle, args.log, args.done_dir)
+    signal.signal(signal.SIGTERM, watcher.stop)
+    logging.info("Watching %s with %d workers", watcher.input_dir, watcher.workers)
+    try:
+        failed = watcher.run(args.once)
+    except KeyboardInterrupt:
+        return 0
+    return 1 if failed and args.once else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
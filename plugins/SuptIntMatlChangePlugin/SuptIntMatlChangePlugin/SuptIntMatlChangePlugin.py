@@ -564,7 +564,7 @@ class SuptIntMatlChangePlugin(Extension):
                         end_at_line = index_list[index_num + 1]
                         ## Put the 'Revert' section together
                         return_location_list = []
-                        return_location_list = self._getReturnLocation(gcode_list, dnum, end_at_line, retract_speed)
+                        return_location_list = self._getReturnLocation(gcode_list, dnum, end_at_line, retract_speed, lines)
                         return_location = str(return_location_list[0])
                         is_retraction = bool(return_location_list[1])
                         
@@ -585,7 +585,7 @@ class SuptIntMatlChangePlugin(Extension):
 
                         ## Final changes to the 'Interface' change string
                         startout_location_list = []
-                        startout_location_list = self._getReturnLocation(gcode_list, dnum, start_at_line, retract_speed)
+                        startout_location_list = self._getReturnLocation(gcode_list, dnum, start_at_line, retract_speed, lines)
                         startout_location = startout_location_list[0]
                         is_start_retraction = bool(startout_location_list[1])
                         if not relative_ext_mode:
@@ -630,8 +630,10 @@ class SuptIntMatlChangePlugin(Extension):
             setattr(scene, "gcode_dict", gcode_dict)
 
     # Get the return location and see if there was a retraction before the Interface
-    def _getReturnLocation(self, data: str, num: int, index: int, retract_speed: str):
-        lines = data[num].split("\n")
+    def _getReturnLocation(self, data: str, num: int, index: int, retract_speed: str, lines: list = None):
+        ## 'lines' is data[num] already split (the layer is only split once for all the look ups in it)
+        if lines is None:
+            lines = data[num].split("\n")
         is_retraction = None
         ret_x = None
         ret_y = 0
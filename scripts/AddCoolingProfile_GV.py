@@ -6,7 +6,7 @@
 ##    If 'By Feature' then a Start Layer and/or an End Layer can be defined.
 ##    Fan speeds are scaled PWM (0 - 255) or RepRap (0.0 - 1.0) depending on Cura's "Scale Fan Speed 0-1" {machine_scale_fan_speed_zero_to_one}.
 ##    A minimum fan speed of 12% is enforced.  It is the slowest speed that my cooling fan will turn on so that's what I used.  'M106 S14' (as Cura might insert) was pretty useless.
-##    If multiple extruders have separate fan circuits the speeds are set at tool changes and conform to the layer or feature setting.  There is support for up to 4 layer cooling fan circuits.
+##    If multiple extruders have separate fan circuits the speeds are set at tool changes and conform to the layer or feature setting.  Each extruder can have its own layer cooling fan circuit.
 
 from ..Script import Script
 from UM.Application import Application
@@ -41,6 +41,14 @@ class AddCoolingProfile_GV(Script):
                     "value": true,
                     "default_value": true
                 },
+                "remove_repeated_m106":
+                {
+                    "label": "Remove repeated fan lines.",
+                    "description": "Every feature (and every tool change) gets an M106 line even when the fan is running at that speed already.  When checked the M106/M107 lines that don't change the speed of their fan are taken out.  Each one is a command the printer has to read and it can make the printer stutter when printing over USB.",
+                    "type": "bool",
+                    "enabled": true,
+                    "default_value": false
+                },
                 "feature_fan_start_layer":
                 {
                     "label": "Starting Layer",
@@ -64,7 +72,7 @@ class AddCoolingProfile_GV(Script):
                 "layer_fan_1":
                 {
                     "label": "Layer/Percent #1",
-                    "description": "Enter as: 'LAYER / Percent' Ex: 55/100 with the layer first, then a '/' to delimit, and then the fan percentage.  There are up to 8 changes.  If you need more then add a second instance of this script and remember to turn off 'Remove M106 lines' in the second instance.  The layer numbers in the second instance must start with a layer number higher than the last layer number in a previous script.  You can't end the first script with a setting for layer 80 and then start the second script with a setting for layer 40 because 'Remove M106 lines' always starts with the lowest layer number when 'By Layer' is selected.",
+                    "description": "Enter as: 'LAYER / Percent' Ex: 55/100 with the layer first, then a '/' to delimit, and then the fan percentage.  There are 8 of these.  If you need more changes then put the rest in 'More Layer/Percent'.",
                     "type": "str",
                     "default_value": "5/30",
                     "unit": "L#/%    ",
@@ -133,6 +141,23 @@ class AddCoolingProfile_GV(Script):
                     "unit": "L#/%    ",
                     "enabled": "fan_layer_or_feature == 'by_layer'"
                 },
+                "layer_fan_more":
+                {
+                    "label": "More Layer/Percent",
+                    "description": "Any number of more changes as 'LAYER / Percent' separated by commas.  Ex: 60/50, 80/75, 100/100",
+                    "type": "str",
+                    "default_value": "",
+                    "unit": "L#/%    ",
+                    "enabled": "fan_layer_or_feature == 'by_layer'"
+                },
+                "layer_fan_ramp":
+                {
+                    "label": "Ramp between the layers",
+                    "description": "When checked the fan speed changes a little at every layer from one Layer/Percent to the next (a straight line) instead of all at once at the layer of each one.  The last speed carries on to the end.",
+                    "type": "bool",
+                    "default_value": false,
+                    "enabled": "fan_layer_or_feature == 'by_layer'"
+                },
                 "feature_fan_skirt":
                 {
                     "label": "Skirt/Brim/Ooze Shield %",
@@ -235,11 +260,52 @@ class AddCoolingProfile_GV(Script):
                 "feature_fan_combing":
                 {
                     "label": "Fan 'OFF' during Combing:",
-                    "description": "When checked will set the fan to 0% for combing moves over 5 lines long in the gcode. When un-checked the fan speed during combing is whatever the previous speed is set to.",
+                    "description": "When checked will set the fan to 0% for long combing moves. When un-checked the fan speed during combing is whatever the previous speed is set to.",
                     "type": "bool",
                     "enabled": "fan_layer_or_feature == 'by_feature'",
                     "default_value": true
                 },
+                "feature_fan_combing_measure":
+                {
+                    "label": "    Long Combing is Measured by",
+                    "description": "How a run of combing (G0) moves is judged to be long enough to turn the fan off.  'Number of Moves' counts the G0 lines, 'Distance' adds up the X/Y travel and 'Time' is the travel time at the feedrate of the moves.",
+                    "type": "enum",
+                    "options": {
+                        "moves": "Number of Moves",
+                        "distance": "Distance",
+                        "time": "Time"},
+                    "default_value": "moves",
+                    "enabled": "fan_layer_or_feature == 'by_feature' and feature_fan_combing"
+                },
+                "feature_fan_combing_moves":
+                {
+                    "label": "    More Moves Than",
+                    "description": "Combing with more G0 lines than this turns the fan off.",
+                    "type": "int",
+                    "default_value": 5,
+                    "minimum_value": 1,
+                    "enabled": "fan_layer_or_feature == 'by_feature' and feature_fan_combing and feature_fan_combing_measure == 'moves'"
+                },
+                "feature_fan_combing_distance":
+                {
+                    "label": "    Longer Than",
+                    "description": "Combing that travels further than this turns the fan off.",
+                    "type": "float",
+                    "default_value": 20,
+                    "minimum_value": 0,
+                    "unit": "mm  ",
+                    "enabled": "fan_layer_or_feature == 'by_feature' and feature_fan_combing and feature_fan_combing_measure == 'distance'"
+                },
+                "feature_fan_combing_time":
+                {
+                    "label": "    Takes Longer Than",
+                    "description": "Combing that takes longer than this turns the fan off.",
+                    "type": "float",
+                    "default_value": 0.25,
+                    "minimum_value": 0,
+                    "unit": "sec  ",
+                    "enabled": "fan_layer_or_feature == 'by_feature' and feature_fan_combing and feature_fan_combing_measure == 'time'"
+                },
                 "feature_fan_feature_final":
                 {
                     "label": "Final %",
@@ -287,7 +353,7 @@ class AddCoolingProfile_GV(Script):
     def execute(self, data):
         #Initialize variables that are buried in if statements.
         mycura = Application.getInstance().getGlobalContainerStack()
-        t0_fan = " P0"; t1_fan = " P0"; t2_fan = " P0"; t3_fan = " P0"; is_multi_extr_print = True
+        is_multi_extr_print = True
 
         #Get some information from Cura-----------------------------------
         extruder = mycura.extruderList
@@ -312,40 +378,26 @@ class AddCoolingProfile_GV(Script):
             else:
         #No P parameter if there is a single fan circuit------------------
                 t0_fan = ""
+            tool_fans = [t0_fan]
 
         #Get the cooling fan numbers for each extruder if the printer has multiple extruders
         elif extruder_count > 1:
             is_multi_fan = True
-            t0_fan = " P" + str((extruder[0].getProperty("machine_extruder_cooling_fan_number", "value")))
-        if is_multi_fan:
-            if extruder_count > 1: t1_fan = " P" + str((extruder[1].getProperty("machine_extruder_cooling_fan_number", "value")))
-            if extruder_count > 2: t2_fan = " P" + str((extruder[2].getProperty("machine_extruder_cooling_fan_number", "value")))
-            if extruder_count > 3: t3_fan = " P" + str((extruder[3].getProperty("machine_extruder_cooling_fan_number", "value")))
+            ## The fan of each tool.  tool_fans[n] is the P parameter for Tn.
+            tool_fans = [" P" + str((extruder[num].getProperty("machine_extruder_cooling_fan_number", "value"))) for num in range(extruder_count)]
+            t0_fan = tool_fans[0]
 
-        #Initialize the fan_list with defaults----------------------------
-        fan_list = ["z"] * 16
-        for num in range(0,15,2):
-            fan_list[num] = len(data)
-            fan_list[num + 1] = "M106 S0"
+        ## The (layer, fan line) changes when "By Layer"
+        fan_list = []
 
         #Assign the variable values if "By Layer"-------------------------
         by_layer_or_feature = self.getSettingValueByKey("fan_layer_or_feature")
         if  by_layer_or_feature == "by_layer":
             ## By layer doesn't do any feature search so there is no need to look for combing moves
             feature_fan_combing = False
-            fan_list[0] = self.getSettingValueByKey("layer_fan_1")
-            fan_list[2] = self.getSettingValueByKey("layer_fan_2")
-            fan_list[4] = self.getSettingValueByKey("layer_fan_3")
-            fan_list[6] = self.getSettingValueByKey("layer_fan_4")
-            fan_list[8] = self.getSettingValueByKey("layer_fan_5")
-            fan_list[10] = self.getSettingValueByKey("layer_fan_6")
-            fan_list[12] = self.getSettingValueByKey("layer_fan_7")
-            fan_list[14] = self.getSettingValueByKey("layer_fan_8")
-            ## If there is no '/' delimiter then ignore the line else put the settings in a list
-            for num in range(0,15,2):
-                if "/" in fan_list[num]:
-                    fan_list[num + 1] = self._layer_checker(fan_list[num], "p", fan_mode)
-                    fan_list[num] = self._layer_checker(fan_list[num], "l", fan_mode)
+            layer_entries = [self.getSettingValueByKey("layer_fan_" + str(num)) for num in range(1, 9)]
+            layer_entries += re.split("[,;]", self.getSettingValueByKey("layer_fan_more"))
+            fan_list = self._layer_fan_list(layer_entries, bool(self.getSettingValueByKey("layer_fan_ramp")), fan_mode)
 
         ## Assign the variable values if "By Feature"
         elif by_layer_or_feature == "by_feature":
@@ -373,6 +425,9 @@ class AddCoolingProfile_GV(Script):
             feature_speed_list.append(self._feature_checker(self.getSettingValueByKey("feature_fan_bridge"), fan_mode)); feature_name_list.append(";BRIDGE")
             feature_speed_list.append(self._feature_checker(self.getSettingValueByKey("feature_fan_feature_final"), fan_mode)); feature_name_list.append("FINAL_FAN")
             feature_fan_combing = self.getSettingValueByKey("feature_fan_combing")
+            combing_measure = self.getSettingValueByKey("feature_fan_combing_measure")
+            combing_minimum = self.getSettingValueByKey("feature_fan_combing_" + combing_measure)
+            combing_speed = float(extruder[0].getProperty("speed_travel", "value"))
             if the_end_layer > -1 and by_layer_or_feature == "by_feature":
                 ## Required so the final speed input can be determined
                 the_end_is_enabled = True
@@ -399,48 +454,25 @@ class AddCoolingProfile_GV(Script):
 
         ## Is this a single extruder print on a multi-extruder printer? - get the correct fan number for the extruder being used.
         if is_multi_fan:
-            T0_used = False
-            T1_used = False
-            T2_used = False
-            T3_used = False
-            ## Bypass the file header and ending gcode.
-            for num in range(1,len(data)-1,1):
-                lines = data[num]
-                if "T0" in lines:
-                    T0_used = True
-                if "T1" in lines:
-                    T1_used = True
-                if "T2" in lines:
-                    T2_used = True
-                if "T3" in lines:
-                    T3_used = True
-            is_multi_extr_print = True if sum([T0_used, T1_used, T2_used, T3_used]) > 1 else False
+            ## The tool changes are read once.  They give the tools used between the file header and the ending gcode
+            ## and the fan passes look them up.
+            from GcodeTools_GV import ToolTimeline
+            timeline = ToolTimeline(data)
+            tools_used = sorted(set(tool_nr for item_nr, index, tool_nr in timeline.changes(1, -2) if tool_nr < len(tool_fans)))
+            is_multi_extr_print = True if len(tools_used) > 1 else False
 
             ## On a multi-extruder printer and single extruder print find out which extruder starts the file.
             init_fan = t0_fan
             if not is_multi_extr_print:
-                startup = data[1]
-                lines = startup.split("\n")
-                for line in lines:
-                    if line == "T1":
-                        t0_fan = t1_fan
-                    elif line == "T2":
-                        t0_fan = t2_fan
-                    elif line == "T3":
-                        t0_fan = t3_fan
+                ## Its fan is used for T0 too
+                for item_nr, index, tool_nr in timeline.changes(1):
+                    if 0 < tool_nr < len(tool_fans):
+                        t0_fan = tool_fans[0] = tool_fans[tool_nr]
             elif is_multi_extr_print:
             ## On a multi-extruder printer and multi extruder print find out which extruder starts the file.
-                startup = data[1]
-                lines = startup.split("\n")
-                for line in lines:
-                    if line == "T0":
-                        init_fan = t0_fan
-                    elif line == "T1":
-                        init_fan = t1_fan
-                    elif line == "T2":
-                        init_fan = t2_fan
-                    elif line == "T3":
-                        init_fan = t3_fan
+                for item_nr, index, tool_nr in timeline.changes(1):
+                    if tool_nr < len(tool_fans):
+                        init_fan = tool_fans[tool_nr]
         else:
             init_fan = ""
         ## Assign the variable values if "Raft Enabled"
@@ -458,307 +490,264 @@ class AddCoolingProfile_GV(Script):
             start_from = int(raft_start_index)
         else:
             if by_layer_or_feature == "by_layer":
-                altered_start_layer = str(len(data))
                 ## The fan list layers don't need to be in ascending order.  Get the lowest.
-                for num in range(0,15,2):
-                    try:
-                        if int(fan_list[num]) < int(altered_start_layer):
-                            altered_start_layer = int(fan_list[num])
-                    except:
-                        pass
+                altered_start_layer = min([int(fan_layer) for fan_layer, fan_line in fan_list], default = len(data))
             elif by_layer_or_feature == "by_feature":
                 altered_start_layer = int(the_start_layer) - 1
             start_from = int(layer_0_index) + int(altered_start_layer)
-        ## Strip the M106 and M107 lines from the file
-        for l_index in range(int(start_from), len(data) - 1, 1):
-            data[l_index] = re.sub(re.compile("M106(.*)\n"), "", data[l_index])
-            data[l_index] = re.sub(re.compile("M107(.*)\n"), "", data[l_index])
+        strip_fan_lines = [(re.compile("M106(.*)\n"), ""), (re.compile("M107(.*)\n"), "")]
 
-        ## Deal with a raft and with One-At-A-Time print sequence
+        ## The fan lines that go in after the first line of the raft layers and the first layer.  Each list is in the order the lines end up in.
+        first_lines = {}
         if raft_enabled and bed_adhesion == "raft":
             if print_sequence == "one_at_a_time":
                 for r_index in range(2,len(data)-2,1):
-                    lines = data[r_index].split("\n")
-                    if not raft_enabled or bed_adhesion != "raft":
-                        if ";LAYER:0" in data[r_index] or ";LAYER:-" in data[r_index]:
-                            lines.insert(1, "M106 S0" + str(t0_fan))
-                    if raft_enabled and bed_adhesion == "raft":
-                        if ";LAYER:-" in data[r_index]:
-                        ## Turn the raft fan on
-                            lines.insert(1, fan_sp_raft + str(t0_fan))
-                        ## Shut the raft fan off at layer 0
-                        if ";LAYER:0" in data[r_index]:
-                            lines.insert(1,"M106 S0" + str(t0_fan))
-                    data[r_index] = "\n".join(lines)
-            elif print_sequence == "all_at_once":
-                layer = data[raft_start_index]
-                lines = layer.split("\n")
-                if ";LAYER:-" in layer:
+                    ## Shut the raft fan off at layer 0
+                    if ";LAYER:0" in data[r_index]:
+                        first_lines.setdefault(r_index, []).append("M106 S0" + str(t0_fan))
                     ## Turn the raft fan on
-                    lines.insert(1, fan_sp_raft + str(init_fan))
-                layer = "\n".join(lines)
-                data[raft_start_index] = layer
-                layer = data[layer_0_index]
-                lines = layer.split("\n")
-                ## Shut the raft fan off
-                lines.insert(1, "M106 S0" + str(init_fan))
-                data[layer_0_index] = "\n".join(lines)
-        else:
+                    if ";LAYER:-" in data[r_index]:
+                        first_lines.setdefault(r_index, []).append(fan_sp_raft + str(t0_fan))
+            elif print_sequence == "all_at_once":
+                ## Turn the raft fan on and shut it off at layer 0
+                if ";LAYER:-" in data[raft_start_index]:
+                    first_lines.setdefault(raft_start_index, []).append(fan_sp_raft + str(init_fan))
+                first_lines.setdefault(layer_0_index, []).insert(0, "M106 S0" + str(init_fan))
+        elif not any(fan_layer == "0" for fan_layer, fan_line in fan_list):
             for r_index in range(2,len(data)-2,1):
-                lines = data[r_index].split("\n")
                 if ";LAYER:0" in data[r_index] or ";LAYER:-" in data[r_index]:
-                    if not "0" in fan_list:
-                        lines.insert(1, "M106 S0" + str(t0_fan))
-                data[r_index] = "\n".join(lines)
-
-        ## Turn off all fans at the end of data[1].  If more than one instance of this script is running then this will result in multiple M106 lines.
-        temp_startup = data[1].split("\n")
-        temp_startup.insert(len(temp_startup)-2,"M106 S0" + str(t0_fan))
-        ## If there are multiple cooling fans shut them all off
-        if is_multi_fan:
-            if extruder_count > 1 and t1_fan != t0_fan: temp_startup.insert(len(temp_startup)-2,"M106 S0" + str(t1_fan))
-            if extruder_count > 2 and t2_fan != t1_fan and t2_fan != t0_fan: temp_startup.insert(len(temp_startup)-2,"M106 S0" + str(t2_fan))
-            if extruder_count > 3 and t3_fan != t2_fan and t3_fan != t1_fan and t3_fan != t0_fan: temp_startup.insert(len(temp_startup)-2,"M106 S0" + str(t3_fan))
-        data[1] = "\n".join(temp_startup)
-
-        ## If 'feature_fan_combing' is True then add additional 'MESH:NONMESH' lines for travel moves over 5 lines long
-        ## For compatibility with 5.3.0 change any MESH:NOMESH to MESH:NONMESH.
-        if feature_fan_combing:
-            for layer_num in range(2,len(data)):
-                layer = data[layer_num]
-                data[layer_num] = re.sub(";MESH:NOMESH", ";MESH:NONMESH", layer)
-            data = self._add_travel_comment(data, layer_0_index)
-
-        # Single Fan "By Layer"--------------------------------------------
-        if by_layer_or_feature == "by_layer" and not is_multi_fan:
-            return self._single_fan_by_layer(data, layer_0_index, fan_list, t0_fan)
+                    first_lines[r_index] = ["M106 S0" + str(t0_fan)]
 
-        # Multi-Fan "By Layer"---------------------------------------------
-        if by_layer_or_feature == "by_layer" and is_multi_fan:
-            return self._multi_fan_by_layer(data, layer_0_index, fan_list, t0_fan, t1_fan, t2_fan, t3_fan)
-
-        #Single Fan "By Feature"------------------------------------------
-        if by_layer_or_feature == "by_feature" and (not is_multi_fan or not is_multi_extr_print):
-            return self._single_fan_by_feature(data, layer_0_index, the_start_layer, the_end_layer, the_end_is_enabled, fan_list, t0_fan, feature_speed_list, feature_name_list, feature_fan_combing)
-
-        #Multi Fan "By Feature"-------------------------------------------
-        if by_layer_or_feature == "by_feature" and is_multi_fan:  
-            return self._multi_fan_by_feature(data, layer_0_index, the_start_layer, the_end_layer, the_end_is_enabled, fan_list, t0_fan, t1_fan, t2_fan, t3_fan, feature_speed_list, feature_name_list, feature_fan_combing)
+        ## The new fan lines for each layer
+        if by_layer_or_feature == "by_layer" and not is_multi_fan:
+            # Single Fan "By Layer"--------------------------------------------
+            fan_layer = self._single_fan_by_layer(data, layer_0_index, fan_list, t0_fan)
+        elif by_layer_or_feature == "by_layer" and is_multi_fan:
+            # Multi-Fan "By Layer"---------------------------------------------
+            fan_layer = self._multi_fan_by_layer(data, timeline, layer_0_index, fan_list, tool_fans)
+        elif by_layer_or_feature == "by_feature" and (not is_multi_fan or not is_multi_extr_print):
+            #Single Fan "By Feature"------------------------------------------
+            fan_layer = self._single_fan_by_feature(data, layer_0_index, the_start_layer, the_end_layer, the_end_is_enabled, t0_fan, feature_speed_list, feature_name_list, feature_fan_combing)
+        else:
+            #Multi Fan "By Feature"-------------------------------------------
+            fan_layer = self._multi_fan_by_feature(data, timeline, layer_0_index, the_start_layer, the_end_layer, the_end_is_enabled, tool_fans, feature_speed_list, feature_name_list, feature_fan_combing)
+
+        ## One pass over the file.  Each layer has the old fan lines stripped, the raft and first layer fan lines added,
+        ## the long combing moves marked and then the new fan lines put in, and is written back once.
+        from GcodeTools_GV import mark_combing, sub_all
+        for num in range(len(data)):
+            layer = data[num]
+            if start_from <= num < len(data) - 1:
+                layer = sub_all(layer, strip_fan_lines)
+            if num in first_lines:
+                line_end = layer.find("\n")
+                if line_end == -1:
+                    line_end = len(layer)
+                layer = layer[:line_end] + "\n" + "\n".join(first_lines[num]) + layer[line_end:]
+            if num == 1:
+                layer = self._startup_fans_off(layer, is_multi_fan, tool_fans)
+            ## If 'feature_fan_combing' is True then add additional 'MESH:NONMESH' lines for long travel moves
+            ## For compatibility with 5.3.0 change any MESH:NOMESH to MESH:NONMESH.
+            if feature_fan_combing and num >= 2:
+                layer = layer.replace(";MESH:NOMESH", ";MESH:NONMESH")
+            if feature_fan_combing and layer_0_index <= num < len(data) - 1:
+                layer = mark_combing(layer, combing_measure, combing_minimum, combing_speed)
+            data[num] = fan_layer(num, layer)
+        ## Take out the fan lines that don't change the speed of their fan
+        if self.getSettingValueByKey("remove_repeated_m106"):
+            from GcodeTools_GV import FanTimeline
+            FanTimeline(data).drop_repeats(data)
+        return data
+
+    ## Turn off all fans at the end of data[1].  If more than one instance of this script is running then this will result in multiple M106 lines.
+    def _startup_fans_off(self, startup: str, is_multi_fan: bool, tool_fans: list) -> str:
+        temp_startup = startup.split("\n")
+        ## If there are multiple cooling fans shut them all off (each fan once)
+        fans = tool_fans if is_multi_fan else tool_fans[:1]
+        for index, fan in enumerate(fans):
+            if fan in fans[:index]:
+                continue
+            temp_startup.insert(len(temp_startup)-2,"M106 S0" + str(fan))
+        return "\n".join(temp_startup)
+
+    ## The four passes below each return fan_layer(num, layer) that gives the layer with its new fan lines.  It is called
+    ## for every item in order so it can follow the tool and the layer number from one layer to the next.  Only the marked
+    ## lines (tool changes, ';LAYER:', features) are looked at - the rest of the layer is copied as it is.
 
     # The Single Fan "By Layer"----------------------------------------
-    def _single_fan_by_layer(self, data: str, layer_0_index: int, fan_list: str, t0_fan: str)->str:
-        layer_number = "0"
-        single_fan_data = data
-        for l_index in range(layer_0_index,len(single_fan_data)-1,1):
-            layer = single_fan_data[l_index]
-            fan_lines = layer.split("\n")
-            for fan_line in fan_lines:
-                if ";LAYER:" in fan_line:
-                    layer_number = str(fan_line.split(":")[1])
-                    ## If there is a match for the current layer number make the insertion
-                    for num in range(0,15,2):
-                        if layer_number == str(fan_list[num]):
-                            layer = layer.replace(fan_lines[0],fan_lines[0] + "\n" + fan_list[num + 1] + str(t0_fan))
-                            single_fan_data[l_index] = layer
-        return single_fan_data
+    def _single_fan_by_layer(self, data: list, layer_0_index: int, fan_list: list, t0_fan: str):
+        data_count = len(data)
+        layer_fans = self._layer_fans(fan_list)
+
+        def fan_layer(l_index: int, layer: str) -> str:
+            if l_index < layer_0_index or l_index >= data_count - 1:
+                return layer
+            fan_lines = layer
+            first_line = fan_lines.split("\n", 1)[0]
+            pos = fan_lines.find(";LAYER:")
+            while pos != -1:
+                line_end = fan_lines.find("\n", pos)
+                if line_end == -1:
+                    line_end = len(fan_lines)
+                layer_number = str(fan_lines[fan_lines.rfind("\n", 0, pos) + 1:line_end].split(":")[1])
+                ## If there is a match for the current layer number make the insertion
+                for fan_line in layer_fans.get(layer_number, []):
+                    layer = layer.replace(first_line, first_line + "\n" + fan_line + str(t0_fan))
+                pos = fan_lines.find(";LAYER:", line_end)
+            return layer
+
+        return fan_layer
 
     # Multi-Fan "By Layer"-----------------------------------------
-    def _multi_fan_by_layer(self, data: str, layer_0_index: int, fan_list: str, t0_fan: str, t1_fan: str, t2_fan: str, t3_fan: str)->str:
-        multi_fan_data = data
+    def _multi_fan_by_layer(self, data: list, timeline, layer_0_index: int, fan_list: list, tool_fans: list):
+        from GcodeTools_GV import rewrite_marked_lines
+        data_count = len(data)
+        line_fans = {"T" + str(tool_nr): str(fan) for tool_nr, fan in enumerate(tool_fans)}
+        layer_fans = self._layer_fans(fan_list)
         layer_number = "0"
         current_fan_speed = "0"
-        prev_fan = str(t0_fan)
-        this_fan = str(t0_fan)
-        start_index = str(len(multi_fan_data))
-        for num in range(0,15,2):
+        prev_fan = str(tool_fans[0])
+        this_fan = str(tool_fans[0])
         ## The fan_list may not be in ascending order.  Get the lowest layer number
-            try:
-                if int(fan_list[num]) < int(start_index):
-                    start_index = str(fan_list[num])
-            except:
-                pass
+        start_index = min([int(fan_layer) for fan_layer, fan_line in fan_list], default = len(data))
         ## Move the start point if delete_existing_m106 is false
         start_index = int(start_index) + int(layer_0_index)
-        ## Track the tool number
-        for num in range(1,int(start_index),1):
-            layer = multi_fan_data[num]
-            lines = layer.split("\n")
-            for line in lines:
-                if line == "T0":
-                    prev_fan = this_fan
-                    this_fan = t0_fan
-                elif line == "T1":
-                    prev_fan = this_fan
-                    this_fan = t1_fan
-                elif line == "T2":
-                    prev_fan = this_fan
-                    this_fan = t2_fan
-                elif line == "T3":
-                    prev_fan = this_fan
-                    this_fan = t3_fan
-        for l_index in range(int(start_index),len(multi_fan_data)-1,1):
-            modified_data = ""
-            layer = multi_fan_data[l_index]
-            fan_lines = layer.split("\n")
-            for fan_line in fan_lines:
-                ## Prepare to shut down the previous fan and start the next one.
-                if fan_line.startswith("T"):
-                    if fan_line == "T0": this_fan = str(t0_fan)
-                    if fan_line == "T1": this_fan = str(t1_fan)
-                    if fan_line == "T2": this_fan = str(t2_fan)
-                    if fan_line == "T3": this_fan = str(t3_fan)
-                    modified_data += "M106 S0" + prev_fan + "\n"
-                    modified_data += fan_line + "\n"
-                    modified_data += "M106 S" + str(current_fan_speed) + this_fan + "\n"
-                    prev_fan = this_fan
-                elif ";LAYER:" in fan_line:
-                    modified_data += fan_line + "\n"
-                    layer_number = str(fan_line.split(":")[1])
-                    for num in range(0,15,2):
-                        if layer_number == str(fan_list[num]):
-                            modified_data += fan_list[num + 1] + this_fan + "\n"
-                            current_fan_speed = str(fan_list[num + 1].split("S")[1])
-                            current_fan_speed = str(current_fan_speed.split(" ")[0]) ## Just in case
-                else:
-                    modified_data += fan_line + "\n"
-            if modified_data.endswith("\n"): modified_data = modified_data[0:-1]
-            multi_fan_data[l_index] = modified_data
-        return multi_fan_data
+        ## Follow the tool changes below the start point
+        for item_nr, index, tool_nr in timeline.changes(1, min(start_index, data_count) - 1) if start_index > 1 else []:
+            if tool_nr < len(tool_fans):
+                prev_fan = this_fan
+                this_fan = str(tool_fans[tool_nr])
+
+        def fan_line(line: str) -> list:
+            nonlocal layer_number, current_fan_speed, prev_fan, this_fan
+            ## Prepare to shut down the previous fan and start the next one.
+            if line.startswith("T"):
+                this_fan = line_fans.get(line, this_fan)
+                new_lines = ["M106 S0" + prev_fan, line, "M106 S" + str(current_fan_speed) + this_fan]
+                prev_fan = this_fan
+                return new_lines
+            new_lines = [line]
+            layer_number = str(line.split(":")[1])
+            for fan_line in layer_fans.get(layer_number, []):
+                new_lines.append(fan_line + this_fan)
+                current_fan_speed = str(fan_line.split("S")[1])
+                current_fan_speed = str(current_fan_speed.split(" ")[0]) ## Just in case
+            return new_lines
+
+        def fan_layer(l_index: int, layer: str) -> str:
+            if start_index <= l_index < data_count - 1:
+                layer = rewrite_marked_lines(layer, ("\nT", ";LAYER:"), fan_line)
+            return layer
+
+        return fan_layer
 
     # Single fan by feature-----------------------------------------------
-    def _single_fan_by_feature(self, data: str, layer_0_index: int, the_start_layer: str, the_end_layer: str, the_end_is_enabled: str, fan_list: str, t0_fan: str, feature_speed_list: str, feature_name_list: str, feature_fan_combing: bool)->str:
-        single_fan_data = data
+    def _single_fan_by_feature(self, data: list, layer_0_index: int, the_start_layer: str, the_end_layer: str, the_end_is_enabled: str, t0_fan: str, feature_speed_list: list, feature_name_list: list, feature_fan_combing: bool):
+        from GcodeTools_GV import rewrite_marked_lines
+        data_count = len(data)
+        feature_speeds = dict(zip(feature_name_list, feature_speed_list))
+        marks = [";LAYER:", ";MESH:NONMESH"] + feature_name_list
         layer_number = "0"
-        index = 1
-        ## Start with layer:0
-        for l_index in range(layer_0_index,len(single_fan_data)-1,1):
-            modified_data = ""
-            layer = single_fan_data[l_index]
-            lines = layer.split("\n")
-            for line in lines:
-                if ";LAYER:" in line:
-                    layer_number = str(line.split(":")[1])
-                if int(layer_number) >= int(the_start_layer) and int(layer_number) < int(the_end_layer)-1:
-                    temp = line.split(" ")[0]
-                    try:
-                        name_index = feature_name_list.index(temp)
-                    except:
-                        name_index = -1
-                    if name_index != -1:
-                        modified_data += feature_speed_list[name_index] + t0_fan + "\n"
-                    elif ";MESH:NONMESH" in line:
-                        if feature_fan_combing == True:
-                            modified_data += "M106 S0" + t0_fan + "\n"
-                modified_data += line + "\n"
-                ## If an End Layer is defined and is less than the last layer then insert the Final Speed
-                if line == ";LAYER:" + str(the_end_layer) and the_end_is_enabled == True:
-                    modified_data += feature_speed_list[len(feature_speed_list) - 1] + t0_fan + "\n"
-            if modified_data.endswith("\n"): modified_data = modified_data[0: - 1]
-            single_fan_data[l_index] = modified_data
-        return single_fan_data
+
+        def fan_line(line: str) -> list:
+            nonlocal layer_number
+            if ";LAYER:" in line:
+                layer_number = str(line.split(":")[1])
+            new_lines = [line]
+            if int(layer_number) >= int(the_start_layer) and int(layer_number) < int(the_end_layer)-1:
+                feature_speed = feature_speeds.get(line.split(" ")[0])
+                if feature_speed is not None:
+                    new_lines.insert(0, feature_speed + t0_fan)
+                elif ";MESH:NONMESH" in line:
+                    if feature_fan_combing == True:
+                        new_lines.insert(0, "M106 S0" + t0_fan)
+            ## If an End Layer is defined and is less than the last layer then insert the Final Speed
+            if line == ";LAYER:" + str(the_end_layer) and the_end_is_enabled == True:
+                new_lines.append(feature_speed_list[len(feature_speed_list) - 1] + t0_fan)
+            return new_lines
+
+        def fan_layer(l_index: int, layer: str) -> str:
+            ## Start with layer:0
+            if layer_0_index <= l_index < data_count - 1:
+                layer = rewrite_marked_lines(layer, marks, fan_line)
+            return layer
+
+        return fan_layer
 
     # Multi-fan by feature------------------------------------------------
-    def _multi_fan_by_feature(self, data: str, layer_0_index: int, the_start_layer: str, the_end_layer: str, the_end_is_enabled: str, fan_list: str, t0_fan: str, t1_fan: str, t2_fan: str, t3_fan: str, feature_speed_list: str, feature_name_list: str, feature_fan_combing: bool)->str:
-        multi_fan_data = data
+    def _multi_fan_by_feature(self, data: list, timeline, layer_0_index: int, the_start_layer: str, the_end_layer: str, the_end_is_enabled: str, tool_fans: list, feature_speed_list: list, feature_name_list: list, feature_fan_combing: bool):
+        from GcodeTools_GV import rewrite_marked_lines
+        data_count = len(data)
+        line_fans = {"T" + str(tool_nr): fan for tool_nr, fan in enumerate(tool_fans)}
+        feature_speeds = dict(zip(feature_name_list, feature_speed_list))
+        marks = ["\nT", ";LAYER:", ";MESH:NONMESH"] + feature_name_list
         layer_number = "0"
         start_index = 1
-        prev_fan = t0_fan
-        this_fan = t0_fan
-        modified_data = ""
+        prev_fan = tool_fans[0]
+        this_fan = tool_fans[0]
         current_fan_speed = "0"
-        for my_index in range(1, len(multi_fan_data) - 1, 1):
-            layer = multi_fan_data[my_index]
-            if ";LAYER:" + str(the_start_layer) + "\n" in layer:
+        for my_index in range(1, len(data) - 1, 1):
+            if ";LAYER:" + str(the_start_layer) + "\n" in data[my_index]:
                 start_index = int(my_index) - 1
                 break
-        ## Track the previous tool changes
-        for num in range(1,start_index,1):
-            layer = multi_fan_data[num]
-            lines = layer.split("\n")
-            for line in lines:
-                if line == "T0":
-                    prev_fan = this_fan
-                    this_fan = t0_fan
-                elif line == "T1":
-                    prev_fan = this_fan
-                    this_fan = t1_fan
-                elif line == "T2":
-                    prev_fan = this_fan
-                    this_fan = t2_fan
-                elif line == "T3":
-                    prev_fan = this_fan
-                    this_fan = t3_fan
-        ## Get the current tool.
-        for l_index in range(start_index,start_index + 1,1):
-            layer = multi_fan_data[l_index]
-            lines = layer.split("\n")
-            for line in lines:
-                if line.startswith("T"):
-                    if line == "T0": this_fan = t0_fan
-                    if line == "T1": this_fan = t1_fan
-                    if line == "T2": this_fan = t2_fan
-                    if line == "T3": this_fan = t3_fan
-                    prev_fan = this_fan
-
-        ## Start to make insertions-------------------------------------
-        for l_index in range(start_index+1,len(multi_fan_data)-1,1):
-            layer = multi_fan_data[l_index]
-            lines = layer.split("\n")
-            for line in lines:
-                if line.startswith("T"):
-                    if line == "T0": this_fan = t0_fan
-                    if line == "T1": this_fan = t1_fan
-                    if line == "T2": this_fan = t2_fan
-                    if line == "T3": this_fan = t3_fan
-                    ## Turn off the prev fan
-                    modified_data += "M106 S0" + prev_fan + "\n"
-                    modified_data += line + "\n"
-                    ## Turn on the current fan
-                    modified_data += "M106 S" + str(current_fan_speed) + this_fan + "\n"
-                    prev_fan = this_fan
-                if ";LAYER:" in line:
-                    layer_number = str(line.split(":")[1])
-                    modified_data += line + "\n"
-                if int(layer_number) >= int(the_start_layer):
-                    temp = line.split(" ")[0]
-                    try:
-                        name_index = feature_name_list.index(temp)
-                    except:
-                        name_index = -1
-                    if name_index != -1:
-                        modified_data += line + "\n" + feature_speed_list[name_index] + this_fan + "\n"
-                        #modified_data += feature_speed_list[name_index] + this_fan + "\n"
-                        current_fan_speed = str(feature_speed_list[name_index].split("S")[1])
-                    elif ";MESH:NONMESH" in line:
-                        if feature_fan_combing == True:
-                            modified_data += line + "\n"
-                            modified_data += "M106 S0" + this_fan + "\n"
-                            current_fan_speed = "0"
-                        else:
-                            modified_data += line + "\n"
-                    ## If an end layer is defined - Insert the final speed and set the other variables to Final Speed to finish the file
-                    ## There cannot be a break here because if there are multiple fan numbers they still need to be shut off and turned on.
-                    elif line == ";LAYER:" + str(the_end_layer):
-                        modified_data += feature_speed_list[len(feature_speed_list) - 1] + this_fan + "\n"
-                        for set_speed in range(0, len(feature_speed_list) - 2):
-                            feature_speed_list[set_speed] = feature_speed_list[len(feature_speed_list) - 1]
-                    else:
-                    ## Layer and Tool get inserted into modified_data above.  All other lines go into modified_data here
-                        if not line.startswith("T") and not line.startswith(";LAYER:"): modified_data += line + "\n"
-            if modified_data.endswith("\n"): modified_data = modified_data[0: - 1]
-            multi_fan_data[l_index] = modified_data
-            modified_data = ""
-        return multi_fan_data
-
-    #Try to catch layer input errors, set the minimum speed to 12%, and put the strings together
-    def _layer_checker(self, fan_string: str, ty_pe: str, fan_mode: bool) -> str:
+        ## Track the previous tool changes and get the current tool.
+        for item_nr, index, tool_nr in timeline.changes(1, start_index - 1) if start_index > 1 else []:
+            if tool_nr < len(tool_fans):
+                prev_fan = this_fan
+                this_fan = tool_fans[tool_nr]
+        for item_nr, index, tool_nr in timeline.changes(start_index):
+            this_fan = line_fans.get("T" + str(tool_nr), this_fan)
+            prev_fan = this_fan
+
+        def fan_line(line: str) -> list:
+            nonlocal layer_number, prev_fan, this_fan, current_fan_speed
+            new_lines = []
+            if line.startswith("T"):
+                this_fan = line_fans.get(line, this_fan)
+                ## Turn off the prev fan and turn on the current fan
+                new_lines += ["M106 S0" + prev_fan, line, "M106 S" + str(current_fan_speed) + this_fan]
+                prev_fan = this_fan
+            if ";LAYER:" in line:
+                layer_number = str(line.split(":")[1])
+                new_lines.append(line)
+            if int(layer_number) >= int(the_start_layer):
+                feature_speed = feature_speeds.get(line.split(" ")[0])
+                if feature_speed is not None:
+                    new_lines += [line, feature_speed + this_fan]
+                    current_fan_speed = str(feature_speed.split("S")[1])
+                elif ";MESH:NONMESH" in line:
+                    new_lines.append(line)
+                    if feature_fan_combing == True:
+                        new_lines.append("M106 S0" + this_fan)
+                        current_fan_speed = "0"
+                ## If an end layer is defined - Insert the final speed and set the other features to Final Speed to finish the file
+                ## There cannot be a break here because if there are multiple fan numbers they still need to be shut off and turned on.
+                elif line == ";LAYER:" + str(the_end_layer):
+                    final_speed = feature_speed_list[len(feature_speed_list) - 1]
+                    new_lines.append(final_speed + this_fan)
+                    for name in feature_name_list[0:len(feature_name_list) - 2]:
+                        feature_speeds[name] = final_speed
+            ## Layer and Tool lines are in new_lines already.  Everything else is kept as it is.
+            if not line.startswith("T") and not ";LAYER:" in line and not line in new_lines:
+                new_lines.insert(0, line)
+            return new_lines
+
+        def fan_layer(l_index: int, layer: str) -> str:
+            if start_index < l_index < data_count - 1:
+                layer = rewrite_marked_lines(layer, marks, fan_line)
+            return layer
+
+        return fan_layer
+
+    #Try to catch layer input errors.  The (layer, percent) of a 'Layer/Percent' entry.  _feature_checker sets the minimum speed.
+    def _layer_checker(self, fan_string: str) -> tuple:
         fan_string_l = str(fan_string.split("/")[0])
         try:
             if int(fan_string_l) <= 1: fan_string_l = "1"
-            if fan_string_l == "": fan_string_l = str(len(data))
         except ValueError:
-            fan_string_l = str(len(data))
-        fan_string_l = str(int(fan_string_l) - 1)
+            ## Not a layer number so the entry is left out
+            return None
+        fan_string_l = int(fan_string_l) - 1
         fan_string_p = str(fan_string.split("/")[1])
         if fan_string_p == "": fan_string_p = "0"
         try:
@@ -766,18 +755,30 @@ class AddCoolingProfile_GV(Script):
             if int(fan_string_p) > 100: fan_string_p = "100"
         except ValueError:
             fan_string_p = "0"
-        ## Set the minimum fan speed to 12%
-        if int(fan_string_p) < 12 and int(fan_string_p) != 0:
-            fan_string_p = "12"
-        fan_layer_line = str(fan_string_l)
-        if fan_mode:
-            fan_percent_line = "M106 S" + str(round(int(fan_string_p) * 2.55))
-        else:
-            fan_percent_line = "M106 S" + str(round(int(fan_string_p) / 100, 1))
-        if ty_pe == "l":
-            return str(fan_layer_line)
-        elif ty_pe == "p":
-            return fan_percent_line
+        return fan_string_l, int(fan_string_p)
+
+    ## The (layer, fan line) list from the 'Layer/Percent' entries.  When 'ramp' is checked there is a line for every layer
+    ## where the speed on the straight line between two entries changes.
+    def _layer_fan_list(self, layer_entries: list, ramp: bool, fan_mode: bool) -> list:
+        ## If there is no '/' delimiter then ignore the entry
+        fan_points = [self._layer_checker(entry) for entry in layer_entries if "/" in entry]
+        fan_points = [point for point in fan_points if point is not None]
+        if not ramp:
+            return [(str(fan_layer), self._feature_checker(fan_percent, fan_mode)) for fan_layer, fan_percent in fan_points]
+        from GcodeTools_GV import layer_schedule
+        fan_list = []
+        for fan_layer, fan_percent in layer_schedule(fan_points):
+            fan_line = self._feature_checker(round(fan_percent), fan_mode)
+            if not fan_list or fan_line != fan_list[-1][1]:
+                fan_list.append((str(fan_layer), fan_line))
+        return fan_list
+
+    ## {layer: [fan lines]} so each ';LAYER:' line is looked up once
+    def _layer_fans(self, fan_list: list) -> dict:
+        layer_fans = {}
+        for fan_layer, fan_line in fan_list:
+            layer_fans.setdefault(fan_layer, []).append(fan_line)
+        return layer_fans
 
     #Try to catch feature input errors, set the minimum speed to 12%, and put the strings together when 'By Feature'
     def _feature_checker(self, fan_feat_string: int, fan_mode: bool) -> str:
@@ -789,47 +790,4 @@ class AddCoolingProfile_GV(Script):
             fan_sp_feat = "M106 S" + str(round(fan_feat_string * 2.55))
         else:
             fan_sp_feat = "M106 S" + str(round(fan_feat_string / 100, 1))
-        return fan_sp_feat
-
-    # Add additional travel comments to turn the fan off during combing.
-    def _add_travel_comment(self, comment_data: str, lay_0_index: str) -> str:
-        for lay_num in range(int(lay_0_index), len(comment_data)-1,1):
-            layer = comment_data[lay_num]
-            lines = layer.split("\n")
-            ## Copy the data to new_data and make the insertions there
-            new_data = lines
-            g0_count = 0
-            g0_index = -1
-            feature_type = ";TYPE:SUPPORT"
-            is_travel = False
-            for index, line in enumerate(lines):
-                insert_index = 0
-                if ";TYPE:" in line:
-                    feature_type = line
-                    is_travel = False
-                    g0_count = 0
-                if ";MESH:NONMESH" in line:
-                    is_travel = True
-                    g0_count = 0
-                if line.startswith("G0 ") and not is_travel:
-                    g0_count += 1
-                    if g0_index == -1:
-                        g0_index = lines.index(line)
-                elif not line.startswith("G0 ") and not is_travel:
-                ## Add additional 'NONMESH' lines to shut the fan off during long combing moves--------
-                    if g0_count > 5:
-                        if not is_travel:
-                            new_data.insert(g0_index + insert_index, ";MESH:NONMESH")
-                            insert_index += 1
-                ## Add the feature_type at the end of the combing move to turn the fan back on
-                            new_data.insert(g0_index + g0_count + 1, feature_type)
-                            insert_index += 1
-                        g0_count = 0
-                        g0_index = -1
-                        is_travel = False
-                    elif g0_count <= 5:
-                        g0_count = 0
-                        g0_index = -1
-                        is_travel = False
-            comment_data[lay_num] = "\n".join(new_data)
-        return comment_data
\ No newline at end of file
+        return fan_sp_feat
\ No newline at end of file
@@ -252,13 +252,12 @@ class AlterZhops_GV(Script):
             new_hop_hgt_t3 = new_hop_hgt_t0
 
         # Make a list of start and end layers-----------------------------
-        layer_list = []
+        z_ranges = []
         list_error = False
         z_start_layer = self.getSettingValueByKey("z_start_layer1") - 1
         z_end_layer = self.getSettingValueByKey("z_end_layer1")
         if z_end_layer == -1: z_end_layer = len(data) - 4
-        for m in range(z_start_layer, z_end_layer):
-            layer_list.append(m)
+        z_ranges.append((z_start_layer, z_end_layer - 1))
         if bool(self.getSettingValueByKey("z_layers2")):
             z_start_layer = self.getSettingValueByKey("z_start_layer2") - 1
             # Error check for layer range 2
@@ -268,8 +267,7 @@ class AlterZhops_GV(Script):
             z_end_layer = self.getSettingValueByKey("z_end_layer2")
             if z_end_layer == -1: z_end_layer = len(data) - 4
             if not list_error:
-                for m in range(z_start_layer, z_end_layer):
-                    layer_list.append(m)
+                z_ranges.append((z_start_layer, z_end_layer - 1))
         if bool(self.getSettingValueByKey("z_layers3")) and bool(self.getSettingValueByKey("z_layers2")):
             z_start_layer = self.getSettingValueByKey("z_start_layer3") -1
             # Error check for layer range 3
@@ -279,8 +277,9 @@ class AlterZhops_GV(Script):
             z_end_layer = self.getSettingValueByKey("z_end_layer3")
             if z_end_layer == -1: z_end_layer = len(data) - 4
             if not list_error:
-                for m in range(z_start_layer, z_end_layer):
-                    layer_list.append(m)
+                z_ranges.append((z_start_layer, z_end_layer - 1))
+        from GcodeTools_GV import LayerRanges
+        layer_list = LayerRanges.from_intervals(z_ranges)
                 
         #Initialize some variables---------------------------------------------------------------------------------
         new_z = float(layer_height_0)
@@ -289,6 +288,7 @@ class AlterZhops_GV(Script):
         z_value = 0.2
         z_up = False
         layer_number = 0
+        in_layer_list = 0 in layer_list
         tool_hop = False   #This one tracks if there is a hop at tool change----------------------------------------
         skip_next = False  #This one is to avoid wiping out 'retract at tool change' hops---------------------------------
 
@@ -309,6 +309,7 @@ class AlterZhops_GV(Script):
                 current_line_nr += 1
                 if line.startswith(";LAYER:"):
                     layer_number = str(line.split(":")[1])
+                    in_layer_list = int(layer_number) in layer_list
                     if int(layer_number) > 0: height_current_layer = float(layer_height)
                     working_z = round(float(layer_height_0) + (float(layer_number) * float(layer_height)),3)
                 #Switch hop height for separate extruders or leave as is for single extruders--------------------------------                
@@ -339,7 +340,7 @@ class AlterZhops_GV(Script):
                     tool_hop = tool_hop_t3
     
                 #Change the gcode between the start layer and end layer (inclusive)-----------------------------------------------
-                if int(layer_number) in layer_list:                    
+                if in_layer_list:                    
                     if line.startswith(search_str) and not z_up:
                         #If there is a tool change coming up and 'hop on tool change' is enabled allow the hop to pass and go to the next line.
                         if lines[current_line_nr + 2].startswith("T") and tool_hop:
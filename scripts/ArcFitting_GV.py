@@ -0,0 +1,64 @@
+# Copyright (c) 2024 GregValiant
+#   Released under the terms of the AGPLv3 or higher.
+#
+#   Arc Fitting:  Cura writes curved walls as long runs of short G1 moves.  Sending thousands of tiny moves can starve
+#   the planner buffer (and a serial link) and the printer stutters and leaves blobs at speed.  This finds the runs of
+#   G1 moves that lie on a circle (within the tolerance) and replaces each run with a single G2/G3 arc.
+#       - The arc ends exactly where the last move of the run ended.
+#       - The E is kept exactly.  In absolute mode the arc gets the E of the last move and in relative mode the sum of the E's.
+#       - A run has to have the same feedrate and about the same extrusion per mm all the way along.
+#       - The printer must support arcs (ARC_SUPPORT in Marlin, enabled by default).
+#   The number of lines and bytes that were saved is added to the opening paragraph (data[0]).
+#   The same thing is available as an option in Little Utilities.
+
+from ..Script import Script
+from UM.Application import Application
+
+class ArcFitting_GV(Script):
+
+    def getSettingDataString(self):
+        return """{
+            "name": "Arc Fitting GV",
+            "key": "ArcFitting_GV",
+            "metadata": {},
+            "version": 2,
+            "settings":
+            {
+                "arc_tolerance":
+                {
+                    "label": "Tolerance",
+                    "description": "How far (in mm) the arc is allowed to be from the points of the original moves and from the middle of each move.  Larger values make more (and longer) arcs but the path is less like the original.",
+                    "type": "float",
+                    "default_value": 0.025,
+                    "unit": "mm  ",
+                    "minimum_value": 0.001,
+                    "maximum_value_warning": 0.1
+                },
+                "arc_min_segments":
+                {
+                    "label": "Minimum moves in an arc",
+                    "description": "Runs with fewer moves than this are left as G1 moves.",
+                    "type": "int",
+                    "default_value": 3,
+                    "minimum_value": 2
+                },
+                "arc_max_radius":
+                {
+                    "label": "Maximum radius",
+                    "description": "Runs that would make an arc with a bigger radius than this are left as G1 moves.  Very big arcs are almost straight lines and some firmware handles them badly.",
+                    "type": "float",
+                    "default_value": 1000,
+                    "unit": "mm  ",
+                    "minimum_value": 1
+                }
+            }
+        }"""
+
+    def execute(self, data):
+        from GcodeTools_GV import ArcFitter
+        relative_extrusion = bool(Application.getInstance().getGlobalContainerStack().getProperty("relative_extrusion", "value"))
+        fitter = ArcFitter(self.getSettingValueByKey("arc_tolerance"), self.getSettingValueByKey("arc_min_segments"),
+                           self.getSettingValueByKey("arc_max_radius"), relative_extrusion)
+        fitter.fit_data(data)
+        data[0] += fitter.report("Arc Fitting")
+        return data
@@ -213,102 +213,118 @@ class BridgeTemperatureAdjustment_GV(Script):
         # Relative Travel Height and initialize variables
         move_z = self.getSettingValueByKey("head_move_z")
         current_z = 0
+        x = 0
+        y = 0
         current_e = 0
         previous_e = 0
         is_retracted = False
         is_bridge = False
 
+        ## Track the XYZE of a line the way the main loop does
+        def track_move(line):
+            nonlocal current_z, x, y, current_e, previous_e, is_retracted
+            if line.startswith("G0 ") or line.startswith("G1 ") or line.startswith("G2 ") or line.startswith("G3 "):
+                if self.getValue(line, "Z") is not None:
+                    current_z = self.getValue(line, "Z")
+                if self.getValue(line, "X") is not None and self.getValue(line, "Y") is not None:
+                    x = self.getValue(line, "X")
+                    y = self.getValue(line, "Y")
+                if self.getValue(line, "E") is not None:
+                    current_e = self.getValue(line, "E")
+
+                    # Track the retractions so we don't double dip if there already was one.
+                    if current_e >= previous_e:
+                        is_retracted = False
+                    elif current_e < previous_e:
+                        is_retracted = True
+                    previous_e = current_e
+
+        ## Track the XYZE of a line the way the scan for the end of the bridge does
+        def track_scan(line):
+            nonlocal current_z, x, y, current_e, previous_e, is_retracted
+            if self.getValue(line, "Z") is not None:
+                current_z = self.getValue(line, "Z")
+            if self.getValue(line, "X") is not None and self.getValue(line, "Y") is not None:
+                x = self.getValue(line, "X")
+                y = self.getValue(line, "Y")
+            if self.getValue(line, "E") is not None:
+                current_e = self.getValue(line, "E")
+                if float(current_e) >= float(previous_e):
+                    is_retracted = False
+                else:
+                    is_retracted = True
+                previous_e = current_e
+
+        from GcodeTools_GV import EditJournal
         for lay_index, layer in enumerate(data):
             # If there is no BRIDGE in the layer then skip it
             if not ";BRIDGE\n" in layer:
                 continue
             lines = layer.split("\n")
+            # The park and wait code goes in a journal and is put in when the layer is done.  The lines it adds are
+            # still tracked in the order they will be in the gcode.
+            journal = EditJournal(lines)
             for index, line in enumerate(lines):
                 # If a Z, XY, or E parameter is in the line then get the value
-                if line.startswith("G0 ") or line.startswith("G1 ") or line.startswith("G2 ") or line.startswith("G3 "):
-                    if self.getValue(line, "Z") is not None:
-                        current_z = self.getValue(line, "Z")
-                    if self.getValue(line, "X") is not None and self.getValue(line, "Y") is not None:
-                        x = self.getValue(line, "X")
-                        y = self.getValue(line, "Y")
-                    if self.getValue(line, "E") is not None:
-                        current_e = self.getValue(line, "E")
-
-                        # Track the retractions so we don't double dip if there already was one.
-                        if current_e >= previous_e:
-                            is_retracted = False
-                        elif current_e < previous_e:
-                            is_retracted = True
-                        previous_e = current_e
+                track_move(line)
 
                 # Reverse the park and wait code to resume the print-------------------------
-                if line.startswith(feature_type) and (lines[index+1].startswith(";BRIDGE") or lines[index+2].startswith(";BRIDGE")):
+                if line.startswith(feature_type) and any(coming.startswith(";BRIDGE") for coming in journal.following(index, 2)):
                     if wait_cmd == "M104 S":
-                        lines.insert(index+2,wait_cmd + str(bridge_temp))
-                        next_start = index+3
+                        block = [wait_cmd + str(bridge_temp)]
                     elif wait_cmd == "M109 R":
-                        lines.insert(index+2, rel_ext_cmd)
-                        lines.insert(index+2, "G90")
-                        if not is_retracted:
-                            lines.insert(index+2, "G1 " + speed_retract + " E" + str(retract_dist))
-                        else:
-                            lines.insert(index+2, ";Prime Not Required")
-                        lines.insert(index+2, "G0 " + speed_z + " Z-" + str(move_z))
-                        lines.insert(index+2, "G91")
-                        lines.insert(index+2, "G0 " + speed_trav + " X" + str(x) + " Y" + str(y))
-                        lines.insert(index+2, wait_cmd + str(bridge_temp))
-                        lines.insert(index+2, "G0 " + speed_trav + " X" + str(park_x) + " Y" + str(park_y))
-                        lines.insert(index+2, "G90")
-                        lines.insert(index+2, "G0 " + speed_z + " Z" + str(move_z))
-                        if not is_retracted:
-                            lines.insert(index+2, "G1 " + speed_retract + " E-" + str(retract_dist))
-                        else:
-                            lines.insert(index+2, ";Retraction Not Required")
-                        lines.insert(index+2, "M83")
-                        lines.insert(index+2, "G91")
-                        next_start = index+15
+                        block = [
+                            "G91",
+                            "M83",
+                            "G1 " + speed_retract + " E-" + str(retract_dist) if not is_retracted else ";Retraction Not Required",
+                            "G0 " + speed_z + " Z" + str(move_z),
+                            "G90",
+                            "G0 " + speed_trav + " X" + str(park_x) + " Y" + str(park_y),
+                            wait_cmd + str(bridge_temp),
+                            "G0 " + speed_trav + " X" + str(x) + " Y" + str(y),
+                            "G91",
+                            "G0 " + speed_z + " Z-" + str(move_z),
+                            "G1 " + speed_retract + " E" + str(retract_dist) if not is_retracted else ";Prime Not Required",
+                            "G90",
+                            rel_ext_cmd]
                         m109_count += 1
+                    ## The block goes after the next line.  That is a line that was added behind this one or the next line of the layer.
+                    added = journal.after(index)
+                    if added:
+                        added[1:1] = block
+                        scan_added = added[1 + len(block):]
+                        scan_start = index + 1
+                    else:
+                        journal.insert_after(index + 1, block)
+                        scan_added = []
+                        scan_start = index + 2
 
                     # Track the XYZE while scrolling down to the next "TYPE" change
-                    for num in range(next_start,len(lines),1):
-                        if self.getValue(lines[num], "Z") is not None:
-                            current_z = self.getValue(lines[num], "Z")
-                        if self.getValue(lines[num], "X") is not None and self.getValue(lines[num], "Y") is not None:
-                            x = self.getValue(lines[num], "X")
-                            y = self.getValue(lines[num], "Y")
-                        if self.getValue(lines[num], "E") is not None:
-                            current_e = self.getValue(lines[num], "E")
-                            if float(current_e) >= float(previous_e):
-                                is_retracted = False
-                            else:
-                                is_retracted = True
-                            previous_e = current_e
+                    for added_line in scan_added:
+                        track_scan(added_line)
+                    for num in range(scan_start,len(lines),1):
+                        track_scan(lines[num])
 
                         # Catch TYPE or MESH.  If M104 was chosen then there is no park and wait.  Resume temp code.
                         if lines[num].startswith(";TYPE") or lines[num].startswith(";MESH"):
                             if resume_cmd == "M104 S":
-                                lines.insert(num+1,resume_cmd + str(resume_temperature))
+                                journal.insert_after(num, resume_cmd + str(resume_temperature))
                                 break
                             elif resume_cmd == "M109 R":
-                                lines.insert(num+1, rel_ext_cmd)
-                                lines.insert(num+1, "G90")
-                                if not is_retracted:
-                                    lines.insert(num+1, "G1 " + speed_retract + " E" + str(retract_dist))
-                                else:
-                                    lines.insert(num+1, ";Prime Not Required")
-                                lines.insert(num+1, "G0 " + speed_z + " Z-" + str(move_z))
-                                lines.insert(num+1, "G91")
-                                lines.insert(num+1, "G0 " + speed_trav + " X" + str(x) + " Y" + str(y))
-                                lines.insert(num+1, resume_cmd + str(resume_temperature))
-                                lines.insert(num+1, "G0 " + speed_trav + " X" + str(park_x) + " Y" + str(park_y))
-                                lines.insert(num+1, "G90")
-                                lines.insert(num+1, "G0 " + speed_z + " Z" + str(move_z))
-                                if not is_retracted:
-                                    lines.insert(num+1, "G1 " + speed_retract + " E-" + str(retract_dist))
-                                else:
-                                    lines.insert(num+1, ";Retraction Not Required")
-                                lines.insert(num+1, "M83")
-                                lines.insert(num+1, "G91")
+                                journal.insert_after(num, [
+                                    "G91",
+                                    "M83",
+                                    "G1 " + speed_retract + " E-" + str(retract_dist) if not is_retracted else ";Retraction Not Required",
+                                    "G0 " + speed_z + " Z" + str(move_z),
+                                    "G90",
+                                    "G0 " + speed_trav + " X" + str(park_x) + " Y" + str(park_y),
+                                    resume_cmd + str(resume_temperature),
+                                    "G0 " + speed_trav + " X" + str(x) + " Y" + str(y),
+                                    "G91",
+                                    "G0 " + speed_z + " Z-" + str(move_z),
+                                    "G1 " + speed_retract + " E" + str(retract_dist) if not is_retracted else ";Prime Not Required",
+                                    "G90",
+                                    rel_ext_cmd])
                                 m109_count += 1
                                 break
 
@@ -316,8 +332,12 @@ class BridgeTemperatureAdjustment_GV(Script):
                 if line.startswith(";TIME_ELAPSED:"):
                     elapsed_time = float(line.split(":")[1])
                     elapsed_time += int(m109_count) * int(time_add)
-                    lines[index] = ";TIME_ELAPSED:" + str(round(elapsed_time))
-            data[lay_index] = "\n".join(lines)
+                    journal.replace(index, ";TIME_ELAPSED:" + str(round(elapsed_time)))
+
+                # The lines that were added behind this one
+                for added_line in journal.after(index):
+                    track_move(added_line)
+            data[lay_index] = "\n".join(journal.apply())
         layer = data[0]
 
         # Adjust the print time at the start of the file
@@ -124,9 +124,11 @@ class CleaningStation_GV(Script):
                 freq = 0
                 raise Exception("Error.  Insert changed to Once Only.")
         index_list = self._fill_index_list(data, self._the_start_layer, freq)
+        from GcodeTools_GV import StateTracker
+        states = StateTracker(data, self._relative_extrusion)
     # Get the data indexes of all the layers that will be included, create the cleaning string and insert it.
         for num in range(0, len(index_list)):
-            cleaning_list = self._create_cleaning_list(data, index_list[num])
+            cleaning_list = self._create_cleaning_list(states.at_end(index_list[num]))
             self._time_adj_total += self._time_adj
             layer = data[index_list[num]].split("\n")
             for line in cleaning_list:
@@ -145,70 +147,53 @@ class CleaningStation_GV(Script):
 
     # Fill the index list with the relevant data indexes
     def _fill_index_list(self, data: str, initial_layer: int, clean_frequency: int) -> int:
+        from GcodeTools_GV import LayerIndex
+        layer_index = LayerIndex(data)
+        last_index = len(data) - 2
         index_list = []
-        new_layer = initial_layer
     #Single cleaning
         if self._clean_frequency == "once_only":
-            for num in range(2,len(data)-1,1):
-                if ";LAYER:" + str(new_layer) + "\n" in data[num]:
+            for num in layer_index.indexes_of(initial_layer):
+                if 2 <= num <= last_index:
                     index_list.append(num)
                     if self._print_sequence == "all_at_once":
                         break
             return index_list
         elif self._clean_frequency != "once_only":
+            # In one-at-a-time mode the count starts over at the LAYER:0 of each model
             if self._print_sequence == "all_at_once":
-                for num in range(2,len(data)-1,1):
-                    if ";LAYER:" + str(new_layer) + "\n" in data[num]:
-                        index_list.append(num)
-                        new_layer += clean_frequency
-
+                section_starts = [2]
             elif self._print_sequence == "one_at_a_time":
-                for num in range(2,len(data)-1,1):
-                    if ";LAYER:0\n" in data[num]:
-                        new_layer = initial_layer
-                    if ";LAYER:" + str(new_layer) + "\n" in data[num]:
-                        index_list.append(num)
-                        new_layer += clean_frequency
+                section_starts = [2] + [num for num in layer_index.model_starts if num > 2]
+            else:
+                section_starts = []
+            section_ends = section_starts[1:] + [last_index + 1]
+            for section_start, section_end in zip(section_starts, section_ends):
+                new_layer = initial_layer
+                num = layer_index.index_of(new_layer, section_start)
+                while num is not None and num < section_end:
+                    index_list.append(num)
+                    new_layer += clean_frequency
+                    num = layer_index.index_of(new_layer, num + 1)
         return index_list
 
     # Create the string to be inserted at the end of each relevant layer
-    def _create_cleaning_list(self, data: str, num: int) ->str:
+    def _create_cleaning_list(self, state) ->str:
         cleaning_list = []
-        x_loc = 0
-        y_loc = 0
-        z_loc = 0
-        e_loc = 0
-        e_loc_prev = 0
-        f_speed = 0
-        is_retracted = False
         min_z_lift = self.getSettingValueByKey("minimum_z")
-        # Get the X, Y, Z locations thru the previous layer and the current layer
+        # The X, Y, Z locations at the end of the layer
         if self._clean_reps == 1:
             xtra_retract = round(self._retract_dist / 2 / 2, 5)
         elif self._clean_reps == 2:
             xtra_retract = round(self._retract_dist / 2 / 4, 5)
         elif self._clean_reps == 3:
             xtra_retract = round(self._retract_dist / 2 / 6, 5)            
-        for index in range(num-1, num+1):
-            layer = data[index]
-            lines = layer.split("\n")
-            for line in lines:
-                if line.startswith("G0") or line.startswith("G1") or line.startswith("G2") or line.startswith("G3"):
-                    if " X" in line:
-                        x_loc = self.getValue(line, "X")
-                    if " Y" in line:
-                        y_loc = self.getValue(line, "Y")
-                    if " Z" in line:
-                        z_loc = self.getValue(line, "Z")
-                    if " E" in line:
-                        e_loc = self.getValue(line, "E")
-                        if e_loc < e_loc_prev or e_loc < 0:
-                            is_retracted = True
-                        else:
-                            is_retracted = False
-                        e_loc_prev = e_loc
-                    if " F" in line:
-                        f_speed = self.getValue(line, "F")
+        x_loc = state.x
+        y_loc = state.y
+        z_loc = state.z
+        e_loc = state.e
+        f_speed = state.f
+        is_retracted = state.retracted
         if self._relative_extrusion:
             e_loc = 0
         z_lift = min_z_lift
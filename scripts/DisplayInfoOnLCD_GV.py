@@ -10,6 +10,7 @@
 ##           - Display Total Layer Count
 ##           - Disply Time Remaining for the print
 ##           - Time Fudge Factor % - Divide the Actual Print Time by the Cura Estimate.  Enter as a percentage and the displayed time will be adjusted.  This allows you to bring the displayed time closer to reality (Ex: Entering 87.5 would indicate an adjustment to 87.5% of the Cura estimate).
+##           - Recalculate Print Times - works the print time out again from the moves in the gcode (using the printer's acceleration, jerk and feedrate limits) and rewrites the ;TIME: and ;TIME_ELAPSED: lines before the remaining time is worked out.  Use it when the scripts that run before this one change the moves.
 ##           - Time to Pauses changes the M117/M118 lines to countdown to the next pause as  1/479 | TP 2h36m
 ##           - 'Add M118 Line' is available with either option.  M118 will bounce the message back to a remote print server through the USB connection.
 ##           - 'Add M73 Line' is used by 'Display Progress' only.  There are options to incluse M73 P(percent) and M73 R(time remaining)
@@ -156,6 +157,14 @@ class DisplayInfoOnLCD_GV(Script):
                     "default_value": 100,
                     "enabled": "enable_end_message or display_option == 'display_progress'"
                 },
+                "recalculate_times":
+                {
+                    "label": "Recalculate Print Times",
+                    "description": "Work the print time out again from the moves in the gcode (with the printer's max feedrate, acceleration and jerk and any M201/M203/M204/M205 in the gcode) and put it in the ;TIME: and ;TIME_ELAPSED: lines before the remaining time is worked out.  Use this when scripts that run before this one add or change moves.  The startup and ending gcode and waiting for the heaters are not counted (the same as Cura's estimate).",
+                    "type": "bool",
+                    "default_value": false,
+                    "enabled": "display_option == 'display_progress'"
+                },
                 "enable_countdown":
                 {
                     "label": "Enable Countdown to Pauses",
@@ -201,137 +210,120 @@ class DisplayInfoOnLCD_GV(Script):
         }"""
 
     def execute(self, data):
-        display_option = self.getSettingValueByKey("display_option")
-        add_m118_line = self.getSettingValueByKey("add_m118_line")
-        add_m73_line = self.getSettingValueByKey("add_m73_line")
-        add_m73_time = self.getSettingValueByKey("add_m73_time")
-        add_m73_percent = self.getSettingValueByKey("add_m73_percent")
+        from GcodeTools_GV import run_layer_hooks
+        run_layer_hooks(data, self._layer_hooks())
+        ## If enabled then change the ET to TP for 'Time To Pause'
+        if self.getSettingValueByKey("display_option") == "display_progress" and bool(self.getSettingValueByKey("countdown_to_pause")):
+            self._countdown_to_pause(data, self._pause_cmd, self.getSettingValueByKey("speed_factor") / 100)
+        return data
+
+    # Layer hooks so this can share a pass over the gcode with other scripts (see GcodeTools_GV.LayerHooks).
+    # Counting down to a pause has to look at all the layers after they are done so it runs on its own.  So does
+    # recalculating the times - it reads the moves of every layer before the first one is changed.
+    def getLayerHooks(self) -> list:
+        if self.getSettingValueByKey("display_option") == "display_progress" and (bool(self.getSettingValueByKey("countdown_to_pause"))
+                                                                                  or bool(self.getSettingValueByKey("recalculate_times"))):
+            return None
+        return self._layer_hooks()
+
+    def _layer_hooks(self) -> list:
+        if self.getSettingValueByKey("display_option") == "filename_layer":
+            return [self._filename_layer_hooks()]
+        elif self.getSettingValueByKey("display_option") == "display_progress":
+            return [self._display_progress_hooks()]
+        return []
 
     # This is Display Filename and Layer on LCD---------------------------------------------------------
-        if display_option == "filename_layer":
-            max_layer = 0
-            lcd_text = "M117 "
-            if self.getSettingValueByKey("file_name") != "":
-                file_name = self.getSettingValueByKey("file_name")
-            else:
-                file_name = Application.getInstance().getPrintInformation().jobName
-            if self.getSettingValueByKey("addPrefixPrinting"):
-                lcd_text += "Printing "
-            if not self.getSettingValueByKey("scroll"):
-                lcd_text += "Layer "
-            else:
-                lcd_text += file_name + " - Layer "
-            i = self.getSettingValueByKey("startNum")
-            for layer in data:
-                display_text = lcd_text + str(i)
-                layer_index = data.index(layer)
-                lines = layer.split("\n")
-                for line in lines:
-                    if line.startswith(";LAYER_COUNT:"):
-                        max_layer = line
-                        max_layer = max_layer.split(":")[1]
-                        if self.getSettingValueByKey("startNum") == 0:
-                            max_layer = str(int(max_layer) - 1)
-                    if line.startswith(";LAYER:"):
-                        if self.getSettingValueByKey("maxlayer"):
-                            display_text = display_text + " of " + max_layer
-                            if not self.getSettingValueByKey("scroll"):
-                                display_text = display_text + " " + file_name
+    def _filename_layer_hooks(self):
+        from GcodeTools_GV import EditJournal, LayerHooks
+        add_m118_line = self.getSettingValueByKey("add_m118_line")
+        max_layer = 0
+        lcd_text = "M117 "
+        if self.getSettingValueByKey("file_name") != "":
+            file_name = self.getSettingValueByKey("file_name")
+        else:
+            file_name = Application.getInstance().getPrintInformation().jobName
+        if self.getSettingValueByKey("addPrefixPrinting"):
+            lcd_text += "Printing "
+        if not self.getSettingValueByKey("scroll"):
+            lcd_text += "Layer "
+        else:
+            lcd_text += file_name + " - Layer "
+        i = self.getSettingValueByKey("startNum")
+
+        def layer(num, lines):
+            nonlocal max_layer, i
+            display_text = lcd_text + str(i)
+            journal = EditJournal(lines)
+            for line_index, line in enumerate(lines):
+                if line.startswith(";LAYER_COUNT:"):
+                    max_layer = line
+                    max_layer = max_layer.split(":")[1]
+                    if self.getSettingValueByKey("startNum") == 0:
+                        max_layer = str(int(max_layer) - 1)
+                if line.startswith(";LAYER:"):
+                    if self.getSettingValueByKey("maxlayer"):
+                        display_text = display_text + " of " + max_layer
+                        if not self.getSettingValueByKey("scroll"):
+                            display_text = display_text + " " + file_name
+                    else:
+                        if not self.getSettingValueByKey("scroll"):
+                            display_text = display_text + " " + file_name + "!"
                         else:
-                            if not self.getSettingValueByKey("scroll"):
-                                display_text = display_text + " " + file_name + "!"
-                            else:
-                                display_text = display_text + "!"
-                        line_index = lines.index(line)
-                        lines.insert(line_index + 1, display_text)
-                        if add_m118_line:
-                            lines.insert(line_index + 2, str(display_text.replace("M117", "M118", 1)))
-                        i += 1
-                final_lines = "\n".join(lines)
-                data[layer_index] = final_lines
+                            display_text = display_text + "!"
+                    journal.insert_after(line_index, display_text)
+                    if add_m118_line:
+                        journal.insert_after(line_index, str(display_text.replace("M117", "M118", 1)))
+                    i += 1
+            return journal.apply()
+
+        def end(data):
             if bool(self.getSettingValueByKey("enable_end_message")):
                 message_str = self.message_to_user(self.getSettingValueByKey("speed_factor") / 100)
                 Message(title = "Display Info on LCD - Estimated Finish Time", text = message_str[0] + "\n\n" + message_str[1] + "\n" + message_str[2] + "\n" + message_str[3]).show()
-            return data
+
+        return LayerHooks(layer = layer, end = end, reads_data = False)
 
     # Display Progress (from 'Show Progress' and 'Display Progress on LCD')---------------------------------------
-        elif display_option == "display_progress":
-            print_sequence = Application.getInstance().getGlobalContainerStack().getProperty("print_sequence", "value")
-            ## Add the Initial Layer Height just below Layer Height in data[0]
-            init_layer_hgt_line = ";Initial Layer Height: " + str(Application.getInstance().getGlobalContainerStack().getProperty("layer_height_0", "value"))
-            nozzle_size_line = ";Nozzle Size T0: " + str(Application.getInstance().getGlobalContainerStack().extruderList[0].getProperty("machine_nozzle_size", "value"))
-            match = re.search(";Layer height: (\d\.\d*)", data[0])[0]
-            data[0] = re.sub(match, match + "\n" + init_layer_hgt_line + "\n" + nozzle_size_line, data[0])
-            ## Get settings
-            display_total_layers = self.getSettingValueByKey("display_total_layers")
-            display_remaining_time = self.getSettingValueByKey("display_remaining_time")
-            speed_factor = self.getSettingValueByKey("speed_factor") / 100
-            m73_time = False
-            m73_percent = False
-            if add_m73_line and add_m73_time:
-                m73_time = True
-            if add_m73_line and add_m73_percent:
-                m73_percent = True
-            if add_m73_line:
-                data[1] = "M75\n" + data[1]
-                data[len(data)-1] += "M77\n"
-            ## Initialize some variables
-            first_layer_index = 0
-            time_total = int(data[0].split(";TIME:")[1].split("\n")[0])
-            number_of_layers = 0
-            time_elapsed = 0
+    def _display_progress_hooks(self):
+        from GcodeTools_GV import LayerHooks
+        add_m118_line = self.getSettingValueByKey("add_m118_line")
+        add_m73_line = self.getSettingValueByKey("add_m73_line")
+        add_m73_time = self.getSettingValueByKey("add_m73_time")
+        add_m73_percent = self.getSettingValueByKey("add_m73_percent")
+        print_sequence = Application.getInstance().getGlobalContainerStack().getProperty("print_sequence", "value")
+        ## Get settings
+        display_total_layers = self.getSettingValueByKey("display_total_layers")
+        display_remaining_time = self.getSettingValueByKey("display_remaining_time")
+        speed_factor = self.getSettingValueByKey("speed_factor") / 100
+        m73_time = False
+        m73_percent = False
+        if add_m73_line and add_m73_time:
+            m73_time = True
+        if add_m73_line and add_m73_percent:
+            m73_percent = True
+        ## If at least one of the settings is disabled, there is enough room on the display to display "layer"
+        if not display_total_layers or not display_remaining_time:
+            base_display_text = "layer "
+        else:
+            base_display_text = ""
+        self._pause_cmd = []
+        all_data = []
+        ending_lines = []
+        first_layer_index = 0
+        last_layer_index = 0
+        time_total = 0
+        number_of_layers = 0
+        time_elapsed = 0
+        current_layer = 0
+        time_estimate = None
 
-            ## If at least one of the settings is disabled, there is enough room on the display to display "layer"
-            first_section = data[0]
-            lines = first_section.split("\n")
-            for line in lines:
-                if line.startswith(";TIME:"):
-                    tindex = lines.index(line)
-                    cura_time = int(line.split(":")[1])
-                    print_time = cura_time * speed_factor
-                    hhh = print_time/3600
-                    hr = round(hhh // 1)
-                    mmm = round((hhh % 1) * 60)
-                    orig_hhh = cura_time/3600
-                    orig_hr = round(orig_hhh // 1)
-                    orig_mmm = math.floor((orig_hhh % 1) * 60)
-                    if add_m118_line: lines.insert(tindex + 5,"M118 Adjusted Print Time " + str(hr) + "hr " + str(mmm) + "min")
-                    lines.insert(tindex + 5,"M117 ET " + str(hr) + "hr " + str(mmm) + "min")
-                    ## Add M73 line at beginning
-                    mins = int(60 * hr + mmm)
-                    if m73_time:
-                        lines.insert(tindex + 4, "M73 R{}".format(mins))
-                    if m73_percent:
-                        lines.insert(tindex + 4, "M73 P0")
-                    ## If Countdown to pause is enabled then count the pauses
-                    pause_str = ""
-                    if bool(self.getSettingValueByKey("countdown_to_pause")):
-                        pause_count = 0
-                        pause_setting = self.getSettingValueByKey("pause_cmd").upper()
-                        pause_cmd = []
-                        if "," in pause_setting:
-                            pause_cmd = pause_setting.split(",")
-                        else:
-                            pause_cmd.append(pause_setting)
-                        for q in range(0, len(pause_cmd)):
-                            pause_cmd[q] = "\n" + pause_cmd[q]
-                        for num in range(2,len(data) - 2, 1):
-                            for q in range(0,len(pause_cmd)):
-                                if pause_cmd[q] in data[num]:
-                                    pause_count += data[num].count(pause_cmd[q], 0, len(data[num]))
-                        pause_str = f" with {pause_count} pause(s)"
-                    ## This line goes in to convert seconds to hours and minutes
-                    lines.insert(tindex + 5, f";Cura Time Estimate: {orig_hr}hr {orig_mmm}min {pause_str}")
-                    data[0] = "\n".join(lines)
-                    data[len(data)-1] += "M117 Orig Cura Est " + str(orig_hr) + "hr " + str(orig_mmm) + "min\n"
-                    if add_m118_line: data[len(data)-1] += "M118 Est w/FudgeFactor  " + str(speed_factor * 100) + "% was " + str(hr) + "hr " + str(mmm) + "min\n"
-            if not display_total_layers or not display_remaining_time:
-                base_display_text = "layer "
-            else:
-                base_display_text = ""
-            layer = data[len(data)-1]
-            data[len(data)-1] = layer.replace(";End of Gcode" + "\n", "")
-            data[len(data)-1] += ";End of Gcode" + "\n"
+        def begin(data):
+            nonlocal all_data, first_layer_index, last_layer_index, time_total, number_of_layers, time_estimate
+            all_data = data
+            if bool(self.getSettingValueByKey("recalculate_times")):
+                time_estimate = self._time_estimate(data)
+            time_total = int(data[0].split(";TIME:")[1].split("\n")[0])
             ## Search for the number of layers and the total time from the start code
             for index in range(len(data)):
                 data_section = data[index]
@@ -350,117 +342,202 @@ class DisplayInfoOnLCD_GV(Script):
                                     number_of_layers += 1
                         elif line.startswith(";TIME:"):
                             time_total = int(line.split(":")[1])
-            ## For all layers...
-            current_layer = 0
-            for layer_counter in range(len(data)-2):
-                current_layer += 1
-                layer_index = first_layer_index + layer_counter
-                display_text = base_display_text
-                display_text += str(current_layer)
-                ## Create a list where each element is a single line of code within the layer
-                lines = data[layer_index].split("\n")
-                if not ";LAYER:" in data[layer_index]:
-                    current_layer -= 1
-                    continue
-                ## Add the total number of layers if this option is checked
-                if display_total_layers:
-                    display_text += "/" + str(number_of_layers)
-                ## If display_remaining_time is checked, it is calculated in this loop
-                if display_remaining_time:
-                    time_remaining_display = " | ET "  ## initialize the time display
-                    m = (time_total - time_elapsed) // 60  ## estimated time in minutes
-                    m *= speed_factor  ## correct for printing time
-                    m = int(m)
-                    h, m = divmod(m, 60)  ## convert to hours and minutes
-                    ## Add the time remaining to the display_text
-                    if h > 0:  ## if it's more than 1 hour left, display format = xhxxm
-                        time_remaining_display += str(h) + "h"
-                        if m < 10:  ## Add trailing zero if necessary
-                            time_remaining_display += "0"
-                        time_remaining_display += str(m) + "m"
-                    else:
-                        time_remaining_display += str(m) + "m"
-                    display_text += time_remaining_display
-                    ## Find time_elapsed at the end of the layer (used to calculate the remaining time of the next layer)
-                    if not current_layer == number_of_layers:
-                        for line_index in range(len(lines) - 1, -1, -1):
-                            line = lines[line_index]
-                            if line.startswith(";TIME_ELAPSED:"):
-                                ## update time_elapsed for the NEXT layer and exit the loop
-                                time_elapsed = int(float(line.split(":")[1]))
-                                break
-                ## Insert the text AFTER the first line of the layer (in case other scripts use ";LAYER:")
-                for l_index, line in enumerate(lines):
-                    if line.startswith(";LAYER:"):
-                        lines[l_index] += "\nM117 " + display_text
-                        ## Add M73 line
-                        mins = int(60 * h + m)
-                        if m73_time:
-                            lines[l_index] += "\nM73 R{}".format(mins)
-                        if m73_percent:
-                            lines[l_index] += "\nM73 P" + str(round(int(current_layer) / int(number_of_layers) * 100))
-                        if add_m118_line:
-                            lines[l_index] += "\nM118 " + display_text
-                        break
-                ## Overwrite the layer with the modified layer
-                data[layer_index] = "\n".join(lines)
+            last_layer_index = first_layer_index + len(data) - 3
+            if time_estimate is not None:
+                time_total = round(time_estimate.total)
+
+        def wants(num):
+            if num in (0, 1, len(all_data) - 1):
+                return True
+            if time_estimate is not None and num in time_estimate.elapsed:
+                return True
+            return first_layer_index <= num <= last_layer_index and ";LAYER:" in all_data[num]
 
-            ## If enabled then change the ET to TP for 'Time To Pause'
-            if bool(self.getSettingValueByKey("countdown_to_pause")):
-                time_list = []
-                time_list.append("0")
-                time_list.append("0")
-                this_time = 0
-                pause_index = 1
+        def layer(num, lines):
+            ## The new times go in first so everything below reads them
+            if time_estimate is not None:
+                lines = time_estimate.rewrite_lines(num, lines)
+            if num == 0:
+                return self._progress_header(lines, all_data, m73_time, m73_percent, add_m118_line, speed_factor, ending_lines)
+            if num == 1 and add_m73_line:
+                lines.insert(0, "M75")
+            if num == len(all_data) - 1:
+                layer = "\n".join(lines)
+                if add_m73_line:
+                    layer += "M77\n"
+                layer += "".join(ending_lines)
+                layer = layer.replace(";End of Gcode" + "\n", "")
+                layer += ";End of Gcode" + "\n"
+                lines = layer.split("\n")
+            if first_layer_index <= num <= last_layer_index and any(";LAYER:" in line for line in lines):
+                lines = progress_layer(lines)
+            return lines
 
-                ## Get the layer times
-                for num in range(2,len(data) - 1):
-                    layer = data[num]
-                    lines = layer.split("\n")
-                    for line in lines:
-                        if line.startswith(";TIME_ELAPSED:"):
-                            this_time = (float(line.split(":")[1]))*speed_factor
-                            time_list.append(str(this_time))
-                            for p_cmd in pause_cmd:
-                                if p_cmd in layer:
-                                    for qnum in range(num - 1, pause_index, -1):
-                                        time_list[qnum] = str(float(this_time) - float(time_list[qnum])) + "P"
-                                    pause_index = num-1
-                                    break
-                
-                ## Make the adjustments to the M117 (and M118) lines that are prior to a pause
-                for num in range (2, len(data) - 1,1):
-                    layer = data[num]
-                    lines = layer.split("\n")
-                    for line in lines:
-                        try:
-                            if line.startswith("M117") and "|" in line and "P" in time_list[num]:
-                                M117_line = line.split("|")[0] + "| TP "
-                                alt_time = time_list[num][:-1]
-                                hhh = int(float(alt_time) / 3600)
-                                if hhh > 0:
-                                    hhr = str(hhh) + "h"
-                                else:
-                                    hhr = ""
-                                mmm = ((float(alt_time) / 3600) - (int(float(alt_time) / 3600))) * 60
-                                sss = int((mmm - int(mmm)) * 60)
-                                mmm = str(round(mmm)) + "m"
-                                time_to_go = str(hhr) + str(mmm)
-                                if hhr == "": time_to_go = time_to_go + str(sss) + "s"
-                                M117_line = M117_line + time_to_go
-                                layer = layer.replace(line, M117_line)
-                            if line.startswith("M118") and "|" in line and "P" in time_list[num]:
-                                M118_line = line.split("|")[0] + "| TP " + time_to_go
-                                layer = layer.replace(line, M118_line)
-                        except:
-                            continue
-                    data[num] = layer
+        ## For all layers...
+        def progress_layer(lines):
+            nonlocal current_layer, time_elapsed
+            current_layer += 1
+            display_text = base_display_text
+            display_text += str(current_layer)
+            ## Add the total number of layers if this option is checked
+            if display_total_layers:
+                display_text += "/" + str(number_of_layers)
+            ## The remaining time (it is also used by M73)
+            m = (time_total - time_elapsed) // 60  ## estimated time in minutes
+            m *= speed_factor  ## correct for printing time
+            m = int(m)
+            h, m = divmod(m, 60)  ## convert to hours and minutes
+            ## If display_remaining_time is checked, add it to the display_text
+            if display_remaining_time:
+                time_remaining_display = " | ET "  ## initialize the time display
+                if h > 0:  ## if it's more than 1 hour left, display format = xhxxm
+                    time_remaining_display += str(h) + "h"
+                    if m < 10:  ## Add trailing zero if necessary
+                        time_remaining_display += "0"
+                    time_remaining_display += str(m) + "m"
+                else:
+                    time_remaining_display += str(m) + "m"
+                display_text += time_remaining_display
+            ## Find time_elapsed at the end of the layer (used to calculate the remaining time of the next layer)
+            if not current_layer == number_of_layers:
+                for line_index in range(len(lines) - 1, -1, -1):
+                    line = lines[line_index]
+                    if line.startswith(";TIME_ELAPSED:"):
+                        ## update time_elapsed for the NEXT layer and exit the loop
+                        time_elapsed = int(float(line.split(":")[1]))
+                        break
+            ## Insert the text AFTER the first line of the layer (in case other scripts use ";LAYER:")
+            for l_index, line in enumerate(lines):
+                if line.startswith(";LAYER:"):
+                    lines[l_index] += "\nM117 " + display_text
+                    ## Add M73 line
+                    mins = int(60 * h + m)
+                    if m73_time:
+                        lines[l_index] += "\nM73 R{}".format(mins)
+                    if m73_percent:
+                        lines[l_index] += "\nM73 P" + str(round(int(current_layer) / int(number_of_layers) * 100))
+                    if add_m118_line:
+                        lines[l_index] += "\nM118 " + display_text
+                    break
+            return lines
 
-            setting_data = ""
+        def end(data):
             if bool(self.getSettingValueByKey("enable_end_message")):
                 message_str = self.message_to_user(speed_factor)
                 Message(title = "[Display Info on LCD] - Estimated Finish Time", text = message_str[0] + "\n\n" + message_str[1] + "\n" + message_str[2] + "\n" + message_str[3]).show()
-        return data
+
+        return LayerHooks(begin = begin, wants = wants, layer = layer, end = end)
+
+    ## Add the Initial Layer Height, Nozzle Size and the time estimates to the opening paragraph
+    def _progress_header(self, lines: list, data: list, m73_time: bool, m73_percent: bool, add_m118_line: bool, speed_factor: float, ending_lines: list) -> list:
+        first_section = "\n".join(lines)
+        ## Add the Initial Layer Height just below Layer Height in data[0]
+        init_layer_hgt_line = ";Initial Layer Height: " + str(Application.getInstance().getGlobalContainerStack().getProperty("layer_height_0", "value"))
+        nozzle_size_line = ";Nozzle Size T0: " + str(Application.getInstance().getGlobalContainerStack().extruderList[0].getProperty("machine_nozzle_size", "value"))
+        match = re.search(";Layer height: (\d\.\d*)", first_section)[0]
+        first_section = re.sub(match, match + "\n" + init_layer_hgt_line + "\n" + nozzle_size_line, first_section)
+        lines = first_section.split("\n")
+        for line in lines:
+            if line.startswith(";TIME:"):
+                tindex = lines.index(line)
+                cura_time = int(line.split(":")[1])
+                print_time = cura_time * speed_factor
+                hhh = print_time/3600
+                hr = round(hhh // 1)
+                mmm = round((hhh % 1) * 60)
+                orig_hhh = cura_time/3600
+                orig_hr = round(orig_hhh // 1)
+                orig_mmm = math.floor((orig_hhh % 1) * 60)
+                if add_m118_line: lines.insert(tindex + 5,"M118 Adjusted Print Time " + str(hr) + "hr " + str(mmm) + "min")
+                lines.insert(tindex + 5,"M117 ET " + str(hr) + "hr " + str(mmm) + "min")
+                ## Add M73 line at beginning
+                mins = int(60 * hr + mmm)
+                if m73_time:
+                    lines.insert(tindex + 4, "M73 R{}".format(mins))
+                if m73_percent:
+                    lines.insert(tindex + 4, "M73 P0")
+                ## If Countdown to pause is enabled then count the pauses
+                pause_str = ""
+                if bool(self.getSettingValueByKey("countdown_to_pause")):
+                    pause_count = 0
+                    pause_setting = self.getSettingValueByKey("pause_cmd").upper()
+                    pause_cmd = []
+                    if "," in pause_setting:
+                        pause_cmd = pause_setting.split(",")
+                    else:
+                        pause_cmd.append(pause_setting)
+                    for q in range(0, len(pause_cmd)):
+                        pause_cmd[q] = "\n" + pause_cmd[q]
+                    for num in range(2,len(data) - 2, 1):
+                        for q in range(0,len(pause_cmd)):
+                            if pause_cmd[q] in data[num]:
+                                pause_count += data[num].count(pause_cmd[q], 0, len(data[num]))
+                    pause_str = f" with {pause_count} pause(s)"
+                    self._pause_cmd = pause_cmd
+                ## This line goes in to convert seconds to hours and minutes
+                lines.insert(tindex + 5, f";Cura Time Estimate: {orig_hr}hr {orig_mmm}min {pause_str}")
+                ending_lines.append("M117 Orig Cura Est " + str(orig_hr) + "hr " + str(orig_mmm) + "min\n")
+                if add_m118_line: ending_lines.append("M118 Est w/FudgeFactor  " + str(speed_factor * 100) + "% was " + str(hr) + "hr " + str(mmm) + "min\n")
+        return lines
+
+    ## A new print time estimate for the ;TIME: and ;TIME_ELAPSED: lines (the scripts before this one may have changed the moves)
+    def _time_estimate(self, data: list):
+        from GcodeTools_GV import MotionLimits, PrintTimeEstimate
+        global_stack = Application.getInstance().getGlobalContainerStack()
+        limits = MotionLimits.from_settings(lambda key: global_stack.getProperty(key, "value"))
+        return PrintTimeEstimate(data, limits, bool(global_stack.getProperty("relative_extrusion", "value")))
+
+    ## Change the ET to TP for 'Time To Pause' on the layers before each pause
+    def _countdown_to_pause(self, data: list, pause_cmd: list, speed_factor: float):
+        time_list = []
+        time_list.append("0")
+        time_list.append("0")
+        this_time = 0
+        pause_index = 1
+
+        ## Get the layer times (the statistics find the ;TIME_ELAPSED: of every layer in one pass)
+        from GcodeTools_GV import LayerStats
+        stats = LayerStats(data, read_moves = False)
+        for num in range(2,len(data) - 1):
+            layer = data[num]
+            if stats.elapsed(num) is not None:
+                this_time = stats.elapsed(num)*speed_factor
+                time_list.append(str(this_time))
+                for p_cmd in pause_cmd:
+                    if p_cmd in layer:
+                        for qnum in range(num - 1, pause_index, -1):
+                            time_list[qnum] = str(float(this_time) - float(time_list[qnum])) + "P"
+                        pause_index = num-1
+                        break
+        
+        ## Make the adjustments to the M117 (and M118) lines that are prior to a pause
+        for num in range (2, len(data) - 1,1):
+            layer = data[num]
+            lines = layer.split("\n")
+            for line in lines:
+                try:
+                    if line.startswith("M117") and "|" in line and "P" in time_list[num]:
+                        M117_line = line.split("|")[0] + "| TP "
+                        alt_time = time_list[num][:-1]
+                        hhh = int(float(alt_time) / 3600)
+                        if hhh > 0:
+                            hhr = str(hhh) + "h"
+                        else:
+                            hhr = ""
+                        mmm = ((float(alt_time) / 3600) - (int(float(alt_time) / 3600))) * 60
+                        sss = int((mmm - int(mmm)) * 60)
+                        mmm = str(round(mmm)) + "m"
+                        time_to_go = str(hhr) + str(mmm)
+                        if hhr == "": time_to_go = time_to_go + str(sss) + "s"
+                        M117_line = M117_line + time_to_go
+                        layer = layer.replace(line, M117_line)
+                    if line.startswith("M118") and "|" in line and "P" in time_list[num]:
+                        M118_line = line.split("|")[0] + "| TP " + time_to_go
+                        layer = layer.replace(line, M118_line)
+                except:
+                    continue
+            data[num] = layer
+        return
 
     def message_to_user(self, speed_factor: float):
         ## Message the user of the projected finish time of the print
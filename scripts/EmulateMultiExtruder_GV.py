@@ -260,58 +260,34 @@ class EmulateMultiExtruder_GV(Script):
         t3_replacement_pre_string_1 = ";TYPE:CUSTOM  T3 Tool Change replacement code\n" + m84_line + "\nG91 ;Relative positioning\n"
         t3_replacement_pre_string_2 = "G1 F600 Z3 ;Move Up\nG90 ;Absolute movement\n" + park_string + m300_str + t3_temp + t3_str + m118_t3_str + pause_cmd
         purge_line = "M83\nG1 F200 E10\n" + retract_line + "G92 E0\n"
+        replacement_pre_strings = [(t0_replacement_pre_string_1, t0_replacement_pre_string_2), (t1_replacement_pre_string_1, t1_replacement_pre_string_2),
+                                   (t2_replacement_pre_string_1, t2_replacement_pre_string_2), (t3_replacement_pre_string_1, t3_replacement_pre_string_2)]
+        ## Where the tool changes are.  Lines are replaced below but none are added so the line indexes stay good.
+        from GcodeTools_GV import LineFinder, ToolTimeline
+        timeline = ToolTimeline(data)
         # Comment out the first tool changes-----------------------------------
         lines = data[1].split("\n")
-        for index, line in enumerate(lines):
-            if line in ["T0","T1","T2","T3"]:
-                lines[index] = ";" + line
+        for item_nr, index, tool_nr in timeline.changes(1):
+            if lines[index] in ["T0","T1","T2","T3"]:
+                lines[index] = ";" + lines[index]
         data[1] = "\n".join(lines)
         skip_it = 2 if bool(self.getSettingValueByKey("skip_skirt")) else 0
+        retract_start = "G1 F" + str(retract_speed) + " E"
+        finder_tests = {"xy": lambda line: " X" in line and " Y" in line, "retract": lambda line: line.startswith(retract_start)}
         for num in range(2,len(data)-1,1):
             lines = data[num].split("\n")
+            tool_lines = {index: tool_nr for item_nr, index, tool_nr in timeline.changes(num) if tool_nr < 4}
+            ## The return locations are looked up in the layer as it was before any tool change in it was replaced
+            finder = LineFinder(lines, finder_tests)
+            self._previous_finder = None
             for index, line in enumerate(lines):
                 if lines[index].startswith("M109"):
                     lines[index] = "M104 S" + lines[index].split("S")[1]
-                    data[num] = "\n".join(lines)
-                if line.startswith("T0"):
+                if index in tool_lines:
                     if skip_it > 0:
                         skip_it -= 1
                         continue
-                    return_location_list = []
-                    return_location_list = self.getReturnLocation(data, num, index, retract_speed)
-                    return_location = str(return_location_list[0])
-                    is_retraction = bool(return_location_list[1])
-                    if is_retraction:
-                        retract_str = retract_line
-                        unretract_str = unretract_line
-                    else:
-                        retract_str = ""
-                        unretract_str = ""
-                    return_to_str = f"G0 F{speed_travel}{return_location}\n"
-                    final_str = t0_replacement_pre_string_1 + retract_str + t0_replacement_pre_string_2 + purge_line + return_to_str + "G91\nG0 F600 Z-3\nG90\n" + unretract_str + ext_mode_str + "; End of change"
-                    lines[index] = final_str
-                    data[num] = "\n".join(lines)
-                if line.startswith("T1"):
-                    if skip_it > 0:
-                        skip_it -= 1
-                        continue
-                    return_location = self.getReturnLocation(data, num, index, retract_speed)[0]
-                    is_retraction = bool(self.getReturnLocation(data, num, index, retract_speed)[1])
-                    if is_retraction:
-                        retract_str = retract_line
-                        unretract_str = unretract_line
-                    else:
-                        retract_str = ""
-                        unretract_str = ""
-                    return_to_str = f"G0 F{speed_travel}{return_location}\n"
-                    final_str = t1_replacement_pre_string_1 + retract_str + t1_replacement_pre_string_2 + purge_line + return_to_str + "G91\nG0 F600 Z-3\nG90\n" + unretract_str + ext_mode_str + "; End of change"
-                    lines[index] = final_str #lines.insert(index+1,final_str)
-                    data[num] = "\n".join(lines)
-                if line.startswith("T2"):
-                    if skip_it > 0:
-                        skip_it -= 1
-                        continue
-                    return_location_list = self.getReturnLocation(data, num, index, retract_speed)
+                    return_location_list = self.getReturnLocation(data, num, index, finder)
                     return_location = return_location_list[0]
                     is_retraction = bool(return_location_list[1])
                     if is_retraction:
@@ -321,50 +297,37 @@ class EmulateMultiExtruder_GV(Script):
                         retract_str = ""
                         unretract_str = ""
                     return_to_str = f"G0 F{speed_travel}{return_location}\n"
-                    final_str = t2_replacement_pre_string_1 + retract_str + t2_replacement_pre_string_2 + purge_line + return_to_str + "G91\nG0 F600 Z-3\nG90\n" + unretract_str + ext_mode_str + "; End of change"
-                    lines[index] = final_str #lines[index].replace(lines[index],final_str)
-                    data[num] = "\n".join(lines)
-                if line.startswith("T3"):
-                    if skip_it > 0:
-                        skip_it -= 1
-                        continue
-                    return_location_list = self.getReturnLocation(data, num, index, retract_speed)
-                    return_location = return_location_list[0]
-                    is_retraction = bool(return_location_list[1])
-                    if is_retraction:
-                        retract_str = retract_line
-                        unretract_str = unretract_line
-                    else:
-                        retract_str = ""
-                        unretract_str = ""
-                    return_to_str = f"G0 F{speed_travel}{return_location}\n"
-                    final_str = t3_replacement_pre_string_1 + retract_str + t3_replacement_pre_string_2 + purge_line + return_to_str + "G91\nG0 F600 Z-3\nG90\n" + unretract_str + ext_mode_str + "; End of change"
-                    lines[index] = final_str #lines[index] = final_str
-                    data[num] = "\n".join(lines)
+                    pre_string_1, pre_string_2 = replacement_pre_strings[tool_lines[index]]
+                    final_str = pre_string_1 + retract_str + pre_string_2 + purge_line + return_to_str + "G91\nG0 F600 Z-3\nG90\n" + unretract_str + ext_mode_str + "; End of change"
+                    lines[index] = final_str
+            data[num] = "\n".join(lines)
         return data
 
-    def getReturnLocation(self, data: str, num: int, index: int, retract_speed: str) -> str:
-        lines = data[num].split("\n")
+    def getReturnLocation(self, data: str, num: int, index: int, finder) -> str:
+        ## 'finder' is the LineFinder of data[num].  The last X/Y line above the tool change is the return location.
         is_retraction = None
         ret_x = 0
         ret_y = 0
-        for back_num in range(index,0, -1):
-            if lines[back_num].startswith("G1 F" + str(retract_speed) + " E"):
-                if is_retraction is None: is_retraction = True
-            if " X" in lines[back_num] and " Y" in lines[back_num]:
-                ret_x = self.getValue(lines[back_num], "X")
-                ret_y = self.getValue(lines[back_num], "Y")
-                break
+        xy_row = finder.last("xy", index, 1)
+        if finder.any_between("retract", 1 if xy_row is None else xy_row, index):
+            is_retraction = True
+        if xy_row is not None:
+            ret_x = self.getValue(finder.lines[xy_row], "X")
+            ret_y = self.getValue(finder.lines[xy_row], "Y")
         if ret_x == 0:
-            lines = data[num - 1].split("\n")
+            ## Look in the previous layer.  It is the same for every tool change in this layer so it is only read once.
+            if self._previous_finder is None:
+                from GcodeTools_GV import LineFinder
+                self._previous_finder = LineFinder(data[num - 1].split("\n"), finder.tests)
+            previous = self._previous_finder
+            last_row = len(previous.lines) - 1
             ret_x = 0
             ret_y = 0
-            for back_num in range(len(lines) - 1,0, -1):
-                if lines[back_num].startswith("G1 F" + str(retract_speed) + " E"):
-                    is_retraction = True
-                if " X" in lines[back_num] and " Y" in lines[back_num]:
-                    ret_x = self.getValue(lines[back_num], "X")
-                    ret_y = self.getValue(lines[back_num], "Y")
-                    break
+            xy_row = previous.last("xy", last_row, 1)
+            if previous.any_between("retract", 1 if xy_row is None else xy_row, last_row):
+                is_retraction = True
+            if xy_row is not None:
+                ret_x = self.getValue(previous.lines[xy_row], "X")
+                ret_y = self.getValue(previous.lines[xy_row], "Y")
         ret_loc = " X" + str(ret_x) + " Y" + str(ret_y)
         return [ret_loc, is_retraction]
\ No newline at end of file
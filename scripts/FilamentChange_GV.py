@@ -34,7 +34,7 @@ class FilamentChange_GV(Script):
                 "layer_number":
                 {
                     "label": "Layer",
-                    "description": "Use the Cura Preview numbers.  The Filament Change will occur at the START of the indicated layer(s).  You can use this script for multiple color changes by delimiting the layer numbers with commas.  (EX:  15,20,25)",
+                    "description": "Use the Cura Preview numbers.  The Filament Change will occur at the START of the indicated layer(s).  You can use this script for multiple color changes by delimiting the layer numbers with commas.  (EX:  15,20,25)  Ranges like '30-40' or '10-100/10' (every 10th layer) are allowed as well.",
                     "unit": "lay num(s)",
                     "type": "str",
                     "default_value": "10",
@@ -176,12 +176,10 @@ class FilamentChange_GV(Script):
         enabled = self.getSettingValueByKey("enabled")
         layer_nums = self.getSettingValueByKey("layer_number")
         adhesion_type = Application.getInstance().getGlobalContainerStack().getProperty("adhesion_type", "value")
-        ## Get the raft layer count to adjust the Cura Preview layer to the Gcode layer
-        raft_layers = 0
-        if "raft" in adhesion_type:
-            for num in range(2,10):
-                if ";LAYER:-" in data[num]:
-                    raft_layers += 1
+        ## Find the layers once.  The raft layer count adjusts the Cura Preview layer to the Gcode layer
+        from GcodeTools_GV import LayerIndex
+        layer_index = LayerIndex(data)
+        raft_layers = layer_index.raft_layers if "raft" in adhesion_type else 0
         ## Get the settings
         initial_retract = self.getSettingValueByKey("initial_retract")
         later_retract = self.getSettingValueByKey("later_retract")
@@ -228,19 +226,34 @@ class FilamentChange_GV(Script):
 
         color_change += ";----------End Filament Change\n"
         ## Insert the color_change script at the indicated layers taking into account raft layers and Base 0 numbering.
-        layer_targets = layer_nums.split(",")
+        ## A layer list like "15,20,25", "30-40" or "10-100/10".  An open range ("50-") runs to the last layer.
+        from GcodeTools_GV import LayerRanges
+        top_layer = layer_index.top_layer()
+        try:
+            layer_targets = LayerRanges(layer_nums).layers(None if top_layer is None else top_layer + 1 + raft_layers)
+        except ValueError:
+            Message(title = "[Filament Change]", text = "The layer numbers could not be read.  Please double check the layer numbers.").show()
+            return data
+        ## The targets that were found (in One-at-a-Time a layer is in every model so the changes aren't counted)
+        layers_found = set()
         if len(layer_targets) > 0:
-            layers_found = 0
+            changes = []
             for layer_num in layer_targets:
-                actual_num = str(int(layer_num) - raft_layers - 1)
                 try:
-                    for num in range(2, len(data)-1):
+                    actual_num = str(int(layer_num) - raft_layers - 1)
+                    for num in layer_index.indexes_of(actual_num):
                         if ";LAYER:" + actual_num + "\n" in data[num]:
                             color_change = re.sub("plugin", "(Start of Cura preview layer: " + str(layer_num) + ")", color_change)
-                            data[num] = re.sub(";LAYER:" + actual_num + "\n", ";LAYER:" + actual_num + "\n" + color_change, data[num])
-                            layers_found += 1
+                            changes.append((num, layer_num, actual_num, color_change))
+                except:
+                    pass
+            ## Make the changes in the order of the gcode (in One-at-a-Time a layer number is in every model)
+            for num, layer_num, actual_num, change in sorted(changes, key = lambda change: change[0]):
+                try:
+                    data[num] = re.sub(";LAYER:" + actual_num + "\n", ";LAYER:" + actual_num + "\n" + change, data[num])
+                    layers_found.add(layer_num)
                 except:
                     pass
-        if layers_found != len(layer_targets):
+        if len(layers_found) != len(layer_targets) or not layer_targets:
             Message(title = "[Filament Change]", text = "Some layers were not found.  Please double check the layer numbers.").show()
         return data
@@ -0,0 +1,2544 @@
+# Copyright (c) 2024 GregValiant
+#   Released under the terms of the AGPLv3 or higher.
+#
+#   Shared helpers for the GV post processors.  This file is NOT a post processor.  It must be in the same "scripts"
+#   folder as the *_GV.py scripts that use it.  When Cura loads the scripts folder it also loads this file and registers
+#   it as "GcodeTools_GV" (Cura will log that it has no script class - that is expected and harmless).
+#   The scripts import it inside execute() with "from GcodeTools_GV import ...".
+#
+#   Nothing in here imports UM or cura so it can also be used by the headless runner and by worker processes.
+
+import bisect
+import itertools
+import math
+import multiprocessing
+import os
+import re
+import sys
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from decimal import Decimal
+from typing import Callable, Dict, Iterable, List, Optional, Tuple, Union
+
+## The number after a parameter letter.  Same pattern as Script.getValue.
+_NUMBER = re.compile(r"-?[0-9]+\.?[0-9]*")
+## Rows are made for the lines that start with one of these
+_COMMAND_LETTERS = ("G", "T")
+## MoveTable.g of a row that hasn't been parsed yet
+_UNREAD = -2
+MOVES = (0, 1, 2, 3)
+## map_layers() does files smaller than this (characters in the items it changes) in this process.  Starting the
+## workers and sending the layers back costs more than it saves.
+PARALLEL_MIN_CHARS = 16 * 1024 * 1024
+## 0 for one worker per core.  1 (no workers) unless the headless runner raises it: inside Cura the process that
+## would be forked is Cura itself, and Cura doesn't always run frozen.
+PARALLEL_WORKERS = 1
+
+
+class LayerIndex:
+    """Where the layers are in Cura's data[] list, found in a single pass.
+
+    data[0] is the header, data[1] the startup gcode, then one item per ";LAYER:" and data[-1] is the ending gcode.
+    Layer numbers are the gcode numbers (";LAYER:-2" for a raft layer, ";LAYER:0" for the first model layer).
+    In a One-at-a-Time print every model starts at ";LAYER:0" again so a layer number can be in more than one item.
+    The index holds data[] positions so it stays good while text is added to the items.  Build a new one if items
+    are added to or removed from the list.
+    """
+
+    def __init__(self, data: List[str]) -> None:
+        self.data_count = len(data)
+        self.layer_count = None                 # From ";LAYER_COUNT:" in the startup gcode
+        self.raft_layers = 0                    # Number of ";LAYER:-n" items before the first ";LAYER:0"
+        self.first_layer_index = None           # The first ";LAYER:" item (a raft layer if there is a raft)
+        self.last_layer_index = None            # The last ";LAYER:" item
+        self.layer_0_index = None               # The first ";LAYER:0" item
+        self.model_starts = []                  # Every ";LAYER:0" item.  One entry per model in One-at-a-Time.
+        self.layer_numbers = [None] * len(data) # The layer number of each item (None for header/startup/ending)
+        self.time_elapsed = [None] * len(data)  # The last ";TIME_ELAPSED:" value of each item
+        self._layers = {}                       # {layer number: [data indexes]}
+
+        for num, item in enumerate(data):
+            pos = item.find(";LAYER:")
+            while pos != -1:
+                ## Same test the scripts used: a whole ";LAYER:n" line
+                line_end = item.find("\n", pos)
+                if line_end != -1 and (pos == 0 or item[pos - 1] == "\n"):
+                    try:
+                        layer_nr = int(item[pos + 7:line_end])
+                    except ValueError:
+                        layer_nr = None
+                    if layer_nr is not None:
+                        self._addLayer(num, layer_nr)
+                pos = item.find(";LAYER:", pos + 7)
+            pos = item.rfind(";TIME_ELAPSED:")
+            if pos != -1:
+                line_end = item.find("\n", pos)
+                try:
+                    self.time_elapsed[num] = float(item[pos + 14:line_end if line_end != -1 else len(item)])
+                except ValueError:
+                    pass
+
+        ## The layer count is at the end of the startup gcode
+        stop_at = self.first_layer_index if self.first_layer_index is not None else len(data)
+        for num in range(0, stop_at):
+            pos = data[num].find(";LAYER_COUNT:")
+            if pos != -1:
+                line_end = data[num].find("\n", pos)
+                try:
+                    self.layer_count = int(data[num][pos + 13:line_end if line_end != -1 else len(data[num])])
+                except ValueError:
+                    pass
+                break
+
+    def _addLayer(self, num: int, layer_nr: int) -> None:
+        indexes = self._layers.setdefault(layer_nr, [])
+        if not indexes or indexes[-1] != num:
+            indexes.append(num)
+        if self.layer_numbers[num] is None:
+            self.layer_numbers[num] = layer_nr
+        if self.first_layer_index is None:
+            self.first_layer_index = num
+        self.last_layer_index = num
+        if layer_nr == 0:
+            if self.layer_0_index is None:
+                self.layer_0_index = num
+            if not self.model_starts or self.model_starts[-1] != num:
+                self.model_starts.append(num)
+        elif layer_nr < 0 and self.layer_0_index is None:
+            self.raft_layers += 1
+
+    def index_of(self, layer_nr: int, start: int = 0) -> Optional[int]:
+        """The first data[] index at or after 'start' that holds ";LAYER:<layer_nr>", or None."""
+        indexes = self._layers.get(int(layer_nr), [])
+        pos = bisect.bisect_left(indexes, start)
+        return indexes[pos] if pos < len(indexes) else None
+
+    def indexes_of(self, layer_nr: int) -> List[int]:
+        """Every data[] index that holds ";LAYER:<layer_nr>" (more than one in One-at-a-Time prints)."""
+        return list(self._layers.get(int(layer_nr), []))
+
+    def has_layer(self, layer_nr: int) -> bool:
+        return int(layer_nr) in self._layers
+
+    def layer_number(self, data_index: int) -> Optional[int]:
+        return self.layer_numbers[data_index]
+
+    def layer_indexes(self) -> List[int]:
+        """The data[] indexes of all the layer items in order."""
+        return [num for num, layer_nr in enumerate(self.layer_numbers) if layer_nr is not None]
+
+    def model_of(self, data_index: int) -> int:
+        """Which model (0 based) a data[] index belongs to.  Always 0 for All-at-Once prints."""
+        return max(bisect.bisect_right(self.model_starts, data_index) - 1, 0)
+
+    def layers(self) -> Dict[int, List[int]]:
+        return {layer_nr: list(indexes) for layer_nr, indexes in self._layers.items()}
+
+    def top_layer(self) -> Optional[int]:
+        """The highest ";LAYER:" number in the gcode, or None if there are no layers."""
+        return max(self._layers) if self._layers else None
+
+
+## One entry of a layer list: "12", "28-31", "40-" (to the last layer) or "10-200/5" (every 5th layer)
+_RANGE_ENTRY = re.compile(r"(-?[0-9]+)(?:(-)(-?[0-9]+)?)?(?:/([0-9]+))?$")
+
+
+class LayerRanges:
+    """A layer list like "10,15,28-31" compiled to sorted intervals, so 'layer in ranges' is a binary search.
+
+    Entries are separated by commas and spaces are ignored.  An entry is a layer ("12"), a range with both ends
+    included ("28-31"), a range that runs to the last layer ("40-") or a range with a step ("10-200/5" is 10, 15 ... 200).
+    'offset' is added to every number.  The scripts use -1 (less the raft layers where the setting counts them) to turn
+    the Cura preview numbers into ";LAYER:" numbers.  A layer that is entered twice is only in the set once.
+    A bad entry raises ValueError.
+    """
+
+    def __init__(self, spec: str, offset: int = 0) -> None:
+        self.spec = str(spec)
+        self._starts = []       # The step 1 entries merged into intervals that don't touch, sorted
+        self._ends = []         # The last layer of each interval (math.inf for an open range)
+        self._stepped = []      # (first, step) of the open ranges with a step
+        intervals = []
+        for entry in self.spec.replace(" ", "").split(","):
+            if entry == "":
+                continue
+            found = _RANGE_ENTRY.match(entry)
+            if found is None:
+                raise ValueError("'" + entry + "' is not a layer number or a range of layers")
+            first = int(found.group(1)) + offset
+            if found.group(2) is None:
+                last = first
+            elif found.group(3) is None:
+                last = math.inf
+            else:
+                last = int(found.group(3)) + offset
+            step = int(found.group(4)) if found.group(4) is not None else 1
+            if last < first or step < 1:
+                raise ValueError("'" + entry + "' is not a layer number or a range of layers")
+            if step == 1:
+                intervals.append((first, last))
+            elif last == math.inf:
+                self._stepped.append((first, step))
+            else:
+                intervals += [(layer, layer) for layer in range(first, last + 1, step)]
+        intervals.sort()
+        for first, last in intervals:
+            if self._ends and first <= self._ends[-1] + 1:
+                self._ends[-1] = max(self._ends[-1], last)
+            else:
+                self._starts.append(first)
+                self._ends.append(last)
+
+    @classmethod
+    def from_intervals(cls, intervals: Iterable[tuple]) -> "LayerRanges":
+        """The set of the (first, last) layer numbers (both included) in 'intervals'.  A last of None is open."""
+        return cls(",".join(str(first) + "-" + ("" if last is None else str(last)) for first, last in intervals if last is None or last >= first))
+
+    def __contains__(self, layer_nr: int) -> bool:
+        if layer_nr is None:
+            return False
+        at = bisect.bisect_right(self._starts, layer_nr) - 1
+        if at >= 0 and layer_nr <= self._ends[at]:
+            return True
+        return any(layer_nr >= first and (layer_nr - first) % step == 0 for first, step in self._stepped)
+
+    def __bool__(self) -> bool:
+        return bool(self._starts or self._stepped)
+
+    @property
+    def is_open(self) -> bool:
+        """True if a range runs to the last layer."""
+        return bool(self._stepped) or (bool(self._ends) and self._ends[-1] == math.inf)
+
+    @property
+    def first(self) -> Optional[int]:
+        firsts = self._starts[:1] + [first for first, step in self._stepped]
+        return min(firsts) if firsts else None
+
+    def intervals(self) -> List[tuple]:
+        """The merged (first, last) step 1 intervals.  last is None for an open range."""
+        return [(first, None if last == math.inf else last) for first, last in zip(self._starts, self._ends)]
+
+    def layers(self, last: Optional[int] = None) -> List[int]:
+        """The layer numbers in the set in order.  An open range stops at 'last', which it needs.  The layers and the
+        closed ranges are not cut off at 'last' so the caller can tell that they aren't in the gcode."""
+        if last is None and self.is_open:
+            raise ValueError("'" + self.spec + "' has a range that runs to the last layer")
+        found = set()
+        for first, end in zip(self._starts, self._ends):
+            found.update(range(first, int(last if end == math.inf else end) + 1))
+        for first, step in self._stepped:
+            found.update(range(first, last + 1, step))
+        return sorted(found)
+
+    def data_indexes(self, layer_index: "LayerIndex") -> List[int]:
+        """The data[] indexes (in order) of the layer items whose ";LAYER:" number is in the set."""
+        return [num for num, layer_nr in enumerate(layer_index.layer_numbers) if layer_nr is not None and layer_nr in self]
+
+
+class MoveTable:
+    """The G/T command numbers and the X/Y/Z/E/F values of the lines in one data[] item, kept in columns.
+
+    Row n is line n of 'lines' (the item split on "\n").  'g' and 't' are -1 when the line doesn't have one and the
+    X/Y/Z/E/F columns are NaN when the parameter isn't on the line.  Only lines that start with "G" or "T" are parsed.
+    A row is parsed the first time it is asked for and the lookups only parse the lines that contain the parameter
+    (" X", " F"...), so asking for the last Z of a layer reads a few lines from the end instead of the whole layer.
+    value() gives the same answer as Script.getValue, including an int for a number written without a decimal point,
+    so values can go back into the gcode unchanged.
+    """
+
+    _COLUMN_BITS = {"X": 1, "Y": 2, "Z": 4, "E": 8, "F": 16}
+
+    def __init__(self, layer: str) -> None:
+        self.lines = layer.split("\n")
+        row_count = len(self.lines)
+        self.g = array("i", [_UNREAD]) * row_count   # _UNREAD until the row is parsed
+        self.t = array("i", [-1]) * row_count
+        self.x = array("d", [math.nan]) * row_count
+        self.y = array("d", [math.nan]) * row_count
+        self.z = array("d", [math.nan]) * row_count
+        self.e = array("d", [math.nan]) * row_count
+        self.f = array("d", [math.nan]) * row_count
+        self._whole = array("B", [0]) * row_count    # Bit set (see _COLUMN_BITS) when getValue would return an int
+        self._columns = {"X": self.x, "Y": self.y, "Z": self.z, "E": self.e, "F": self.f}
+
+    def __len__(self) -> int:
+        return len(self.lines)
+
+    def _parse(self, row: int) -> None:
+        line = self.lines[row]
+        if not line.startswith(_COMMAND_LETTERS):
+            self.g[row] = -1
+            return
+        cut = line.find(";")
+        words = (line if cut == -1 else line[:cut]).split()
+        found = _NUMBER.match(words[0], 1) if words else None
+        command = int(float(found.group(0))) if found is not None else -1
+        if line[0] == "G":
+            self.g[row] = command
+        else:
+            self.g[row] = -1
+            self.t[row] = command
+        columns = self._columns
+        whole = 0
+        for word in words[1:]:
+            letter = word[0]
+            if not letter in columns or columns[letter][row] == columns[letter][row]:
+                continue
+            found = _NUMBER.match(word, 1)
+            if found is None:
+                continue
+            text = found.group(0)
+            columns[letter][row] = float(text)
+            if not "." in text:
+                whole |= self._COLUMN_BITS[letter]
+        self._whole[row] = whole
+
+    def command(self, row: int) -> int:
+        """The G number of the row, -1 if it isn't a G line."""
+        if self.g[row] == _UNREAD:
+            self._parse(row)
+        return self.g[row]
+
+    def tool(self, row: int) -> int:
+        """The T number of the row, -1 if it isn't a tool change."""
+        if self.g[row] == _UNREAD:
+            self._parse(row)
+        return self.t[row]
+
+    def has(self, row: int, letter: str) -> bool:
+        if self.g[row] == _UNREAD:
+            self._parse(row)
+        return not math.isnan(self._columns[letter][row])
+
+    def value(self, row: int, letter: str, default = None) -> Union[int, float, None]:
+        """The X/Y/Z/E/F value of a row the way Script.getValue returns it, or 'default'."""
+        if self.g[row] == _UNREAD:
+            self._parse(row)
+        number = self._columns[letter][row]
+        if math.isnan(number):
+            return default
+        return int(number) if self._whole[row] & self._COLUMN_BITS[letter] else number
+
+    def rows_with(self, letter: str, g_codes: Optional[Iterable[int]] = None) -> List[int]:
+        """The rows (in order) that have a value for 'letter', only the G0/G1/... rows in 'g_codes' if it is given."""
+        key = " " + letter
+        g_codes = set(g_codes) if g_codes is not None else None
+        rows = []
+        for row in [row for row, line in enumerate(self.lines) if key in line]:
+            if self.has(row, letter) and (g_codes is None or self.g[row] in g_codes):
+                rows.append(row)
+        return rows
+
+    def tool_rows(self) -> List[int]:
+        """The rows of the "T" lines."""
+        return [row for row, line in enumerate(self.lines) if line.startswith("T")]
+
+    def last_row(self, letter: str, g_codes: Optional[Iterable[int]] = None, before: Optional[int] = None) -> Optional[int]:
+        """The last row above row 'before' (default the end) that has a value for 'letter', or None."""
+        key = " " + letter
+        g_codes = set(g_codes) if g_codes is not None else None
+        lines = self.lines
+        for row in range(len(lines) if before is None else before, 0, -1):
+            row -= 1
+            if key in lines[row] and self.has(row, letter) and (g_codes is None or self.g[row] in g_codes):
+                return row
+        return None
+
+    def last_value(self, letter: str, default = None, g_codes: Optional[Iterable[int]] = None) -> Union[int, float, None]:
+        """The last value of 'letter' in the item (getValue style), or 'default' if no line has it."""
+        row = self.last_row(letter, g_codes)
+        return default if row is None else self.value(row, letter)
+
+    def last_values(self, letter: str, count: int, g_codes: Optional[Iterable[int]] = None) -> List[Union[int, float]]:
+        """The last 'count' values of 'letter' in line order (fewer if the item doesn't have that many)."""
+        found = []
+        row = len(self.lines)
+        while len(found) < count:
+            row = self.last_row(letter, g_codes, row)
+            if row is None:
+                break
+            found.insert(0, self.value(row, letter))
+        return found
+
+    def values(self, letter: str, g_codes: Optional[Iterable[int]] = None) -> List[Union[int, float]]:
+        """Every value of 'letter' in line order (getValue style)."""
+        return [self.value(row, letter) for row in self.rows_with(letter, g_codes)]
+
+
+class MachineState:
+    """The state of the printer at one point in the gcode.  StateTracker keeps one for the end of every data[] item.
+
+    x/y/z/e/f are given the way Script.getValue returns them (an int for a number written without a decimal point) so
+    they can go back into the gcode unchanged.  'e' is the position of the E axis: an absolute E move or a G92 sets it
+    and a relative (M83) E move is added to it.  'retracted' is True when the last E move went backwards (or after a
+    G10).  'nozzle' is the target temperature of each tool (M104/M109) and 'fans' the speed of each fan (M106 P), None
+    until the gcode sets one.
+    """
+
+    __slots__ = ("x", "y", "z", "e", "f", "relative_e", "relative_xyz", "retracted", "tool", "nozzle", "bed", "fans")
+
+    def __init__(self, relative_e: bool = False, tool: int = 0) -> None:
+        self.x = 0
+        self.y = 0
+        self.z = 0
+        self.e = 0
+        self.f = 0
+        self.relative_e = relative_e
+        self.relative_xyz = False
+        self.retracted = False
+        self.tool = tool
+        self.nozzle = ()    # type: tuple
+        self.bed = None
+        self.fans = ()      # type: tuple
+
+    @property
+    def temperature(self) -> Union[int, float, None]:
+        """The target temperature of the active tool."""
+        return self.nozzle[self.tool] if 0 <= self.tool < len(self.nozzle) else None
+
+    @property
+    def fan(self) -> Union[int, float, None]:
+        """The speed of the layer fan (M106 without a P, or P0)."""
+        return self.fans[0] if self.fans else None
+
+    def __repr__(self) -> str:
+        return "MachineState(" + ", ".join(slot + "=" + repr(getattr(self, slot)) for slot in self.__slots__) + ")"
+
+
+## The lines other than G0-G3 that change the state.  Only these are looked at in most of the items.
+_STATE_LINES = re.compile(r"^(?:G9[0-2]|G1[01](?![0-9])|M8[23]|M10[4679]|M1[49]0|T[0-9])[^\n]*", re.MULTILINE)
+## An item with one of these is walked a line at a time because the moves around them have to be read in order
+_ORDERED_COMMANDS = ("G90", "G91", "G92", "G10", "G11", "M82", "M83")
+
+
+def _words(line: str) -> tuple:
+    ## The command letter and number and the {letter: value} of the parameters of a line, values as getValue gives them
+    cut = line.find(";")
+    words = (line if cut == -1 else line[:cut]).split()
+    if not words:
+        return "", -1, {}
+    found = _NUMBER.match(words[0], 1)
+    command = int(float(found.group(0))) if found is not None else -1
+    values = {}
+    for word in words[1:]:
+        if word[0] in values:
+            continue
+        found = _NUMBER.match(word, 1)
+        if found is not None:
+            text = found.group(0)
+            values[word[0]] = float(text) if "." in text else int(text)
+    return words[0][0], command, values
+
+
+class StateTracker:
+    """The machine state at the end of every data[] item, found in a single pass over data[].
+
+    at_end(num) and at_start(num) give a MachineState without reading the gcode again, so a script that inserts code
+    into many layers doesn't have to look back through the layers before each one.  Position (G0-G3, G90/G91, G92),
+    E position and mode (M82/M83), retraction (E moves going backwards, G10/G11), the active tool (T), the nozzle and
+    bed temperatures (M104/M109, M140/M190), the fans (M106/M107) and the feedrate are followed.  G91 only makes X/Y/Z
+    relative; E follows M82/M83.
+    Most items are read from the end with a MoveTable (the last X, the last two E moves...).  An item with a mode
+    change, a G92 or a firmware retraction in it is read a line at a time.
+    The states are kept in columns so a big file costs a few numbers per item.  Make the tracker before changing
+    data[] - it is not updated when text is added to the items.
+    """
+
+    _COLUMNS = ("x", "y", "z", "e", "f")
+    _RELATIVE_E = 1
+    _RELATIVE_XYZ = 2
+    _RETRACTED = 4
+
+    def __init__(self, data: List[str], relative_e: bool = False, tool: int = 0) -> None:
+        self._first = (relative_e, tool)
+        self._columns = {letter: array("d") for letter in self._COLUMNS}
+        self._whole = array("B")        # Bit n set when column n is an int
+        self._flags = array("B")
+        self._tools = array("i")
+        self._heat = []                 # (nozzle, bed, fans) of each item.  Items that don't change them share one tuple.
+        state = MachineState(relative_e, tool)
+        for item in data:
+            self._walk(item, state)
+            self._store(state)
+
+    def __len__(self) -> int:
+        return len(self._tools)
+
+    def _store(self, state: MachineState) -> None:
+        whole = 0
+        for bit, letter in enumerate(self._COLUMNS):
+            number = getattr(state, letter)
+            self._columns[letter].append(number)
+            if isinstance(number, int):
+                whole |= 1 << bit
+        self._whole.append(whole)
+        self._flags.append((self._RELATIVE_E if state.relative_e else 0) | (self._RELATIVE_XYZ if state.relative_xyz else 0)
+                           | (self._RETRACTED if state.retracted else 0))
+        self._tools.append(state.tool)
+        heat = (state.nozzle, state.bed, state.fans)
+        if self._heat and self._heat[-1] == heat:
+            heat = self._heat[-1]
+        self._heat.append(heat)
+
+    def at_end(self, num: int) -> MachineState:
+        """The state after the last line of data[num]."""
+        if num < 0:
+            num += len(self)
+        state = MachineState()
+        whole = self._whole[num]
+        for bit, letter in enumerate(self._COLUMNS):
+            number = self._columns[letter][num]
+            setattr(state, letter, int(number) if whole & (1 << bit) else number)
+        flags = self._flags[num]
+        state.relative_e = bool(flags & self._RELATIVE_E)
+        state.relative_xyz = bool(flags & self._RELATIVE_XYZ)
+        state.retracted = bool(flags & self._RETRACTED)
+        state.tool = self._tools[num]
+        state.nozzle, state.bed, state.fans = self._heat[num]
+        return state
+
+    def at_start(self, num: int) -> MachineState:
+        """The state before the first line of data[num]."""
+        if num < 0:
+            num += len(self)
+        if num == 0:
+            return MachineState(*self._first)
+        return self.at_end(num - 1)
+
+    def _walk(self, item: str, state: MachineState) -> None:
+        others = [found.group(0) for found in _STATE_LINES.finditer(item)]
+        if state.relative_xyz or any(line.startswith(_ORDERED_COMMANDS) for line in others):
+            for line in item.split("\n"):
+                if line.startswith(("G", "M", "T")):
+                    self._apply(line, state)
+            return
+        moves = MoveTable(item)
+        for letter in ("X", "Y", "Z", "F"):
+            row = moves.last_row(letter, MOVES)
+            if row is not None:
+                setattr(state, letter.lower(), moves.value(row, letter))
+        if state.relative_e:
+            e_values = moves.values("E", MOVES)
+            if e_values:
+                state.e = round(state.e + sum(e_values), 5)
+                state.retracted = e_values[-1] < 0
+        else:
+            row = moves.last_row("E", MOVES)
+            if row is not None:
+                previous = moves.last_row("E", MOVES, row)
+                before = state.e if previous is None else moves.value(previous, "E")
+                state.e = moves.value(row, "E")
+                state.retracted = state.e < before
+        for line in others:
+            self._apply(line, state)
+
+    def _apply(self, line: str, state: MachineState) -> None:
+        ## One line in order.  Moves only get here when the item is walked a line at a time.
+        letter, command, values = _words(line)
+        if letter == "G":
+            if command in MOVES:
+                for axis in ("X", "Y", "Z"):
+                    if axis in values:
+                        setattr(state, axis.lower(), round(getattr(state, axis.lower()) + values[axis], 5) if state.relative_xyz else values[axis])
+                if "F" in values:
+                    state.f = values["F"]
+                if "E" in values:
+                    if state.relative_e:
+                        state.e = round(state.e + values["E"], 5)
+                        state.retracted = values["E"] < 0
+                    else:
+                        state.retracted = values["E"] < state.e
+                        state.e = values["E"]
+            elif command == 90 or command == 91:
+                state.relative_xyz = command == 91
+            elif command == 92:
+                for axis in ("X", "Y", "Z", "E"):
+                    if axis in values:
+                        setattr(state, axis.lower(), values[axis])
+            elif command == 10 or command == 11:
+                state.retracted = command == 10
+        elif letter == "M":
+            if command == 82 or command == 83:
+                state.relative_e = command == 83
+            elif command == 104 or command == 109:
+                target = values.get("S", values.get("R"))
+                if target is not None:
+                    tool = int(values.get("T", state.tool))
+                    nozzle = list(state.nozzle) + [None] * (tool + 1 - len(state.nozzle))
+                    nozzle[tool] = target
+                    state.nozzle = tuple(nozzle)
+            elif command == 140 or command == 190:
+                target = values.get("S", values.get("R"))
+                if target is not None:
+                    state.bed = target
+            elif command == 106 or command == 107:
+                fan = int(values.get("P", 0))
+                fans = list(state.fans) + [None] * (fan + 1 - len(state.fans))
+                fans[fan] = values.get("S", 255) if command == 106 else 0
+                state.fans = tuple(fans)
+        elif letter == "T" and command >= 0:
+            state.tool = command
+
+
+class LineFinder:
+    """The rows of one data[] item that pass some tests, kept in order so "the last X/Y move at or before line n" is a
+    binary search instead of a walk back up the layer.
+
+    'tests' is {name: function(line) -> bool}.  Each test is run over the lines once when the finder is made, so a
+    script that looks for the return location at every tool change reads the layer once instead of once per change.
+    The rows are the line numbers of 'lines' as they were then - changes made to the list afterwards are not seen.
+    """
+
+    def __init__(self, lines: List[str], tests: Dict[str, Callable[[str], bool]]) -> None:
+        self.lines = lines
+        self.tests = tests
+        self._rows = {name: [row for row, line in enumerate(lines) if test(line)] for name, test in tests.items()}
+
+    def rows(self, name: str) -> List[int]:
+        return self._rows[name]
+
+    def last(self, name: str, index: int, stop: int = 0) -> Optional[int]:
+        """The last row from 'stop' to 'index' (both included) that passed the test, or None."""
+        rows = self._rows[name]
+        at = bisect.bisect_right(rows, index)
+        if at and rows[at - 1] >= stop:
+            return rows[at - 1]
+        return None
+
+    def previous(self, names: Iterable[str], index: int, stop: int = 0) -> Optional[int]:
+        """The last row from 'stop' to 'index' that passed any of the tests, or None.  Used to walk back over only the
+        lines that matter."""
+        found = [row for row in (self.last(name, index, stop) for name in names) if row is not None]
+        return max(found) if found else None
+
+    def any_between(self, name: str, first: int, last: int) -> bool:
+        """True if a row from 'first' to 'last' (both included) passed the test."""
+        rows = self._rows[name]
+        at = bisect.bisect_left(rows, first)
+        return at < len(rows) and rows[at] <= last
+
+
+class EditJournal:
+    """Changes to the lines of one data[] item that are put in all at once by apply().
+
+    lines.insert() in a loop moves every line after the insert each time, so putting a lot of blocks into a big layer
+    gets slow.  The journal keeps the insertions, replacements and deletions against the line numbers of the list it
+    was made with, and apply() builds the new list in one pass.  An inserted line may hold several gcode lines
+    ("G91\nG1 Z2") the same as a line given to lines.insert().
+    """
+
+    def __init__(self, lines: List[str]) -> None:
+        self.lines = lines
+        self._before = {}       # type: Dict[int, List[str]]
+        self._after = {}        # type: Dict[int, List[str]]
+        self._replaced = {}     # type: Dict[int, str]
+        self._deleted = set()
+
+    def _position(self, index: int) -> int:
+        ## Negative line numbers count from the end, as they do for lines.insert()
+        if index < 0:
+            return max(index + len(self.lines), 0)
+        return index
+
+    def insert_before(self, index: int, new_lines: Union[str, List[str]]) -> None:
+        """Put 'new_lines' in front of line 'index' (after anything already put there).  len(lines) adds at the end."""
+        self._before.setdefault(self._position(index), []).extend([new_lines] if isinstance(new_lines, str) else new_lines)
+
+    def insert_after(self, index: int, new_lines: Union[str, List[str]]) -> None:
+        """Put 'new_lines' behind line 'index' (after anything already put there)."""
+        self.after(index).extend([new_lines] if isinstance(new_lines, str) else new_lines)
+
+    def after(self, index: int) -> List[str]:
+        """The lines that go behind line 'index'.  This is the journal's own list so changing it changes the journal."""
+        return self._after.setdefault(self._position(index), [])
+
+    def replace(self, index: int, line: str) -> None:
+        self._replaced[self._position(index)] = line
+
+    def delete(self, index: int) -> None:
+        self._deleted.add(self._position(index))
+
+    def following(self, index: int, count: int) -> List[str]:
+        """The (up to) 'count' lines that will come after line 'index' once the changes are made."""
+        lines = self.lines
+        coming = list(self._after.get(index, []))
+        num = index + 1
+        while len(coming) < count and num <= len(lines):
+            coming += self._before.get(num, [])
+            if num < len(lines):
+                if not num in self._deleted:
+                    coming.append(self._replaced.get(num, lines[num]))
+                coming += self._after.get(num, [])
+            num += 1
+        return coming[:count]
+
+    def __bool__(self) -> bool:
+        return bool(self._replaced or self._deleted or any(self._before.values()) or any(self._after.values()))
+
+    def apply(self) -> List[str]:
+        """The lines with all the changes made."""
+        if not self:
+            return self.lines
+        before = self._before
+        after = self._after
+        replaced = self._replaced
+        deleted = self._deleted
+        new_lines = []
+        for index, line in enumerate(self.lines):
+            if index in before:
+                new_lines += before[index]
+            if not index in deleted:
+                new_lines.append(replaced.get(index, line))
+            if index in after:
+                new_lines += after[index]
+        new_lines += before.get(len(self.lines), [])
+        return new_lines
+
+
+class LayerHooks:
+    """A script's changes to data[] written as hooks so that several scripts can share one pass over the gcode.
+
+    run_layer_hooks() calls begin() of every hook, then splits each data[] item once, hands the lines to layer() of
+    every hook in script order and joins them once, and then calls end() of every hook.  The result is the same as
+    running the scripts one after another when:
+      - begin() and end() only look at data[] (and show messages).  All the changes are made in layer().
+      - layer() only depends on the lines it is given and on what the hook saw in the items before it.
+      - begin() doesn't read anything that an earlier hook in the same pass changes.  A hook that changes the comment
+        lines other scripts read (";LAYER:", ";TIME:", ";TIME_ELAPSED:"...) sets 'changes_structure' and only hooks
+        that don't read data[] in begin() ('reads_data' False) can follow it in the same pass.
+    """
+
+    reads_data = True
+    changes_structure = False
+
+    def __init__(self, begin: Optional[Callable] = None, wants: Optional[Callable] = None, layer: Optional[Callable] = None,
+                 line: Optional[Callable] = None, end: Optional[Callable] = None, reads_data: bool = True, changes_structure: bool = False) -> None:
+        ## The scripts can't subclass this at import time (Cura may load them before this file) so they pass their
+        ## own methods in instead.
+        for name, hook in (("begin", begin), ("wants", wants), ("layer", layer), ("line", line), ("end", end)):
+            if hook is not None:
+                setattr(self, name, hook)
+        self.reads_data = reads_data
+        self.changes_structure = changes_structure
+
+    def begin(self, data: List[str]) -> None:
+        pass
+
+    def wants(self, num: int) -> bool:
+        """False if layer() would leave data[num] as it is.  Items that no hook wants are not split."""
+        return True
+
+    def layer(self, num: int, lines: List[str]) -> List[str]:
+        """Change the lines of data[num] and return them.  By default every line goes through line()."""
+        line_hook = self.line
+        return [line_hook(num, line) for line in lines]
+
+    def line(self, num: int, line: str) -> str:
+        return line
+
+    def end(self, data: List[str]) -> None:
+        pass
+
+
+def run_layer_hooks(data: List[str], hooks: List[LayerHooks]) -> List[str]:
+    """Make one pass over data[] for all the hooks.  See LayerHooks."""
+    for hook in hooks:
+        hook.begin(data)
+    for num in range(len(data)):
+        active = [hook for hook in hooks if hook.wants(num)]
+        if not active:
+            continue
+        lines = data[num].split("\n")
+        for hook_nr, hook in enumerate(active):
+            ## A hook may add lines as "line\nline".  The next hook has to see them as separate lines.
+            if hook_nr > 0 and any("\n" in line for line in lines):
+                lines = "\n".join(lines).split("\n")
+            lines = hook.layer(num, lines)
+        data[num] = "\n".join(lines)
+    for hook in hooks:
+        hook.end(data)
+    return data
+
+
+def can_share_pass(hooks: List[LayerHooks], new_hooks: List[LayerHooks]) -> bool:
+    """True if 'new_hooks' can be added to a pass that already has 'hooks' in it."""
+    structure_changed = any(hook.changes_structure for hook in hooks)
+    for hook in new_hooks:
+        if structure_changed and hook.reads_data:
+            return False
+        structure_changed = structure_changed or hook.changes_structure
+    return True
+
+
+#----Layer-parallel map------------------------------------------------------------------------------------------------
+## The data[] of the running map_layers().  Forked workers get a copy so only the indexes and results are sent.
+_map_data = None
+
+
+def map_layers(data: List[str], function: Callable, indexes: Iterable[int], *args, item_args: Optional[List[tuple]] = None,
+               min_chars: int = PARALLEL_MIN_CHARS) -> None:
+    """data[num] = function(data[num], *args) for each num in 'indexes'.  With 'item_args' (a tuple for each index)
+    the tuple of each item is passed after 'args'.
+
+    For changes where every item is done on its own (re.sub passes, removing comments).  A big file is split into
+    chunks that are done in a process pool and put back in order.  'function' must be a module level function (it is
+    sent to the workers by name).  Small files, streamed data[], Cura itself (PARALLEL_WORKERS is only raised by the
+    headless runner) and systems that can't fork are done one item at a time in this process.  The result is the same either way.
+    """
+    global _map_data
+    indexes = list(indexes)
+    if item_args is None:
+        item_args = [()] * len(indexes)
+    workers = _map_workers(data, indexes, min_chars)
+    if workers < 2:
+        for num, extra_args in zip(indexes, item_args):
+            data[num] = function(data[num], *args, *extra_args)
+        return
+    ## A few chunks per worker so a slow chunk doesn't hold the others up
+    chunk_size = max(1, -(-len(indexes) // (workers * 4)))
+    chunks = [indexes[start:start + chunk_size] for start in range(0, len(indexes), chunk_size)]
+    chunk_args = [item_args[start:start + chunk_size] for start in range(0, len(indexes), chunk_size)]
+    _map_data = data
+    try:
+        with ProcessPoolExecutor(max_workers = min(workers, len(chunks)), mp_context = multiprocessing.get_context("fork")) as executor:
+            results = list(executor.map(_map_chunk, [function] * len(chunks), chunks, [args] * len(chunks), chunk_args))
+    except (OSError, RuntimeError):
+        ## No processes to be had (a sandbox, ulimit).  Do it here.
+        results = [_map_chunk(function, chunk, args, extra_args) for chunk, extra_args in zip(chunks, chunk_args)]
+    finally:
+        _map_data = None
+    for chunk, texts in zip(chunks, results):
+        for num, text in zip(chunk, texts):
+            data[num] = text
+
+
+def _map_workers(data: List[str], indexes: List[int], min_chars: int = PARALLEL_MIN_CHARS) -> int:
+    ## How many processes map_layers() uses for the items.  1 when they are done in this process.
+    workers = PARALLEL_WORKERS or os.cpu_count() or 1
+    if (workers < 2 or len(indexes) < 2 or not isinstance(data, list) or getattr(sys, "frozen", False)
+            or "fork" not in multiprocessing.get_all_start_methods()
+            or sum(len(data[num]) for num in indexes) < min_chars):
+        return 1
+    return workers
+
+
+def _map_chunk(function: Callable, chunk: List[int], args: tuple, item_args: List[tuple]) -> List[str]:
+    return [function(_map_data[num], *args, *extra_args) for num, extra_args in zip(chunk, item_args)]
+
+
+def sub_all(text: str, substitutions: List[tuple]) -> str:
+    """Each (pattern, replacement) re.sub in turn.  For map_layers()."""
+    for pattern, replacement in substitutions:
+        text = re.sub(pattern, replacement, text)
+    return text
+
+
+def rewrite_marked_lines(text: str, marks: Iterable[str], rewrite: Callable[[str], Optional[List[str]]]) -> str:
+    """'text' with every line that has one of the 'marks' in it put through rewrite(line).  A mark that starts with
+    "\n" only counts at the start of a line ("\nT" for the tool changes).
+
+    rewrite() gives the lines that go in place of the line, or None to leave it as it is.  The lines are handed over
+    in order so rewrite() can keep track of things from one line to the next.  The marks are found with str.find and
+    the lines in between are copied in blocks without being split, so an item with a few marked lines costs about one
+    search of its text for each mark.
+    """
+    searched = "\n" + text         # So a mark at the start of a line is found in the first line too
+    marks = list(marks)
+    found = [searched.find(mark) for mark in marks]
+    parts = []
+    copied = 0
+    while True:
+        ## Where the next mark is in 'text'
+        positions = [pos - 1 + mark.startswith("\n") for pos, mark in zip(found, marks) if pos != -1]
+        if not positions:
+            break
+        pos = min(positions)
+        line_start = text.rfind("\n", 0, pos) + 1
+        line_end = text.find("\n", pos)
+        if line_end == -1:
+            line_end = len(text)
+        new_lines = rewrite(text[line_start:line_end])
+        if new_lines is not None:
+            parts.append(text[copied:line_start])
+            parts.append("\n".join(new_lines))
+            copied = line_end
+        ## Look for the next of each mark after this line
+        for index, mark in enumerate(marks):
+            if found[index] != -1 and found[index] <= line_end:
+                found[index] = searched.find(mark, line_end + 1)
+    if not parts:
+        return text
+    parts.append(text[copied:])
+    return "".join(parts)
+
+
+def strip_comment_lines(lines: List[str], keep_layer_lines: bool) -> List[str]:
+    """Drop the comment lines and the comments at the ends of lines.  ';LAYER:' lines stay when 'keep_layer_lines'."""
+    modified_lines = []
+    for line in lines:
+        if keep_layer_lines and line.startswith(";LAYER:"):
+            modified_lines.append(line)
+            continue
+        if line.startswith(";"):
+            continue
+        if ";" in line:
+            line = line.split(";")[0]
+        modified_lines.append(line)
+    return modified_lines
+
+
+def strip_comments(text: str, keep_layer_lines: bool) -> str:
+    """strip_comment_lines() for a whole data[] item.  For map_layers()."""
+    return "\n".join(strip_comment_lines(text.split("\n"), keep_layer_lines))
+
+
+#----Line numbers------------------------------------------------------------------------------------------------------
+## The lines that get a number: every line that isn't empty, every line that isn't empty or a comment, and (with
+## checksums) every line with some gcode in front of its comment.  They are looked for in "\n" + text (starting at
+## the "\n" is a lot faster than "^").
+_NUMBERED_ALL = re.compile(r"\n(?=[^\n])")
+_NUMBERED_NO_COMMENTS = re.compile(r"\n[^;\n]")
+_NUMBERED_CODE = re.compile(r"\n[^\S\n]*[^;\s]")
+## NumPy does the checksums of an item with at least this many numbered lines
+_CHECKSUM_BULK = 64
+
+
+def _numbered(checksum: bool, skip_comments: bool):
+    if checksum:
+        return _NUMBERED_CODE
+    return _NUMBERED_NO_COMMENTS if skip_comments else _NUMBERED_ALL
+
+
+def count_numbered(text: str, checksum: bool = False, skip_comments: bool = False) -> int:
+    """How many lines of a data[] item number_lines() gives a number to."""
+    return len(_numbered(checksum, skip_comments).findall("\n" + text))
+
+
+def _xor_checksum(code: bytes) -> int:
+    ## The XOR of all the bytes, folded in halves as one big number
+    value = int.from_bytes(code, "little")
+    width = len(code)
+    while width > 1:
+        half = (width + 1) // 2
+        value = (value >> (half * 8)) ^ (value & ((1 << (half * 8)) - 1))
+        width = half
+    return value
+
+
+def line_checksums(texts: List[str]) -> List[int]:
+    """The serial checksum (the XOR of the bytes) of each text."""
+    np = _numpy() if len(texts) >= _CHECKSUM_BULK else None
+    if np is None:
+        return [_xor_checksum(text.encode("utf-8")) for text in texts]
+    ## All the lines at once: the XOR from the start of each line to the start of the next takes in its new line (10)
+    buffer = np.frombuffer("\n".join(texts).encode("utf-8"), dtype = np.uint8)
+    starts = np.concatenate(([0], np.flatnonzero(buffer == 10) + 1))
+    sums = np.bitwise_xor.reduceat(buffer, starts)
+    sums[:-1] ^= 10
+    return sums.tolist()
+
+
+def number_lines(lines: List[str], start: int, prefix: str = "", checksum: bool = False, skip_comments: bool = False,
+                 reset: bool = False) -> Tuple[List[str], int]:
+    """Number the lines of a data[] item from 'start'.  The new lines and how many numbers they use.
+
+    Without 'checksum' the lines become "<prefix><n> <line>" (comment lines are skipped with 'skip_comments').
+    With 'checksum' they become "N<n> <gcode>*<checksum>" for hosts that send the file over a serial line.  Comments
+    can't be in the checksum so they come off the ends of the lines and comment lines are left as they are.  'reset'
+    puts "N<start-1> M110 N<start-1>" (with its checksum) in front of the first numbered line so the printer expects
+    'start' next.
+    """
+    if not checksum:
+        ## The same lines as _numbered() without a regex for each line
+        numbers = itertools.count(start)
+        if skip_comments:
+            new_lines = [f"{prefix}{next(numbers)} {line}" if line != "" and line[0] != ";" else line for line in lines]
+        else:
+            new_lines = [f"{prefix}{next(numbers)} {line}" if line != "" else line for line in lines]
+        return new_lines, next(numbers) - start
+    positions = [index for index, line in enumerate(lines) if line.lstrip()[:1] not in ("", ";")]
+    if not positions:
+        return lines, 0
+    texts = ["N" + str(line_number) + " " + lines[index].split(";", 1)[0].strip() for line_number, index in enumerate(positions, start)]
+    if reset:
+        texts.insert(0, "N" + str(start - 1) + " M110 N" + str(start - 1))
+    sums = line_checksums(texts)
+    new_lines = list(lines)
+    if reset:
+        new_lines.insert(positions[0], texts.pop(0) + "*" + str(sums.pop(0)))
+        positions = [index + 1 for index in positions]
+    for index, text, check in zip(positions, texts, sums):
+        new_lines[index] = text + "*" + str(check)
+    return new_lines, len(positions)
+
+
+def number_item(text: str, prefix: str, checksum: bool, skip_comments: bool, start: int, reset: bool) -> str:
+    """number_lines() for a whole data[] item.  For map_layers() (the start of each item is in 'item_args')."""
+    return "\n".join(number_lines(text.split("\n"), start, prefix, checksum, skip_comments, reset)[0])
+
+
+def number_data(data: List[str], start: int, prefix: str = "", checksum: bool = False, skip_comments: bool = False) -> None:
+    """Number the lines of all of data[].  The first number of each item is known from the counts of the items
+    before it so the items are numbered on their own (in parallel for big files, see map_layers())."""
+    if _map_workers(data, list(range(len(data)))) < 2:
+        ## In this process the items are numbered in order and nothing has to be counted first
+        line_number = start
+        for num in range(len(data)):
+            lines, count = number_lines(data[num].split("\n"), line_number, prefix, checksum, skip_comments,
+                                        checksum and line_number == start)
+            if count:
+                data[num] = "\n".join(lines)
+                line_number += count
+        return
+    indexes = []
+    item_args = []
+    line_number = start
+    for num in range(len(data)):
+        count = count_numbered(data[num], checksum, skip_comments)
+        if count:
+            indexes.append(num)
+            item_args.append((line_number, checksum and not item_args))
+            line_number += count
+    map_layers(data, number_item, indexes, prefix, checksum, skip_comments, item_args = item_args)
+
+
+#----Compact gcode-----------------------------------------------------------------------------------------------------
+## The axis letters of a move and what the compactor keeps of them
+_COMPACT_AXES = ("X", "Y", "Z")
+## G commands the position and the feedrate are known to be the same after
+_COMPACT_SAFE_G = (4, 10, 11, 90, 91, 92)
+## M commands that can move the head (pauses, filament changes).  The position and the feedrate are not known after them.
+_COMPACT_MOVING_M = (0, 1, 24, 25, 125, 600, 601, 701, 702)
+
+
+def _trim_number(text: str) -> str:
+    ## "10.500" -> "10.5", "10.000" -> "10", "-0.0" -> "0"
+    if "." in text:
+        text = text.rstrip("0").rstrip(".")
+    return "0" if text in ("", "-", "-0") else text
+
+
+class GcodeCompactor:
+    """Makes the moves of the gcode smaller without changing what the printer does.
+
+      - Trailing zeros come off the numbers of G0-G3 lines ("X10.500" -> "X10.5").
+      - An F that is the same as the feedrate already in use is left out.
+      - G0/G1 moves that don't change the position, the E or the feedrate are removed.
+      - G1 moves in a straight line (every point within 'tolerance' mm of the line from the start to the end) that
+        have the same feedrate and the same E per mm (within 'flow_tolerance', a fraction) become one move.  The E is
+        kept exactly: the E of the last move in absolute mode and the sum of the E's in relative mode.
+    The position, the feedrate and the modes carry on from one item to the next so compact() has to be called for
+    the items in order (with 'change' False for the items that are only followed).  After a homing, a tool change,
+    a pause or a line it doesn't know, nothing is removed until the position and the feedrate are known again.
+    'bytes_saved' is the total.
+    """
+
+    def __init__(self, relative_e: bool = False, tolerance: float = 0.002, flow_tolerance: float = 0.02) -> None:
+        self.tolerance = tolerance
+        self.flow_tolerance = flow_tolerance
+        self.bytes_saved = 0
+        self._relative_e = relative_e
+        self._relative_xyz = False
+        self._position = {"X": None, "Y": None, "Z": None, "E": None}   # None when it isn't known
+        self._f = None
+        self._texts = {"X": None, "Y": None}
+        ## The straight moves waiting to be joined: the points (the start first) and the line so far as
+        ## [F text, E text, length, E, has an X, has a Y], None when nothing is waiting
+        self._points = []
+        self._chain = None
+
+    def compact(self, lines: List[str], change: bool = True) -> List[str]:
+        new_lines = []
+        for line in lines:
+            if change and line.startswith("G"):
+                self._compact_move(line, new_lines)
+            else:
+                self._flush(new_lines)
+                self._follow(line)
+                new_lines.append(line)
+        self._flush(new_lines)
+        self.bytes_saved += sum(len(line) + 1 for line in lines) - sum(len(line) + 1 for line in new_lines)
+        return new_lines
+
+    def _unknown(self) -> None:
+        for letter in self._position:
+            self._position[letter] = None
+        self._texts["X"] = self._texts["Y"] = None
+        self._f = None
+
+    def _follow(self, line: str) -> None:
+        ## The lines that are passed through as they are
+        if line.startswith(";") or line.strip() == "":
+            return
+        letter, command, values = _words(line)
+        if letter == "G":
+            if command in MOVES:
+                self._move_to(values)
+            elif command == 90 or command == 91:
+                self._relative_xyz = command == 91
+            elif command == 92:
+                for axis in self._position:
+                    if axis in values:
+                        self._position[axis] = float(values[axis])
+                        if axis in self._texts:
+                            self._texts[axis] = _trim_number("{:.6f}".format(values[axis]))
+                if not any(axis in values for axis in self._position):
+                    self._unknown()
+            elif not command in _COMPACT_SAFE_G:
+                self._unknown()
+        elif letter == "M":
+            if command == 82 or command == 83:
+                self._relative_e = command == 83
+            elif command in _COMPACT_MOVING_M:
+                self._unknown()
+        else:
+            self._unknown()
+
+    def _move_to(self, values: Dict[str, Union[int, float]], texts: Optional[Dict[str, str]] = None) -> None:
+        ## 'texts' are the numbers as the line has them.  The X and Y of a joined move are written the same way.
+        for axis in self._position:
+            if not axis in values:
+                continue
+            position = self._position[axis]
+            relative = self._relative_e if axis == "E" else self._relative_xyz
+            if relative:
+                self._position[axis] = position + values[axis] if position is not None else None
+            else:
+                self._position[axis] = float(values[axis])
+            if axis in self._texts:
+                if not relative and texts is not None:
+                    self._texts[axis] = texts[axis]
+                elif self._position[axis] is not None:
+                    self._texts[axis] = _trim_number("{:.6f}".format(self._position[axis]))
+                else:
+                    self._texts[axis] = None
+        if "F" in values:
+            self._f = float(values["F"])
+
+    def _compact_move(self, line: str, new_lines: List[str]) -> None:
+        cut = line.find(";")
+        words = (line if cut == -1 else line[:cut]).split()
+        if not words or not words[0] in ("G0", "G1", "G2", "G3"):
+            self._flush(new_lines)
+            self._follow(line)
+            new_lines.append(line)
+            return
+        ## Trim the numbers and read the values.  Only the first of each letter counts (like getValue).
+        values = {}
+        texts = {}
+        others = False
+        for word_nr in range(1, len(words)):
+            word = words[word_nr]
+            found = _NUMBER.match(word, 1)
+            if found is None or found.end() != len(word):
+                others = True
+                continue
+            text = _trim_number(found.group(0))
+            words[word_nr] = word[0] + text
+            if word[0] in values:
+                continue
+            values[word[0]] = float(text)
+            texts[word[0]] = text
+            if not word[0] in ("X", "Y", "Z", "E", "F"):
+                others = True
+        ## Leave out an F that doesn't change the feedrate
+        if "F" in values and values["F"] == self._f:
+            words = [word for word in words if not word.startswith("F")]
+            del values["F"]
+            del texts["F"]
+        comment = line[cut:] if cut != -1 else ""
+        is_line = words[0] in ("G0", "G1") and not others and not comment
+        if is_line and self._changes_nothing(values):
+            return
+        if is_line and words[0] == "G1" and self._join(values, texts, new_lines):
+            return
+        self._flush(new_lines)
+        self._move_to(values, texts)
+        new_lines.append(" ".join(words) + (" " + comment if comment else ""))
+
+    def _changes_nothing(self, values: Dict[str, float]) -> bool:
+        if "F" in values:
+            return False
+        for axis, value in values.items():
+            position = self._position[axis]
+            if position is None:
+                return False
+            if (self._relative_e if axis == "E" else self._relative_xyz) and value != 0:
+                return False
+            if not (self._relative_e if axis == "E" else self._relative_xyz) and value != position:
+                return False
+        return True
+
+    def _join(self, values: Dict[str, float], texts: Dict[str, str], new_lines: List[str]) -> bool:
+        ## Add a G1 to the straight moves waiting to be joined.  False if it can't be joined to anything.
+        start = (self._position["X"], self._position["Y"])
+        if self._relative_xyz or "Z" in values or start[0] is None or start[1] is None or not ("X" in values or "Y" in values):
+            return False
+        end = (values.get("X", start[0]), values.get("Y", start[1]))
+        length = math.hypot(end[0] - start[0], end[1] - start[1])
+        if length < 0.000001:
+            return False
+        extruded = None
+        if "E" in values:
+            if not self._relative_e and self._position["E"] is None:
+                return False
+            extruded = values["E"] if self._relative_e else values["E"] - self._position["E"]
+            if extruded <= 0:
+                return False
+        chain = self._chain
+        if chain is not None and ("F" in values or not self._straight(end) or not self._same_flow(extruded, length)):
+            self._flush(new_lines)
+            chain = None
+        if chain is None:
+            ## Only an F that changes the feedrate is left in 'texts'
+            self._points = [start]
+            self._chain = [texts.get("F"), None, 0.0, None, False, False]
+            chain = self._chain
+        self._points.append(end)
+        chain[2] += length
+        chain[4] = chain[4] or "X" in values
+        chain[5] = chain[5] or "Y" in values
+        if extruded is not None:
+            if self._relative_e:
+                chain[1] = _trim_number(format(Decimal(chain[1] if chain[1] is not None else "0") + Decimal(texts["E"]), "f"))
+            else:
+                chain[1] = texts["E"]
+            chain[3] = (chain[3] or 0.0) + extruded
+        self._move_to(values, texts)
+        return True
+
+    def _straight(self, end: tuple) -> bool:
+        ## True if the waiting moves and the move to 'end' make a straight line going one way
+        start = self._points[0]
+        direction_x, direction_y = end[0] - start[0], end[1] - start[1]
+        length = math.hypot(direction_x, direction_y)
+        if length < 0.000001:
+            return False
+        along = 0.0
+        for point in self._points[1:] + [end]:
+            offset_x, offset_y = point[0] - start[0], point[1] - start[1]
+            if abs(offset_x * direction_y - offset_y * direction_x) / length > self.tolerance:
+                return False
+            distance = (offset_x * direction_x + offset_y * direction_y) / length
+            if distance <= along:
+                return False
+            along = distance
+        return True
+
+    def _same_flow(self, extruded: Optional[float], length: float) -> bool:
+        chain_extruded = self._chain[3]
+        if (extruded is None) != (chain_extruded is None):
+            return False
+        if extruded is None:
+            return True
+        chain_flow = chain_extruded / self._chain[2]
+        return abs(extruded / length - chain_flow) <= chain_flow * self.flow_tolerance
+
+    def _flush(self, new_lines: List[str]) -> None:
+        ## Write the waiting moves as one G1
+        if self._chain is None:
+            return
+        f_text, e_text, length, extruded, has_x, has_y = self._chain
+        line = "G1"
+        if f_text is not None:
+            line += " F" + f_text
+        if has_x:
+            line += " X" + self._texts["X"]
+        if has_y:
+            line += " Y" + self._texts["Y"]
+        if e_text is not None:
+            line += " E" + e_text
+        new_lines.append(line)
+        self._chain = None
+        self._points = []
+
+
+#----Print time estimate-----------------------------------------------------------------------------------------------
+## False to plan the moves (and work out the line checksums) in Python even when NumPy can be imported (to compare the two)
+ESTIMATE_WITH_NUMPY = True
+## Moves shorter than this (mm) are left out, like a move of less than one step in the firmware
+_MIN_MOVE = 0.000001
+## The NumPy planner passes add up this many moves at a time so the running sums stay small enough to be exact
+_PLAN_CHUNK = 4096
+## The lines that are read one at a time, in order.  The G0/G1 moves between them are read in bulk.
+_TIME_LINES = re.compile(r"^(?:G[234](?![0-9])|G28|G9[0-2]|M8[23]|M20[1345]|;TIME_ELAPSED:)[^\n]*", re.MULTILINE)
+## A G0/G1 line with its parameters in the order Cura writes them.  The moves between two _TIME_LINES are read in
+## bulk when all of them match.
+_CURA_MOVE = re.compile(r"^G[01](?![0-9])" + "".join(r"(?: " + letter + r"(-?[0-9]+\.?[0-9]*))?" for letter in "FXYZE") + r"[ \t]*(?:;|$)", re.MULTILINE)
+
+
+def _numpy():
+    ## NumPy if it can be imported (Cura ships it), otherwise None
+    if not ESTIMATE_WITH_NUMPY:
+        return None
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+
+class MotionLimits:
+    """The machine limits the moves are planned with.  Lists are for the X, Y, Z and E axes.
+
+    max_feedrate is in mm/s, max_acceleration and the print, travel and retract accelerations in mm/s² and jerk in
+    mm/s.  The defaults are Cura's machine defaults.  M201, M203, M204 and M205 lines change them (apply()) as the
+    print time estimate reads through the gcode.
+    """
+
+    AXES = ("x", "y", "z", "e")
+
+    def __init__(self, max_feedrate: Iterable[float] = (299792458000, 299792458000, 299792458000, 299792458000),
+                 max_acceleration: Iterable[float] = (9000, 9000, 100, 10000), acceleration: float = 4000,
+                 jerk: Iterable[float] = (20, 20, 0.4, 5)) -> None:
+        self.max_feedrate = [float(value) for value in max_feedrate]
+        self.max_acceleration = [float(value) for value in max_acceleration]
+        self.print_acceleration = float(acceleration)
+        self.travel_acceleration = float(acceleration)
+        self.retract_acceleration = float(acceleration)
+        self.jerk = [float(value) for value in jerk]
+
+    @classmethod
+    def from_settings(cls, get: Callable) -> "MotionLimits":
+        """The limits from Cura's machine settings.  'get' returns the value of a setting
+        (lambda key: global_stack.getProperty(key, "value")).  Settings that are missing or not above 0 keep the default."""
+        limits = cls()
+
+        def setting(key: str, default: float) -> float:
+            try:
+                value = float(get(key))
+            except (TypeError, ValueError):
+                return default
+            return value if value > 0 else default
+
+        for axis_nr, axis in enumerate(cls.AXES):
+            limits.max_feedrate[axis_nr] = setting("machine_max_feedrate_" + axis, limits.max_feedrate[axis_nr])
+            limits.max_acceleration[axis_nr] = setting("machine_max_acceleration_" + axis, limits.max_acceleration[axis_nr])
+            limits.jerk[axis_nr] = setting("machine_max_jerk_" + ("xy" if axis in ("x", "y") else axis), limits.jerk[axis_nr])
+        acceleration = setting("machine_acceleration", limits.print_acceleration)
+        limits.print_acceleration = limits.travel_acceleration = limits.retract_acceleration = acceleration
+        return limits
+
+    def copy(self) -> "MotionLimits":
+        limits = MotionLimits(self.max_feedrate, self.max_acceleration, self.print_acceleration, self.jerk)
+        limits.travel_acceleration = self.travel_acceleration
+        limits.retract_acceleration = self.retract_acceleration
+        return limits
+
+    def apply(self, command: int, values: Dict[str, Union[int, float]]) -> None:
+        """Take in the {letter: value} of an M201 (max acceleration), M203 (max feedrate), M204 (P print, T travel,
+        R retract, S print and travel acceleration) or M205 (jerk) line.  Values that are not above 0 are ignored."""
+        if command == 204:
+            for letter, names in (("S", ("print_acceleration", "travel_acceleration")), ("P", ("print_acceleration",)),
+                                  ("T", ("travel_acceleration",)), ("R", ("retract_acceleration",))):
+                if values.get(letter, 0) > 0:
+                    for name in names:
+                        setattr(self, name, float(values[letter]))
+            return
+        target = {201: self.max_acceleration, 203: self.max_feedrate, 205: self.jerk}.get(command)
+        if target is None:
+            return
+        for axis_nr, letter in enumerate("XYZE"):
+            if values.get(letter, 0) > 0:
+                target[axis_nr] = float(values[letter])
+
+
+class PrintTimeEstimate:
+    """The print time worked out from the moves in data[], to put back into ";TIME:" and ";TIME_ELAPSED:" after the
+    scripts have changed the gcode.
+
+    Every move speeds up and slows down at its acceleration (a trapezoid), the speed through a corner is limited by
+    the jerk of each axis, and no move goes faster than its feedrate or the max feedrate of an axis.  The corner
+    speeds are found with a backward and a forward pass over all the moves, the way Marlin plans them.  G2/G3 arcs
+    (I J) are planned as one move the length of the arc and G4 dwells are added.  Like Cura's own estimate the startup
+    and ending gcode and the waits for heating are not counted.  G91 only makes X/Y/Z relative; E follows M82/M83.
+    NumPy reads the moves and does the passes when it can be imported (Cura ships it).  Without it the same sums are
+    done in Python, which is a lot slower on a big file.  The estimate is not updated when data[] changes.
+    """
+
+    def __init__(self, data: List[str], limits: MotionLimits, relative_e: bool = False) -> None:
+        self.total = 0.0
+        self.item_times = [0.0] * len(data)     # Seconds in each item, dwells included
+        self.elapsed = {}                       # type: Dict[int, List[float]]  # The time at each ;TIME_ELAPSED: line of an item
+        self._np = _numpy()
+        self._limits = limits.copy()
+        self._position = [0.0, 0.0, 0.0, 0.0]
+        self._relative_xyz = False
+        self._relative_e = relative_e
+        self._feedrate = 3000.0                 # mm/min until the gcode sets one (Marlin starts at 50mm/s)
+        self._counting = False
+        self._dwell = 0.0
+        ## The moves in columns: length (mm), speed (mm/s), acceleration, the highest speed at the start of the move and
+        ## the highest speed at the end of the moves that have to stop (a G4, the end of the print), in (mm/s)²
+        self._length = array("d")
+        self._speed = array("d")
+        self._acceleration = array("d")
+        self._entry = array("d")
+        self._stops = {}                        # type: Dict[int, float]
+        self._previous = None                   # (unit vector, speed, safe speed) of the last move, None after a stop
+        self._markers = []                      # (data index, moves before it, dwell before it) of each ;TIME_ELAPSED:
+        items = []
+        for num in range(1, len(data) - 1):
+            self._counting = num > 1
+            items.append((num, len(self._length), self._dwell))
+            self._read_item(num, data[num])
+        self._stop()
+        items.append((len(data) - 1, len(self._length), self._dwell))
+        ends = self._plan()
+        for (num, first, dwell), (_, last, next_dwell) in zip(items, items[1:]):
+            self.item_times[num] = ends[last] - ends[first] + next_dwell - dwell
+        for num, moves, dwell in self._markers:
+            self.elapsed.setdefault(num, []).append(ends[moves] + dwell)
+        self.total = ends[len(self._length)] + self._dwell
+
+    #----Reading the gcode
+    def _read_item(self, num: int, item: str) -> None:
+        start = 0
+        for found in _TIME_LINES.finditer(item):
+            self._read_moves(item, start, found.start())
+            self._read_line(num, found.group(0))
+            start = found.end()
+        self._read_moves(item, start, len(item))
+
+    def _read_moves(self, item: str, start: int, end: int) -> None:
+        ## The G0/G1 moves between two _TIME_LINES
+        if self._np is not None and self._counting:
+            rows = _CURA_MOVE.findall(item, start, end)
+            if len(rows) == item.count("\nG0 ", start, end) + item.count("\nG1 ", start, end):
+                if rows:
+                    self._bulk_moves(rows)
+                return
+        for line in item[start:end].split("\n"):
+            if line.startswith(("G0", "G1")):
+                letter, command, values = _words(line)
+                if command == 0 or command == 1:
+                    self._add_move(*self._move_deltas(values))
+
+    def _read_line(self, num: int, line: str) -> None:
+        if line.startswith(";TIME_ELAPSED:"):
+            if self._counting:
+                self._markers.append((num, len(self._length), self._dwell))
+            return
+        letter, command, values = _words(line)
+        if letter == "G":
+            if command == 2 or command == 3:
+                self._add_arc(command, values)
+            elif command == 4:
+                self._stop()
+                if self._counting:
+                    self._dwell += values.get("P", 0) / 1000 + values.get("S", 0)
+            elif command == 28:
+                self._stop()
+                homed = [axis_nr for axis_nr, letter in enumerate("XYZ") if letter in values]
+                for axis_nr in homed if homed else range(3):
+                    self._position[axis_nr] = 0.0
+            elif command == 90 or command == 91:
+                self._relative_xyz = command == 91
+            elif command == 92:
+                for axis_nr, letter in enumerate("XYZE"):
+                    if letter in values:
+                        self._position[axis_nr] = float(values[letter])
+        elif letter == "M":
+            if command == 82 or command == 83:
+                self._relative_e = command == 83
+            else:
+                self._limits.apply(command, values)
+
+    def _move_deltas(self, values: Dict[str, Union[int, float]]) -> tuple:
+        ## Move the position to the X/Y/Z/E of a line.  Returns how far each axis went and the feedrate.
+        deltas = []
+        for axis_nr, letter in enumerate("XYZE"):
+            delta = 0.0
+            if letter in values:
+                if self._relative_e if axis_nr == 3 else self._relative_xyz:
+                    delta = float(values[letter])
+                    self._position[axis_nr] += delta
+                else:
+                    delta = values[letter] - self._position[axis_nr]
+                    self._position[axis_nr] = float(values[letter])
+            deltas.append(delta)
+        if values.get("F", 0) > 0:
+            self._feedrate = float(values["F"])
+        return deltas, self._feedrate
+
+    def _add_arc(self, command: int, values: Dict[str, Union[int, float]]) -> None:
+        start_x, start_y = self._position[0], self._position[1]
+        deltas, feedrate = self._move_deltas(values)
+        center_x, center_y = start_x + values.get("I", 0), start_y + values.get("J", 0)
+        radius = math.hypot(values.get("I", 0), values.get("J", 0))
+        if radius > _MIN_MOVE:
+            sweep = (math.atan2(self._position[1] - center_y, self._position[0] - center_x)
+                     - math.atan2(start_y - center_y, start_x - center_x))
+            ## G2 goes clockwise and G3 counter-clockwise.  An arc that ends where it starts is a full circle.
+            if command == 2 and sweep >= 0:
+                sweep -= 2 * math.pi
+            elif command == 3 and sweep <= 0:
+                sweep += 2 * math.pi
+            arc_length = abs(sweep) * radius
+            chord = math.hypot(deltas[0], deltas[1])
+            if chord > _MIN_MOVE:
+                deltas[0], deltas[1] = deltas[0] / chord * arc_length, deltas[1] / chord * arc_length
+            else:
+                deltas[0] = deltas[1] = arc_length / math.sqrt(2)
+        self._add_move(deltas, feedrate)
+
+    def _bulk_moves(self, rows: List[tuple]) -> None:
+        ## _add_move() for a run of Cura moves (F X Y Z E as text, "" when the line doesn't have it), in NumPy
+        np = self._np
+        columns = [np.array([float(text) if text else math.nan for text in column]) for column in zip(*rows)]
+
+        def filled(column, start):
+            ## Each row's value, or the one above it (or 'start') when the row doesn't have one
+            have = np.arange(len(column))
+            have[np.isnan(column)] = -1
+            np.maximum.accumulate(have, out = have)
+            return np.where(have < 0, start, column[have])
+
+        deltas = []
+        for axis_nr, column in enumerate(columns[1:]):
+            if self._relative_e if axis_nr == 3 else self._relative_xyz:
+                delta = np.nan_to_num(column)
+                self._position[axis_nr] += float(delta.sum())
+            else:
+                position = filled(column, self._position[axis_nr])
+                delta = np.diff(position, prepend = self._position[axis_nr])
+                self._position[axis_nr] = float(position[-1])
+            deltas.append(delta)
+        feedrate = filled(np.where(columns[0] > 0, columns[0], math.nan), self._feedrate)
+        self._feedrate = float(feedrate[-1])
+        self._add_moves(deltas, feedrate)
+
+    #----Planning the moves
+    def _add_move(self, deltas: List[float], feedrate: float) -> None:
+        """One move: how far each axis goes and the feedrate (mm/min)."""
+        if not self._counting:
+            return
+        delta_x, delta_y, delta_z, delta_e = deltas
+        xyz = math.sqrt(delta_x * delta_x + delta_y * delta_y + delta_z * delta_z)
+        length = xyz if xyz > _MIN_MOVE else abs(delta_e)
+        if length <= _MIN_MOVE:
+            return
+        limits = self._limits
+        speed = feedrate / 60
+        if xyz <= _MIN_MOVE:
+            acceleration = limits.retract_acceleration
+        elif delta_e != 0:
+            acceleration = limits.print_acceleration
+        else:
+            acceleration = limits.travel_acceleration
+        unit = [delta / length for delta in deltas]
+        for axis_nr in range(4):
+            share = abs(unit[axis_nr])
+            if share > 0:
+                speed = min(speed, limits.max_feedrate[axis_nr] / share)
+                acceleration = min(acceleration, limits.max_acceleration[axis_nr] / share)
+        ## The speed it can start from (or stop at) a standstill without going over the jerk of an axis
+        safe = speed
+        for axis_nr in range(4):
+            share = abs(unit[axis_nr])
+            if share * speed > limits.jerk[axis_nr]:
+                safe = min(safe, limits.jerk[axis_nr] / share)
+        if self._previous is None:
+            entry = safe
+        else:
+            previous_unit, previous_speed, previous_safe = self._previous
+            entry = min(speed, previous_speed)
+            factor = 1.0
+            for axis_nr in range(4):
+                change = abs(unit[axis_nr] - previous_unit[axis_nr]) * entry
+                if change > limits.jerk[axis_nr]:
+                    factor = min(factor, limits.jerk[axis_nr] / change)
+            entry *= factor
+        self._length.append(length)
+        self._speed.append(speed)
+        self._acceleration.append(acceleration)
+        self._entry.append(entry * entry)
+        self._previous = (unit, speed, safe)
+
+    def _add_moves(self, deltas: list, feedrate) -> None:
+        ## _add_move() for NumPy columns
+        np = self._np
+        delta_x, delta_y, delta_z, delta_e = deltas
+        xyz = np.sqrt(delta_x * delta_x + delta_y * delta_y + delta_z * delta_z)
+        length = np.where(xyz > _MIN_MOVE, xyz, np.abs(delta_e))
+        keep = length > _MIN_MOVE
+        if not keep.all():
+            length, xyz, feedrate = length[keep], xyz[keep], feedrate[keep]
+            deltas = [delta[keep] for delta in deltas]
+        if not len(length):
+            return
+        limits = self._limits
+        speed = feedrate / 60
+        acceleration = np.where(xyz <= _MIN_MOVE, limits.retract_acceleration,
+                                np.where(deltas[3] != 0, limits.print_acceleration, limits.travel_acceleration))
+        unit = [delta / length for delta in deltas]
+        with np.errstate(divide = "ignore", invalid = "ignore"):
+            for axis_nr in range(4):
+                share = np.abs(unit[axis_nr])
+                speed = np.minimum(speed, limits.max_feedrate[axis_nr] / share)
+                acceleration = np.minimum(acceleration, limits.max_acceleration[axis_nr] / share)
+            safe = speed
+            for axis_nr in range(4):
+                share = np.abs(unit[axis_nr])
+                safe = np.where(share * speed > limits.jerk[axis_nr], np.minimum(safe, limits.jerk[axis_nr] / share), safe)
+            ## The move before each one.  The first one comes after the last move that was added (or a stop).
+            previous = self._previous if self._previous is not None else ([0.0] * 4, 0.0, 0.0)
+            previous_speed = np.concatenate(([previous[1]], speed[:-1]))
+            entry = np.minimum(speed, previous_speed)
+            factor = np.ones(len(length))
+            for axis_nr in range(4):
+                previous_unit = np.concatenate(([previous[0][axis_nr]], unit[axis_nr][:-1]))
+                change = np.abs(unit[axis_nr] - previous_unit) * entry
+                factor = np.where(change > limits.jerk[axis_nr], np.minimum(factor, limits.jerk[axis_nr] / change), factor)
+            entry = entry * factor
+        if self._previous is None:
+            entry[0] = safe[0]
+        self._length.frombytes(length.tobytes())
+        self._speed.frombytes(speed.tobytes())
+        self._acceleration.frombytes(acceleration.tobytes())
+        self._entry.frombytes((entry * entry).tobytes())
+        self._previous = ([float(axis[-1]) for axis in unit], float(speed[-1]), float(safe[-1]))
+
+    def _stop(self) -> None:
+        ## The last move has to end at a standstill
+        if self._previous is not None:
+            self._stops[len(self._length) - 1] = self._previous[2] * self._previous[2]
+            self._previous = None
+
+    def _plan(self):
+        """The time at the start of each move (and at the end of the last one) with the corner speeds planned."""
+        count = len(self._length)
+        if self._np is not None and count:
+            return self._plan_numpy(count)
+        length, speed, acceleration, entry_limit, stops = self._length, self._speed, self._acceleration, self._entry, self._stops
+        ## Backward: the fastest each move can start and still slow down for the ones after it
+        entry = array("d", [0.0]) * count
+        following = math.inf
+        for move in range(count - 1, -1, -1):
+            entry[move] = following = min(entry_limit[move], min(stops.get(move, math.inf), following) + 2 * acceleration[move] * length[move])
+        ## Forward: as fast as it can speed up to
+        ends = array("d", [0.0]) * (count + 1)
+        start = entry[0] if count else 0.0
+        for move in range(count):
+            end = min(stops.get(move, math.inf), entry[move + 1] if move + 1 < count else math.inf,
+                      start + 2 * acceleration[move] * length[move])
+            ends[move + 1] = ends[move] + _move_time(length[move], speed[move], acceleration[move], start, end)
+            start = end
+        return ends
+
+    def _plan_numpy(self, count: int):
+        np = self._np
+        length = np.frombuffer(self._length, dtype = np.float64)
+        speed = np.frombuffer(self._speed, dtype = np.float64)
+        acceleration = np.frombuffer(self._acceleration, dtype = np.float64)
+        gain = 2 * acceleration * length
+        stops = np.full(count, math.inf)
+        if self._stops:
+            stops[np.fromiter(self._stops.keys(), dtype = np.int64)] = np.fromiter(self._stops.values(), dtype = np.float64)
+        ## Backward: entry[i] = min(limit[i], entry[i + 1] + gain[i]) is a running minimum of limit + the gains summed
+        ## from the end
+        limit = np.minimum(np.frombuffer(self._entry, dtype = np.float64), stops + gain)
+        entry = np.empty(count + 1)
+        entry[count] = math.inf
+        for first in range(((count - 1) // _PLAN_CHUNK) * _PLAN_CHUNK, -1, -_PLAN_CHUNK):
+            last = min(first + _PLAN_CHUNK, count)
+            part = limit[first:last].copy()
+            part[-1] = min(part[-1], entry[last] + gain[last - 1])
+            sums = np.cumsum(gain[first:last]) - gain[first:last]
+            entry[first:last] = np.minimum.accumulate((part + sums)[::-1])[::-1] - sums
+        ## Forward: end[i] = min(cap[i], end[i - 1] + gain[i]), a running minimum the other way
+        cap = np.minimum(stops, entry[1:])
+        end = np.empty(count)
+        start = entry[0]
+        for first in range(0, count, _PLAN_CHUNK):
+            last = min(first + _PLAN_CHUNK, count)
+            sums = np.cumsum(gain[first:last])
+            end[first:last] = sums + np.minimum(start, np.minimum.accumulate(cap[first:last] - sums))
+            start = end[last - 1]
+        start = np.concatenate(([entry[0]], end[:-1]))
+        ## The time of each move
+        start_speed, end_speed = np.sqrt(start), np.sqrt(end)
+        cruise = length - (2 * speed * speed - start - end) / (2 * acceleration)
+        peak = np.sqrt((gain + start + end) / 2)
+        times = np.where(cruise >= 0, (2 * speed - start_speed - end_speed) / acceleration + np.maximum(cruise, 0) / speed,
+                         (np.maximum(peak - start_speed, 0) + np.maximum(peak - end_speed, 0)) / acceleration)
+        return np.concatenate(([0.0], np.cumsum(times))).tolist()
+
+    #----Writing the times
+    def rewrite_lines(self, num: int, lines: List[str]) -> List[str]:
+        """Put the estimate in the ";TIME:" line of data[0] or the ";TIME_ELAPSED:" lines of data[num]."""
+        if num == 0:
+            for index, line in enumerate(lines):
+                if line.startswith((";TIME:", ";PRINT.TIME:")):
+                    lines[index] = line.split(":")[0] + ":" + str(round(self.total))
+            return lines
+        times = iter(self.elapsed.get(num, ()))
+        for index, line in enumerate(lines):
+            if line.startswith(";TIME_ELAPSED:"):
+                elapsed = next(times, None)
+                if elapsed is None:
+                    break
+                lines[index] = ";TIME_ELAPSED:{:f}".format(elapsed)
+        return lines
+
+    def rewrite(self, data: List[str]) -> List[str]:
+        """rewrite_lines() for data[0] and every item with a ";TIME_ELAPSED:" line."""
+        for num in [0] + list(self.elapsed):
+            data[num] = "\n".join(self.rewrite_lines(num, data[num].split("\n")))
+        return data
+
+
+def _move_time(length: float, speed: float, acceleration: float, start: float, end: float) -> float:
+    ## Seconds for a move that starts at sqrt(start) mm/s, speeds up to 'speed' (or as far as it can) and slows to sqrt(end)
+    start_speed, end_speed = math.sqrt(start), math.sqrt(end)
+    cruise = length - (2 * speed * speed - start - end) / (2 * acceleration)
+    if cruise >= 0:
+        return (2 * speed - start_speed - end_speed) / acceleration + cruise / speed
+    peak = math.sqrt((2 * acceleration * length + start + end) / 2)
+    return (max(peak - start_speed, 0) + max(peak - end_speed, 0)) / acceleration
+
+
+#----Layer statistics--------------------------------------------------------------------------------------------------
+## The lines LayerStats reads one at a time, in order.  The G0/G1 moves between them are read in bulk.
+_STATS_LINES = re.compile(r"^(?:G[23](?![0-9])|G28|G9[0-2]|M8[23]|M10[4679]|M1[49]0|T[0-9])[^\n]*", re.MULTILINE)
+## The lines that are read when the moves are left out
+_STATS_LINES_NO_MOVES = re.compile(r"^(?:M10[4679]|M1[49]0|T[0-9])[^\n]*", re.MULTILINE)
+## The start of a ";TYPE:" block
+_TYPE_LINE = re.compile(r"^;TYPE:([^\n]*)", re.MULTILINE)
+## The header lines with the footprint of the print, Marlin flavor and Griffin flavor
+_FOOTPRINT_KEYS = (("MINX", "PRINT.SIZE.MIN.X"), ("MINY", "PRINT.SIZE.MIN.Y"), ("MAXX", "PRINT.SIZE.MAX.X"), ("MAXY", "PRINT.SIZE.MAX.Y"))
+
+
+class LayerStats:
+    """Statistics for every data[] item, found in a single pass over data[] so the scripts can look them up instead of
+    reading the layers again.
+
+    For each item: the XY box around its extruding moves, the filament it extrudes (mm of E on moves with an X or Y
+    that push filament - retractions and primes are left out), the ";TYPE:" blocks in it, the tools that print in it
+    and the tool at its end, the layer fan speed (M106/M107 without a P, or P0), the nozzle temperature of the active
+    tool (M104/M109) and the bed temperature (M140/M190) at its end, and its last ";TIME_ELAPSED:".  A ";TYPE:" block
+    is a (start, end, name) span of characters in the item from its ";TYPE:" line to the next one or the end of the
+    item.  G2/G3 arcs add their end points to the box.  'header' holds the ";KEY:value" lines of data[0] as text.
+    With read_moves=False the moves aren't read (a lot faster): the boxes are None, the extruded lengths 0 and the
+    tools of an item are the ones that are active in it.
+    Everything is kept in arrays so a big file costs a few numbers per item.  Make the statistics before changing
+    data[] - they are not updated when text is added to the items.
+    """
+
+    def __init__(self, data: List[str], relative_e: bool = False, read_moves: bool = True) -> None:
+        self.header = {}                    # type: Dict[str, str]
+        self.types = []                     # The ";TYPE:" names.  The spans hold indexes into this list.
+        self._type_ids = {}                 # type: Dict[str, int]
+        self._box = {key: array("d") for key in ("min_x", "min_y", "max_x", "max_y")}
+        self._extruded = array("d")
+        self._tools = array("Q")            # Bit n set when tool n prints in the item
+        self._last_tool = array("i")
+        self._fan = array("d")              # NaN until the gcode sets one
+        self._nozzle = array("d")
+        self._bed = array("d")
+        self._whole = array("B")            # Bit 0/1/2 set when the fan/nozzle/bed value is an int
+        self._elapsed = array("d")
+        self._span_first = array("L", [0])  # The spans of item n are [_span_first[n]:_span_first[n + 1]]
+        self._span_start = array("L")
+        self._span_end = array("L")
+        self._span_type = array("H")
+        self._np = _numpy() if read_moves else None
+        self._read_moves_too = read_moves
+        self._relative_e = relative_e
+        self._relative_xyz = False
+        self._position = [0.0, 0.0, 0.0]    # X Y E
+        self._tool = 0
+        self._fan_value = None
+        self._nozzles = {}                  # type: Dict[int, Union[int, float]]
+        self._bed_value = None
+        for line in data[0].split("\n") if data else ():
+            if line.startswith(";") and ":" in line:
+                key, value = line[1:].split(":", 1)
+                self.header[key] = value
+        for item in data:
+            self._read_item(item)
+
+    def __len__(self) -> int:
+        return len(self._extruded)
+
+    #----Reading the gcode
+    def _read_item(self, item: str) -> None:
+        self._item_box = [math.inf, math.inf, -math.inf, -math.inf]
+        self._item_extruded = 0.0
+        self._item_tools = 0 if self._read_moves_too else _tool_bit(self._tool)
+        start = 0
+        for found in (_STATS_LINES if self._read_moves_too else _STATS_LINES_NO_MOVES).finditer(item):
+            if self._read_moves_too:
+                self._read_moves(item, start, found.start())
+            self._read_line(found.group(0))
+            start = found.end()
+        if self._read_moves_too:
+            self._read_moves(item, start, len(item))
+        ## The ";TYPE:" blocks and the time don't change the state so they are found on their own
+        starts = [(found.start(), found.group(1)) for found in _TYPE_LINE.finditer(item)]
+        for (span_start, name), (span_end, _) in zip(starts, starts[1:] + [(len(item), None)]):
+            if not name in self._type_ids:
+                self._type_ids[name] = len(self.types)
+                self.types.append(name)
+            self._span_start.append(span_start)
+            self._span_end.append(span_end)
+            self._span_type.append(self._type_ids[name])
+        self._item_elapsed = math.nan
+        pos = item.rfind(";TIME_ELAPSED:")
+        if pos != -1:
+            line_end = item.find("\n", pos)
+            try:
+                self._item_elapsed = float(item[pos + 14:line_end if line_end != -1 else len(item)])
+            except ValueError:
+                pass
+        self._store()
+
+    def _read_moves(self, item: str, start: int, end: int) -> None:
+        ## The G0/G1 moves between two _STATS_LINES
+        rows = _CURA_MOVE.findall(item, start, end)
+        if len(rows) == item.count("\nG0 ", start, end) + item.count("\nG1 ", start, end):
+            if rows and self._np is not None:
+                self._bulk_moves(rows)
+            else:
+                for row in rows:
+                    self._move(*(float(text) if text else None for text in (row[1], row[2], row[4])))
+            return
+        for line in item[start:end].split("\n"):
+            if line.startswith(("G0", "G1")):
+                letter, command, values = _words(line)
+                if command == 0 or command == 1:
+                    self._move(values.get("X"), values.get("Y"), values.get("E"))
+
+    def _read_line(self, line: str) -> None:
+        letter, command, values = _words(line)
+        if letter == "G":
+            if command == 2 or command == 3:
+                self._move(values.get("X"), values.get("Y"), values.get("E"))
+            elif command == 28:
+                homed = [axis_nr for axis_nr, axis in enumerate("XY") if axis in values]
+                for axis_nr in homed if homed or "Z" in values else (0, 1):
+                    self._position[axis_nr] = 0.0
+            elif command == 90 or command == 91:
+                self._relative_xyz = command == 91
+            elif command == 92:
+                for axis_nr, axis in enumerate("XYE"):
+                    if axis in values:
+                        self._position[axis_nr] = float(values[axis])
+        elif letter == "M":
+            if command == 82 or command == 83:
+                self._relative_e = command == 83
+            elif command == 104 or command == 109:
+                target = values.get("S", values.get("R"))
+                if target is not None:
+                    self._nozzles[int(values.get("T", self._tool))] = target
+            elif command == 140 or command == 190:
+                target = values.get("S", values.get("R"))
+                if target is not None:
+                    self._bed_value = target
+            elif (command == 106 or command == 107) and int(values.get("P", 0)) == 0:
+                self._fan_value = values.get("S", 255) if command == 106 else 0
+        elif letter == "T" and command >= 0:
+            self._tool = command
+            if not self._read_moves_too:
+                self._item_tools |= _tool_bit(command)
+
+    def _move(self, x: Optional[float], y: Optional[float], e: Optional[float]) -> None:
+        ## One move in order
+        start_x, start_y = self._position[0], self._position[1]
+        for axis_nr, value in ((0, x), (1, y)):
+            if value is not None:
+                self._position[axis_nr] = self._position[axis_nr] + value if self._relative_xyz else float(value)
+        if e is None:
+            return
+        if self._relative_e:
+            pushed = e
+        else:
+            pushed = e - self._position[2]
+            self._position[2] = float(e)
+        if pushed > 0 and (x is not None or y is not None):
+            self._item_extruded += pushed
+            self._item_tools |= _tool_bit(self._tool)
+            box = self._item_box
+            box[0] = min(box[0], start_x, self._position[0])
+            box[1] = min(box[1], start_y, self._position[1])
+            box[2] = max(box[2], start_x, self._position[0])
+            box[3] = max(box[3], start_y, self._position[1])
+
+    def _bulk_moves(self, rows: List[tuple]) -> None:
+        ## _move() for a run of Cura moves (F X Y Z E as text, "" when the line doesn't have it), in NumPy
+        np = self._np
+        x, y, e = (np.array([float(row[index]) if row[index] else math.nan for row in rows]) for index in (1, 2, 4))
+
+        def filled(column, start):
+            ## Each row's value, or the one above it (or 'start') when the row doesn't have one
+            have = np.arange(len(column))
+            have[np.isnan(column)] = -1
+            np.maximum.accumulate(have, out = have)
+            return np.where(have < 0, start, column[have])
+
+        ## The position before each move and after the last one
+        positions = []
+        for axis_nr, column in enumerate((x, y)):
+            if self._relative_xyz:
+                position = self._position[axis_nr] + np.cumsum(np.nan_to_num(column))
+            else:
+                position = filled(column, self._position[axis_nr])
+            positions.append(np.concatenate(([self._position[axis_nr]], position)))
+            self._position[axis_nr] = float(position[-1])
+        if self._relative_e:
+            pushed = e
+        else:
+            position = filled(e, self._position[2])
+            pushed = np.where(np.isnan(e), math.nan, np.diff(position, prepend = self._position[2]))
+            self._position[2] = float(position[-1])
+        printing = np.flatnonzero((np.nan_to_num(pushed) > 0) & ~(np.isnan(x) & np.isnan(y)))
+        if not len(printing):
+            return
+        self._item_extruded += float(pushed[printing].sum())
+        self._item_tools |= _tool_bit(self._tool)
+        box = self._item_box
+        for axis_nr, position in enumerate(positions):
+            points = np.concatenate((position[printing], position[printing + 1]))
+            box[axis_nr] = min(box[axis_nr], float(points.min()))
+            box[axis_nr + 2] = max(box[axis_nr + 2], float(points.max()))
+
+    def _store(self) -> None:
+        box = self._item_box
+        for key, value in zip(("min_x", "min_y", "max_x", "max_y"), box):
+            self._box[key].append(value if box[0] <= box[2] else math.nan)
+        self._extruded.append(self._item_extruded)
+        self._tools.append(self._item_tools)
+        self._last_tool.append(self._tool)
+        whole = 0
+        for bit, (column, value) in enumerate(((self._fan, self._fan_value), (self._nozzle, self._nozzles.get(self._tool)),
+                                               (self._bed, self._bed_value))):
+            column.append(math.nan if value is None else value)
+            if isinstance(value, int):
+                whole |= 1 << bit
+        self._whole.append(whole)
+        self._elapsed.append(self._item_elapsed)
+        self._span_first.append(len(self._span_start))
+
+    #----Looking things up.  'num' can be negative like a data[] index.
+    def _items(self, first: int, last: Optional[int]) -> range:
+        first = first + len(self) if first < 0 else first
+        last = first if last is None else last + len(self) if last < 0 else last
+        return range(first, last + 1)
+
+    def box(self, first: int, last: Optional[int] = None) -> Optional[tuple]:
+        """(min x, min y, max x, max y) of the extruding moves in data[first] (to data[last] when it is given), None
+        when nothing is extruded."""
+        items = self._items(first, last)
+        box = []
+        for key, pick in (("min_x", min), ("min_y", min), ("max_x", max), ("max_y", max)):
+            values = [value for value in self._box[key][items.start:items.stop] if not math.isnan(value)]
+            if not values:
+                return None
+            box.append(pick(values))
+        return tuple(box)
+
+    def extruded(self, first: int, last: Optional[int] = None) -> float:
+        """mm of filament extruded in data[first] (to data[last] when it is given)."""
+        items = self._items(first, last)
+        return round(sum(self._extruded[items.start:items.stop]), 5)
+
+    def tools(self, first: int, last: Optional[int] = None) -> List[int]:
+        """The tools that print in data[first] (to data[last] when it is given)."""
+        items = self._items(first, last)
+        used = 0
+        for bits in self._tools[items.start:items.stop]:
+            used |= bits
+        return [tool for tool in range(used.bit_length()) if used & (1 << tool)]
+
+    def tool_at_end(self, num: int) -> int:
+        """The active tool at the end of data[num]."""
+        return self._last_tool[num]
+
+    def _value(self, column: array, bit: int, num: int) -> Union[int, float, None]:
+        value = column[num]
+        if math.isnan(value):
+            return None
+        return int(value) if self._whole[num] & (1 << bit) else value
+
+    def fan(self, num: int) -> Union[int, float, None]:
+        """The layer fan speed at the end of data[num], None until the gcode sets one."""
+        return self._value(self._fan, 0, num)
+
+    def nozzle(self, num: int) -> Union[int, float, None]:
+        """The target temperature of the active tool at the end of data[num], None until the gcode sets one."""
+        return self._value(self._nozzle, 1, num)
+
+    def bed(self, num: int) -> Union[int, float, None]:
+        """The target bed temperature at the end of data[num], None until the gcode sets one."""
+        return self._value(self._bed, 2, num)
+
+    def elapsed(self, num: int) -> Optional[float]:
+        """The last ";TIME_ELAPSED:" of data[num], None when it doesn't have one."""
+        value = self._elapsed[num]
+        return None if math.isnan(value) else value
+
+    def spans(self, num: int, name: Optional[str] = None) -> List[tuple]:
+        """The (start, end, name) of each ";TYPE:" block in data[num] (only the ";TYPE:name" ones when 'name' is given)."""
+        num = num + len(self) if num < 0 else num
+        return [(self._span_start[index], self._span_end[index], self.types[self._span_type[index]])
+                for index in range(self._span_first[num], self._span_first[num + 1])
+                if name is None or self.types[self._span_type[index]] == name]
+
+    def footprint(self) -> Optional[tuple]:
+        """(min x, min y, max x, max y) of the print from the ";MINX:" ";MINY:" ";MAXX:" ";MAXY:" lines (or the
+        ";PRINT.SIZE." lines) of the header, with the numbers as Script.getValue gives them.  When the header doesn't
+        have them it is the box around all the extruding moves."""
+        footprint = []
+        for keys in _FOOTPRINT_KEYS:
+            found = _NUMBER.match(next((self.header[key] for key in keys if key in self.header), "").strip())
+            if found is None:
+                return self.box(0, -1) if len(self) else None
+            text = found.group(0)
+            footprint.append(float(text) if "." in text else int(text))
+        return tuple(footprint)
+
+
+def _tool_bit(tool: int) -> int:
+    ## The bit of a tool in LayerStats._tools (tools past 63 aren't counted)
+    return 1 << tool if 0 <= tool < 64 else 0
+
+
+#----Tool changes------------------------------------------------------------------------------------------------------
+## A tool change line.  The number is read the way Script.getValue reads it.
+_TOOL_CHANGE = re.compile(r"^T([0-9]+)", re.MULTILINE)
+
+
+class ToolTimeline:
+    """Every tool change in Cura's data[] list, found in a single pass, so the scripts can ask which tools are used,
+    which tool is active at an item and where the changes are instead of reading the lines again.
+
+    A change is a (data index, line index, tool) tuple.  The line index is the position of the "T" line in
+    data[num].split("\n").  'first_tool' is the active tool before the first change.
+    Make the timeline before changing data[] - the line indexes are not updated when lines are added to the items.
+    """
+
+    def __init__(self, data: List[str], first_tool: int = 0) -> None:
+        self.first_tool = first_tool
+        self._num = array("L")
+        self._line = array("L")
+        self._tool = array("i")
+        self._first = array("L", [0])       # The changes of item n are [_first[n]:_first[n + 1]]
+        for num, item in enumerate(data):
+            line_nr = 0
+            start = 0
+            for found in _TOOL_CHANGE.finditer(item):
+                line_nr += item.count("\n", start, found.start())
+                start = found.start()
+                self._num.append(num)
+                self._line.append(line_nr)
+                self._tool.append(int(found.group(1)))
+            self._first.append(len(self._tool))
+
+    def __len__(self) -> int:
+        return len(self._tool)
+
+    def _items(self, first: int, last: Optional[int]) -> range:
+        items = len(self._first) - 1
+        first = first + items if first < 0 else first
+        last = first if last is None else last + items if last < 0 else last
+        return range(first, last + 1)
+
+    def changes(self, first: int, last: Optional[int] = None) -> List[tuple]:
+        """The (data index, line index, tool) of each tool change in data[first] (to data[last] when it is given)."""
+        items = self._items(first, last)
+        return [(self._num[index], self._line[index], self._tool[index])
+                for index in range(self._first[items.start], self._first[items.stop])]
+
+    def tools(self, first: int = 0, last: Optional[int] = -1) -> List[int]:
+        """The tools that are active somewhere in data[first] (to data[last], all of data[] by default)."""
+        items = self._items(first, last)
+        used = set(self._tool[self._first[items.start]:self._first[items.stop]])
+        used.add(self.tool_at_start(items.start))
+        return sorted(used)
+
+    def tool_at_start(self, num: int) -> int:
+        """The active tool at the start of data[num]."""
+        index = self._first[self._items(num, None).start]
+        return self._tool[index - 1] if index else self.first_tool
+
+    def tool_at_end(self, num: int) -> int:
+        """The active tool at the end of data[num]."""
+        index = self._first[self._items(num, None).stop]
+        return self._tool[index - 1] if index else self.first_tool
+
+
+#----Fan speeds--------------------------------------------------------------------------------------------------------
+## The lines that set a fan and the ones after which the fan speeds aren't known for sure (pauses, tool changes and
+## firmware macros).  Starting at the "\n" is a lot faster than "^".
+_FAN_LINES = re.compile(r"\n((?:M10[67]|M[01]|M25|M125|M226|M60[01])(?![0-9])[^\n]*|(?:[A-FH-LO-Za-z_@]|[GMN](?![0-9]))[^\n]*)")
+## A line with a line number
+_NUMBERED_LINE = re.compile(r"\nN[0-9]")
+
+
+class FanTimeline:
+    """The speed of each fan at the end of every data[] item, found in a single pass over data[].
+
+    Fans are numbered by the P of M106/M107.  A line without a P is fan 0 (as in Marlin) and an M106 without an S is
+    full speed (255).  The speeds are the S values as they are in the gcode.
+    The M106/M107 lines that set a fan to the speed it has already are noted as they are read and drop_repeats() takes
+    them out.  A speed is only sure from the line that sets it up to the next pause, tool change or firmware macro line
+    (the firmware may change the fans there), and a line with a P is not taken as the same fan as a line without one,
+    so a line is only a repeat when it can't make a difference.  A file with line numbers has no repeats.
+    Make the timeline before changing data[] - the repeats are found by their place in the items.
+    """
+
+    def __init__(self, data: List[str]) -> None:
+        self.fans = []                      # The fan numbers in the gcode
+        self.dropped = 0
+        self._speed = {}                    # type: Dict[int, array]  One speed per item, NaN until the fan is set
+        self._current = {}                  # type: Dict[int, float]
+        self._sure = {}                     # type: Dict[tuple, float]  {(has a P, fan): speed}
+        self._repeats = {}                  # type: Dict[int, List[tuple]]  {item: [(start, end) of each repeat line]}
+        self._items = 0
+        numbered = any(item.startswith("N") or _NUMBERED_LINE.search(item) for item in data)
+        for num, item in enumerate(data):
+            repeats = self._read_item(item)
+            if repeats and not numbered:
+                self._repeats[num] = repeats
+            self._items += 1
+            for fan in self.fans:
+                self._speed[fan].append(self._current[fan])
+
+    def __len__(self) -> int:
+        return self._items
+
+    #----Reading the gcode
+    def _read_item(self, item: str) -> List[tuple]:
+        ## The (start, end) of the repeat lines in 'item', each with the "\n" after it
+        repeats = []
+        ## The "\n" in front lets the first line be found too.  The positions are one past the ones in 'item'.
+        for found in _FAN_LINES.finditer("\n" + item):
+            line = found.group(1)
+            if not line.startswith("M10"):
+                self._sure.clear()
+                continue
+            letter, command, values = _words(line)
+            if not self._set_fan(command, values):
+                repeats.append((found.start(1) - 1, found.end(1)))
+        return repeats
+
+    def _set_fan(self, command: int, values: dict) -> bool:
+        ## Follow an M106/M107.  False when it sets the fan to the speed it is sure to have already.
+        fan = int(values.get("P", 0))
+        speed = float(values.get("S", 255)) if command == 106 else 0.0
+        if not fan in self._current:
+            self.fans.append(fan)
+            self.fans.sort()
+            self._speed[fan] = array("d", [math.nan] * self._items)
+        self._current[fan] = speed
+        key = ("P" in values, fan)
+        if any(not letter in "SP" for letter in values) or (command == 106 and not "S" in values):
+            ## Something the speed alone doesn't describe
+            self._sure.clear()
+            return True
+        if self._sure.get(key) == speed:
+            return False
+        ## A line with a P and one without can set the same fan
+        for other in list(self._sure):
+            if other[0] != key[0]:
+                del self._sure[other]
+        self._sure[key] = speed
+        return True
+
+    #----Changing the gcode
+    def drop_repeats(self, data: List[str]) -> int:
+        """Take the lines that set a fan to the speed it has already out of data[] (the list the timeline was made
+        from).  The speeds don't change.  Returns how many lines were taken out ('dropped' is the total)."""
+        dropped = 0
+        for num, repeats in self._repeats.items():
+            item = data[num]
+            pieces = []
+            start = 0
+            for line_start, line_end in repeats:
+                pieces.append(item[start:line_start])
+                start = line_end
+            pieces.append(item[start:])
+            text = "".join(pieces)
+            ## The last line was taken out
+            if text.endswith("\n") and not item.endswith("\n"):
+                text = text[:-1]
+            data[num] = text
+            dropped += len(repeats)
+        self._repeats = {}
+        self.dropped += dropped
+        return dropped
+
+    #----Looking things up
+    def speed(self, num: int, fan: int = 0) -> Union[int, float, None]:
+        """The speed of the fan at the end of data[num], None until the gcode sets it."""
+        value = self._speed[fan][num] if fan in self._speed else math.nan
+        if math.isnan(value):
+            return None
+        return int(value) if value.is_integer() else value
+
+    def column(self, fan: int = 0) -> array:
+        """The speed of the fan at the end of each data[] item (NaN until the gcode sets it) as an array of doubles."""
+        return array("d", self._speed.get(fan, array("d", [math.nan] * self._items)))
+
+
+def layer_schedule(points: Iterable[tuple]) -> List[tuple]:
+    """The (layer, value) of every layer from the first to the last of the (layer, value) 'points', on straight lines
+    between them.  The points can be in any order and a layer that is in them more than once gets its last value.
+    NumPy works out the values when it is there and the result is the same without it."""
+    values = dict(points)
+    if not values:
+        return []
+    layers = sorted(values)
+    first = layers[0]
+    last = layers[-1]
+    np = _numpy()
+    if np is not None:
+        schedule = np.interp(np.arange(first, last + 1), layers, [values[layer] for layer in layers])
+        return list(zip(range(first, last + 1), schedule.tolist()))
+    schedule = []
+    for layer in range(first, last + 1):
+        index = bisect.bisect_right(layers, layer) - 1
+        if index == len(layers) - 1:
+            schedule.append((layer, float(values[last])))
+            continue
+        low, high = layers[index], layers[index + 1]
+        ## The same sum as numpy.interp
+        slope = (values[high] - values[low]) / (high - low)
+        schedule.append((layer, slope * (layer - low) + values[low]))
+    return schedule
+
+
+#----Combing moves-----------------------------------------------------------------------------------------------------
+## A ";TYPE:" line, a ";MESH:NONMESH" line or a run of G0 lines.  Starting at the "\n" is a lot faster than "^".
+_COMBING_LINES = re.compile(r"\n(;TYPE:[^\n]*|;MESH:NONMESH[^\n]*|G0 [^\n]*(?:\nG0 [^\n]*)*)")
+## How mark_combing() measures a run.  "moves" is the number of G0 lines, "distance" the mm of X/Y travel and "time"
+## the seconds the travel takes at its feedrate.
+COMBING_MEASURES = ("moves", "distance", "time")
+
+
+def mark_combing(text: str, measure: str = "moves", minimum: float = 5, travel_speed: float = 150.0) -> str:
+    """Put a ";MESH:NONMESH" line in front of each long run of G0 moves in a layer and the ";TYPE:" line of the feature
+    it is in after the run, so a By Feature fan pass turns the fan off for the combing and back on after it.
+
+    A run is long when its 'measure' (see COMBING_MEASURES) is more than 'minimum'.  For "time" a run moves at
+    'travel_speed' mm/s until one of its lines has an F.  The G0 moves after a ";MESH:NONMESH" line are travel already
+    and are left alone up to the next ";TYPE:".  A run with no line after it isn't marked.  A run that ends at a
+    ";TYPE:" or ";MESH:NONMESH" line isn't marked when counting "moves" (as the script always did) and doesn't get a
+    ";TYPE:" after it for the other measures.  The text is read once.
+    """
+    pieces = []
+    start = 0
+    feature = ";TYPE:SUPPORT"
+    in_travel = False
+    xy = [None, None]           # The X/Y at 'xy_at' in the text
+    xy_at = 0
+    ## The "\n" in front lets the first line be found too.  The positions are one past the ones in 'text'.
+    for found in _COMBING_LINES.finditer("\n" + text):
+        line = found.group(1)
+        if line.startswith(";TYPE:"):
+            feature = line
+            in_travel = False
+            continue
+        if line.startswith(";MESH:NONMESH"):
+            in_travel = True
+            continue
+        run_start = found.start(1) - 1
+        run_end = found.end(1) - 1
+        if in_travel or run_end == len(text):
+            continue
+        if measure == "moves":
+            is_long = (text.count("\n", run_start, run_end) + 1 > minimum
+                       and not text.startswith((";TYPE:", ";MESH:NONMESH"), run_end + 1))
+        else:
+            xy = _xy_before(text, run_start, xy_at, xy)
+            travel, xy = _travel_measure(text, run_start, run_end, xy, measure, minimum, travel_speed)
+            is_long = travel > minimum
+            xy_at = run_end
+        if is_long:
+            pieces += [text[start:run_start], ";MESH:NONMESH\n", text[run_start:run_end + 1]]
+            start = run_end + 1
+            ## A ";TYPE:" or ";MESH:NONMESH" line after the run sets the fan already
+            if not text.startswith((";TYPE:", ";MESH:NONMESH"), start):
+                pieces.append(feature + "\n")
+    if not pieces:
+        return text
+    pieces.append(text[start:])
+    return "".join(pieces)
+
+
+def _xy_before(text: str, end: int, stop: int, xy: list) -> list:
+    ## The X/Y at 'end' in the text.  The lines are read back from 'end' until both are found or 'stop' (where the X/Y
+    ## were 'xy') is reached.  Usually it is the line just above.
+    found = [None, None]
+    while end > stop and (found[0] is None or found[1] is None):
+        line_start = max(text.rfind("\n", stop, end - 1) + 1, stop)
+        if text.startswith("G", line_start):
+            move = _CURA_MOVE.match(text, line_start)
+            if move is not None:
+                values = {key: float(value) for key, value in zip("XY", move.group(2, 3)) if value}
+            else:
+                letter, command, values = _words(text[line_start:end])
+                values = values if command in MOVES else {}
+            for axis, key in enumerate("XY"):
+                if found[axis] is None and key in values:
+                    found[axis] = values[key]
+        end = line_start
+    return [xy[axis] if found[axis] is None else found[axis] for axis in (0, 1)]
+
+
+def _travel_measure(text: str, start: int, end: int, xy: list, measure: str, minimum: float, travel_speed: float) -> tuple:
+    ## The mm ("distance") or seconds ("time") of the run of G0 lines in text[start:end] that starts at 'xy' (it stops
+    ## adding once it is past 'minimum') and the X/Y at the end of the run.
+    rows = _CURA_MOVE.findall(text, start, end)
+    if len(rows) != text.count("\n", start, end) + 1:
+        ## Not all in Cura's order
+        rows = []
+        for line in text[start:end].split("\n"):
+            values = _words(line)[2]
+            rows.append(tuple(str(values[key]) if key in values else "" for key in "FXY"))
+    x, y = xy
+    speed = travel_speed
+    total = 0.0
+    for row in rows:
+        if row[0] and float(row[0]) > 0:
+            speed = float(row[0]) / 60
+        new_x = float(row[1]) if row[1] else x
+        new_y = float(row[2]) if row[2] else y
+        if x is not None and y is not None and new_x is not None and new_y is not None:
+            length = math.hypot(new_x - x, new_y - y)
+            total += length if measure == "distance" else length / speed
+            if total > minimum:
+                break
+        x, y = new_x, new_y
+    end_xy = list(xy)
+    for axis in (0, 1):
+        value = next((row[axis + 1] for row in reversed(rows) if row[axis + 1]), None)
+        if value is not None:
+            end_xy[axis] = float(value)
+    return total, end_xy
+
+
+#----Arc fitting-------------------------------------------------------------------------------------------------------
+## A G1 that can be part of an arc: X and/or Y, maybe F and E, in Cura's order and nothing else on the line
+_ARC_SEGMENT = re.compile(r"G1(?: F(-?[0-9]+\.?[0-9]*))?(?: X(-?[0-9]+\.?[0-9]*))?(?: Y(-?[0-9]+\.?[0-9]*))?(?: E(-?[0-9]+\.?[0-9]*))?[ \t]*$")
+## How far the E per mm of a move in an arc can be from the first move's (a fraction of it)
+_ARC_FLOW_TOLERANCE = 0.05
+## Arcs stop short of a full circle so the start and the end can't be the same point
+_ARC_MAX_SWEEP = 2 * math.pi - 0.001
+
+
+def _arc_number(value: float) -> str:
+    ## 3 decimals without the trailing zeros, like Cura writes X and Y
+    text = "{:.3f}".format(value).rstrip("0").rstrip(".")
+    return "0" if text == "-0" else text
+
+
+def _arc_through(points: List[tuple], tolerance: float, max_radius: float) -> Optional[tuple]:
+    """The arc through the first, middle and last of 'points' as (center x, center y, radius, clockwise, sweep) or
+    None if a point or the middle of a move between them is more than 'tolerance' off it, the moves don't all go the
+    same way around, or the radius is over 'max_radius'."""
+    (x0, y0), (x1, y1), (x2, y2) = points[0], points[len(points) // 2], points[-1]
+    det = 2 * (x0 * (y1 - y2) + x1 * (y2 - y0) + x2 * (y0 - y1))
+    if abs(det) < 0.000000001:
+        return None
+    square0, square1, square2 = x0 * x0 + y0 * y0, x1 * x1 + y1 * y1, x2 * x2 + y2 * y2
+    center_x = (square0 * (y1 - y2) + square1 * (y2 - y0) + square2 * (y0 - y1)) / det
+    center_y = (square0 * (x2 - x1) + square1 * (x0 - x2) + square2 * (x1 - x0)) / det
+    radius = math.hypot(x0 - center_x, y0 - center_y)
+    if radius > max_radius:
+        return None
+    clockwise = None
+    sweep = 0.0
+    for point_nr in range(1, len(points)):
+        turn = _arc_turn(center_x, center_y, radius, points[point_nr - 1], points[point_nr], tolerance)
+        if turn is None or (clockwise is not None and (turn < 0) != clockwise):
+            return None
+        clockwise = turn < 0
+        sweep += abs(turn)
+    return (center_x, center_y, radius, clockwise, sweep) if sweep < _ARC_MAX_SWEEP else None
+
+
+def _arc_turn(center_x: float, center_y: float, radius: float, start: tuple, end: tuple, tolerance: float) -> Optional[float]:
+    ## The angle a move turns around the center (radians, clockwise is negative).  None if the end point or the middle
+    ## of the move is more than 'tolerance' off the circle.
+    if abs(math.hypot(end[0] - center_x, end[1] - center_y) - radius) > tolerance:
+        return None
+    chord = math.hypot(end[0] - start[0], end[1] - start[1])
+    if radius - math.sqrt(max(radius * radius - chord * chord / 4, 0)) > tolerance:
+        return None
+    start_x, start_y = start[0] - center_x, start[1] - center_y
+    end_x, end_y = end[0] - center_x, end[1] - center_y
+    turn = math.atan2(start_x * end_y - start_y * end_x, start_x * end_x + start_y * end_y)
+    return turn if turn != 0 else None
+
+
+class ArcFitter:
+    """Turns runs of short G1 moves that lie on a circle into G2/G3 arcs.
+
+    A run is G1 moves in X/Y (no Z, no comment on the line) that either all extrude, with about the same E per mm, or
+    all don't, and that keep the feedrate of the first one.  Every point of the run and the middle of every move has
+    to be within 'tolerance' (mm) of the arc.  The arc ends exactly where the last move did and the E is kept exactly:
+    the E of the last move in absolute mode and the sum of the E's in relative mode.  The printer needs arc support
+    (ARC_SUPPORT in Marlin).
+    fit() does one data[] item.  Call it for the items in order (the startup gcode too, with 'fit_moves' False) so the
+    position carries on.  'replaced', 'arcs' and 'bytes_saved' count what was done.
+    """
+
+    def __init__(self, tolerance: float = 0.025, min_segments: int = 3, max_radius: float = 1000.0, relative_e: bool = False) -> None:
+        self.tolerance = tolerance
+        self.min_segments = max(int(min_segments), 2)
+        self.max_radius = max_radius
+        self.replaced = 0
+        self.arcs = 0
+        self.bytes_saved = 0
+        self._relative_e = relative_e
+        self._relative_xyz = False
+        self._x = self._y = self._e = self._f = 0.0
+        self._x_text = self._y_text = "0"
+        ## The run being built: the point it starts at and (line, x, y, X text, Y text, E text, E per mm, F text) of
+        ## each move.  '_arc' is the arc the moves so far fit on, found once there are 'min_segments' of them.
+        self._start = (0.0, 0.0)
+        self._run = []
+        self._arc = None
+
+    def fit_data(self, data: List[str]) -> List[str]:
+        """fit() for the layers of data[].  The startup and ending gcode are left as they are."""
+        for num in range(1, len(data) - 1):
+            data[num] = "\n".join(self.fit(data[num].split("\n"), num > 1))
+        return data
+
+    def report(self, script_name: str) -> str:
+        """A line for data[0] with what was done."""
+        return (";  [" + script_name + "] " + "{:,.0f}".format(self.replaced) + " G1 lines were replaced by "
+                + "{:,.0f}".format(self.arcs) + " arcs.  " + "{:,.0f}".format(self.replaced - self.arcs) + " lines and "
+                + "{:,.0f}".format(self.bytes_saved) + " bytes were saved.\n")
+
+    def fit(self, lines: List[str], fit_moves: bool = True) -> List[str]:
+        new_lines = []
+        for line in lines:
+            found = _ARC_SEGMENT.match(line) if fit_moves and line.startswith("G1 ") and not self._relative_xyz else None
+            if found is not None and self._add(found, line, new_lines):
+                continue
+            self._end_run(new_lines)
+            new_lines.append(line)
+            self._follow(line)
+        self._end_run(new_lines)
+        return new_lines
+
+    def _add(self, found, line: str, new_lines: List[str]) -> bool:
+        ## Add a move to the run (ending the run first if the move doesn't fit on it).  False if it can't be in an arc.
+        f_text, x_text, y_text, e_text = found.groups()
+        if x_text is None and y_text is None:
+            return False
+        point = (float(x_text) if x_text is not None else self._x, float(y_text) if y_text is not None else self._y)
+        length = math.hypot(point[0] - self._x, point[1] - self._y)
+        if length < 0.000001:
+            return False
+        flow = None
+        if e_text is not None:
+            extruded = float(e_text) if self._relative_e else float(e_text) - self._e
+            if extruded <= 0:
+                return False
+            flow = extruded / length
+        feedrate = float(f_text) if f_text is not None else self._f
+        if self._run:
+            first_flow = self._run[0][6]
+            if (feedrate != self._f or (flow is None) != (first_flow is None)
+                    or (flow is not None and abs(flow - first_flow) > first_flow * _ARC_FLOW_TOLERANCE)):
+                self._end_run(new_lines)
+        if self._arc is not None:
+            center_x, center_y, radius, clockwise, sweep = self._arc
+            turn = _arc_turn(center_x, center_y, radius, (self._x, self._y), point, self.tolerance)
+            if turn is not None and (turn < 0) == clockwise and sweep + abs(turn) < _ARC_MAX_SWEEP:
+                self._arc = (center_x, center_y, radius, clockwise, sweep + abs(turn))
+            else:
+                ## The first arc was found from a few moves.  The arc through the ends of the longer run may still fit.
+                longer = _arc_through(self._points(len(self._run)) + [point], self.tolerance, self.max_radius)
+                if longer is None:
+                    self._end_run(new_lines)
+                else:
+                    self._arc = longer
+        if not self._run:
+            self._start = (self._x, self._y)
+        self._x, self._y, self._f = point[0], point[1], feedrate
+        if x_text is not None:
+            self._x_text = x_text
+        if y_text is not None:
+            self._y_text = y_text
+        if e_text is not None:
+            self._e = self._e + float(e_text) if self._relative_e else float(e_text)
+        self._run.append((line, point[0], point[1], self._x_text, self._y_text, e_text, flow, f_text))
+        if self._arc is None and len(self._run) >= self.min_segments:
+            self._arc = _arc_through(self._points(len(self._run)), self.tolerance, self.max_radius)
+            if self._arc is None:
+                ## Not an arc yet.  Try again without the first move.
+                first = self._run.pop(0)
+                new_lines.append(first[0])
+                self._start = (first[1], first[2])
+        return True
+
+    def _points(self, count: int) -> List[tuple]:
+        return [self._start] + [(move[1], move[2]) for move in self._run[:count]]
+
+    def _end_run(self, new_lines: List[str]) -> None:
+        ## Put the run in as an arc.  The moves of the run were checked against the first arc that fit them so the arc
+        ## through the end points is checked again, and if it's off the run is shortened.
+        run = self._run
+        count = len(run) if self._arc is not None else 0
+        while count >= self.min_segments:
+            arc = _arc_through(self._points(count), self.tolerance, self.max_radius)
+            if arc is not None:
+                new_lines.append(self._arc_line(arc, run[:count]))
+                break
+            count -= 1
+        else:
+            count = 0
+        new_lines.extend(move[0] for move in run[count:])
+        self._run = []
+        self._arc = None
+
+    def _arc_line(self, arc: tuple, moves: List[tuple]) -> str:
+        center_x, center_y, radius, clockwise, sweep = arc
+        last = moves[-1]
+        line = "G2" if clockwise else "G3"
+        if moves[0][7] is not None:
+            line += " F" + moves[0][7]
+        line += " X" + last[3] + " Y" + last[4] + " I" + _arc_number(center_x - self._start[0]) + " J" + _arc_number(center_y - self._start[1])
+        if last[5] is not None:
+            line += " E" + (format(sum(Decimal(move[5]) for move in moves), "f") if self._relative_e else last[5])
+        self.replaced += len(moves)
+        self.arcs += 1
+        self.bytes_saved += sum(len(move[0]) + 1 for move in moves) - len(line) - 1
+        return line
+
+    def _follow(self, line: str) -> None:
+        ## Keep track of the position and the modes through the lines that are not fitted
+        if not line.startswith(("G", "M")):
+            return
+        letter, command, values = _words(line)
+        if letter == "G":
+            if command in MOVES:
+                if "X" in values:
+                    self._x = self._x + values["X"] if self._relative_xyz else float(values["X"])
+                    self._x_text = _arc_number(self._x)
+                if "Y" in values:
+                    self._y = self._y + values["Y"] if self._relative_xyz else float(values["Y"])
+                    self._y_text = _arc_number(self._y)
+                if "E" in values:
+                    self._e = self._e + values["E"] if self._relative_e else float(values["E"])
+                if "F" in values:
+                    self._f = float(values["F"])
+            elif command == 90 or command == 91:
+                self._relative_xyz = command == 91
+            elif command == 92:
+                if "X" in values:
+                    self._x = float(values["X"])
+                    self._x_text = _arc_number(self._x)
+                if "Y" in values:
+                    self._y = float(values["Y"])
+                    self._y_text = _arc_number(self._y)
+                if "E" in values:
+                    self._e = float(values["E"])
+        elif letter == "M" and (command == 82 or command == 83):
+            self._relative_e = command == 83
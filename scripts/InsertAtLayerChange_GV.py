@@ -123,36 +123,34 @@ class InsertAtLayerChange_GV(Script):
                 the_search_layer = int(self.getSettingValueByKey("single_end_layer"))-1
                 raise Exception("Error.  Insert changed to Once Only.")
 
+#Find the layers once
+        from GcodeTools_GV import LayerIndex
+        layer_index = LayerIndex(data)
+
 #Single insertion
         if when_to_insert == "once_only":
             if Application.getInstance().getGlobalContainerStack().getProperty("print_sequence", "value") == "all_at_once":
-                for index, layer in enumerate(data):
-                    if ";LAYER:" + str(the_search_layer) + "\n" in layer:
-                        lines = layer.split("\n")
-                        lines.insert(1,gcode_to_add[0:-1])
-                        data[index] = "\n".join(lines)
-                        return data
+                for index in layer_index.indexes_of(the_search_layer):
+                    lines = data[index].split("\n")
+                    lines.insert(1,gcode_to_add[0:-1])
+                    data[index] = "\n".join(lines)
+                    return data
 
             else:
-                for index, layer in enumerate(data):
-                    if ";LAYER:" + str(the_search_layer) + "\n" in layer:
-                        lines = layer.split("\n")
-                        lines.insert(1,gcode_to_add[0:-1])
-                        data[index] = "\n".join(lines)
-                        continue
+                for index in layer_index.indexes_of(the_search_layer):
+                    lines = data[index].split("\n")
+                    lines.insert(1,gcode_to_add[0:-1])
+                    data[index] = "\n".join(lines)
                 return data
 
 #Multiple insertions
         if when_to_insert != "once_only":
-            for index, layer in enumerate(data):
-                lines = layer.split("\n")
-                for l_index, line in enumerate(lines):
-                    if ";LAYER:" in line:
-                        layer_number = int(line.split(":")[1])
-                        if layer_number >= int(the_start_layer)-1 and layer_number <= int(the_end_layer)-1:
-                            real_num = layer_number - int(the_start_layer)
-                            if int(real_num / freq) - (real_num / freq) == 0:
-                                lines.insert(1,gcode_to_add[0:-1])
-                                data[index] = "\n".join(lines)
-                                break
+            for index in layer_index.layer_indexes():
+                layer_number = layer_index.layer_number(index)
+                if layer_number >= int(the_start_layer)-1 and layer_number <= int(the_end_layer)-1:
+                    real_num = layer_number - int(the_start_layer)
+                    if real_num % freq == 0:
+                        lines = data[index].split("\n")
+                        lines.insert(1,gcode_to_add[0:-1])
+                        data[index] = "\n".join(lines)
         return data
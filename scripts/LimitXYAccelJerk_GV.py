@@ -171,16 +171,31 @@ class LimitXYAccelJerk_GV(Script):
         }"""
 
     def execute(self, data):
-        mycura = CuraApplication.getInstance().getGlobalContainerStack()
-        extruder = mycura.extruderList
-        machine_name = str(mycura.getProperty("machine_name", "value"))
-        print_sequence = str(mycura.getProperty("print_sequence", "value"))
-
         # Exit if the printer is an Ultimaker------------------------------------------------------
-        if "Ultimaker" in machine_name or "UltiGCode" in self._firmware_flavor or "Griffin" in self._firmware_flavor:
+        if self._is_ultimaker():
             Message(title = "[Limit the X-Y Accel/Jerk]", text = "<NOTICE> The script DID NOT RUN.  This post processor is for bed slinger printers only.").show()
             data[0] += ";  [LimitXYAccelJerk] DID NOT RUN because the printer doesn't have a sliding bed.\n"
             return data
+        from GcodeTools_GV import run_layer_hooks
+        return run_layer_hooks(data, [self._accel_jerk_hooks()])
+
+    # Layer hooks so this can share a pass over the gcode with other scripts (see GcodeTools_GV.LayerHooks)
+    def getLayerHooks(self) -> list:
+        if self._is_ultimaker():
+            return None
+        return [self._accel_jerk_hooks()]
+
+    def _is_ultimaker(self) -> bool:
+        machine_name = str(CuraApplication.getInstance().getGlobalContainerStack().getProperty("machine_name", "value"))
+        return "Ultimaker" in machine_name or "UltiGCode" in self._firmware_flavor or "Griffin" in self._firmware_flavor
+
+    # The changes are worked out in begin() and kept by item number.  layer() makes them in the same order the
+    # script always made them.
+    def _accel_jerk_hooks(self):
+        from GcodeTools_GV import LayerHooks
+        mycura = CuraApplication.getInstance().getGlobalContainerStack()
+        extruder = mycura.extruderList
+        print_sequence = str(mycura.getProperty("print_sequence", "value"))
 
         type_of_change = str(self.getSettingValueByKey("type_of_change"))
         accel_print_enabled = bool(extruder[0].getProperty("acceleration_enabled", "value"))
@@ -232,6 +247,71 @@ class LimitXYAccelJerk_GV(Script):
         m205_jerk_new = jerk_cmd + f" X{x_jerk} Y{y_jerk}"
         m205_jerk_old = jerk_cmd + f" X{jerk_old} Y{jerk_old}"
         
+        changes = {}
+
+        def begin(data):
+            changes.clear()
+            self._plan_changes(data, changes, type_of_change, print_sequence, accel_old, x_accel, y_accel,
+                               m201_limit_new, m201_limit_old, m204_pt_new, m205_jerk_pattern, m205_jerk_new,
+                               m205_jerk_old, accel_reset_x, accel_reset_y)
+
+        def layer(num, lines):
+            for change in changes[num]:
+                lines = change(lines)
+            return lines
+
+        return LayerHooks(begin = begin, wants = lambda num: num in changes, layer = layer)
+
+    def _plan_changes(self, data: list, changes: dict, type_of_change: str, print_sequence: str, accel_old, x_accel: str,
+                      y_accel: str, m201_limit_new: str, m201_limit_old: str, m204_pt_new: str, m205_jerk_pattern: str,
+                      m205_jerk_new: str, m205_jerk_old: str, accel_reset_x, accel_reset_y) -> None:
+        from GcodeTools_GV import EditJournal
+        jerk_enable = self.getSettingValueByKey("jerk_enable")
+
+        def change_at(num, change):
+            changes.setdefault(num, []).append(change)
+
+        # Add the Accel limit and new Jerk after the ;LAYER: line----------------------------------
+        def start_change(m201_limit_new, m204_pt_new):
+            def change(lines):
+                journal = EditJournal(lines)
+                for index, line in enumerate(lines):
+                    if line.startswith(";LAYER:"):
+                        journal.insert_after(index, [m201_limit_new] + ([m205_jerk_new] if jerk_enable else []) + [m204_pt_new])
+                return journal.apply()
+            return change
+
+        def end_change(lines):
+            journal = EditJournal(lines)
+            for index, line in enumerate(lines):
+                if line.startswith(";LAYER:"):
+                    journal.insert_after(index, [m201_limit_old] + ([m205_jerk_old] if jerk_enable else []))
+            return journal.apply()
+
+        def gradual_change(m201_limit_new, m204_pt_new):
+            def change(lines):
+                journal = EditJournal(lines)
+                for index, line in enumerate(lines):
+                    if line.startswith(";LAYER:"):
+                        journal.insert_after(index, [m201_limit_new, m204_pt_new])
+                return journal.apply()
+            return change
+
+        def jerk_change(lines):
+            for index, line in enumerate(lines):
+                if line.startswith("M205") or line.startswith("M566"):
+                    lines[index] = re.sub(m205_jerk_pattern, m205_jerk_new, line)
+            return lines
+
+        # This prevents a double entry---------------------------------------------------------------
+        def model_reset(lines):
+            if not lines[1].startswith("M201"):
+                lines.insert(1,m201_limit_old)
+            return lines
+
+        # At the end of the print reset Accel and Jerk to defaults-----------------------------------
+        def end_of_print(lines):
+            return re.sub(";End of Gcode", f"M201 X{accel_reset_x} Y{accel_reset_y}\n{m205_jerk_old}\n;End of Gcode", "\n".join(lines)).split("\n")
         #Get the indexes of the start and end layers for all-at-once ------------------------------
         start_list = []
         end_list = []
@@ -242,20 +322,17 @@ class LimitXYAccelJerk_GV(Script):
         else:
             start_layer = int(self.getSettingValueByKey("gradient_start_layer"))-1
             end_layer = int(self.getSettingValueByKey("gradient_end_layer"))
+        from GcodeTools_GV import LayerIndex
+        layer_index = LayerIndex(data)
         start_index = 2
         end_index = len(data)-2
-        for num in range(2,len(data)-1):
-            if ";LAYER:" + str(start_layer) + "\n" in data[num]:
-                start_index = num
-                break
+        num = layer_index.index_of(start_layer, 2)
+        if num is not None and num < len(data)-1:
+            start_index = num
         if int(end_layer) > 0:
-            for num in range(3,len(data)-1):
-                try:
-                    if ";LAYER:" + str(end_layer) + "\n" in data[num]:
-                        end_index = num
-                        break
-                except:
-                    end_index = len(data)-2
+            num = layer_index.index_of(end_layer, 3)
+            if num is not None and num < len(data)-1:
+                end_index = num
         start_list.append(start_index)
         end_list.append(end_index)
         if end_layer > -1 and type_of_change == "immediate_change":
@@ -269,63 +346,33 @@ class LimitXYAccelJerk_GV(Script):
             end_list = []
             jerk_end_list = []
             # Starts
-            for num in range(start_index, len(data)):
-                if ";LAYER:" + str(start_layer) + "\n" in data[num]:
-                    start_list.append(num)
+            start_list = [num for num in layer_index.indexes_of(start_layer) if num >= start_index]
             # End and Jerk end
-            for num in range(start_index + 1, len(data)):
-                if end_layer > -1:
-                    if ";LAYER:" + str(end_layer) + "\n" in data[num]:
-                        end_list.append(num)
-                if end_layer == -1:
-                    if ";LAYER:0" in data[num]:
-                        end_list.append(num)
-                if ";LAYER:0" in data[num]:
-                    jerk_end_list.append(num)
+            model_starts = [num for num in layer_index.model_starts if num > start_index]
+            if end_layer > -1:
+                end_list = [num for num in layer_index.indexes_of(end_layer) if num > start_index]
+            elif end_layer == -1:
+                end_list = list(model_starts)
+            jerk_end_list = list(model_starts)
             end_list.append(len(data)-1)
             jerk_end_list.append(len(data)-1)
 
         # If 'immediate_change' Add the Accel limit and new Jerk at start layer--------------------
         if type_of_change == "immediate_change":
             for st_index in range(0,len(start_list)):
-                layer = data[start_list[st_index]]
-                lines = layer.split("\n")
-                for index, line in enumerate(lines):
-                    if lines[index].startswith(";LAYER:"):
-                        lines.insert(index+1, m204_pt_new)
-                        lines.insert(index + 1,m201_limit_new)
-                        if self.getSettingValueByKey("jerk_enable"):
-                            lines.insert(index + 2,m205_jerk_new)
-                        data[start_list[st_index]] = "\n".join(lines)
+                change_at(start_list[st_index], start_change(m201_limit_new, m204_pt_new))
                 # Reset at the End layer-----------------------------------------------------------
-                layer_e = data[end_list[st_index]]
-                lines_e = layer_e.split("\n")
-                for index, line in enumerate(lines_e):
-                    if lines_e[index].startswith(";LAYER:"):
-                        lines_e.insert(index + 1,m201_limit_old)
-                        if self.getSettingValueByKey("jerk_enable"):
-                            lines_e.insert(index + 2,m205_jerk_old)
-                        data[end_list[st_index]] = "\n".join(lines_e)
+                change_at(end_list[st_index], end_change)
                 #Alter any existing jerk lines to the End Layer------------------------------------
                 for num in range(start_list[st_index],end_list[st_index],1):
-                    layer_j = data[num]
-                    lines_j = layer_j.split("\n")
-                    for index, line in enumerate(lines_j):
-                        if line.startswith("M205") or line.startswith("M566"):
-                            lines_j[index] = re.sub(m205_jerk_pattern, m205_jerk_new, line)
-                    data[num] = "\n".join(lines_j)
+                    change_at(num, jerk_change)
             # If print sequence is One at a Time then reset at every Layer:0-----------------------
             if print_sequence == "one_at_a_time":
-                for num in range(start_index + 1, len(data)-1):
-                    if ";LAYER:0\n" in data[num]:
-                        lines = data[num].split("\n")
-                        # This prevents a double entry---------------------------------------------
-                        if not lines[1].startswith("M201"):
-                            lines.insert(1,m201_limit_old)
-                        data[num] = "\n".join(lines)
+                for num in layer_index.model_starts:
+                    if start_index < num < len(data)-1:
+                        change_at(num, model_reset)
             # At the end of the print reset Accel and Jerk to defaults-----------------------------
-            data[len(data)-1] = re.sub(";End of Gcode", f"M201 X{accel_reset_x} Y{accel_reset_y}\n{m205_jerk_old}\n;End of Gcode", data[len(data)-1])
-            return data
+            change_at(len(data)-1, end_of_print)
             
         # Gradual Accel change---------------------------------------------------------------------
         elif type_of_change == "gradual_change":
@@ -354,18 +401,8 @@ class LimitXYAccelJerk_GV(Script):
                     m204_pt_new = f"M204 P{y_accel_start} T{y_accel_start}"
                 
                 #Add Accel limit and new Jerk at start layer---------------------------------------
-                layer = data[start_list[st_index]]
-                lines = layer.split("\n")
-                for index, line in enumerate(lines):
-                    if lines[index].startswith(";LAYER:"):
-                        lines.insert(index+1,m204_pt_new)
-                        lines.insert(index+1,m201_limit_new)
-                        if self.getSettingValueByKey("jerk_enable"):
-                            lines.insert(index+2,m205_jerk_new)
-                        data[start_list[st_index]] = "\n".join(lines)
+                change_at(start_list[st_index], start_change(m201_limit_new, m204_pt_new))
                 for num in range(start_list[st_index] + 1, end_list[st_index],1):
-                    layer = data[num]
-                    lines = layer.split("\n")
                     if accel_old >= int(x_accel):
                         x_accel_start -= x_accel_hyst
                         if x_accel_start < int(x_accel): x_accel_start = int(x_accel)
@@ -384,28 +421,15 @@ class LimitXYAccelJerk_GV(Script):
                         m204_pt_new = f"M204 P{round(round(x_accel_start/10)*10)} T{round(round(x_accel_start/10)*10)}"
                     else:
                         m204_pt_new = f"M204 P{round(round(y_accel_start/10)*10)} T{round(round(y_accel_start/10)*10)}"
-                    for index, line in enumerate(lines):
-                        if line.startswith(";LAYER:"):
-                            lines.insert(index+1, m204_pt_new)
-                            lines.insert(index+1, m201_limit_new)
-                    data[num] = "\n".join(lines)
+                    change_at(num, gradual_change(m201_limit_new, m204_pt_new))
                 #Alter any existing jerk lines-----------------------------------------------------
-                if self.getSettingValueByKey("jerk_enable"):
+                if jerk_enable:
                     for num in range(start_list[st_index],jerk_end_list[st_index],1):
-                        layer = data[num]
-                        lines = layer.split("\n")
-                        for index, line in enumerate(lines):
-                            if line.startswith("M205") or line.startswith("M566"):
-                                lines[index] = re.sub(m205_jerk_pattern, m205_jerk_new, line)
-                        data[num] = "\n".join(lines)
+                        change_at(num, jerk_change)
             # Reset the Accel at the start of each model-------------------------------------------
             if print_sequence == "one_at_a_time":
-                for num in range(start_index + 1, len(data)-1):
-                    if ";LAYER:0\n" in data[num]:
-                        lines = data[num].split("\n")
-                        if not lines[1].startswith("M201"):
-                            lines.insert(1,m201_limit_old)
-                        data[num] = "\n".join(lines)
+                for num in layer_index.model_starts:
+                    if start_index < num < len(data)-1:
+                        change_at(num, model_reset)
             # At the end of the print reset Accel and Jerk to defaults-----------------------------
-            data[len(data)-1] = re.sub(";End of Gcode", f"M201 X{accel_reset_x} Y{accel_reset_y}\n{m205_jerk_old}\n;End of Gcode", data[len(data)-1])
-            return data
\ No newline at end of file
+            change_at(len(data)-1, end_of_print)
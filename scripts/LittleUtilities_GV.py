@@ -8,12 +8,14 @@
 #     6) Change Printer Settings - Max Feedrate, Max Accel, Home Offsets, Steps/mm.  (There is no Max for Jerk)
 #     7) Very Cool FanPath - Raise 1mm and follow a zigzag path across the print with just the Layer Cooling Fan running.
 #     8) Disable ABL for small models.  The user defines 'small' and models that fall below that area on the build plate cause G29 and M420 to be commented out of the StartUp Gcode.  There is also a 'minimum time' option.
-#     9) Gcode Line Numbering - Numbers the lines in the gcode.  A prefix is an option.  (authored by: Slashee the Cow)
+#     9) Gcode Line Numbering - Numbers the lines in the gcode.  A prefix is an option.  With checksums (N123 G1 X10*45 and an M110 reset) for hosts that send over a serial line.  (authored by: Slashee the Cow)
 #     10) Debug Gcode File - A debug tool that removes all the extrusions and heating lines from a range of layers or the whole file.  The result is a 'Movement Only' file so users can check a toolpath.
 #     11) One-at-a-Time Final Z - A bug fix that adds a move up to the transit (print MAXZ) height before the ending Gcode.  Prevents a crash if the last print is shorter than others.
 #     12) Adjust Temperatures One-at-a-Time - Enter a list of temperatures and each succesive model will print at the assigned temperature.
 #     13) Enable Speed Enforcement - If Flow Rate Compensation alters some print speeds to very high values this script will reset them to the speeds in the Cura settings.  The speeds are checked per feature and per extruder.  Speeds might be lowered, never raised.
 #     14) Custom Script - A user can utilize this one to write and run their own script.  One setting box is provided.
+#     15) Arc Fitting - Replaces runs of short G1 moves that lie on a circle with G2/G3 arcs (the same as the Arc Fitting script).  The printer must support arcs.
+#     16) Compact Gcode - Makes the file smaller without changing the print.  Trailing zeros come off the numbers, repeated F's and moves that go nowhere are removed, and straight runs of G1 moves with the same flow become one move.
 
 from ..Script import Script
 from UM.Application import Application
@@ -89,6 +91,21 @@ class LittleUtilities_GV(Script):
                     "default_value": false,
                     "enabled": "remove_comments"
                 },
+                "compact_gcode":
+                {
+                    "label": "Compact Gcode",
+                    "description": "Makes the gcode smaller without changing the print.  Trailing zeros are removed from the numbers, an F that is the same as the speed already in use is removed, moves that don't go anywhere are removed, and straight runs of G1 moves with the same speed and the same extrusion per mm are joined into one move.",
+                    "type": "bool",
+                    "default_value": false
+                },
+                "compact_gcode_report":
+                {
+                    "label": "    Report each layer",
+                    "description": "Adds a comment at the end of each layer with the number of bytes that were saved on that layer.  The comments take up room too and the total (less the size of the comments) is always added to the end of the Ending Gcode.",
+                    "type": "bool",
+                    "default_value": false,
+                    "enabled": "compact_gcode"
+                },
                 "add_extruder_end":
                 {
                     "label": "Add Last Extruder Ending Gcode",
@@ -113,7 +130,7 @@ class LittleUtilities_GV(Script):
                 "very_cool_layer":
                 {
                     "label": "    End of which layer(s)?",
-                    "description": "Pick the layer(s) from the Cura preview.  The printhead will move in the 'Y' in a grid toolpath 1.0mm above the current Z (no extrusions) with the Layer Cooling Fan speed at the percent you enter here.  The 'X' index is 10mm.  For multiple layers delimit with a comma (',') and delimit ranges of layers with a dash ('-') do not add spaces.  Ex: 5,6,12-25,30,45-55 or 200-225.",
+                    "description": "Pick the layer(s) from the Cura preview.  The printhead will move in the 'Y' in a grid toolpath 1.0mm above the current Z (no extrusions) with the Layer Cooling Fan speed at the percent you enter here.  The 'X' index is 10mm.  For multiple layers delimit with a comma (',') and delimit ranges of layers with a dash ('-').  Ex: 5,6,12-25,30,45-55 or 200-225.  '200-' runs to the last layer and '20-200/10' is every 10th layer.",
                     "type": "str",
                     "default_value": "1-227",
                     "unit": "Lay num  ",
@@ -435,6 +452,14 @@ class LittleUtilities_GV(Script):
                     "default_value": false,
                     "enabled": "line_numbers"
                 },
+                "add_line_nr_checksum":
+                {
+                    "label": "    Add checksums",
+                    "description": "For hosts that send the gcode to the printer over a serial line.  The lines become 'N123 G1 X10*45' with the checksum at the end, and an 'M110' line at the start tells the printer the first number.  The prefix is always 'N', comment lines are skipped and the comments at the ends of the lines are removed.",
+                    "type": "bool",
+                    "default_value": false,
+                    "enabled": "line_numbers"
+                },
                 "disable_abl":
                 {
                     "label": "Disable ABL for Small Models",
@@ -522,6 +547,25 @@ class LittleUtilities_GV(Script):
                     "default_value": "all_speeds",
                     "enabled": "speed_limit_enable"
                 },
+                "arc_fitting":
+                {
+                    "label": "Arc Fitting",
+                    "description": "Replace runs of short G1 moves that lie on a circle with G2/G3 arcs.  The arcs end where the moves did and the extrusion is kept exactly.  The printer must support arcs (ARC_SUPPORT in Marlin).",
+                    "type": "bool",
+                    "default_value": false,
+                    "enabled": true
+                },
+                "arc_fitting_tolerance":
+                {
+                    "label": "    Arc Tolerance",
+                    "description": "How far (in mm) an arc is allowed to be from the points of the original moves and from the middle of each move.",
+                    "type": "float",
+                    "default_value": 0.025,
+                    "unit": "mm  ",
+                    "minimum_value": 0.001,
+                    "maximum_value_warning": 0.1,
+                    "enabled": "arc_fitting"
+                },
                 "custom_setting":
                 {
                     "label": "    Custom Setting",
@@ -533,46 +577,61 @@ class LittleUtilities_GV(Script):
             }
         }"""
 
+    ## (setting, method, only when 'debugging_tools' is on) in the order they run
+    _UTILITIES = [
+        ("add_extruder_end", "_add_extruder_end", False),
+        ("final_z", "_final_z", False),
+        ("renum_or_revert", "_renumber_layers", False),
+        ("add_data_headers", "_add_data_header", True),
+        ("remove_comments", "_remove_comments", False),
+        ("compact_gcode", "_compact_gcode", False),
+        ("lift_head_park", "_lift_head_park", False),
+        ("change_printer_settings", "_change_printer_settings", False),
+        ("very_cool", "_very_cool", False),
+        ("disable_abl", "_disable_abl", False),
+        ("arc_fitting", "_arc_fitting", False),
+        ("line_numbers", "_line_numbering", False),
+        ("debug_file", "_practice_file", True),
+        ("adjust_temps", "_adjust_temps_per_model", False),
+        ("speed_limit_enable", "_speed_limits", False),
+        ("data_num_and_line_nums", "_data_num_and_line_nums", True)]
+
+    def _enabled_utilities(self) -> list:
+        debugging_tools = self.getSettingValueByKey("debugging_tools")
+        return [method for setting, method, debug_only in self._UTILITIES if self.getSettingValueByKey(setting) and (debugging_tools or not debug_only)]
+
     def execute(self, data):
-        if  self.getSettingValueByKey("add_extruder_end"):
-            self._add_extruder_end(data)
-        if self.getSettingValueByKey("final_z"):
-            self._final_z(data)
-        if self.getSettingValueByKey("renum_or_revert"):
-            self._renumber_layers(data)
-        if self.getSettingValueByKey("add_data_headers") and self.getSettingValueByKey("debugging_tools"):
-            self._add_data_header(data)
-        if self.getSettingValueByKey("remove_comments"):
-            self._remove_comments(data)
-        if self.getSettingValueByKey("lift_head_park"):
-            self._lift_head_park(data)
-        if self.getSettingValueByKey("change_printer_settings"):
-            self._change_printer_settings(data)
-        if self.getSettingValueByKey("very_cool"):
-            self._very_cool(data)
-        if self.getSettingValueByKey("disable_abl"):
-            self._disable_abl(data)
-        if self.getSettingValueByKey("line_numbers"):
-            self._line_numbering(data)
-        if self.getSettingValueByKey("debug_file") and self.getSettingValueByKey("debugging_tools"):
-            self._practice_file(data)
-        if self.getSettingValueByKey("adjust_temps"):
-            self._adjust_temps_per_model(data)
-        if self.getSettingValueByKey("speed_limit_enable"):
-            self._speed_limits(data)
-        if self.getSettingValueByKey("data_num_and_line_nums") and self.getSettingValueByKey("debugging_tools"):
-            self._data_num_and_line_nums(data)
+        ## The layer hooks are for the headless runner's shared pass (--fused).  On their own the utilities that have
+        ## them do the items in parallel for big files (see GcodeTools_GV.map_layers).
+        self._stats = None
+        for method in self._enabled_utilities():
+            getattr(self, method)(data)
         return data
 
+    # The per-layer statistics (see GcodeTools_GV.LayerStats).  The utilities only read the header, the fan speeds and the
+    # times from them and the utilities that run first don't change those, so one set does the whole run.
+    def _layer_stats(self, data:str):
+        if self._stats is None or len(self._stats) != len(data):
+            from GcodeTools_GV import LayerStats
+            self._stats = LayerStats(data, read_moves = False)
+        return self._stats
+
+    # Layer hooks so the utilities can share a pass over the gcode with other scripts (see GcodeTools_GV.LayerHooks).
+    # None unless every utility that is enabled has hooks.
+    def getLayerHooks(self) -> list:
+        hook_makers = {"_remove_comments": self._remove_comments_hooks, "_compact_gcode": self._compact_gcode_hooks,
+                       "_line_numbering": self._line_numbering_hooks}
+        enabled = self._enabled_utilities()
+        if not enabled or any(not method in hook_makers for method in enabled):
+            return None
+        return [hook_makers[method]() for method in enabled]
+
     # Add Extruder Ending Gcode-------------------------------------------
     def _add_extruder_end(self, data:str)->str:
-        t_nr = 0
+        from GcodeTools_GV import ToolTimeline
+        ## The tool that is active at the end of the last layer
+        t_nr = ToolTimeline(data).tool_at_end(len(data)-3)
         try:
-            for num in range(1,len(data)-2):
-                lines = data[num].split("\n")
-                for line in lines:
-                    if re.match("T(\d*)",line):
-                        t_nr = self.getValue(line, "T")
             end_gcode = Application.getInstance().getGlobalContainerStack().extruderList[t_nr].getProperty("machine_extruder_end_code","value")
         except:
             end_gcode = Application.getInstance().getGlobalContainerStack().extruderList[0].getProperty("machine_extruder_end_code","value")
@@ -603,63 +662,88 @@ class LittleUtilities_GV(Script):
 
     # Remove Comments----------------------------------------------------------
     def _remove_comments(self, data:str)->str:
+        ## Every item is done on its own so big files are done in parallel
+        from GcodeTools_GV import map_layers, strip_comments
         me_opening = bool(self.getSettingValueByKey("remove_comments_inc_opening"))
         me_startup = bool(self.getSettingValueByKey("remove_comments_inc_startup"))
         me_ending = bool(self.getSettingValueByKey("remove_comments_inc_ending"))
         me_layerlines = bool(self.getSettingValueByKey("remove_comments_leave_layer_lines"))
+        map_layers(data, strip_comments, [num for num, wanted in ((0, me_opening), (1, me_startup)) if wanted], False)
+        map_layers(data, strip_comments, list(range(2, len(data) - 1)) + ([len(data) - 1] if me_ending else []), not me_layerlines)
+        return
 
-        ## Start with the opening data paragraph if enabled
-        if me_opening:
-            layer = data[0]
-            lines = layer.split("\n")
-            modified_data = ""
-            for line in lines:
-                if line.startswith(";"):
-                    line = ""
-                    continue
-                if ";" in line:
-                    line = line.split(";")[0]
-                modified_data += line + "\n"
-            data[0] = modified_data[0:-1]
-
-        ## the StartUp Gcode section if enabled
-        if me_startup:
-            layer = data[1]
-            lines = layer.split("\n")
-            modified_data = ""
-            for line in lines:
-                if line.startswith(";"):
-                    line = ""
-                    continue
-                if ";" in line:
-                    line = line.split(";")[0]
-                modified_data += line + "\n"
-            data[1] = modified_data[0:-1]
-        stop_at = len(data)
-        if me_ending:
-            stop_at = len(data)
-        else:
-            stop_at = len(data)-1
+    def _remove_comments_hooks(self):
+        from GcodeTools_GV import LayerHooks, strip_comment_lines
+        me_opening = bool(self.getSettingValueByKey("remove_comments_inc_opening"))
+        me_startup = bool(self.getSettingValueByKey("remove_comments_inc_startup"))
+        me_ending = bool(self.getSettingValueByKey("remove_comments_inc_ending"))
+        me_layerlines = bool(self.getSettingValueByKey("remove_comments_leave_layer_lines"))
+        last_index = 0
 
-        ## Remove comments from the Layers and (if enabled) from the Ending Gcode
-        for num in range(2,stop_at,1):
-            layer = data[num]
-            lines = layer.split("\n")
-            modified_data = ""
-            for line in lines:
-                # Leave the Layer Lines unless removal is enabled
-                if line.startswith(";LAYER:") and not me_layerlines:
-                    modified_data += line + "\n"
-                    continue
-                if line.startswith(";"):
-                    line = ""
-                    continue
-                if ";" in line:
-                    line = line.split(";")[0]
-                modified_data += line + "\n"
-            data[num] = modified_data[0:-1]
+        def begin(data):
+            nonlocal last_index
+            last_index = len(data) - 1
+
+        ## The opening paragraph and the StartUp Gcode if enabled, the Layers, and (if enabled) the Ending Gcode
+        def wants(num):
+            if num == 0:
+                return me_opening
+            if num == 1:
+                return me_startup
+            if num == last_index:
+                return me_ending
+            return True
+
+        def layer(num, lines):
+            # Leave the Layer Lines unless removal is enabled
+            return strip_comment_lines(lines, num >= 2 and not me_layerlines)
+
+        return LayerHooks(begin = begin, wants = wants, layer = layer, reads_data = False, changes_structure = True)
+
+    # Compact Gcode-------------------------------------------------------------
+    def _compact_gcode(self, data:str)->str:
+        from GcodeTools_GV import run_layer_hooks
+        run_layer_hooks(data, [self._compact_gcode_hooks()])
         return
 
+    def _compact_gcode_hooks(self):
+        ## One pass.  The opening paragraph is already written by the time the total is known so it goes at the end of the Ending Gcode.
+        from GcodeTools_GV import GcodeCompactor, LayerHooks
+        relative_extrusion = bool(Application.getInstance().getGlobalContainerStack().getProperty("relative_extrusion", "value"))
+        add_report = bool(self.getSettingValueByKey("compact_gcode_report"))
+        compactor = GcodeCompactor(relative_extrusion)
+        last_index = 0
+
+        def begin(data):
+            nonlocal last_index
+            last_index = len(data) - 1
+
+        ## The StartUp Gcode and the Ending Gcode are only followed (for the position and the feedrate)
+        def wants(num):
+            return num >= 1
+
+        def layer(num, lines):
+            saved = compactor.bytes_saved
+            lines = compactor.compact(lines, 2 <= num < last_index)
+            # The report goes before the ';TIME_ELAPSED:' line so the layer still ends with it
+            if num == last_index:
+                report = ";  [Little Utilities] Compact Gcode saved " + str(compactor.bytes_saved) + " bytes"
+            elif add_report and num >= 2:
+                report = ";  [Little Utilities] Compact Gcode saved " + str(compactor.bytes_saved - saved) + " bytes on this layer"
+            else:
+                return lines
+            insert_at = len(lines) - 1 if lines and lines[-1] == "" else len(lines)
+            for index in range(len(lines) - 1, -1, -1):
+                if lines[index].startswith(";TIME_ELAPSED:"):
+                    insert_at = index
+                    break
+            lines.insert(insert_at, report)
+            ## The comments don't count as saved
+            compactor.bytes_saved -= len(report) + 1
+            return lines
+
+        return LayerHooks(begin = begin, wants = wants, layer = layer, reads_data = False, changes_structure = False)
+
     # Renumber Layers----------------------------------------------------------
     def _renumber_layers(self, data:str)->str:
         renum_layers = str(self.getSettingValueByKey("renum_layers"))
@@ -757,16 +841,7 @@ class LittleUtilities_GV(Script):
         travel_speed = int(extruder[0].getProperty("speed_travel", "value"))*60
 
         ## Get the footprint size of the print on the build plate
-        lines = data[0].split("\n")
-        for line in lines:
-            if line.startswith(";MINX:") or line.startswith(";PRINT.SIZE.MIN.X:"):
-                x_min = float(line.split(":")[1])
-            if line.startswith(";MINY:") or line.startswith(";PRINT.SIZE.MIN.Y:"):
-                y_min = float(line.split(":")[1])
-            if line.startswith(";MAXX:") or line.startswith(";PRINT.SIZE.MAX.X:"):
-                x_max = float(line.split(":")[1])
-            if line.startswith(";MAXY:") or line.startswith(";PRINT.SIZE.MAX.Y:"):
-                y_max = float(line.split(":")[1])
+        x_min, y_min, x_max, y_max = (float(value) for value in self._layer_stats(data).footprint())
 
         ## Get the XY origin of the print
         mesh_x_origin = round(x_max - ((x_max - x_min)/2),2)
@@ -937,30 +1012,10 @@ class LittleUtilities_GV(Script):
     # Very_cool cooling--------------------------------------------------------
     def _very_cool(self, data:str)->str:
         all_layers = self.getSettingValueByKey("very_cool_layer")
-        add_layers = ""
-        numstart = 0
-        numend = 0
-        very_cool_layers = []
-        ## The layers can be individual entries or ranges.  This figures that out and adds all the named layers to 'very_cool_layers'
-        if "," in all_layers:
-            new_layers = all_layers.split(",")
-            for index, n in enumerate(new_layers):
-                if "-" in str(n):
-                    numstart = str(n.split("-")[0])
-                    numend = str(n.split("-")[1])
-                    for m in range(int(numend),int(numstart)-1,-1):
-                        new_layers.insert(index+1,m)
-                    new_layers.pop(index)
-            very_cool_layers = new_layers
-        elif not "," in all_layers and "-" in all_layers:
-            new_layers = []
-            numstart = str(all_layers.split("-")[0])
-            numend = str(all_layers.split("-")[1])
-            for m in range(int(numstart),int(numend)+1,1):
-                new_layers.append(m)
-            very_cool_layers = new_layers
-        else:
-            very_cool_layers.append(all_layers)
+        ## The layers can be individual entries or ranges.  The fanpath goes at the end of ';LAYER:' (preview number - 1).
+        from GcodeTools_GV import LayerIndex, LayerRanges
+        very_cool_layers = LayerRanges(all_layers, -1)
+        layer_index = LayerIndex(data)
 
         ## Get the rest of the information that is required
         very_cool_y_index = bool(self.getSettingValueByKey("very_cool_y_index"))
@@ -984,105 +1039,86 @@ class LittleUtilities_GV(Script):
 
         ## Get the travel speed percentage
         travel_rate = int(self.getSettingValueByKey("very_cool_feed")) * 60
-        lines = data[0].split("\n")
 
         ## The Mins and Maxes become the frame for the cooling movement grid
-        for line in lines:
-            if line.startswith(";MINX:") or line.startswith(";PRINT.SIZE.MIN.X:"):
-                min_x = line.split(":")[1]
-            if line.startswith(";MINY:") or line.startswith(";PRINT.SIZE.MIN.Y:"):
-                min_y = line.split(":")[1]
-            if line.startswith(";MAXX:") or line.startswith(";PRINT.SIZE.MAX.X:"):
-                max_x = line.split(":")[1]
-            if line.startswith(";MAXY:") or line.startswith(";PRINT.SIZE.MAX.Y:"):
-                max_y = line.split(":")[1]
-
-        ## Track the fan speed
-        for lay in very_cool_layers:
-            cur_layer = int(lay)-1
-            for num in range(2,len(data)-2,1):
-                layer = data[num]
-                if "M106 S" in layer:
-                    rev_lines = layer.split("\n")
-                    rev_lines.reverse()
-                    for line in rev_lines:
-                        if line.startswith("M106"):
-                            fan_speed = str(self.getValue(line, "S"))
-                            break
-                        if line.startswith("M107"):
-                            fan_speed = 0
-                            break
+        stats = self._layer_stats(data)
+        min_x, min_y, max_x, max_y = stats.footprint()
 
-                ## Get the return-to X Y
-                if ";LAYER:" + str(cur_layer) + "\n" in layer:
-                    prev_layer = data[num].split("\n")
-                    prev_layer.reverse()
-                    for prev_line in prev_layer:
-                        if " X" in prev_line and " Y" in prev_line:
-                            ret_x = self.getValue(prev_line, "X")
-                            ret_y = self.getValue(prev_line, "Y")
-                            break
+        for num in range(2,len(data)-2,1):
+            ## The fan speed at the end of the layer is put back after the fanpath
+            if stats.fan(num) is not None:
+                fan_speed = stats.fan(num)
 
-                    ## Check for a retraction
-                    for prev_line in prev_layer:
-                        if " E" in prev_line:
-                            ret_e = self.getValue(prev_line, "E")
-                            my_match = re.search(" F(\d*) E[-(\d.*)]", prev_line)
-                            if my_match is not None:
-                                retracted = True
-                            else:
-                                retracted = False
-                            break
+            ## Get the return-to X Y
+            if layer_index.layer_number(num) in very_cool_layers:
+                prev_layer = data[num].split("\n")
+                prev_layer.reverse()
+                for prev_line in prev_layer:
+                    if " X" in prev_line and " Y" in prev_line:
+                        ret_x = self.getValue(prev_line, "X")
+                        ret_y = self.getValue(prev_line, "Y")
+                        break
 
-                    ## Final Z of the layer
-                    for prev_line in prev_layer:
-                        if " Z" in prev_line:
-                            ret_z = self.getValue(prev_line, "Z")
-                            lift_z = round(ret_z + 1,2)
-                            break
+                ## Check for a retraction
+                for prev_line in prev_layer:
+                    if " E" in prev_line:
+                        ret_e = self.getValue(prev_line, "E")
+                        my_match = re.search(" F(\d*) E[-(\d.*)]", prev_line)
+                        if my_match is not None:
+                            retracted = True
+                        else:
+                            retracted = False
+                        break
+
+                ## Final Z of the layer
+                for prev_line in prev_layer:
+                    if " Z" in prev_line:
+                        ret_z = self.getValue(prev_line, "Z")
+                        lift_z = round(ret_z + 1,2)
+                        break
 
-                    ## Put the travel string together
-                    lines = []
-                    lines.append(";TYPE:CUSTOM [Little Utilities] Very Cool FanPath")
-                    lines.append(f"G0 F{zhop_speed} Z{lift_z}")
-                    if not retracted and retr_enabled:
-                        lines.append(f"G1 F{retr_speed} E{round(ret_e - float(retr_dist),5)}")
-                    lines.append(f"M106 S{very_cool_fan_speed}")
-                    x_index = float(min_x)
-                    lines.append(f"G0 F{travel_rate} X{min_x} Y{min_y}")
-                    while x_index < float(max_x):
-                        lines.append(f"G0 X{round(x_index,2)} Y{max_y}")
-                        if x_index + very_cool_index_dist > bed_width:
+                ## Put the travel string together
+                lines = []
+                lines.append(";TYPE:CUSTOM [Little Utilities] Very Cool FanPath")
+                lines.append(f"G0 F{zhop_speed} Z{lift_z}")
+                if not retracted and retr_enabled:
+                    lines.append(f"G1 F{retr_speed} E{round(ret_e - float(retr_dist),5)}")
+                lines.append(f"M106 S{very_cool_fan_speed}")
+                x_index = float(min_x)
+                lines.append(f"G0 F{travel_rate} X{min_x} Y{min_y}")
+                while x_index < float(max_x):
+                    lines.append(f"G0 X{round(x_index,2)} Y{max_y}")
+                    if x_index + very_cool_index_dist > bed_width:
+                        break
+                    lines.append(f"G0 X{round(x_index + very_cool_index_dist,2)} Y{max_y}")
+                    lines.append(f"G0 X{round(x_index + very_cool_index_dist,2)} Y{min_y}")
+                    ## Break out of the loop if the move will be beyond the bed width
+                    if x_index + very_cool_index_dist * 2 > bed_width:
+                        break
+                    lines.append(f"G0 X{round(x_index + very_cool_index_dist * 2,2)} Y{min_y}")
+                    x_index = x_index + very_cool_index_dist * 2
+                if very_cool_y_index:
+                    y_index = float(min_y)
+                    while y_index < float(max_y):
+                        lines.append(f"G0 X{max_x} Y{round(y_index,2)}")
+                        if y_index + very_cool_index_dist > bed_depth:
                             break
-                        lines.append(f"G0 X{round(x_index + very_cool_index_dist,2)} Y{max_y}")
-                        lines.append(f"G0 X{round(x_index + very_cool_index_dist,2)} Y{min_y}")
+                        lines.append(f"G0 X{max_x} Y{round(y_index + very_cool_index_dist,2)}")
+                        lines.append(f"G0 X{min_x} Y{round(y_index + very_cool_index_dist,2)}")
                         ## Break out of the loop if the move will be beyond the bed width
-                        if x_index + very_cool_index_dist * 2 > bed_width:
+                        if y_index + very_cool_index_dist * 2 > bed_depth:
                             break
-                        lines.append(f"G0 X{round(x_index + very_cool_index_dist * 2,2)} Y{min_y}")
-                        x_index = x_index + very_cool_index_dist * 2
-                    if very_cool_y_index:
-                        y_index = float(min_y)
-                        while y_index < float(max_y):
-                            lines.append(f"G0 X{max_x} Y{round(y_index,2)}")
-                            if y_index + very_cool_index_dist > bed_depth:
-                                break
-                            lines.append(f"G0 X{max_x} Y{round(y_index + very_cool_index_dist,2)}")
-                            lines.append(f"G0 X{min_x} Y{round(y_index + very_cool_index_dist,2)}")
-                            ## Break out of the loop if the move will be beyond the bed width
-                            if y_index + very_cool_index_dist * 2 > bed_depth:
-                                break
-                            lines.append(f"G0 X{min_x} Y{round(y_index + very_cool_index_dist * 2,2)}")
-                            y_index = y_index + very_cool_index_dist * 2
-                    lines.append(f"M106 S{fan_speed}")
-                    lines.append(f"G0 F{travel_speed} X{ret_x} Y{ret_y}")
-                    lines.append(f"G0 F{zhop_speed} Z{ret_z}")
-                    if not retracted and retr_enabled:
-                        lines.append(f"G1 F{retr_speed} E{ret_e}")
-                    lines.append(f"G0 F{travel_speed} ;CUSTOM END")
-                    fan_layer = "\n".join(lines)
-                    time_line = re.search(";TIME_ELAPSED:(\d.*)", data[num])
-                    data[num] = re.sub(";TIME_ELAPSED:(\d.*)", fan_layer  + "\n" + time_line[0], data[num])
+                        lines.append(f"G0 X{min_x} Y{round(y_index + very_cool_index_dist * 2,2)}")
+                        y_index = y_index + very_cool_index_dist * 2
+                lines.append(f"M106 S{fan_speed}")
+                lines.append(f"G0 F{travel_speed} X{ret_x} Y{ret_y}")
+                lines.append(f"G0 F{zhop_speed} Z{ret_z}")
+                if not retracted and retr_enabled:
+                    lines.append(f"G1 F{retr_speed} E{ret_e}")
+                lines.append(f"G0 F{travel_speed} ;CUSTOM END")
+                fan_layer = "\n".join(lines)
+                time_line = re.search(";TIME_ELAPSED:(\d.*)", data[num])
+                data[num] = re.sub(";TIME_ELAPSED:(\d.*)", fan_layer  + "\n" + time_line[0], data[num])
         return
 
     # Disable ABL for small prints
@@ -1121,19 +1157,9 @@ class LittleUtilities_GV(Script):
         else:
             subtract_dim = adhesion_line_width * -1
         ## Get the size of the footprint on the build plate
-        layer = data[0]
-        lines = layer.split("\n")
-        for line in lines:
-            if line.startswith(";TIME:"):
-                print_time = int(line.split(":")[1])
-            if line.startswith(";MINX:") or line.startswith(";PRINT.SIZE.MIN.X:"):
-                min_x = float(line.split(":")[1])
-            if line.startswith(";MINY:") or line.startswith(";PRINT.SIZE.MIN.Y:"):
-                min_y = float(line.split(":")[1])
-            if line.startswith(";MAXX:") or line.startswith(";PRINT.SIZE.MAX.X:"):
-                max_x = float(line.split(":")[1])
-            if line.startswith(";MAXY:") or line.startswith(";PRINT.SIZE.MAX.Y:"):
-                max_y = float(line.split(":")[1])
+        stats = self._layer_stats(data)
+        print_time = int(stats.header["TIME"])
+        min_x, min_y, max_x, max_y = (float(value) for value in stats.footprint())
         ## Determine the actual area of the model
         x_dim = max_x - min_x - subtract_dim
         y_dim = max_y - min_y - subtract_dim
@@ -1162,24 +1188,42 @@ class LittleUtilities_GV(Script):
             Message(title = "[Little Utilities] ABL is DISABLED", text = "The print is either small or of short duration so ABL IS DISABLED for this print.").show()
         return
 
+    # Arc Fitting (before the lines are numbered)------------------------------
+    def _arc_fitting(self, data:str)->str:
+        from GcodeTools_GV import ArcFitter
+        relative_extrusion = bool(Application.getInstance().getGlobalContainerStack().getProperty("relative_extrusion", "value"))
+        fitter = ArcFitter(tolerance = self.getSettingValueByKey("arc_fitting_tolerance"), relative_e = relative_extrusion)
+        fitter.fit_data(data)
+        data[0] += fitter.report("Little Utilities - Arc Fitting")
+        return
+
     # Line Numbering------------------------------------------------------
     def _line_numbering(self, data:str)->str:
+        ## The first number of every item is known from the counts of the items before it so big files are done in parallel
+        from GcodeTools_GV import number_data
         prefix = self.getSettingValueByKey("add_line_nr_sentence_number_prefix")
-        line_number = int(self.getSettingValueByKey("add_line_nr_starting_number"))
         skip_comments = bool(self.getSettingValueByKey("add_line_nr_skip_comments"))
-        for layer_index, layer in enumerate(data):
-            lines = layer.split("\n")
-            for line_index, line in enumerate(lines):
-                if skip_comments:
-                    if not line.startswith(";") and line != "":
-                        lines[line_index] = f"{prefix}{line_number} {line}"
-                        line_number += 1
-                elif not skip_comments and line != "":
-                        lines[line_index] = f"{prefix}{line_number} {line}"
-                        line_number += 1
-            data[layer_index] = "\n".join(lines)
+        checksum = bool(self.getSettingValueByKey("add_line_nr_checksum"))
+        number_data(data, int(self.getSettingValueByKey("add_line_nr_starting_number")), prefix, checksum, skip_comments)
         return
 
+    def _line_numbering_hooks(self):
+        from GcodeTools_GV import LayerHooks, number_lines
+        prefix = self.getSettingValueByKey("add_line_nr_sentence_number_prefix")
+        skip_comments = bool(self.getSettingValueByKey("add_line_nr_skip_comments"))
+        checksum = bool(self.getSettingValueByKey("add_line_nr_checksum"))
+        line_number = int(self.getSettingValueByKey("add_line_nr_starting_number"))
+        first_line_number = line_number
+
+        def layer(num, lines):
+            nonlocal line_number
+            # The M110 goes in front of the first line that gets a number
+            new_lines, count = number_lines(lines, line_number, prefix, checksum, skip_comments, checksum and line_number == first_line_number)
+            line_number += count
+            return new_lines
+
+        return LayerHooks(layer = layer, reads_data = False, changes_structure = True)
+
     # Debug Practice File with no extrusions or heating ------------------
     def _practice_file(self, data:str)->str:
         start_layer = int(self.getSettingValueByKey("debug_start_layer")) - 1
@@ -1188,20 +1232,19 @@ class LittleUtilities_GV(Script):
         print_sequence = str(Application.getInstance().getGlobalContainerStack().getProperty("print_sequence", "value"))
         layer_height = Application.getInstance().getGlobalContainerStack().getProperty("layer_height", "value")
         layer_height_0 = Application.getInstance().getGlobalContainerStack().getProperty("layer_height_0", "value")
+        ## Find the start and end layers
+        from GcodeTools_GV import LayerIndex
+        layer_index = LayerIndex(data)
+        practice_start = layer_index.index_of(start_layer)
+        if practice_start is None:
+            data[0] += ";  [Little Utilities] (Debug Practice File did not run because the Start Layer was not found)\n"
+            Message(title = "[Little Utilities] Debug Practice File", text = "Did not run because the Start Layer was not found.").show()
+            return
+        practice_end = layer_index.index_of(end_layer) if end_layer != -1 else None
+        ## An End Layer of -1 (or one past the end of the print) runs to the end of the last layer
+        if practice_end is None:
+            practice_end = layer_index.last_layer_index + 1
         ## Get the Initial Z
-        for index, layer in enumerate(data):
-            if ";LAYER:" + str(start_layer) + "\n" in layer:
-                practice_start = index
-                break
-        for index, layer in enumerate(data):
-            if end_layer != -1:
-                if ";LAYER:" + str(end_layer) + "\n" in layer:
-                    practice_end = index
-                    break
-            elif end_layer == -1:
-                if ";LAYER:" in layer:
-                    practice_end = index + 1
-
         if practice_end < practice_start:
             practice_end = practice_start + 1
         lines = data[practice_start - 1 ].split("\n")
@@ -1221,14 +1264,9 @@ class LittleUtilities_GV(Script):
             data[num] = data[num].split("\n")[0] + "\n"
         ## Insert a AutoHome and initial Z move to the first remaining layer
         data[practice_start] = debug_autohome_cmd + "\nG1 Z" + str(resume_z) + "\n" + data[practice_start]
-        ## Remove all extrusions and all the heating lines
-        for num in range(1,len(data),1):
-            layer = data[num]
-            data[num] = re.sub(" E([-+]?[0-9]*\.[0-9]*)", "", data[num])
-            data[num] = re.sub("M104", ";M104", data[num])
-            data[num] = re.sub("M109", ";M109", data[num])
-            data[num] = re.sub("M140", ";M140", data[num])
-            data[num] = re.sub("M190", ";M190", data[num])
+        ## Remove all extrusions and all the heating lines.  Each layer is done on its own so big files are done in parallel.
+        from GcodeTools_GV import map_layers, sub_all
+        map_layers(data, sub_all, range(1,len(data),1), [(" E([-+]?[0-9]*\.[0-9]*)", ""), ("M104", ";M104"), ("M109", ";M109"), ("M140", ";M140"), ("M190", ";M190")])
         ## Insert a parking move at the end of the last remaining layer
         data[practice_end] += "G1 X0 Y0\nM118 END OF GCODE\n"
         return
@@ -1341,14 +1379,9 @@ class LittleUtilities_GV(Script):
         extruder_speed_list = []
         extruder_speed = []
         cur_extruder = 0
-        if extruder_count > 1:
-            for num in range(0, 10, 1):
-                lines = data[num].split("\n")
-                for line in lines:
-                    if ";LAYER:0" in line:
-                        break
-                    if line.startswith("T"):
-                        cur_extruder = self.getValue(line, "T")
+        ## The tool changes are read once.  The tool at the start of layer:0 is the one the layers start with.
+        from GcodeTools_GV import MoveTable, ToolTimeline
+        timeline = ToolTimeline(data) if extruder_count > 1 else None
         for num in range(0, extruder_count):
             extruder_speed.append(extruder[num].getProperty("speed_print", "value") * 60)
             extruder_speed.append(extruder[num].getProperty("skirt_brim_speed", "value") * 60)
@@ -1373,59 +1406,65 @@ class LittleUtilities_GV(Script):
         for index, layer in enumerate(data):
             if ";LAYER:0" in data[index]:
                 start_at = index + 1
-                lines = data[index].split("\n")
-                for l_index, line in enumerate(lines):
+                if timeline is not None:
+                    cur_extruder = timeline.tool_at_start(index)
+                ## Only the tool changes and the lines with an F need to be looked at
+                moves = MoveTable(data[index])
+                lines = moves.lines
+                for l_index in sorted(moves.tool_rows() + moves.rows_with("F")):
                     ## Track the tool number
-                    if line.startswith("T"):
-                        cur_extruder = self.getValue(line, "T")
+                    if lines[l_index].startswith("T"):
+                        cur_extruder = moves.tool(l_index)
                         continue
+                    cur_speed = moves.value(l_index, "F")
                     ## Check the initial layer printing speeds
                     if speeds_to_check != "travel_speeds":
-                        if self.getValue(line, "G") in (1,2,3):
-                            if " F" in line:
-                                cur_speed = self.getValue(line, "F")
-                                if cur_speed > initial_print_speed:
-                                    lines[l_index] = re.sub("F(\d*)", "F" + str(initial_print_speed), lines[l_index])
+                        if moves.command(l_index) in (1,2,3):
+                            if cur_speed > initial_print_speed:
+                                lines[l_index] = re.sub("F(\d*)", "F" + str(initial_print_speed), lines[l_index])
                     ## Check the initial layer travel speeds
                     if speeds_to_check != "print_speeds":
-                        if self.getValue(line, "G") == 0:
-                            if " F" in line:
-                                cur_speed = self.getValue(line, "F")
-                                if cur_speed > initial_travel_speed:
-                                    lines[l_index] = re.sub("F(\d*)", "F" + str(initial_travel_speed), lines[l_index])
+                        if moves.command(l_index) == 0:
+                            if cur_speed > initial_travel_speed:
+                                lines[l_index] = re.sub("F(\d*)", "F" + str(initial_travel_speed), lines[l_index])
                 data[index] = "\n".join(lines)
                 break
             if not ";LAYER:0" in data[index]:
                 continue
         ## Layers above layer:0
         for num in range(start_at, len(data) - 1, 1):
-            layer = data[num].split("\n")
-            for l_index, line in enumerate(layer):
-                ## Track the tool number
-                if line.startswith("T"):
-                    cur_extruder = self.getValue(line, "T")
-                    continue
+            moves = MoveTable(data[num])
+            layer = moves.lines
+            ## The feature speed comes from the last ";TYPE:" line above each move
+            type_lines = [l_index for l_index, line in enumerate(layer) if line.startswith(";TYPE:")]
+            type_lines.append(len(layer))
+            type_nr = 0
+            for l_index in sorted(moves.tool_rows() + moves.rows_with("F")) + [len(layer)]:
                 ## Find the correct By Feature speed
-                if line.startswith(";TYPE:"):
+                while type_lines[type_nr] < l_index:
                     try:
-                        theindex = feature_name_list.index(line)
+                        theindex = feature_name_list.index(layer[type_lines[type_nr]])
                     except ValueError:
                         theindex = 0
                     new_speed = extruder_speed_list[cur_extruder][theindex]
+                    type_nr += 1
+                if l_index == len(layer):
+                    break
+                ## Track the tool number
+                if layer[l_index].startswith("T"):
+                    cur_extruder = moves.tool(l_index)
+                    continue
+                cur_speed = moves.value(l_index, "F")
                 ## Check the printing speeds
                 if speeds_to_check != "travel_speeds":
-                    if self.getValue(line, "G") in (1,2,3):
-                        if " F" in line:
-                            cur_speed = self.getValue(line, "F")
-                            if cur_speed > new_speed:
-                                layer[l_index] = re.sub("F(\d*)", "F" + str(new_speed), layer[l_index])
+                    if moves.command(l_index) in (1,2,3):
+                        if cur_speed > new_speed:
+                            layer[l_index] = re.sub("F(\d*)", "F" + str(new_speed), layer[l_index])
                 ## Check the travel speeds
                 if speeds_to_check != "print_speeds":
-                    if self.getValue(line, "G") == 0:
-                        if " F" in line:
-                            cur_speed = self.getValue(line, "F")
-                            if cur_speed > travel_speed:
-                                layer[l_index] = re.sub("F(\d*)", "F" + str(travel_speed), layer[l_index])
+                    if moves.command(l_index) == 0:
+                        if cur_speed > travel_speed:
+                            layer[l_index] = re.sub("F(\d*)", "F" + str(travel_speed), layer[l_index])
             data[num] = "\n".join(layer)
         return
 
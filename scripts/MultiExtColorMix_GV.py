@@ -469,6 +469,10 @@ class MultiExtColorMix_GV(Script):
             m163_t3 = ""
         m164str = m163_t0 + m163_t1 + m163_t2 + m163_t3 + "\nM164 S" + str(m164_ext_nr) + "\nT" + str(m164_ext_nr)
 
+        # Find the layers once for the park/purge lookups---------------------
+        from GcodeTools_GV import LayerIndex
+        self._layer_index = LayerIndex(data)
+
         # If purge is selected-------------------------------------------------
         initial_purge = ""
         start_purge = ""
@@ -764,8 +768,7 @@ class MultiExtColorMix_GV(Script):
                     break
         return
 
-    @staticmethod
-    def park_script(purge_layer: str, data: str, park_x: str, park_y: str, retract_amt: str) -> str:
+    def park_script(self, purge_layer: str, data: str, park_x: str, park_y: str, retract_amt: str) -> str:
         # Put together the park/purge lines to be inserted----------------------------
         mycura = Application.getInstance().getGlobalContainerStack()
         extruder = mycura.extruderList
@@ -775,26 +778,25 @@ class MultiExtColorMix_GV(Script):
         else:
             zup = " Z2\n"
             zdn = " Z-2\n"
-        for index, layer in enumerate(data):
-            if ";LAYER:" + str(purge_layer) + "\n" in layer:
-                prev_layer = data[index-1]
-                lines = prev_layer.split("\n")
-                lines.reverse()
-                xloc = ""
-                yloc = ""
-                for line in lines:
-                    if line.startswith("G0") or line.startswith("G1") or line.startswith("G2") or line.startswith("G3"):
-                        if " X" in line:
-                            xtemp = line.split("X")[1]
-                            xloc = " X" + str(xtemp.split(" ")[0])
-                        if " Y" in line:
-                            ytemp = line.split("Y")[1]
-                            try:
-                                yloc = " Y" + str(ytemp.split(" ")[0])
-                            except:
-                                yloc = " Y" + str(ytemp)
-                    if xloc != "" and yloc != "":
-                        break
+        for index in self._layer_index.indexes_of(purge_layer)[-1:]:
+            prev_layer = data[index-1]
+            lines = prev_layer.split("\n")
+            lines.reverse()
+            xloc = ""
+            yloc = ""
+            for line in lines:
+                if line.startswith("G0") or line.startswith("G1") or line.startswith("G2") or line.startswith("G3"):
+                    if " X" in line:
+                        xtemp = line.split("X")[1]
+                        xloc = " X" + str(xtemp.split(" ")[0])
+                    if " Y" in line:
+                        ytemp = line.split("Y")[1]
+                        try:
+                            yloc = " Y" + str(ytemp.split(" ")[0])
+                        except:
+                            yloc = " Y" + str(ytemp)
+                if xloc != "" and yloc != "":
+                    break
         park_ret_prime = "\n;TYPE:CUSTOM Multi Mix Purge\nG91\nM83\n"
         park_ret = "\n;TYPE:CUSTOM Multi Mix Purge\nG91\nM83\n"
         park_prime = "\n;TYPE:CUSTOM Multi Mix Purge\nG91\nM83\n"
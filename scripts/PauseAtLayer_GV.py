@@ -23,7 +23,7 @@ class PauseAtLayer_GV(Script):
                 "pause_layer":
                 {
                     "label": "Pause at end of layer...",
-                    "description": "Enter the number of the LAST layer you want to finish prior to the pause. Use the layer numbers from the Cura preview.  If you want to use these exact same settings for more than one pause then use a comma to delimit the layer numbers.  If the settings are different then you must add another instance of PauseAtLayer.",
+                    "description": "Enter the number of the LAST layer you want to finish prior to the pause. Use the layer numbers from the Cura preview.  If you want to use these exact same settings for more than one pause then use a comma to delimit the layer numbers (a range like '20-30/5' pauses at 20, 25 and 30).  If the settings are different then you must add another instance of PauseAtLayer.",
                     "type": "str",
                     "value": "25",
                     "minimum_value": "1",
@@ -350,9 +350,11 @@ class PauseAtLayer_GV(Script):
 
     def execute(self, data):
         pause_layer_setting = str(self.getSettingValueByKey("pause_layer"))
-        pause_layer_list = pause_layer_setting.split(",")
+        from GcodeTools_GV import LayerRanges
+        ## An open range ("40-") runs to the last layer item
+        pause_layer_list = LayerRanges(pause_layer_setting).layers(len(data) - 3)
         for pause_layer in pause_layer_list:
-            data = self._find_pause(data, int(pause_layer.strip()))
+            data = self._find_pause(data, pause_layer)
         return data
 
     ##  Get the X and Y values for a layer (will be used to get X and Y of the layer after the pause and of the 'redo' layer if that option is used).
@@ -366,6 +368,31 @@ class PauseAtLayer_GV(Script):
                     return x, y
         return 0, 0
 
+    ##  Look back from the pause to where the layers started for the last extrusion feed rate and the last Z.
+    def _last_f_and_z(self, data: [str], start: Tuple[int, int], end: Tuple[int, int], current_extrusion_f: float, current_z: float) -> Tuple[float, float]:
+        from GcodeTools_GV import MoveTable
+        found_f = False
+        found_z = False
+        for index in range(end[0], start[0] - 1, -1):
+            moves = MoveTable(data[index])
+            first_line = start[1] if index == start[0] else 0
+            last_line = end[1] if index == end[0] else len(moves)
+            row = last_line
+            while not found_f:
+                row = moves.last_row("E", before = row)
+                if row is None or row < first_line:
+                    break
+                if moves.has(row, "F"):
+                    current_extrusion_f = moves.value(row, "F")
+                    found_f = True
+            row = moves.last_row("Z", before = last_line) if not found_z else None
+            if row is not None and row >= first_line:
+                current_z = moves.value(row, "Z")
+                found_z = True
+            if found_f and found_z:
+                break
+        return current_extrusion_f, current_z
+
     def _find_pause(self, new_data: [str], pause_layer: int) -> [str]:
         mycura = Application.getInstance().getGlobalContainerStack()
         extruder = mycura.extruderList
@@ -464,9 +491,11 @@ class PauseAtLayer_GV(Script):
             lines = layer.split("\n")
 
             ## Scroll each line of instruction for each layer in the G-code
-            for line in lines:
+            for line_nr, line in enumerate(lines):
                 ## Fist positive layer reached
                 if ";LAYER:0" in line:
+                    if not layers_started:
+                        layers_started_at = (index, line_nr)
                     layers_started = True
                 ## Count nbr of negative layers (raft)
                 elif ";LAYER:-" in line:
@@ -480,14 +509,6 @@ class PauseAtLayer_GV(Script):
                 if not layers_started:
                     continue
 
-                ## Look for the feed rate of an extrusion instruction
-                if self.getValue(line, "F") is not None and self.getValue(line, "E") is not None:
-                    current_extrusion_f = self.getValue(line, "F")
-
-                ## If a Z instruction is in the line, read the current Z
-                if self.getValue(line, "Z") is not None:
-                    current_z = self.getValue(line, "Z")
-
                 if not line.startswith(";LAYER:"):
                     continue
                 current_layer = line[len(";LAYER:"):]
@@ -500,6 +521,9 @@ class PauseAtLayer_GV(Script):
                 if current_layer < pause_layer - nbr_negative_layers:
                     continue
 
+                ## The feed rate of the last extrusion and the last Z before the pause
+                current_extrusion_f, current_z = self._last_f_and_z(new_data, layers_started_at, (index, line_nr), current_extrusion_f, current_z)
+
                 prev_layer = new_data[index - 1]
                 prev_lines = prev_layer.split("\n")
 
@@ -190,12 +190,11 @@ class SearchAndReplace_GV(Script):
         if not is_regex:
             search_string = re.escape(search_string)
         search_regex = re.compile(search_string)
+        ## Each layer is done on its own so big files are done in parallel
+        from GcodeTools_GV import map_layers, sub_all
         if end_index > start_index:
-            for index in range(start_index,end_index,1):
-                layer = data[index]
-                data[index] = re.sub(search_regex, replace_string, layer)
+            map_layers(data, sub_all, range(start_index,end_index,1), [(search_regex, replace_string)])
         elif end_index == start_index:
-            layer = data[start_index]
-            data[start_index] = re.sub(search_regex, replace_string, layer)
+            map_layers(data, sub_all, [start_index], [(search_regex, replace_string)])
         return data
         
\ No newline at end of file
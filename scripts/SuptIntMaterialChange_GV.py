@@ -113,7 +113,7 @@ class SuptIntMaterialChange_GV(Script):
                 "layers_of_interest":
                 {
                     "label": "Layers #'s for Mat'l Change",
-                    "description": "Use the Cura preview layer numbers.  Enter the layer numbers that you want to change material for the support interfaces.  The numbers must be ascending.  Delimit individual layer numbers with a ',' comma and delimit layer ranges with a '-' dash.  Spaces are not allowed.  If there is no 'SUPPORT-INTERFACE' on a layer then it is ignored.",
+                    "description": "Use the Cura preview layer numbers.  Enter the layer numbers that you want to change material for the support interfaces.  The numbers must be ascending.  Delimit individual layer numbers with a ',' comma and delimit layer ranges with a '-' dash.  A range can be open ('40-' runs to the last layer) or have a step ('10-30/5' is every 5th layer).  If there is no 'SUPPORT-INTERFACE' on a layer then it is ignored.",
                     "type": "str",
                     "default_value": "10,15,28-31",
                     "enabled": true
@@ -310,49 +310,29 @@ class SuptIntMaterialChange_GV(Script):
             Message(title = "[Support-Interface Mat'l Change]", text = "Is not compatible with 'One-at-a-Time' mode and did not run.").show()
             return data
 
-        # Count the raft layers
+        # Find the layers and count the raft layers
+        from GcodeTools_GV import LayerIndex
+        layer_index = LayerIndex(data)
         raft_layers = 0
         if str(mycura.getProperty("adhesion_type", "value")) == "raft":
-            for num in range(2,10,1):
-                layer = data[num]
-                if ";LAYER:-" in layer:
-                    raft_layers += 1
-                if ":LAYER:0\n" in layer:
-                    break
+            raft_layers = layer_index.raft_layers
 
-        # Make a list of the user entered layer numbers
+        # Make a list of the user entered layer numbers.  The ';LAYER:' number is the preview number - 1 - the raft layers.
+        from GcodeTools_GV import LayerRanges
         layers_of_interest = str(self.getSettingValueByKey("layers_of_interest"))
-        layer_list = []
-        if "," in layers_of_interest:   # Start with the comma delimited layers
-            the_layers = layers_of_interest.split(",")
-            for layer in the_layers:
-                if not "-" in layer:
-                    layer_list.append(int(layer) - 1 - raft_layers)
-                else:
-                    startat = int(layer.split("-")[0])  # If there are layer ranges then split them and add all the layers to the list
-                    endat = int(layer.split("-")[1])
-                    for m in range(startat, endat + 1):
-                        layer_list.append(m - 1 - raft_layers)
-        elif "-" in layers_of_interest and not "," in layers_of_interest: # If there are no commas but there is a layer range
-            startat = int(layers_of_interest.split("-")[0])
-            endat = int(layers_of_interest.split("-")[1])
-            for m in range(startat, endat + 1):
-                layer_list.append(m - 1 - raft_layers)
-        else:
-            layer_list.append(int(layers_of_interest) - 1 - raft_layers)  # If there is a single layer entered
+        layer_list = LayerRanges(layers_of_interest, -1 - raft_layers).layers(layer_index.top_layer())
         ## Convert the Layer_List layer numbers to a Data_List of the corresponding data items.  That takes care of the any raft negative numbers.
         data_list = []
         for num in range(0,len(layer_list)):
             the_layer = int(layer_list[num])
-            for data_num in range(the_layer, len(data)-1):
-                if ";LAYER:" + str(the_layer) + "\n" in data[data_num]:
-                    data_list.append(data_num)
-                    break
+            data_num = layer_index.index_of(the_layer, max(the_layer, 0))
+            if data_num is not None and data_num < len(data)-1:
+                data_list.append(data_num)
 
         ## Check the Raft Air Gap.  If it is greater than 0 send a message.
         if raft_layers > 0:
             raft_airgap = mycura.getProperty("raft_airgap", "value")
-            raft_is_included = True if layer_list[0] < 0 else False
+            raft_is_included = True if layer_list and layer_list[0] < 0 else False
             if raft_airgap > 0 and raft_is_included:
                 Message(title = "[Supt-Interface Material Change]", text = "Your 'Raft Air Gap' is not 0.  This will work, but the bottom layer of the model is better if the air gap is 0.").show()
 
@@ -556,7 +536,7 @@ class SuptIntMaterialChange_GV(Script):
                 end_at_line = index_list[index_num + 1]
                 ## Put the 'Revert' section together
                 return_location_list = []
-                return_location_list = self.getReturnLocation(data, dnum, end_at_line, retract_speed)
+                return_location_list = self.getReturnLocation(data, dnum, end_at_line, retract_speed, lines)
                 return_location = str(return_location_list[0])
                 is_retraction = bool(return_location_list[1])
                 ## Relative extrusion or not
@@ -576,7 +556,7 @@ class SuptIntMaterialChange_GV(Script):
 
                 ## Final changes to the 'Interface' change string
                 startout_location_list = []
-                startout_location_list = self.getReturnLocation(data, dnum, start_at_line, retract_speed)
+                startout_location_list = self.getReturnLocation(data, dnum, start_at_line, retract_speed, lines)
                 startout_location = startout_location_list[0]
                 is_start_retraction = bool(startout_location_list[1])
                 if not relative_ext_mode:
@@ -614,8 +594,10 @@ class SuptIntMaterialChange_GV(Script):
         return data
 
     # Get the return location and see if there was a retraction before the Interface
-    def getReturnLocation(self, data: str, num: int, index: int, retract_speed: str):  #
-        lines = data[num].split("\n")
+    def getReturnLocation(self, data: str, num: int, index: int, retract_speed: str, lines: list = None):
+        ## 'lines' is data[num] already split (the layer is only split once for all the look ups in it)
+        if lines is None:
+            lines = data[num].split("\n")
         is_retraction = None
         ret_x = None
         ret_y = 0
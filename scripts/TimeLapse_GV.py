@@ -118,12 +118,6 @@ class TimeLapse_GV(Script):
         retract = bool(self.getSettingValueByKey("retract"))
         zhop = self.getSettingValueByKey("zhop")
         when_to_insert = self.getSettingValueByKey("insert_frequency")
-        last_x = 0
-        last_y = 0
-        last_z = 0
-        last_e = 0
-        prev_e = 0
-        is_retracted = False
         gcode_to_append = ""
         if park_print_head:
             gcode_to_append += self.putValue(G=1, F=trav_speed, X=x_park, Y=y_park) + "     ;Park print head\n"
@@ -151,33 +145,21 @@ class TimeLapse_GV(Script):
                 step_freq = 1
 
         # Use the step_freq to index through the layers----------------------------------------
+        from GcodeTools_GV import EditJournal, StateTracker
+        # The state is followed through every layer, not just the ones that get a photo
+        states = StateTracker(data, relative_extrusion)
         for num in range(2,len(data)-1,step_freq):
             layer = data[num]
             try:
-                # Track X,Y,Z location.--------------------------------------------------------
-                for line in layer.split("\n"):
-                    if self.getValue(line, "G") in {0, 1}:
-                        last_x = self.getValue(line, "X", last_x)
-                        last_y = self.getValue(line, "Y", last_y)
-                        last_z = self.getValue(line, "Z", last_z)
-                #Track the E location so that if there is already a retraction we don't double dip.
-                        if rel_cmd == 82:
-                            if " E" in line:
-                                last_e = line.split("E")[1]
-                                if float(last_e) < float(prev_e):
-                                    is_retracted = True
-                                else:
-                                    is_retracted = False
-                                prev_e = last_e
-                        elif rel_cmd == 83:
-                            if " E" in line:
-                                last_e = line.split("E")[1]
-                                if float(last_e) < 0:
-                                    is_retracted = True
-                                else:
-                                    is_retracted = False
-                                prev_e = last_e
+                # X,Y,Z location at the end of the layer.--------------------------------------------------------
+                state = states.at_end(num)
+                last_x = state.x
+                last_y = state.y
+                last_z = state.z
+                #If there is already a retraction we don't double dip.
+                is_retracted = state.retracted
                 lines = layer.split("\n")
+                journal = EditJournal(lines)
                 # Insert the code----------------------------------------------------
                 for line in lines:
                     if ";LAYER:" in line:
@@ -198,9 +180,9 @@ class TimeLapse_GV(Script):
                             camera_line += self.putValue(G=1, E=retract_dist, F=retract_speed) + "         ;Un-Retract filament\n"
                             camera_line += self.putValue(M=rel_cmd) + "                 ;Extruder Mode\n"
                         camera_line += self.putValue(";--------------------TimeLapse End")
-                        lines.insert(len(lines)-2, camera_line)
+                        journal.insert_before(len(lines)-2, camera_line)
                         break
-                data[num] = "\n".join(lines)
+                data[num] = "\n".join(journal.apply())
             except:
                 pass
         return data